@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Escalado del conector con el pool de workers AGI (AGI_WORKERS): para cada número de
+workers se lanza un ``AGIWorkerPool`` real (procesos con SO_REUSEPORT, dueño único de
+AMI que reparte los eventos por IPC) y se carga con ``--calls-per-worker`` llamadas por
+worker, con los mismos sustitutos que bench_connector_load.py: llamadas AGI en tiempo
+real y servidor AMI falso en otro proceso, y un broker en memoria en cada worker.
+
+Por cada configuración se informa de la CPU consumida (workers + principal, por el
+latido de salud de cada worker), los núcleos equivalentes, las llamadas por núcleo,
+la pérdida (tramas enviadas frente a publicadas; el VAD va en modo mark) y el retraso
+máximo del bucle de los workers. Una configuración se sostiene si la pérdida no pasa de
+``--max-loss`` ni el retraso de ``--max-lag-ms``.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_agi_workers.py [--workers 1 2 4] [--calls-per-worker 100] \\
+        [--duration 10] [--ami-events-per-sec 2000]
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from asterisk_connector.ami_client import AMIClient
+from asterisk_connector.ami_parser import DEFAULT_FIELD_WHITELIST
+from asterisk_connector.call_registry import CallRegistry
+from asterisk_connector.rabbitmq_publisher import AsyncRabbitMQPublisher
+from asterisk_connector.worker_pool import AGIWorkerPool
+from bench_connector_load import FRAME_MS, _load_process
+from standins import draining_channel
+
+HEALTH_INTERVAL = 0.25
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _totals(health: Dict[int, Dict[str, object]]) -> Dict[str, float]:
+    return {
+        "cpu_s": sum(h.get("cpu_s", 0.0) for h in health.values()),
+        "frames_published": sum(h.get("frames_published", 0) for h in health.values()),
+    }
+
+
+async def run_workers(workers: int, calls: int, duration: float = 10.0, ramp: float = 1.0,
+                      ami_events_per_sec: float = 2000.0, max_loss: float = 0.001,
+                      max_lag_ms: float = 50.0) -> Dict[str, object]:
+    """Carga un pool de ``workers`` procesos con ``calls`` llamadas y devuelve el informe."""
+    # Los workers heredan el entorno: VAD en modo mark para que cada trama se publique
+    previous_vad = os.environ.get("AGI_VAD")
+    os.environ["AGI_VAD"] = "mark"
+    try:
+        return await _run_workers(workers, calls, duration, ramp, ami_events_per_sec, max_loss, max_lag_ms)
+    finally:
+        if previous_vad is None:
+            os.environ.pop("AGI_VAD", None)
+        else:
+            os.environ["AGI_VAD"] = previous_vad
+
+
+async def _run_workers(workers, calls, duration, ramp, ami_events_per_sec, max_loss, max_lag_ms):
+    agi_port = free_port()
+    ami_channel = await draining_channel()
+    ami_client = AMIClient(publisher=AsyncRabbitMQPublisher(ami_channel), field_whitelist=DEFAULT_FIELD_WHITELIST,
+                           event_queue_size=0)
+    pool = AGIWorkerPool(workers, agi_port, call_registry=CallRegistry(), channel_factory=draining_channel,
+                         health_interval=HEALTH_INTERVAL, health_timeout=30)
+    pool.subscribe_to(ami_client)
+    pool_task = asyncio.create_task(pool.start())
+    await pool.wait_ready(timeout=60)
+
+    loop = asyncio.get_running_loop()
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.get_context("spawn").Process(
+        target=_load_process, args=(agi_port, calls, duration, ramp, ami_events_per_sec, child_conn), daemon=True)
+    process.start()
+    ami_client.host, ami_client.port = "127.0.0.1", await loop.run_in_executor(None, conn.recv)
+    await asyncio.wait_for(ami_client.connect(), timeout=10)
+
+    # Retraso máximo del bucle de cada worker a lo largo de la prueba, según sus latidos
+    await asyncio.sleep(2 * HEALTH_INTERVAL)
+    lag = {i: 0.0 for i in range(workers)}
+
+    async def sample_health():
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            for i, health in pool.health().items():
+                lag[i] = max(lag[i], health.get("loop_lag_ms", 0.0))
+
+    before = _totals(pool.health())
+    wall, owner_cpu = time.perf_counter(), time.process_time()
+    sampler = asyncio.create_task(sample_health())
+    conn.send("go")
+    load = await loop.run_in_executor(None, conn.recv)
+    await asyncio.sleep(2 * HEALTH_INTERVAL)
+    sampler.cancel()
+    wall, owner_cpu = time.perf_counter() - wall, time.process_time() - owner_cpu
+    after = _totals(pool.health())
+    restarts = sum(h["restarts"] for h in pool.health().values())
+
+    await ami_client.close()
+    conn.send("stop")
+    process.join(timeout=5)
+    pool_task.cancel()
+    await asyncio.gather(pool_task, return_exceptions=True)
+    await ami_channel.close()
+
+    worker_cpu = after["cpu_s"] - before["cpu_s"]
+    published = after["frames_published"] - before["frames_published"]
+    lost = max(0, load["sent"] - published)
+    loss = lost / load["sent"] if load["sent"] else 0.0
+    cores = (worker_cpu + owner_cpu) / wall if wall else 0.0
+    return {
+        "workers": workers,
+        "calls": calls,
+        "sustained": loss <= max_loss and max(lag.values()) <= max_lag_ms and not restarts,
+        "duration_s": round(wall, 2),
+        "worker_cpu_s": round(worker_cpu, 3),
+        "owner_cpu_s": round(owner_cpu, 3),
+        "cores": round(cores, 3),
+        "calls_per_core": round(calls / cores, 1) if cores else 0.0,
+        "chunks_sent": load["sent"],
+        "chunks_lost": lost,
+        "worker_loop_lag_max_ms": round(max(lag.values()), 2),
+        "max_send_lag_ms": load["max_send_lag_ms"],
+        "restarts": restarts,
+    }
+
+
+async def run_scaling(workers: List[int], calls_per_worker: int, **kwargs) -> List[Dict[str, object]]:
+    return [await run_workers(n, n * calls_per_worker, **kwargs) for n in workers]
+
+
+def print_report(reports: List[Dict[str, object]]):
+    print(f"{'workers':>7} {'llamadas':>8} {'sostenido':>9} {'núcleos':>8} {'llam/núcleo':>11} "
+          f"{'perdidas':>8} {'lag máx ms':>10} {'envío máx ms':>12}")
+    for r in reports:
+        print(f"{r['workers']:>7} {r['calls']:>8} {'sí' if r['sustained'] else 'no':>9} {r['cores']:>8} "
+              f"{r['calls_per_core']:>11} {r['chunks_lost']:>8} {r['worker_loop_lag_max_ms']:>10} "
+              f"{r['max_send_lag_ms']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="tamaños de pool a medir")
+    parser.add_argument("--calls-per-worker", type=int, default=100, help="llamadas simultáneas por worker")
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos de audio por llamada")
+    parser.add_argument("--ramp", type=float, default=1.0, help="segundos para escalonar el inicio de las llamadas")
+    parser.add_argument("--ami-events-per-sec", type=float, default=2000.0, help="ritmo de la tormenta AMI (0 = sin eventos)")
+    parser.add_argument("--max-loss", type=float, default=0.001, help="pérdida máxima de una configuración sostenida")
+    parser.add_argument("--max-lag-ms", type=float, default=50.0, help="retraso máximo del bucle de los workers")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print(f"Tramas de {FRAME_MS} ms; {os.cpu_count()} núcleos disponibles")
+    print_report(asyncio.run(run_scaling(
+        args.workers, args.calls_per_worker, duration=args.duration, ramp=args.ramp,
+        ami_events_per_sec=args.ami_events_per_sec, max_loss=args.max_loss, max_lag_ms=args.max_lag_ms,
+    )))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del parser de tramas AMI.
+
+Reproduce un flujo de eventos grabado (benchmarks/data/ami_event_storm.txt), lo trocea
+en segmentos TCP y compara eventos/segundo entre el parser anterior (buffer str +
+split + dict) y AMIFrameParser, con y sin lista blanca de campos.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_ami_parser.py [--repeat 2000] [--segment 1460]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.ami_parser import DEFAULT_FIELD_WHITELIST, AMIFrameParser
+
+STREAM_PATH = os.path.join(os.path.dirname(__file__), "data", "ami_event_storm.txt")
+
+
+class LegacyParser:
+    """Implementación previa de AMIClientProtocol.data_received + handle_message."""
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, data):
+        frames = []
+        self.buffer += data.decode(errors="replace")
+        while "\r\n\r\n" in self.buffer:
+            msg, self.buffer = self.buffer.split("\r\n\r\n", 1)
+            parsed = {}
+            for line in msg.split("\r\n"):
+                if ":" in line:
+                    k, v = line.split(":", 1)
+                    parsed[k.strip()] = v.strip()
+            frames.append(parsed)
+        return frames
+
+
+def load_stream(repeat):
+    with open(STREAM_PATH, "rb") as f:
+        return f.read() * repeat
+
+
+def segment(stream, size):
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def run(name, parser, segments):
+    start = time.perf_counter()
+    events = 0
+    for seg in segments:
+        events += len(parser.feed(seg))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {events:>9} eventos  {elapsed * 1000:>9.1f} ms  {events / elapsed:>12,.0f} eventos/s")
+    return events / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=2000, help="repeticiones del flujo grabado")
+    ap.add_argument("--segment", type=int, nargs="+", default=[1460, 65536, 262144], help="tamaños de segmento TCP")
+    args = ap.parse_args()
+
+    stream = load_stream(args.repeat)
+    print(f"Flujo: {len(stream) / 1e6:.1f} MB")
+    for size in args.segment:
+        segments = segment(stream, size)
+        print(f"\n--- segmentos de {size} bytes ({len(segments)} lecturas) ---")
+        legacy = run("legacy (str + split)", LegacyParser(), segments)
+        fast = run("AMIFrameParser", AMIFrameParser(), segments)
+        filtered = run("AMIFrameParser + whitelist", AMIFrameParser(DEFAULT_FIELD_WHITELIST), segments)
+        print(f"speedup: x{fast / legacy:.2f} (x{filtered / legacy:.2f} con whitelist)")
+
+
+if __name__ == "__main__":
+    main()
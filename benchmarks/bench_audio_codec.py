@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de common.audio_codec.
+
+Mide el rendimiento de la (de)codificación G.711 y del remuestreo en segundos de canal
+procesados por segundo de CPU (cuántas llamadas en tiempo real caben en un núcleo),
+tanto en tramas de 20 ms (caso real, por llamada) como en bloques de 1 s.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_audio_codec.py [--seconds 60]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from common.audio_codec import Resampler, from_linear, to_linear
+
+
+def speech_like(rate, seconds):
+    rng = np.random.default_rng(1)
+    t = np.arange(int(rate * seconds)) / rate
+    signal = 6000 * np.sin(2 * np.pi * 180 * t) * (1 + np.sin(2 * np.pi * 3 * t)) + rng.normal(0, 300, t.size)
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+def run(name, func, chunks, seconds):
+    start = time.process_time()
+    for chunk in chunks:
+        func(chunk)
+    elapsed = max(time.process_time() - start, 1e-9)
+    print(f"{name:<36} {seconds / elapsed:>12,.0f} s canal / s CPU")
+
+
+def split(buffer, size):
+    view = memoryview(buffer)
+    return [view[i:i + size] for i in range(0, len(view), size)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, default=60, help="segundos de audio por caso")
+    args = ap.parse_args()
+    seconds = args.seconds
+
+    pcm8 = speech_like(8000, seconds)
+    ulaw = from_linear(pcm8, "ulaw")
+    alaw = from_linear(pcm8, "alaw")
+    for label, frame_ms in (("20 ms", 20), ("1 s", 1000)):
+        print(f"\n--- bloques de {label} ---")
+        samples = 8 * frame_ms
+        run("ulaw -> slin (decode)", lambda c: to_linear(c, "ulaw"), split(ulaw, samples), seconds)
+        run("alaw -> slin (decode)", lambda c: to_linear(c, "alaw"), split(alaw, samples), seconds)
+        pcm_chunks = [to_linear(c, "slin") for c in split(pcm8.tobytes(), samples * 2)]
+        run("slin -> ulaw (encode)", lambda c: from_linear(c, "ulaw"), pcm_chunks, seconds)
+        for src, dst in ((8000, 16000), (16000, 8000), (24000, 16000), (22050, 16000)):
+            source = speech_like(src, seconds)
+            step = src * frame_ms // 1000
+            chunks = [source[i:i + step] for i in range(0, len(source), step)]
+            run(f"resample {src} -> {dst}", Resampler(src, dst).process, chunks, seconds)
+
+
+if __name__ == "__main__":
+    main()
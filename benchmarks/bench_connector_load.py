@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de extremo a extremo del conector de Asterisk (AGIServer + AMIClient)
+con sustitutos locales (benchmarks/standins.py), sin Asterisk ni RabbitMQ:
+
+- N llamadas AGI simuladas que envían audio slin en tiempo real (tramas de 20 ms),
+  escalonadas durante ``--ramp`` segundos;
+- un servidor AMI falso que emite tormentas de eventos (``--ami-events-per-sec``);
+- un broker en memoria con la interfaz de canal aio-pika, con un consumidor que mide
+  cada trama al llegar a ``incoming_audio_chunks`` y, con ``--echo``, la devuelve por
+  ``outgoing_audio_chunks`` para ejercitar también el audio saliente.
+
+Por defecto las llamadas y el servidor AMI corren en otro proceso, de modo que la CPU
+medida (``time.process_time``) es la del conector más el broker y su consumidor; con
+``--in-process`` todo comparte bucle (más simple, pero la CPU incluye a los clientes).
+
+Informe: llamadas sostenidas (pérdida <= ``--max-loss``, salvo con VAD suppress, y p99
+<= ``--max-p99-ms``), CPU por llamada, retardo del bucle de eventos, percentiles de
+latencia trama a trama (envío del cliente -> llegada al broker), tramas perdidas y
+eventos AMI publicados.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_connector_load.py [--calls 100] [--duration 20] \\
+        [--ami-events-per-sec 2000] [--vad mark] [--echo] [--in-process]
+"""
+
+import argparse
+import asyncio
+import collections
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, Optional
+
+import aio_pika
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from asterisk_connector.ami_client import AMIClient
+from asterisk_connector.ami_parser import DEFAULT_FIELD_WHITELIST
+from asterisk_connector.main import AGIServer
+from asterisk_connector.rabbitmq_publisher import AsyncRabbitMQPublisher
+from common import envelope
+from standins import FakeAMIServer, InProcessChannel, agi_call, speech_like_frames
+
+FRAME_MS = 20
+AMI_CALL_EVENTS = ("call_started", "call_ended")
+
+
+def percentiles(values) -> Dict[str, float]:
+    if not len(values):
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    values = np.asarray(values)
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2),
+            "max": round(float(values.max()), 2)}
+
+
+class LoadCollector:
+    """
+    Consumidor de ``incoming_audio_chunks``: latencia de cada trama respecto a su instante
+    de envío (``agi_arg_1`` + seq * 20 ms), tramas recibidas por llamada y latencia de los
+    eventos AMI (su Uniqueid es el instante de emisión del servidor AMI falso).
+    """
+
+    def __init__(self, channel, echo: bool = False, frame_ms: int = FRAME_MS):
+        self.channel = channel
+        self.echo = echo
+        self.frame_s = frame_ms / 1000.0
+        self.t0: Dict[str, float] = {}
+        self.received = collections.Counter()
+        self.latency: Dict[str, list] = collections.defaultdict(list)
+        self.ami_latency = []
+        self.events = collections.Counter()
+        self.echoed = 0
+
+    async def on_message(self, message):
+        now = time.time()
+        env = envelope.decode(message.body)
+        kind = envelope.kind(env)
+        if kind == "call_start":
+            start = env.call_start
+            self.t0[start.call_id] = float(start.agi_env.get("agi_arg_1", start.start_ts))
+        elif kind == "audio_chunk":
+            chunk = env.audio_chunk
+            t0 = self.t0.get(chunk.call_id)
+            self.received[chunk.call_id] += 1
+            if t0 is not None:
+                self.latency[chunk.call_id].append((now - (t0 + chunk.seq * self.frame_s)) * 1000)
+            if self.echo:
+                self.echoed += len(chunk.payload)
+                await self.channel.default_exchange.publish(
+                    aio_pika.Message(body=chunk.payload, headers={"call_id": chunk.call_id, "seq": chunk.seq}),
+                    routing_key="outgoing_audio_chunks")
+        elif kind == "call_event":
+            event = env.call_event
+            self.events[event.event] += 1
+            if event.event in AMI_CALL_EVENTS and "Uniqueid" in event.fields:
+                self.ami_latency.append((now - float(event.fields["Uniqueid"])) * 1000)
+
+
+async def monitor_loop_lag(samples: list, interval: float = 0.01):
+    """Retardo del bucle de eventos: cuánto tarda de más en volver un sleep de ``interval``."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - start - interval) * 1000)
+
+
+async def generate_load(agi_port: int, calls: int, duration: float, ramp: float) -> Dict[str, object]:
+    """Lanza ``calls`` llamadas AGI escalonadas durante ``ramp`` segundos y agrega sus resultados."""
+    frames = speech_like_frames(FRAME_MS)
+
+    async def call(i):
+        await asyncio.sleep(ramp * i / calls)
+        return await agi_call(agi_port, f"SIP/load-call-{i:05d}", duration, frames, FRAME_MS)
+
+    results = await asyncio.gather(*(call(i) for i in range(calls)))
+    return {
+        "sent": sum(r["sent"] for r in results),
+        "received_bytes": sum(r["received_bytes"] for r in results),
+        "max_send_lag_ms": round(max((r["max_send_lag_ms"] for r in results), default=0.0), 2),
+    }
+
+
+def _load_process(agi_port, calls, duration, ramp, ami_events_per_sec, conn):
+    """Proceso generador: servidor AMI falso + llamadas AGI, coordinados por ``conn``."""
+
+    async def run():
+        ami = FakeAMIServer(ami_events_per_sec)
+        conn.send(await ami.start())
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, conn.recv)
+        result = await generate_load(agi_port, calls, duration, ramp)
+        result["ami_emitted"] = ami.emitted
+        conn.send(result)
+        # El servidor AMI sigue abierto hasta que el conector se desconecta
+        await loop.run_in_executor(None, conn.recv)
+        await ami.stop()
+
+    asyncio.run(run())
+
+
+async def run_load(calls: int = 20, duration: float = 10.0, ramp: float = 1.0, ami_events_per_sec: float = 2000.0,
+                   vad: str = "mark", echo: bool = False, in_process: bool = False, max_loss: float = 0.001,
+                   max_p99_ms: float = 50.0) -> Dict[str, object]:
+    """Ejecuta la prueba de carga y devuelve el informe como diccionario."""
+    channel = InProcessChannel()
+    collector = LoadCollector(channel, echo=echo)
+    await (await channel.declare_queue("incoming_audio_chunks")).consume(collector.on_message, no_ack=True)
+
+    ami_client = AMIClient(publisher=AsyncRabbitMQPublisher(channel), field_whitelist=DEFAULT_FIELD_WHITELIST,
+                           event_queue_size=0)
+    agi = AGIServer(0, ami_client, channel)
+    agi.vad_mode = vad
+    # El eco devuelve la voz del propio llamante: no debe interrumpirse a sí mismo
+    agi.barge_in = not echo
+    await agi.audio_router.consume(channel, "outgoing_audio_chunks")
+    server = await asyncio.start_server(agi.handle_agi, "127.0.0.1", 0)
+    agi_port = server.sockets[0].getsockname()[1]
+
+    fake_ami: Optional[FakeAMIServer] = None
+    process = conn = None
+    if in_process:
+        fake_ami = FakeAMIServer(ami_events_per_sec)
+        ami_client.port = await fake_ami.start()
+    else:
+        conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.get_context("spawn").Process(
+            target=_load_process, args=(agi_port, calls, duration, ramp, ami_events_per_sec, child_conn), daemon=True)
+        process.start()
+        loop = asyncio.get_running_loop()
+        ami_client.port = await loop.run_in_executor(None, conn.recv)
+    ami_client.host = "127.0.0.1"
+    await asyncio.wait_for(ami_client.connect(), timeout=10)
+
+    lag = []
+    monitor = asyncio.create_task(monitor_loop_lag(lag))
+    wall, cpu = time.perf_counter(), time.process_time()
+    if in_process:
+        load = await generate_load(agi_port, calls, duration, ramp)
+        load["ami_emitted"] = fake_ami.emitted
+    else:
+        conn.send("go")
+        load = await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+    # Dejar que el broker entregue lo pendiente antes de cerrar la medida
+    await asyncio.sleep(0.2)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    monitor.cancel()
+
+    await ami_client.close()
+    if fake_ami is not None:
+        await fake_ami.stop()
+    if process is not None:
+        conn.send("stop")
+        process.join(timeout=5)
+    server.close()
+    await server.wait_closed()
+    await channel.close()
+
+    received = sum(collector.received.values())
+    all_latency = [ms for values in collector.latency.values() for ms in values]
+    sent_per_call = int(duration * 1000 / FRAME_MS)
+    sustained = sum(
+        1 for call_id in collector.t0
+        if (vad == "suppress" or sent_per_call - collector.received[call_id] <= max_loss * sent_per_call)
+        and percentiles(collector.latency[call_id])["p99"] <= max_p99_ms
+    )
+    ami_published = sum(collector.events[event] for event in AMI_CALL_EVENTS)
+    return {
+        "calls": calls,
+        "calls_sustained": sustained,
+        "duration_s": round(wall, 2),
+        "cpu_s": round(cpu, 3),
+        # Porcentaje de un núcleo que consume cada llamada simultánea
+        "cpu_per_call_pct": round(cpu / (calls * duration) * 100, 3) if calls else 0.0,
+        "loop_lag_ms": percentiles(lag),
+        "chunk_latency_ms": percentiles(all_latency),
+        "chunks_sent": load["sent"],
+        "chunks_received": received,
+        # Con --vad suppress el silencio no se publica: la diferencia no es pérdida
+        "chunks_lost": load["sent"] - received if vad != "suppress" else None,
+        "max_send_lag_ms": load["max_send_lag_ms"],
+        "vad_events": {k: v for k, v in collector.events.items() if k not in AMI_CALL_EVENTS},
+        "ami_events_emitted": load["ami_emitted"],
+        "ami_call_events_published": ami_published,
+        "ami_latency_ms": percentiles(collector.ami_latency),
+        "echo_bytes_sent": collector.echoed,
+        "echo_bytes_received": load["received_bytes"],
+        "barge_ins": agi.barge_in_latency.count,
+    }
+
+
+def print_report(report: Dict[str, object]):
+    print(f"Llamadas: {report['calls_sustained']}/{report['calls']} sostenidas en {report['duration_s']} s")
+    print(f"CPU: {report['cpu_s']} s ({report['cpu_per_call_pct']} % de un núcleo por llamada)")
+    print(f"Retardo del bucle (ms): {report['loop_lag_ms']}")
+    print(f"Latencia por trama (ms): {report['chunk_latency_ms']} (retraso máximo de envío: "
+          f"{report['max_send_lag_ms']} ms)")
+    lost = report["chunks_lost"]
+    print(f"Tramas: {report['chunks_sent']} enviadas, {report['chunks_received']} recibidas, "
+          + (f"{lost} perdidas" if lost is not None else "pérdida no medible con VAD suppress"))
+    if report["vad_events"]:
+        print(f"Eventos VAD: {report['vad_events']}")
+    print(f"AMI: {report['ami_events_emitted']} eventos emitidos, {report['ami_call_events_published']} eventos de "
+          f"llamada publicados, latencia (ms): {report['ami_latency_ms']}")
+    if report["echo_bytes_sent"]:
+        print(f"Eco: {report['echo_bytes_sent']} bytes devueltos, {report['echo_bytes_received']} reproducidos")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20, help="llamadas AGI simultáneas")
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos de audio por llamada")
+    parser.add_argument("--ramp", type=float, default=1.0, help="segundos para escalonar el inicio de las llamadas")
+    parser.add_argument("--ami-events-per-sec", type=float, default=2000.0, help="ritmo de la tormenta AMI (0 = sin eventos)")
+    parser.add_argument("--vad", choices=("off", "mark", "suppress"), default="mark", help="modo VAD del conector")
+    parser.add_argument("--echo", action="store_true", help="devolver cada trama por outgoing_audio_chunks")
+    parser.add_argument("--in-process", action="store_true", help="generador de carga en el mismo proceso")
+    parser.add_argument("--max-loss", type=float, default=0.001, help="pérdida máxima de una llamada sostenida")
+    parser.add_argument("--max-p99-ms", type=float, default=50.0, help="p99 máximo de una llamada sostenida")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print_report(asyncio.run(run_load(
+        calls=args.calls, duration=args.duration, ramp=args.ramp, ami_events_per_sec=args.ami_events_per_sec,
+        vad=args.vad, echo=args.echo, in_process=args.in_process, max_loss=args.max_loss, max_p99_ms=args.max_p99_ms,
+    )))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del formato de mensajes en RabbitMQ.
+
+Compara el formato anterior (``str(dict)`` en el productor y ``ast.literal_eval`` en el
+consumidor, con el entorno AGI completo en cada trama) con el sobre protobuf de
+common.envelope: bytes por mensaje y coste de codificar/decodificar una trama de audio,
+un evento de llamada y una transcripción.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_envelope.py [--count 100000] [--frame-ms 20]
+"""
+
+import argparse
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from common import envelope
+
+CALL_ID = "SIP/1001-0000002a"
+# Entorno AGI típico de una llamada entrante
+AGI_ENV = {
+    "agi_request": "agi://asterisk_connector:4573", "agi_channel": CALL_ID, "agi_language": "es",
+    "agi_type": "SIP", "agi_uniqueid": "1718031234.42", "agi_version": "18.20.0",
+    "agi_callerid": "1001", "agi_calleridname": "Recepcion", "agi_callingpres": "0",
+    "agi_callingani2": "0", "agi_callington": "0", "agi_callingtns": "0", "agi_dnid": "600",
+    "agi_rdnis": "unknown", "agi_context": "from-internal", "agi_extension": "600",
+    "agi_priority": "2", "agi_enhanced": "0.0", "agi_accountcode": "", "agi_threadid": "140211584681728",
+}
+
+
+def bench(name, encode, decode, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        data = encode()
+    encoded = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(count):
+        decode(data)
+    decoded = time.perf_counter() - start
+    print(f"{name:<34} {len(data):>6} B  enc {encoded / count * 1e6:>6.2f} us  dec {decoded / count * 1e6:>6.2f} us")
+    return len(data)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--count", type=int, default=100000, help="mensajes por caso")
+    ap.add_argument("--frame-ms", type=int, default=20, help="duración de la trama de audio slin 8 kHz")
+    args = ap.parse_args()
+
+    payload = bytes(range(256)) * (args.frame_ms * 16 // 256 + 1)
+    payload = payload[:args.frame_ms * 16]
+    ts = time.time()
+
+    print(f"--- trama de audio ({len(payload)} B de payload) ---")
+    legacy = bench("str(dict) con agi_env", lambda: str({
+        "call_id": CALL_ID, "audio": payload, "format": "pcm", "agi_env": AGI_ENV,
+    }).encode(), lambda d: ast.literal_eval(d.decode()), args.count // 10)
+    binary = bench("envelope AudioChunk", lambda: envelope.encode_audio_chunk(CALL_ID, 1234, ts, payload),
+                   envelope.decode, args.count)
+    print(f"bytes por trama: x{legacy / binary:.2f} menos")
+    bench("envelope CallStart (una vez)", lambda: envelope.encode_call_start(CALL_ID, "slin", 8000, args.frame_ms,
+                                                                              AGI_ENV, "1718031234.42", ts),
+          envelope.decode, args.count // 10)
+
+    print("\n--- evento de llamada ---")
+    bench("str(dict)", lambda: str({"call_id": CALL_ID, "event": "call_ended"}).encode(),
+          lambda d: ast.literal_eval(d.decode()), args.count)
+    bench("envelope CallEvent", lambda: envelope.encode_call_event(CALL_ID, "call_ended", ts), envelope.decode,
+          args.count)
+
+    print("\n--- transcripción ---")
+    text = "El usuario dice: 'Hola, ¿en qué puedo ayudarle?'"
+    bench("str(dict)", lambda: str({"call_id": CALL_ID, "text": text}).encode(),
+          lambda d: ast.literal_eval(d.decode()), args.count)
+    bench("envelope Transcript", lambda: envelope.encode_transcript(CALL_ID, text, True, ts, ts + 1.2),
+          envelope.decode, args.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Sustitutos locales para las pruebas de carga del conector (bench_connector_load.py):
+
+- ``InProcessChannel``: broker en memoria con la interfaz de canal aio-pika que usan
+  AGIServer, AMIClient y AsyncRabbitMQPublisher (``default_exchange.publish``,
+  ``declare_queue`` y ``queue.consume``).
+- ``draining_channel``: ese mismo canal con un consumidor que descarta lo publicado.
+- ``FakeAMIServer``: servidor AMI que acepta Login/Events/Ping y emite tormentas de
+  eventos a partir del ciclo de vida grabado en data/ami_event_storm.txt.
+- ``agi_call``: cliente AGI que envía el entorno AGI y audio slin en tiempo real.
+"""
+
+import asyncio
+import collections
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+STORM_PATH = __file__.rsplit("/", 1)[0] + "/data/ami_event_storm.txt"
+# Valores del ciclo grabado que se sustituyen en cada llamada sintética
+TEMPLATE_CHANNEL = b"SIP/100-0000002a"
+TEMPLATE_UNIQUEID = b"1697630001.84"
+
+
+class InProcessQueue:
+    """Cola del broker en memoria: entrega en orden, desde una única tarea, a su consumidor."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._messages = collections.deque()
+        self._callback: Optional[Callable] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+
+    def put(self, message):
+        self._messages.append(message)
+        self.published += 1
+        self._wakeup.set()
+
+    async def consume(self, callback, no_ack: bool = False):
+        self._callback = callback
+        if self._task is None:
+            self._task = asyncio.create_task(self._deliver())
+
+    async def _deliver(self):
+        while True:
+            while not self._messages:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            message = self._messages.popleft()
+            self.delivered += 1
+            await self._callback(message)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class InProcessExchange:
+    def __init__(self, channel: "InProcessChannel"):
+        self.channel = channel
+
+    async def publish(self, message, routing_key: str):
+        self.channel.queue(routing_key).put(message)
+
+
+class InProcessChannel:
+    """Canal aio-pika mínimo sobre colas en memoria (exchange por defecto: routing_key = cola)."""
+
+    def __init__(self):
+        self.default_exchange = InProcessExchange(self)
+        self.queues: Dict[str, InProcessQueue] = {}
+
+    def queue(self, name: str) -> InProcessQueue:
+        queue = self.queues.get(name)
+        if queue is None:
+            queue = self.queues[name] = InProcessQueue(name)
+        return queue
+
+    async def declare_queue(self, name: str, durable: bool = False, **kwargs) -> InProcessQueue:
+        return self.queue(name)
+
+    async def close(self):
+        for queue in self.queues.values():
+            await queue.close()
+
+
+async def draining_channel() -> InProcessChannel:
+    """
+    Canal en memoria cuyo ``incoming_audio_chunks`` se vacía sin procesar: el broker de
+    cada worker AGI en bench_agi_workers.py (el coste medido es el del conector).
+    """
+    channel = InProcessChannel()
+
+    async def drain(message):
+        pass
+
+    await (await channel.declare_queue("incoming_audio_chunks")).consume(drain, no_ack=True)
+    return channel
+
+
+class FakeAMIServer:
+    """
+    Servidor AMI de pruebas. Tras el Login emite, en ráfagas cada ``tick`` segundos,
+    ciclos de vida de llamada (Newchannel, Newexten, VarSet, Newstate, ..., Hangup) a
+    razón de ``events_per_sec`` eventos por segundo. El Uniqueid de cada ciclo es el
+    instante de emisión, para medir en destino la latencia de los eventos.
+    """
+
+    BANNER = b"Asterisk Call Manager/5.0.0\r\n"
+
+    def __init__(self, events_per_sec: float = 2000.0, tick: float = 0.01, template_path: str = STORM_PATH):
+        with open(template_path, "rb") as f:
+            self.template = f.read().rstrip(b"\r\n") + b"\r\n\r\n"
+        self.events_per_cycle = self.template.count(b"Event:")
+        self.events_per_sec = events_per_sec
+        self.tick = tick
+        self.emitted = 0
+        self.cycles = 0
+        self._server = None
+        self._storms = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for task in list(self._storms):
+            task.cancel()
+        await asyncio.gather(*self._storms, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def cycle(self) -> bytes:
+        """Ciclo de vida de una llamada sintética."""
+        self.cycles += 1
+        channel = b"SIP/load-%08x" % self.cycles
+        return self.template.replace(TEMPLATE_CHANNEL, channel).replace(
+            TEMPLATE_UNIQUEID, b"%.6f" % time.time())
+
+    async def _handle(self, reader, writer):
+        writer.write(self.BANNER)
+        storm = None
+        try:
+            buffer = b""
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                while b"\r\n\r\n" in buffer:
+                    frame, buffer = buffer.split(b"\r\n\r\n", 1)
+                    fields = dict(line.split(b": ", 1) for line in frame.split(b"\r\n") if b": " in line)
+                    action = fields.get(b"Action", b"").lower()
+                    response = b"Response: Success\r\nActionID: %s\r\n" % fields.get(b"ActionID", b"")
+                    if action == b"login":
+                        response += b"Message: Authentication accepted\r\n"
+                        if storm is None and self.events_per_sec > 0:
+                            storm = asyncio.create_task(self._storm(writer))
+                            self._storms.add(storm)
+                    elif action == b"ping":
+                        response += b"Ping: Pong\r\n"
+                    writer.write(response + b"\r\n")
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            if storm is not None:
+                storm.cancel()
+                self._storms.discard(storm)
+            writer.close()
+
+    async def _storm(self, writer):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        while True:
+            due = int((loop.time() - start) * self.events_per_sec / self.events_per_cycle) + 1
+            burst = [self.cycle() for _ in range(due - self.cycles)]
+            if burst:
+                writer.write(b"".join(burst))
+                self.emitted += len(burst) * self.events_per_cycle
+                await writer.drain()
+            await asyncio.sleep(self.tick)
+
+
+def speech_like_frames(frame_ms: int = 20, rate: int = 8000, seconds: float = 3.0) -> list:
+    """Tramas slin de voz sintética: tono modulado 1 s de cada 1,5 s y ruido de fondo."""
+    rng = np.random.default_rng(7)
+    t = np.arange(int(rate * seconds)) / rate
+    voiced = (t % 1.5) < 1.0
+    signal = voiced * 6000 * np.sin(2 * np.pi * 180 * t) * (1 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    pcm = np.clip(signal + rng.normal(0, 60, t.size), -32768, 32767).astype("<i2").tobytes()
+    size = rate * frame_ms // 1000 * 2
+    return [pcm[i:i + size] for i in range(0, len(pcm) - size + 1, size)]
+
+
+async def agi_call(port: int, call_id: str, duration: float, frames: list, frame_ms: int = 20,
+                   host: str = "127.0.0.1") -> Dict[str, float]:
+    """
+    Llamada AGI simulada: envía el entorno AGI (con el instante de inicio en
+    ``agi_arg_1``) y tramas de ``frame_ms`` a ritmo real con reloj absoluto, mientras
+    cuenta el audio saliente recibido. La trama ``seq`` se envía en ``t0 + seq * frame_ms``.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    loop = asyncio.get_running_loop()
+    received = 0
+
+    async def read_outgoing():
+        nonlocal received
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            received += len(data)
+
+    reader_task = asyncio.create_task(read_outgoing())
+    t0 = time.time()
+    writer.write(f"agi_channel: {call_id}\nagi_uniqueid: {t0:.6f}\nagi_arg_1: {t0:.6f}\n\n".encode())
+    count = int(duration * 1000 / frame_ms)
+    start = loop.time()
+    late = 0.0
+    for seq in range(count):
+        delay = start + seq * frame_ms / 1000 - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            late = max(late, -delay)
+        writer.write(frames[seq % len(frames)])
+        await writer.drain()
+    writer.write_eof()
+    try:
+        await asyncio.wait_for(reader_task, timeout=2)
+    except asyncio.TimeoutError:
+        reader_task.cancel()
+    writer.close()
+    return {"sent": count, "received_bytes": received, "max_send_lag_ms": late * 1000}
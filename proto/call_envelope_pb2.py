@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: call_envelope.proto
+# Protobuf Python Version: 6.31.0
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    6,
+    31,
+    0,
+    '',
+    'call_envelope.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x13\x63\x61ll_envelope.proto\x12\rcall_envelope\"\x94\x02\n\x08\x45nvelope\x12\x0f\n\x07version\x18\x01 \x01(\r\x12.\n\ncall_start\x18\x02 \x01(\x0b\x32\x18.call_envelope.CallStartH\x00\x12\x30\n\x0b\x61udio_chunk\x18\x03 \x01(\x0b\x32\x19.call_envelope.AudioChunkH\x00\x12.\n\ncall_event\x18\x04 \x01(\x0b\x32\x18.call_envelope.CallEventH\x00\x12/\n\ntranscript\x18\x05 \x01(\x0b\x32\x19.call_envelope.TranscriptH\x00\x12,\n\x05speak\x18\x06 \x01(\x0b\x32\x1b.call_envelope.SpeakRequestH\x00\x42\x06\n\x04\x62ody\"\xe3\x01\n\tCallStart\x12\x0f\n\x07\x63\x61ll_id\x18\x01 \x01(\t\x12\x10\n\x08uniqueid\x18\x02 \x01(\t\x12\x14\n\x0c\x61udio_format\x18\x03 \x01(\t\x12\x13\n\x0bsample_rate\x18\x04 \x01(\r\x12\x10\n\x08\x66rame_ms\x18\x05 \x01(\r\x12\x10\n\x08start_ts\x18\x06 \x01(\x01\x12\x35\n\x07\x61gi_env\x18\x07 \x03(\x0b\x32$.call_envelope.CallStart.AgiEnvEntry\x1a-\n\x0b\x41giEnvEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"`\n\nAudioChunk\x12\x0f\n\x07\x63\x61ll_id\x18\x01 \x01(\t\x12\x0b\n\x03seq\x18\x02 \x01(\x04\x12\x12\n\ncapture_ts\x18\x03 \x01(\x01\x12\x0f\n\x07payload\x18\x04 \x01(\x0c\x12\x0f\n\x07silence\x18\x05 \x01(\x08\"\x9c\x01\n\tCallEvent\x12\x0f\n\x07\x63\x61ll_id\x18\x01 \x01(\t\x12\r\n\x05\x65vent\x18\x02 \x01(\t\x12\n\n\x02ts\x18\x03 \x01(\x01\x12\x34\n\x06\x66ields\x18\x04 \x03(\x0b\x32$.call_envelope.CallEvent.FieldsEntry\x1a-\n\x0b\x46ieldsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"_\n\nTranscript\x12\x0f\n\x07\x63\x61ll_id\x18\x01 \x01(\t\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x10\n\x08is_final\x18\x03 \x01(\x08\x12\x10\n\x08start_ts\x18\x04 \x01(\x01\x12\x0e\n\x06\x65nd_ts\x18\x05 \x01(\x01\"\x82\x01\n\x0cSpeakRequest\x12\x0f\n\x07\x63\x61ll_id\x18\x01 \x01(\t\x12\x14\n\x0cutterance_id\x18\x02 \x01(\t\x12\x0c\n\x04text\x18\x03 \x01(\t\x12\x15\n\rlanguage_code\x18\x04 \x01(\t\x12\x12\n\nvoice_name\x18\x05 \x01(\t\x12\x12\n\nrequest_ts\x18\x06 \x01(\x01\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'call_envelope_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_CALLSTART_AGIENVENTRY']._loaded_options = None
+  _globals['_CALLSTART_AGIENVENTRY']._serialized_options = b'8\001'
+  _globals['_CALLEVENT_FIELDSENTRY']._loaded_options = None
+  _globals['_CALLEVENT_FIELDSENTRY']._serialized_options = b'8\001'
+  _globals['_ENVELOPE']._serialized_start=39
+  _globals['_ENVELOPE']._serialized_end=315
+  _globals['_CALLSTART']._serialized_start=318
+  _globals['_CALLSTART']._serialized_end=545
+  _globals['_CALLSTART_AGIENVENTRY']._serialized_start=500
+  _globals['_CALLSTART_AGIENVENTRY']._serialized_end=545
+  _globals['_AUDIOCHUNK']._serialized_start=547
+  _globals['_AUDIOCHUNK']._serialized_end=643
+  _globals['_CALLEVENT']._serialized_start=646
+  _globals['_CALLEVENT']._serialized_end=802
+  _globals['_CALLEVENT_FIELDSENTRY']._serialized_start=757
+  _globals['_CALLEVENT_FIELDSENTRY']._serialized_end=802
+  _globals['_TRANSCRIPT']._serialized_start=804
+  _globals['_TRANSCRIPT']._serialized_end=899
+  _globals['_SPEAKREQUEST']._serialized_start=902
+  _globals['_SPEAKREQUEST']._serialized_end=1032
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: stt_tts_service.proto
+# Protobuf Python Version: 6.31.0
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    6,
+    31,
+    0,
+    '',
+    'stt_tts_service.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x15stt_tts_service.proto\x12\x0fstt_tts_service\"r\n\x18SpeechRecognitionRequest\x12\x0f\n\x07\x63\x61ll_id\x18\x01 \x01(\t\x12\x13\n\x0b\x61udio_chunk\x18\x02 \x01(\x0c\x12\x15\n\rlanguage_code\x18\x03 \x01(\t\x12\x19\n\x11\x66inal_recognition\x18\x04 \x01(\x08\"R\n\x19SpeechRecognitionResponse\x12\x0f\n\x07\x63\x61ll_id\x18\x01 \x01(\t\x12\x12\n\ntranscript\x18\x02 \x01(\t\x12\x10\n\x08is_final\x18\x03 \x01(\x08\"b\n\x10SynthesisRequest\x12\x0f\n\x07\x63\x61ll_id\x18\x01 \x01(\t\x12\x12\n\ntext_input\x18\x02 \x01(\t\x12\x15\n\rlanguage_code\x18\x03 \x01(\t\x12\x12\n\nvoice_name\x18\x04 \x01(\t\"K\n\x11SynthesisResponse\x12\x0f\n\x07\x63\x61ll_id\x18\x01 \x01(\t\x12\x13\n\x0b\x61udio_chunk\x18\x02 \x01(\x0c\x12\x10\n\x08is_final\x18\x03 \x01(\x08\x32\xdc\x01\n\rSttTtsService\x12l\n\x0fRecognizeSpeech\x12).stt_tts_service.SpeechRecognitionRequest\x1a*.stt_tts_service.SpeechRecognitionResponse(\x01\x30\x01\x12]\n\x10SynthesizeSpeech\x12!.stt_tts_service.SynthesisRequest\x1a\".stt_tts_service.SynthesisResponse(\x01\x30\x01\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'stt_tts_service_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_SPEECHRECOGNITIONREQUEST']._serialized_start=42
+  _globals['_SPEECHRECOGNITIONREQUEST']._serialized_end=156
+  _globals['_SPEECHRECOGNITIONRESPONSE']._serialized_start=158
+  _globals['_SPEECHRECOGNITIONRESPONSE']._serialized_end=240
+  _globals['_SYNTHESISREQUEST']._serialized_start=242
+  _globals['_SYNTHESISREQUEST']._serialized_end=340
+  _globals['_SYNTHESISRESPONSE']._serialized_start=342
+  _globals['_SYNTHESISRESPONSE']._serialized_end=417
+  _globals['_STTTTSSERVICE']._serialized_start=420
+  _globals['_STTTTSSERVICE']._serialized_end=640
+# @@protoc_insertion_point(module_scope)
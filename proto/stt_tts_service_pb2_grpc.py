@@ -0,0 +1,145 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+import warnings
+
+import stt_tts_service_pb2 as stt__tts__service__pb2
+
+GRPC_GENERATED_VERSION = '1.73.1'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
+
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
+
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + f' but the generated code in stt_tts_service_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
+
+
+class SttTtsServiceStub(object):
+    """Servicio para Speech-to-Text y Text-to-Speech
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.RecognizeSpeech = channel.stream_stream(
+                '/stt_tts_service.SttTtsService/RecognizeSpeech',
+                request_serializer=stt__tts__service__pb2.SpeechRecognitionRequest.SerializeToString,
+                response_deserializer=stt__tts__service__pb2.SpeechRecognitionResponse.FromString,
+                _registered_method=True)
+        self.SynthesizeSpeech = channel.stream_stream(
+                '/stt_tts_service.SttTtsService/SynthesizeSpeech',
+                request_serializer=stt__tts__service__pb2.SynthesisRequest.SerializeToString,
+                response_deserializer=stt__tts__service__pb2.SynthesisResponse.FromString,
+                _registered_method=True)
+
+
+class SttTtsServiceServicer(object):
+    """Servicio para Speech-to-Text y Text-to-Speech
+    """
+
+    def RecognizeSpeech(self, request_iterator, context):
+        """Stream de audio para transcripción (STT)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SynthesizeSpeech(self, request_iterator, context):
+        """Stream de texto para generar audio (TTS)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_SttTtsServiceServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'RecognizeSpeech': grpc.stream_stream_rpc_method_handler(
+                    servicer.RecognizeSpeech,
+                    request_deserializer=stt__tts__service__pb2.SpeechRecognitionRequest.FromString,
+                    response_serializer=stt__tts__service__pb2.SpeechRecognitionResponse.SerializeToString,
+            ),
+            'SynthesizeSpeech': grpc.stream_stream_rpc_method_handler(
+                    servicer.SynthesizeSpeech,
+                    request_deserializer=stt__tts__service__pb2.SynthesisRequest.FromString,
+                    response_serializer=stt__tts__service__pb2.SynthesisResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'stt_tts_service.SttTtsService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('stt_tts_service.SttTtsService', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class SttTtsService(object):
+    """Servicio para Speech-to-Text y Text-to-Speech
+    """
+
+    @staticmethod
+    def RecognizeSpeech(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/stt_tts_service.SttTtsService/RecognizeSpeech',
+            stt__tts__service__pb2.SpeechRecognitionRequest.SerializeToString,
+            stt__tts__service__pb2.SpeechRecognitionResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def SynthesizeSpeech(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/stt_tts_service.SttTtsService/SynthesizeSpeech',
+            stt__tts__service__pb2.SynthesisRequest.SerializeToString,
+            stt__tts__service__pb2.SynthesisResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,110 @@
+import asyncio
+import math
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+class PendingAction:
+    """Acción AMI en vuelo a la espera de su respuesta (y, si es una lista, de sus eventos)."""
+
+    __slots__ = ("action_id", "future", "deadline", "slot", "response", "events")
+
+    def __init__(self, action_id: str, future: asyncio.Future):
+        self.action_id = action_id
+        self.future = future
+        self.deadline = 0.0
+        self.slot: Optional[int] = None
+        self.response: Optional[Dict[str, Any]] = None
+        self.events: List[Dict[str, Any]] = []
+
+    def feed(self, data: Dict[str, Any]) -> bool:
+        """
+        Incorpora una trama con el ActionID de la acción. Devuelve True cuando la acción
+        está completa: una respuesta simple, o el evento ``EventList: Complete`` de una
+        respuesta multi-evento (``EventList: start``).
+        """
+        if "Event" in data:
+            if data.get("EventList", "").lower() == "complete":
+                return True
+            self.events.append(data)
+            return False
+        self.response = data
+        return data.get("EventList", "").lower() != "start"
+
+    def result(self) -> Dict[str, Any]:
+        response = dict(self.response or {})
+        if self.events or response.get("EventList", "").lower() == "start":
+            response["events"] = self.events
+        return response
+
+
+class TimeoutWheel:
+    """
+    Rueda de temporizadores compartida por todas las acciones en vuelo.
+
+    En lugar de un ``asyncio.wait_for`` (y su temporizador) por acción, cada acción se
+    coloca en la ranura correspondiente a su vencimiento y un único ``call_later``
+    avanza la rueda cada ``resolution`` segundos mientras haya algo pendiente.
+    """
+
+    def __init__(self, on_expire: Callable[[Any], None], resolution: float = 0.1, slots: int = 128):
+        self.on_expire = on_expire
+        self.resolution = resolution
+        self._slots: List[Set[Any]] = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._count = 0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        # Instante (reloj del bucle) del próximo avance de la rueda
+        self._next_tick_at = 0.0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, item, timeout: float):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        item.deadline = now + timeout
+        if self._handle is None:
+            self._schedule(loop, now)
+        # La ranura se cuenta desde el próximo avance, no desde ahora: parte del tick en
+        # curso ya ha pasado. Así la ranura se alcanza en su vencimiento o justo después
+        ticks = 1 + max(0, math.ceil((item.deadline - self._next_tick_at) / self.resolution))
+        index = (self._cursor + ticks) % len(self._slots)
+        self._slots[index].add(item)
+        item.slot = index
+        self._count += 1
+
+    def _schedule(self, loop, now: float):
+        self._next_tick_at = now + self.resolution
+        self._handle = loop.call_later(self.resolution, self._tick)
+
+    def discard(self, item):
+        if item.slot is None:
+            return
+        self._slots[item.slot].discard(item)
+        item.slot = None
+        self._count -= 1
+        if not self._count and self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _tick(self):
+        loop = asyncio.get_running_loop()
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        slot = self._slots[self._cursor]
+        if slot:
+            # Los que no han vencido dan otra vuelta (timeouts mayores que la rueda)
+            horizon = loop.time() + self.resolution / 2
+            for item in [i for i in slot if i.deadline <= horizon]:
+                slot.discard(item)
+                item.slot = None
+                self._count -= 1
+                self.on_expire(item)
+        if self._count:
+            self._schedule(loop, loop.time())
+        else:
+            self._handle = None
+
+    def cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
@@ -1,41 +1,89 @@
 import asyncio
+import collections
 import logging
 import os
-from typing import Any, Dict, Optional
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set
 
-import pika
+import aio_pika
 
-from .rabbitmq_publisher import RabbitMQPublisher
+from common import envelope, metrics
+from common.backoff import Backoff
+
+from .ami_actions import PendingAction, TimeoutWheel
+from .ami_events import DROP_OLDEST, AMIEventDispatcher
+from .ami_parser import AMIFrameParser, parse_ami_message
+from .rabbitmq_publisher import AsyncRabbitMQPublisher, RabbitMQPublisher
+
+
+# Campos del evento AMI que acompañan a los eventos de llamada publicados
+EVENT_FIELDS = ("Uniqueid", "Linkedid", "CallerIDNum", "Exten", "Cause", "Cause-txt")
+
+AMI_PARSE_SECONDS = metrics.REGISTRY.histogram("ami_frame_parse_seconds",
+                                               "Tiempo de parseo de cada segmento TCP recibido del AMI")
+AMI_FRAMES = metrics.REGISTRY.counter("ami_frames_total", "Tramas AMI recibidas")
+AMI_ACTION_SECONDS = metrics.REGISTRY.histogram("ami_action_roundtrip_seconds",
+                                                "Tiempo desde el envío de una acción AMI hasta su respuesta", ("action",))
+AMI_CONNECTED = metrics.REGISTRY.gauge("ami_connected", "Cliente AMI conectado y autenticado")
+AMI_RECONNECTS = metrics.REGISTRY.counter("ami_reconnects_total", "Reconexiones al AMI tras perder la conexión")
+AMI_RECOVERY_SECONDS = metrics.REGISTRY.histogram(
+    "ami_recovery_seconds", "Tiempo desde la pérdida de la conexión AMI hasta completar la resincronización",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0))
+AMI_RESYNC_CALLS = metrics.REGISTRY.counter("ami_resync_calls_total",
+                                            "Llamadas reconciliadas al resincronizar tras el login", ("change",))
+
+# Acciones de listado con que se reconstruye el estado de los canales tras el login
+RESYNC_ACTIONS = ("CoreShowChannels", "Status")
+# Campos de los listados que se copian a los eventos sintéticos de la resincronización
+RESYNC_FIELDS = ("Channel", "Uniqueid", "Linkedid", "ChannelState", "ChannelStateDesc", "CallerIDNum",
+                 "CallerIDName", "Context", "Exten")
 
 
 class AMIClientProtocol(asyncio.Protocol):
     def __init__(self, client):
         self.client = client
         self.transport = None
-        self.buffer = ""
+        self.parser = AMIFrameParser(getattr(client, "field_whitelist", None))
+        self._outbox: List[bytes] = []
+        self._flush_scheduled = False
 
     def connection_made(self, transport):
         self.transport = transport
         logging.info("AMI: Conexión establecida con el servidor AMI.")
+        # El login sale antes de que create_connection devuelva el protocolo a connect()
+        self.client.transport = transport
+        self.client.protocol = self
         asyncio.create_task(self.client.authenticate())
 
     def data_received(self, data):
-        text = data.decode(errors="replace")
-        self.buffer += text
-        while "\r\n\r\n" in self.buffer:
-            msg, self.buffer = self.buffer.split("\r\n\r\n", 1)
-            asyncio.create_task(self.client.handle_message(msg))
+        start = time.perf_counter()
+        frames = self.parser.feed(data)
+        AMI_PARSE_SECONDS.observe(time.perf_counter() - start)
+        if frames:
+            AMI_FRAMES.inc(len(frames))
+            self.client.feed_frames(frames)
 
     def connection_lost(self, exc):
         logging.warning("AMI: Conexión perdida con el servidor AMI.")
         asyncio.create_task(self.client.on_connection_lost(exc))
 
     def send(self, data: str):
+        """Encola una acción; todas las enviadas en la misma iteración del bucle salen en una sola escritura."""
         if self.transport:
-            self.transport.write(data.encode())
+            self._outbox.append(data.encode())
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if self.transport and self._outbox:
+            self.transport.write(b"".join(self._outbox))
+        self._outbox.clear()
 
 class AMIClient:
-    def __init__(self, loop=None, publisher=None):
+    def __init__(self, loop=None, publisher=None, field_whitelist: Optional[Mapping[str, Iterable[str]]] = None,
+                 event_queue_size: Optional[int] = None):
         self.host = os.getenv("ASTERISK_HOST", "127.0.0.1")
         self.port = int(os.getenv("ASTERISK_AMI_PORT", "5038"))
         self.username = os.getenv("ASTERISK_AMI_USER", "admin")
@@ -43,13 +91,39 @@ class AMIClient:
         self.loop = loop or asyncio.get_event_loop()
         self.protocol: Optional[AMIClientProtocol] = None
         self.transport = None
-        self.event_queue: asyncio.Queue = asyncio.Queue()
+        # Tramas recibidas pendientes de procesar, en orden y por una sola tarea
+        self._inbound = collections.deque()
+        self._inbound_task: Optional[asyncio.Task] = None
+        self._inbound_high_watermark = int(os.getenv("AMI_INBOUND_HIGH_WATERMARK", "5000"))
+        self._paused_by: Set[str] = set()
         self._connected = asyncio.Event()
         self._authenticated = asyncio.Event()
-        self._reconnect_delay = 3
+        self._connection_lost = asyncio.Event()
+        self._connecting = False
+        # Suscripciones a eventos; la máscara Events del login se deriva de ellas
+        self.events = AMIEventDispatcher(on_change=self._on_subscriptions_changed)
+        self._event_mask: Optional[str] = None
+        # Cola general (acotada) para get_event; con tamaño 0 se desactiva y la máscara se acota
+        if event_queue_size is None:
+            event_queue_size = int(os.getenv("AMI_EVENT_QUEUE_SIZE", "1000"))
+        self._catch_all = self.events.subscribe(maxsize=event_queue_size, policy=DROP_OLDEST) if event_queue_size > 0 else None
+        self.event_queue: Optional[asyncio.Queue] = self._catch_all.queue if self._catch_all else None
+        # Reintentos: el primero inmediato, después exponencial con jitter
+        self.backoff = Backoff(float(os.getenv("AMI_RECONNECT_BASE", "0.5")), float(os.getenv("AMI_RECONNECT_MAX", "30")))
+        self.login_timeout = float(os.getenv("AMI_LOGIN_TIMEOUT", "10"))
+        # Resincronización tras el login: canales vivos conocidos (Uniqueid -> Channel)
+        self.resync_enabled = os.getenv("AMI_RESYNC", "1") not in ("0", "false", "no")
+        self.live_channels: Dict[str, str] = {}
+        self._resync_hangups: Optional[Set[str]] = None
+        self._disconnected_at: Optional[float] = None
         self._action_id = 0
-        self._pending_actions = {}
+        # Acciones en vuelo por ActionID, acotadas y con una única rueda de timeouts
+        self._pending_actions: Dict[str, PendingAction] = {}
+        self._action_slots = asyncio.Semaphore(int(os.getenv("AMI_MAX_IN_FLIGHT", "256")))
+        self._timeouts = TimeoutWheel(self._expire_action)
         self._running = False
+        # Campos a conservar por tipo de evento (None = todos)
+        self.field_whitelist = field_whitelist
 
         # RabbitMQ connection setup
         self.rabbitmq_host = os.getenv("RABBITMQ_HOST", "localhost")
@@ -57,44 +131,105 @@ class AMIClient:
         self.rabbitmq_pass = os.getenv("RABBITMQ_PASS", "guest")
         self.rabbitmq_conn = None
         self.rabbitmq_channel = None
-        self._setup_rabbitmq()
-        # Publisher desacoplado
-        if publisher is not None:
-            self.publisher = publisher
-        elif self.rabbitmq_channel is not None:
-            self.publisher = RabbitMQPublisher(self.rabbitmq_channel)
-        else:
-            self.publisher = None
+        # Publisher desacoplado (si no se inyecta, se crea al conectar)
+        self._publisher = publisher
+        self._backpressure_task: Optional[asyncio.Task] = None
+        self.events.subscribe(("Newchannel", "Hangup"), handler=self.process_ami_events)
+        self.events.subscribe(("Newchannel", "Rename", "Hangup"), handler=self._track_channel)
+
+    @property
+    def publisher(self):
+        if self._publisher is None and self.rabbitmq_channel is not None:
+            # Un canal síncrono (pika o el de los tests) publica directamente; uno aio-pika, en lotes
+            if hasattr(self.rabbitmq_channel, "basic_publish"):
+                self._publisher = RabbitMQPublisher(self.rabbitmq_channel)
+            else:
+                self._publisher = AsyncRabbitMQPublisher(self.rabbitmq_channel, name="ami")
+        return self._publisher
+
+    @publisher.setter
+    def publisher(self, publisher):
+        self._publisher = publisher
 
-    def _setup_rabbitmq(self):
-        credentials = pika.PlainCredentials(self.rabbitmq_user, self.rabbitmq_pass)
-        parameters = pika.ConnectionParameters(host=self.rabbitmq_host, credentials=credentials)
+    async def _setup_rabbitmq(self):
+        url = f"amqp://{self.rabbitmq_user}:{self.rabbitmq_pass}@{self.rabbitmq_host}/"
         try:
-            self.rabbitmq_conn = pika.BlockingConnection(parameters)
-            self.rabbitmq_channel = self.rabbitmq_conn.channel()
-            self.rabbitmq_channel.queue_declare(queue='incoming_audio_chunks', durable=True)
+            self.rabbitmq_conn = await aio_pika.connect_robust(url)
+            self.rabbitmq_channel = await self.rabbitmq_conn.channel(publisher_confirms=True)
+            await self.rabbitmq_channel.declare_queue('incoming_audio_chunks', durable=True)
         except Exception as e:
             logging.error(f"AMI: Error conectando a RabbitMQ: {e}")
             self.rabbitmq_conn = None
             self.rabbitmq_channel = None
 
     async def connect(self):
+        """
+        Conecta y se autentica, reintentando con ``backoff`` hasta lograrlo (o hasta ``close``),
+        y después resincroniza el estado de los canales. Sólo hay un connect() en curso a la
+        vez: si la conexión se pierde mientras tanto, es él quien vuelve a intentarlo.
+        """
         self._running = True
-        while self._running:
-            try:
-                logging.info(f"AMI: Intentando conectar a {self.host}:{self.port}")
-                transport, protocol = await self.loop.create_connection(
-                    lambda: AMIClientProtocol(self), self.host, self.port
-                )
-                self.transport = transport
-                self.protocol = protocol
-                await self._connected.wait()
-                await self._authenticated.wait()
-                logging.info("AMI: Cliente autenticado y listo.")
-                break
-            except Exception as e:
-                logging.error(f"AMI: Error de conexión: {e}. Reintentando en {self._reconnect_delay}s...")
-                await asyncio.sleep(self._reconnect_delay)
+        if self._connecting:
+            return
+        self._connecting = True
+        try:
+            if self._publisher is None and self.rabbitmq_channel is None:
+                await self._setup_rabbitmq()
+            attempt = 0
+            while self._running:
+                if not self._authenticated.is_set():
+                    delay = self.backoff.delay(attempt)
+                    attempt += 1
+                    if delay > 0:
+                        logging.warning(f"AMI: Reintentando conexión en {delay:.2f}s (intento {attempt})")
+                        await asyncio.sleep(delay)
+                        if not self._running:
+                            break
+                    try:
+                        logging.info(f"AMI: Intentando conectar a {self.host}:{self.port}")
+                        self._connection_lost.clear()
+                        transport, protocol = await self.loop.create_connection(
+                            lambda: AMIClientProtocol(self), self.host, self.port
+                        )
+                        self.transport = transport
+                        self.protocol = protocol
+                        if not await self._wait_login():
+                            continue
+                        logging.info("AMI: Cliente autenticado y listo.")
+                        attempt = 0
+                    except Exception as e:
+                        logging.error(f"AMI: Error de conexión: {e}")
+                        continue
+                await self._after_login()
+                # Conexión perdida durante la resincronización: se reintenta
+                if self._authenticated.is_set():
+                    break
+        finally:
+            self._connecting = False
+
+    async def _wait_login(self) -> bool:
+        """Espera al login o a que la conexión se pierda antes; True si quedó autenticado."""
+        waiters = [asyncio.ensure_future(self._authenticated.wait()), asyncio.ensure_future(self._connection_lost.wait())]
+        try:
+            await asyncio.wait(waiters, timeout=self.login_timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        if not self._authenticated.is_set() and not self._connection_lost.is_set():
+            logging.error(f"AMI: Sin login tras {self.login_timeout}s; se cierra la conexión")
+            if self.transport:
+                self.transport.close()
+        return self._authenticated.is_set()
+
+    async def _after_login(self):
+        AMI_CONNECTED.set(1)
+        summary = await self.resync() if self.resync_enabled else None
+        if self._disconnected_at is not None and self._authenticated.is_set():
+            recovery = time.monotonic() - self._disconnected_at
+            self._disconnected_at = None
+            AMI_RECONNECTS.inc()
+            AMI_RECOVERY_SECONDS.observe(recovery)
+            logging.info(f"AMI: Recuperado en {recovery:.2f}s" + (f"; resincronización: {summary}" if summary else ""))
 
     async def authenticate(self):
         self._connected.set()
@@ -102,19 +237,34 @@ class AMIClient:
             "Action": "Login",
             "Username": self.username,
             "Secret": self.password,
-            "Events": "on"
+            "Events": self.events.event_mask()
         }
-        resp = await self.send_action(action, wait_response=True)
+        self._event_mask = action["Events"]
+        try:
+            resp = await self.send_action(action, wait_response=True)
+        except RuntimeError as e:
+            # La conexión se perdió antes de enviar el Login; connect() reintenta
+            logging.error(f"AMI: Login no enviado: {e}")
+            return
         if resp and resp.get("Response", "") == "Success":
             logging.info("AMI: Autenticación exitosa.")
             self._authenticated.set()
         else:
+            # Sin respuesta (socket cerrado, timeout) o rechazado: se cierra sólo esta conexión
+            # y connect() vuelve a intentarlo con backoff; close() queda para el apagado
             logging.error(f"AMI: Fallo de autenticación: {resp}")
             self._authenticated.clear()
-            await self.close()
+            if self.transport:
+                self.transport.close()
 
     async def send_action(self, action_dict: Dict[str, Any], wait_response: bool = False, timeout: float = 5.0) -> Optional[Dict[str, Any]]:
-        """Envía una acción AMI. Si wait_response=True, espera la respuesta y la retorna."""
+        """
+        Envía una acción AMI. Si wait_response=True, espera la respuesta y la retorna.
+
+        Las acciones se encadenan sobre el único socket AMI sin esperar a las anteriores
+        (hasta AMI_MAX_IN_FLIGHT en vuelo). Si la respuesta es una lista (``EventList: start``)
+        se devuelve al completarse, con sus eventos en la clave ``events``.
+        """
         if not self.protocol:
             raise RuntimeError("AMI: No conectado.")
         self._action_id += 1
@@ -122,44 +272,120 @@ class AMIClient:
         action_dict["ActionID"] = action_id
         lines = [f"{k}: {v}" for k, v in action_dict.items()]
         msg = "\r\n".join(lines) + "\r\n\r\n"
-        fut = None
-        if wait_response:
-            fut = self.loop.create_future()
-            self._pending_actions[action_id] = fut
-        self.protocol.send(msg)
-        if wait_response:
+        if not wait_response:
+            self.protocol.send(msg)
+            return None
+        async with self._action_slots:
+            pending = PendingAction(action_id, self.loop.create_future())
+            self._pending_actions[action_id] = pending
+            self._timeouts.add(pending, timeout)
+            started = time.perf_counter()
+            self.protocol.send(msg)
             try:
-                resp = await asyncio.wait_for(fut, timeout=timeout)
-                return resp
+                response = await pending.future
+                AMI_ACTION_SECONDS.labels(action_dict.get("Action", "")).observe(time.perf_counter() - started)
+                return response
             except asyncio.TimeoutError:
                 logging.error(f"AMI: Timeout esperando respuesta para ActionID {action_id}")
                 return None
+            except ConnectionError as e:
+                logging.error(f"AMI: Acción {action_id} abortada: {e}")
+                return None
             finally:
                 self._pending_actions.pop(action_id, None)
-        return None
+                self._timeouts.discard(pending)
+
+    async def send_actions(self, actions: List[Dict[str, Any]], timeout: float = 5.0) -> List[Optional[Dict[str, Any]]]:
+        """Envía varias acciones en pipeline y devuelve sus respuestas en el mismo orden."""
+        return await asyncio.gather(*(self.send_action(a, wait_response=True, timeout=timeout) for a in actions))
+
+    def _expire_action(self, pending: PendingAction):
+        if not pending.future.done():
+            pending.future.set_exception(asyncio.TimeoutError())
+
+    def _fail_pending_actions(self, exc: Exception):
+        for pending in list(self._pending_actions.values()):
+            if not pending.future.done():
+                pending.future.set_exception(exc)
+
+    async def hangup(self, channel: str, cause: int = 16) -> Optional[Dict[str, Any]]:
+        return await self.send_action({"Action": "Hangup", "Channel": channel, "Cause": cause}, wait_response=True)
+
+    async def originate(self, channel: str, context: Optional[str] = None, exten: Optional[str] = None, priority: int = 1,
+                        application: Optional[str] = None, data: Optional[str] = None, caller_id: Optional[str] = None,
+                        variables: Optional[Dict[str, str]] = None, timeout_ms: int = 30000) -> Optional[Dict[str, Any]]:
+        """Origina una llamada hacia ``channel`` con destino dialplan (context/exten) o aplicación."""
+        action: Dict[str, Any] = {"Action": "Originate", "Channel": channel, "Timeout": timeout_ms, "Async": "true"}
+        if application:
+            action["Application"] = application
+            if data is not None:
+                action["Data"] = data
+        else:
+            action.update({"Context": context, "Exten": exten, "Priority": priority})
+        if caller_id:
+            action["CallerID"] = caller_id
+        if variables:
+            action["Variable"] = ",".join(f"{k}={v}" for k, v in variables.items())
+        return await self.send_action(action, wait_response=True)
+
+    async def redirect(self, channel: str, context: str, exten: str, priority: int = 1,
+                       extra_channel: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        action: Dict[str, Any] = {"Action": "Redirect", "Channel": channel, "Context": context, "Exten": exten, "Priority": priority}
+        if extra_channel:
+            action.update({"ExtraChannel": extra_channel, "ExtraContext": context, "ExtraExten": exten, "ExtraPriority": priority})
+        return await self.send_action(action, wait_response=True)
+
+    async def setvar(self, channel: str, variable: str, value: str) -> Optional[Dict[str, Any]]:
+        return await self.send_action({"Action": "Setvar", "Channel": channel, "Variable": variable, "Value": value}, wait_response=True)
 
     async def handle_message(self, msg: str):
-        # Parse AMI message into dict
-        lines = msg.split("\r\n")
-        data = {}
-        for line in lines:
-            if ":" in line:
-                k, v = line.split(":", 1)
-                data[k.strip()] = v.strip()
-
-        if "ActionID" in data and data["ActionID"] in self._pending_actions:
-            fut = self._pending_actions[data["ActionID"]]
-            if not fut.done():
-                fut.set_result(data)
+        await self.handle_frame(parse_ami_message(msg))
+
+    def feed_frames(self, frames: List[Dict[str, str]]):
+        """Encola tramas recibidas; una única tarea las procesa en orden."""
+        self._inbound.extend(frames)
+        if self._inbound_task is None:
+            self._inbound_task = asyncio.get_running_loop().create_task(self._drain_inbound())
+        if len(self._inbound) > self._inbound_high_watermark:
+            self._pause_reading("inbound")
+
+    async def _drain_inbound(self):
+        inbound = self._inbound
+        try:
+            while inbound:
+                data = inbound.popleft()
+                try:
+                    await self.handle_frame(data)
+                except Exception as e:
+                    logging.error(f"AMI: Error procesando trama {data.get('Event') or data.get('Response')}: {e}")
+                if "inbound" in self._paused_by and len(inbound) <= self._inbound_high_watermark // 2:
+                    self._resume_reading("inbound")
+        finally:
+            self._inbound_task = None
+
+    async def handle_frame(self, data: Dict[str, str]):
+        pending = self._pending_actions.get(data["ActionID"]) if "ActionID" in data else None
+        if pending is not None:
+            if pending.feed(data) and not pending.future.done():
+                pending.future.set_result(pending.result())
         elif "Event" in data:
-            await self.process_ami_events(data)
-            await self.event_queue.put(data)
-            logging.info(f"AMI: Evento recibido: {data.get('Event')}")
+            await self.events.dispatch(data)
+            logging.debug(f"AMI: Evento recibido: {data.get('Event')}")
         else:
             # Mensaje no identificado
-            await self.event_queue.put(data)
+            if self._catch_all is not None:
+                await self._catch_all.deliver(data)
             logging.info(f"AMI: Mensaje recibido: {data}")
 
+    def _on_subscriptions_changed(self):
+        """Ajusta en caliente la máscara de eventos del servidor AMI a las suscripciones activas."""
+        if not self._authenticated.is_set() or self.protocol is None:
+            return
+        mask = self.events.event_mask()
+        if mask != self._event_mask:
+            self._event_mask = mask
+            self.loop.create_task(self.send_action({"Action": "Events", "EventMask": mask}))
+
     async def process_ami_events(self, data):
         """
         Procesa eventos AMI y publica en RabbitMQ usando el publisher desacoplado.
@@ -169,41 +395,179 @@ class AMIClient:
         if not call_id:
             logging.warning("No se encontró Channel en el evento AMI; no se puede establecer call_id único para la llamada.")
             return
-        if not self.publisher:
+        # Ojo: el publisher asíncrono con el buffer vacío es falsy (__len__)
+        if self.publisher is None:
             logging.warning("No hay publisher de RabbitMQ disponible.")
             return
         if event_type == "Newchannel":
             logging.info(f"AMI: Nueva llamada iniciada para call_id={call_id} (Channel)")
-            simulated_transcript = {
-                "call_id": call_id,
-                "text": "El usuario dice: 'Hola, ¿en qué puedo ayudarle?'"
-            }
-            self.publisher.publish("incoming_audio_chunks", str(simulated_transcript))
+            body = envelope.encode_call_event(call_id, "call_started", fields=self._event_fields(data))
         elif event_type == "Hangup":
             logging.info(f"AMI: Llamada finalizada para call_id={call_id} (Channel)")
-            end_msg = {"call_id": call_id, "event": "call_ended"}
-            self.publisher.publish("incoming_audio_chunks", str(end_msg))
+            body = envelope.encode_call_event(call_id, "call_ended", fields=self._event_fields(data))
+        else:
+            return
+        self.publisher.publish("incoming_audio_chunks", body)
+        if getattr(self.publisher, "saturated", False):
+            self._pause_for_backpressure()
+
+    @staticmethod
+    def _event_fields(data: Dict[str, Any]) -> Dict[str, str]:
+        return {key: str(data[key]) for key in EVENT_FIELDS if data.get(key) is not None}
+
+    def _pause_reading(self, reason: str):
+        if reason in self._paused_by:
+            return
+        self._paused_by.add(reason)
+        if len(self._paused_by) == 1 and self.transport:
+            logging.warning(f"AMI: Pausando lectura del socket AMI ({reason}).")
+            self.transport.pause_reading()
+
+    def _resume_reading(self, reason: str):
+        if reason not in self._paused_by:
+            return
+        self._paused_by.discard(reason)
+        if not self._paused_by and self.transport:
+            logging.info(f"AMI: Se reanuda la lectura del socket AMI ({reason}).")
+            self.transport.resume_reading()
+
+    def _pause_for_backpressure(self):
+        """Deja de leer del socket AMI hasta que el publisher vacíe su buffer."""
+        if self._backpressure_task is not None or not self.transport:
+            return
+        self._pause_reading("publisher")
+        self._backpressure_task = asyncio.create_task(self._resume_when_writable())
+
+    async def _resume_when_writable(self):
+        try:
+            await self.publisher.wait_writable()
+        finally:
+            self._backpressure_task = None
+            self._resume_reading("publisher")
 
     async def on_connection_lost(self, exc):
+        self._fail_pending_actions(ConnectionError("conexión AMI perdida"))
+        self._paused_by.clear()
         self._connected.clear()
         self._authenticated.clear()
+        self._connection_lost.set()
+        AMI_CONNECTED.set(0)
         self.protocol = None
         self.transport = None
-        if self._running:
+        if self._running and self._disconnected_at is None:
+            self._disconnected_at = time.monotonic()
+        # Si hay un connect() en curso él mismo reintenta; si no, se lanza uno
+        if self._running and not self._connecting:
             logging.warning("AMI: Intentando reconectar...")
-            await asyncio.sleep(self._reconnect_delay)
             await self.connect()
 
+    # --- Resincronización ---
+    def _track_channel(self, data: Dict[str, Any]):
+        """Mantiene los canales vivos vistos por AMI, la referencia de la resincronización."""
+        uniqueid = data.get("Uniqueid")
+        if not uniqueid:
+            return
+        event_type = data.get("Event")
+        if event_type == "Newchannel":
+            self.live_channels[uniqueid] = data.get("Channel", "")
+        elif event_type == "Rename":
+            if uniqueid in self.live_channels:
+                self.live_channels[uniqueid] = data.get("Newname") or data.get("NewName") or self.live_channels[uniqueid]
+        elif event_type == "Hangup":
+            self.live_channels.pop(uniqueid, None)
+            if self._resync_hangups is not None:
+                self._resync_hangups.add(uniqueid)
+
+    @staticmethod
+    def _merge_snapshot(responses: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Canales vivos por Uniqueid según los listados; el primero (CoreShowChannels) manda
+        y los siguientes completan campos. None si ningún listado respondió: sin foto del
+        servidor no se puede dar nada por colgado.
+        """
+        snapshot: Dict[str, Dict[str, Any]] = {}
+        answered = False
+        for resp in reversed(responses):
+            if not resp or resp.get("Response") != "Success":
+                continue
+            answered = True
+            for event in resp.get("events", ()):
+                uniqueid = event.get("Uniqueid")
+                if uniqueid:
+                    snapshot.setdefault(uniqueid, {}).update(event)
+        return snapshot if answered else None
+
+    @staticmethod
+    def _resync_events(fields: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Eventos sintéticos que anuncian un canal vivo que no se conocía."""
+        base = {key: fields[key] for key in RESYNC_FIELDS if fields.get(key)}
+        base["Resync"] = "true"
+        events = [{"Event": "Newchannel", **base}]
+        if base.get("ChannelStateDesc") == "Up":
+            events.append({"Event": "Newstate", **base})
+        bridge_id = fields.get("BridgeId") or fields.get("BridgeID")
+        if bridge_id:
+            events.append({"Event": "BridgeEnter", "Channel": base.get("Channel", ""), "Uniqueid": base["Uniqueid"],
+                           "BridgeUniqueid": bridge_id, "Resync": "true"})
+        return events
+
+    async def resync(self) -> Optional[Dict[str, int]]:
+        """
+        Reconcilia el estado de los canales con el servidor tras el login, en un solo viaje
+        de ida y vuelta (``CoreShowChannels`` y ``Status`` en pipeline). Los canales que se
+        conocían y ya no existen se cierran con un ``Hangup`` sintético y los que existen sin
+        conocerse se anuncian con ``Newchannel`` (más ``Newstate``/``BridgeEnter`` si procede):
+        todos los suscriptores (registro de llamadas, RabbitMQ, workers AGI) se reconcilian
+        igual que con los eventos reales. Los eventos sintéticos llevan ``Resync: true``.
+        """
+        known = dict(self.live_channels)
+        self._resync_hangups = set()
+        try:
+            responses = await self.send_actions([{"Action": action} for action in RESYNC_ACTIONS])
+            snapshot = self._merge_snapshot(responses)
+            if snapshot is None:
+                logging.warning("AMI: Resincronización sin respuesta; se mantiene el estado conocido")
+                return None
+            ended = started = 0
+            for uniqueid, channel in known.items():
+                if uniqueid not in snapshot and uniqueid in self.live_channels:
+                    await self.events.dispatch({"Event": "Hangup", "Channel": channel, "Uniqueid": uniqueid,
+                                                "Cause": "0", "Cause-txt": "resync", "Resync": "true"})
+                    ended += 1
+            for uniqueid, fields in snapshot.items():
+                # Un Hangup real llegado durante la resincronización gana a la foto
+                if uniqueid in self.live_channels or uniqueid in self._resync_hangups or not fields.get("Channel"):
+                    continue
+                for event in self._resync_events(fields):
+                    await self.events.dispatch(event)
+                started += 1
+        finally:
+            self._resync_hangups = None
+        AMI_RESYNC_CALLS.labels("ended").inc(ended)
+        AMI_RESYNC_CALLS.labels("started").inc(started)
+        if ended or started:
+            logging.info(f"AMI: Resincronización: {ended} llamadas cerradas, {started} anunciadas, {len(snapshot)} vivas")
+        return {"ended": ended, "started": started, "live": len(snapshot)}
+
     async def close(self):
         self._running = False
+        self._fail_pending_actions(ConnectionError("cliente AMI cerrado"))
+        if hasattr(self._publisher, "close"):
+            await self._publisher.close()
+        if self.rabbitmq_conn is not None:
+            await self.rabbitmq_conn.close()
+            self.rabbitmq_conn = None
         if self.transport:
             self.transport.close()
         self.protocol = None
         self.transport = None
         self._connected.clear()
         self._authenticated.clear()
+        AMI_CONNECTED.set(0)
 
     async def get_event(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        if self.event_queue is None:
+            raise RuntimeError("AMI: Cola general de eventos desactivada (AMI_EVENT_QUEUE_SIZE=0); usa events.subscribe().")
         try:
             return await asyncio.wait_for(self.event_queue.get(), timeout=timeout)
         except asyncio.TimeoutError:
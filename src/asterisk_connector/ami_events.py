@@ -0,0 +1,190 @@
+import asyncio
+import fnmatch
+import inspect
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+# Clase de permisos AMI (parámetro Events/EventMask) de los eventos habituales
+AMI_EVENT_CLASSES: Dict[str, str] = {
+    **dict.fromkeys((
+        "Newchannel", "Hangup", "HangupRequest", "SoftHangupRequest", "Newstate", "NewCallerid",
+        "NewConnectedLine", "NewAccountCode", "Rename", "DialBegin", "DialEnd", "DialState", "BridgeCreate",
+        "BridgeDestroy", "BridgeEnter", "BridgeLeave", "BridgeMerge", "Hold", "Unhold", "OriginateResponse",
+        "LocalBridge", "MusicOnHoldStart", "MusicOnHoldStop", "AttendedTransfer", "BlindTransfer",
+    ), "call"),
+    **dict.fromkeys(("Newexten", "VarSet"), "dialplan"),
+    **dict.fromkeys(("DTMFBegin", "DTMFEnd"), "dtmf"),
+    **dict.fromkeys(("Cdr", "CEL"), "cdr"),
+    **dict.fromkeys(("RTCPSent", "RTCPReceived"), "reporting"),
+    **dict.fromkeys(("FullyBooted", "Shutdown", "Reload"), "system"),
+    **dict.fromkeys(("AsyncAGIStart", "AsyncAGIExec", "AsyncAGIEnd", "AGIExecStart", "AGIExecEnd"), "agi"),
+    "UserEvent": "user",
+}
+
+Handler = Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]
+
+
+class EventSubscription:
+    """
+    Suscripción a eventos AMI filtrada por tipo y/o patrón de Channel (fnmatch).
+
+    Con ``handler`` cada evento se entrega llamando al handler (síncrono o corrutina);
+    sin él, se encola en una cola acotada que se consume con ``get`` o ``async for``.
+    Si la cola está llena se aplica ``policy``: ``drop_oldest``, ``drop_newest`` o
+    ``block`` (detiene el procesado AMI hasta que haya hueco).
+    """
+
+    def __init__(self, event_types: Optional[Iterable[str]] = None, channel_pattern: Optional[str] = None,
+                 handler: Optional[Handler] = None, maxsize: int = 1000, policy: str = DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de cola no soportada: {policy}")
+        self.event_types = frozenset(event_types) if event_types else None
+        self.channel_pattern = channel_pattern
+        self._channel_match = re.compile(fnmatch.translate(channel_pattern)).match if channel_pattern else None
+        self.handler = handler
+        self._handler_is_async = handler is not None and inspect.iscoroutinefunction(handler)
+        self.policy = policy
+        self.queue: Optional[asyncio.Queue] = None if handler else asyncio.Queue(maxsize=maxsize)
+        self.delivered = 0
+        self.dropped = 0
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if self._channel_match is None:
+            return True
+        channel = event.get("Channel")
+        return channel is not None and self._channel_match(channel) is not None
+
+    async def deliver(self, event: Dict[str, Any]):
+        if self.handler is not None:
+            if self._handler_is_async:
+                await self.handler(event)
+            else:
+                self.handler(event)
+            self.delivered += 1
+            return
+        queue = self.queue
+        if queue.full():
+            if self.policy == BLOCK:
+                await queue.put(event)
+                self.delivered += 1
+                return
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return
+            queue.get_nowait()
+        queue.put_nowait(event)
+        self.delivered += 1
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+
+class AMIEventDispatcher:
+    """
+    Registro de suscripciones y reparto de eventos AMI.
+
+    El reparto es O(suscriptores del tipo): las suscripciones se indexan por tipo de
+    evento y sólo las de "todos los eventos" se consultan siempre. ``event_mask``
+    calcula el valor del parámetro AMI ``Events`` que cubre las suscripciones activas,
+    para que Asterisk no envíe clases de eventos que nadie consume.
+    """
+
+    def __init__(self, on_change: Optional[Callable[[], None]] = None):
+        self.on_change = on_change
+        self._by_type: Dict[str, List[EventSubscription]] = {}
+        self._any: List[EventSubscription] = []
+
+    def __len__(self) -> int:
+        return len(self._any) + sum(len(subs) for subs in self._by_type.values())
+
+    def subscribe(self, event_types: Optional[Iterable[str]] = None, channel_pattern: Optional[str] = None,
+                  handler: Optional[Handler] = None, maxsize: int = 1000, policy: str = DROP_OLDEST) -> EventSubscription:
+        sub = EventSubscription(event_types, channel_pattern, handler, maxsize, policy)
+        if sub.event_types is None:
+            self._any.append(sub)
+        else:
+            for event_type in sub.event_types:
+                self._by_type.setdefault(event_type, []).append(sub)
+        self._changed()
+        return sub
+
+    def unsubscribe(self, sub: EventSubscription):
+        if sub.event_types is None:
+            if sub in self._any:
+                self._any.remove(sub)
+        else:
+            for event_type in sub.event_types:
+                subs = self._by_type.get(event_type)
+                if subs and sub in subs:
+                    subs.remove(sub)
+                    if not subs:
+                        del self._by_type[event_type]
+        self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    async def dispatch(self, event: Dict[str, Any]) -> int:
+        """Entrega el evento a las suscripciones que lo aceptan. Devuelve cuántas lo recibieron."""
+        delivered = 0
+        typed = self._by_type.get(event.get("Event"))
+        for subs in (typed, self._any):
+            if not subs:
+                continue
+            for sub in subs:
+                if sub.matches(event):
+                    # El fallo de un manejador no debe privar del evento a los demás suscriptores
+                    try:
+                        await sub.deliver(event)
+                    except Exception as e:
+                        logging.error(f"AMI: Error en el manejador de {event.get('Event')}: {e}")
+                        continue
+                    delivered += 1
+        return delivered
+
+    def event_mask(self) -> str:
+        if self._any:
+            return "on"
+        if not self._by_type:
+            return "off"
+        classes = set()
+        for event_type in self._by_type:
+            event_class = AMI_EVENT_CLASSES.get(event_type)
+            if event_class is None:
+                return "on"  # Tipo desconocido: no se puede acotar sin perderlo
+            classes.add(event_class)
+        return ",".join(sorted(classes))
+
+    def subscriptions(self) -> List[EventSubscription]:
+        subs = list(self._any)
+        for typed in self._by_type.values():
+            subs.extend(s for s in typed if s not in subs)
+        return subs
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "event_types": sorted(s.event_types) if s.event_types else "*",
+                "channel_pattern": s.channel_pattern,
+                "delivered": s.delivered,
+                "dropped": s.dropped,
+                "queued": s.queue.qsize() if s.queue else 0,
+            }
+            for s in self.subscriptions()
+        ]
@@ -0,0 +1,87 @@
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional
+
+FRAME_TERMINATOR = b"\r\n\r\n"
+
+# Campos que nunca se filtran: sin ellos no se puede enrutar la trama.
+ALWAYS_KEEP: FrozenSet[str] = frozenset(("Event", "Response", "ActionID", "EventList", "Message"))
+
+# Lista blanca por defecto para los eventos más ruidosos de un PBX cargado.
+DEFAULT_FIELD_WHITELIST: Dict[str, FrozenSet[str]] = {
+    "Newexten": frozenset(("Channel", "Uniqueid", "Linkedid", "Context", "Exten", "Priority", "Application", "AppData")),
+    "VarSet": frozenset(("Channel", "Uniqueid", "Linkedid", "Variable", "Value")),
+}
+
+
+class AMIFrameParser:
+    """
+    Parser incremental de tramas AMI.
+
+    Acumula los segmentos TCP en un bytearray y recuerda hasta dónde se ha buscado
+    el terminador, de modo que cada byte se examina una sola vez y el resto parcial
+    nunca se copia ni se decodifica de nuevo. Sólo la región con tramas completas se
+    decodifica (una vez, en C); ``field_whitelist`` limita, por tipo de evento, qué
+    campos llegan al diccionario resultante.
+    """
+
+    def __init__(self, field_whitelist: Optional[Mapping[str, Iterable[str]]] = None, encoding: str = "utf-8"):
+        self.encoding = encoding
+        self._buffer = bytearray()
+        self._scan_offset = 0
+        self._whitelist: Dict[str, FrozenSet[str]] = {
+            event: frozenset(fields) | ALWAYS_KEEP for event, fields in (field_whitelist or {}).items()
+        }
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def feed(self, data: bytes) -> List[Dict[str, str]]:
+        """Añade un segmento recibido y devuelve las tramas completas que contenga."""
+        buf = self._buffer
+        buf += data
+        # El terminador puede haber quedado partido entre dos segmentos.
+        last = buf.rfind(FRAME_TERMINATOR, max(self._scan_offset - 3, 0))
+        if last < 0:
+            self._scan_offset = len(buf)
+            return []
+        region = buf[:last].decode(self.encoding, "replace")
+        del buf[:last + 4]
+        self._scan_offset = len(buf)
+        return self._parse_region(region)
+
+    def reset(self):
+        """Descarta cualquier trama parcial (p. ej. tras una reconexión)."""
+        self._buffer.clear()
+        self._scan_offset = 0
+
+    def _parse_region(self, region: str) -> List[Dict[str, str]]:
+        frames = []
+        whitelist = self._whitelist
+        for frame in region.split("\r\n\r\n"):
+            data: Dict[str, str] = {}
+            allowed: Optional[FrozenSet[str]] = None
+            for line in frame.split("\r\n"):
+                key, sep, value = line.partition(": ")
+                if not sep:
+                    key, sep, value = line.partition(":")
+                    if not sep:
+                        continue
+                    key = key.strip()
+                    value = value.strip()
+                if allowed is not None and key not in allowed:
+                    continue
+                data[key] = value
+                if key == "Event" and whitelist:
+                    allowed = whitelist.get(value)
+            if data:
+                frames.append(data)
+        return frames
+
+
+def parse_ami_message(msg: str) -> Dict[str, str]:
+    """Parsea un mensaje AMI ya decodificado (sin terminador) a diccionario."""
+    data = {}
+    for line in msg.split("\r\n"):
+        if ":" in line:
+            k, v = line.split(":", 1)
+            data[k.strip()] = v.strip()
+    return data
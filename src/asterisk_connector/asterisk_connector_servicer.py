@@ -2,83 +2,287 @@ import asyncio
 import logging
 import os
 import sys
-from concurrent import futures
-from typing import Any
+from typing import Optional
 
+import aio_pika
 import grpc
-import pika
+
+from common import envelope, metrics
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../proto'))
 import asterisk_service_pb2
 import asterisk_service_pb2_grpc
 
+try:
+    from .call_router import CallRouter, RoutedMessage
+except ImportError:
+    from call_router import CallRouter, RoutedMessage
+
+CALL_ENDED = "CALL_ENDED"
+# Evento de control: cortar ya la reproducción en curso (barge-in)
+INTERRUPT = "INTERRUPT"
+# Metadato de las peticiones reenviadas desde otro nodo (no se vuelven a reenviar)
+FORWARDED_BY = "x-forwarded-by"
+
+CALLS_FORWARDED = metrics.REGISTRY.counter(
+    "grpc_calls_forwarded_total", "Peticiones gRPC reenviadas al nodo dueño de la llamada", ("rpc",))
+
 
 class AsteriskConnectorServicer(asterisk_service_pb2_grpc.AsteriskConnectorServicer):
-    def __init__(self):
+    def __init__(self, ami_client=None, agi_server=None, rabbitmq_channel=None, call_streams: Optional[CallRouter] = None,
+                 call_registry=None, ownership=None):
         self.rabbitmq_host = os.getenv("RABBITMQ_HOST", "localhost")
         self.rabbitmq_user = os.getenv("RABBITMQ_USER", "guest")
         self.rabbitmq_pass = os.getenv("RABBITMQ_PASS", "guest")
         self.rabbitmq_conn = None
-        self.rabbitmq_channel = None
-        self._setup_rabbitmq()
+        self.rabbitmq_channel = rabbitmq_channel
+        self.ami_client = ami_client
+        self.agi_server = agi_server
+        self.call_registry = call_registry
+        # Respuestas pendientes de cada stream gRPC abierto, por call_id
+        self.call_streams = call_streams or CallRouter(maxsize=int(os.getenv("GRPC_STREAM_QUEUE_SIZE", "500")), name="call_stream")
+        if agi_server is not None:
+            agi_server.grpc_streams = self
+        # Con varios conectores, índice de qué nodo atiende cada llamada y stubs hacia los demás
+        self.ownership = ownership
+        self.forward_timeout = float(os.getenv("GRPC_FORWARD_TIMEOUT", "5"))
+        self._peers = {}
 
-    def _setup_rabbitmq(self):
-        credentials = pika.PlainCredentials(self.rabbitmq_user, self.rabbitmq_pass)
-        parameters = pika.ConnectionParameters(host=self.rabbitmq_host, credentials=credentials)
+    async def _setup_rabbitmq(self):
+        url = f"amqp://{self.rabbitmq_user}:{self.rabbitmq_pass}@{self.rabbitmq_host}/"
         try:
-            self.rabbitmq_conn = pika.BlockingConnection(parameters)
-            self.rabbitmq_channel = self.rabbitmq_conn.channel()
-            self.rabbitmq_channel.queue_declare(queue='outgoing_audio_chunks', durable=True)
+            self.rabbitmq_conn = await aio_pika.connect_robust(url)
+            self.rabbitmq_channel = await self.rabbitmq_conn.channel()
         except Exception as e:
-            logging.error(f"Error conectando a RabbitMQ: {e}\nVerifica usuario ('{self.rabbitmq_user}') y contraseña ('{self.rabbitmq_pass}') o la configuración del broker.")
+            logging.error(f"Error conectando a RabbitMQ: {e}\nVerifica usuario ('{self.rabbitmq_user}') y la configuración del broker.")
             self.rabbitmq_conn = None
             self.rabbitmq_channel = None
 
+    async def start(self):
+        """Prepara RabbitMQ y lanza el consumidor asíncrono de transcripciones."""
+        if self.rabbitmq_channel is None:
+            await self._setup_rabbitmq()
+        if self.rabbitmq_channel is None:
+            return
+        await self.rabbitmq_channel.declare_queue('outgoing_audio_chunks', durable=True)
+        # Cola propia (exclusiva, se borra al desconectar) en el fanout de transcripciones:
+        # cada conector las recibe todas sin quitárselas al servicio de conversación ni a
+        # los demás nodos, y sólo reenvía las de sus streams abiertos
+        exchange = await self.rabbitmq_channel.declare_exchange(
+            envelope.TRANSCRIPTS_EXCHANGE, aio_pika.ExchangeType.FANOUT, durable=True)
+        queue = await self.rabbitmq_channel.declare_queue(exclusive=True, auto_delete=True)
+        await queue.bind(exchange)
+        await queue.consume(self._on_transcript, no_ack=True)
+
+    def stream_audio(self, call_id: str, audio_chunk: bytes):
+        """Entrega audio de la llamada al stream gRPC abierto para ella, si lo hay."""
+        if call_id in self.call_streams:
+            self.call_streams.dispatch(call_id, asterisk_service_pb2.CallStreamResponse(call_id=call_id, audio_chunk=audio_chunk))
+
+    def stream_text(self, call_id: str, text: str):
+        if call_id in self.call_streams:
+            self.call_streams.dispatch(call_id, asterisk_service_pb2.CallStreamResponse(call_id=call_id, text_response=text))
+
+    def stream_event(self, call_id: str, event_type: str):
+        if call_id in self.call_streams:
+            self.call_streams.dispatch(call_id, asterisk_service_pb2.CallStreamResponse(call_id=call_id, event_type=event_type))
+
+    def _watch_stream(self, call_id: str, active: bool):
+        """Con el pool de workers AGI, el audio de una llamada sólo se reenvía al principal si tiene stream."""
+        subscribe = getattr(self.agi_server, "subscribe_stream", None)
+        if subscribe is not None:
+            subscribe(call_id, active)
+
+    def _is_local(self, call_id: str) -> bool:
+        router = getattr(self.agi_server, "audio_router", None)
+        return router is not None and call_id in router
+
+    async def _owner_stub(self, call_id: str, context):
+        """Stub del nodo que atiende la llamada si es otro; None si se atiende aquí (o no se sabe)."""
+        if self.ownership is None or self._is_local(call_id):
+            return None
+        if any(key == FORWARDED_BY for key, _ in (context.invocation_metadata() or ())):
+            return None
+        try:
+            owner = await self.ownership.owner(call_id)
+        except Exception as e:
+            logging.warning(f"[gRPC] No se ha podido consultar el dueño de call_id={call_id}: {e}")
+            return None
+        if owner is None or owner["node"] == self.ownership.node_id:
+            return None
+        stub = self._peers.get(owner["address"])
+        if stub is None:
+            channel = grpc.aio.insecure_channel(owner["address"])
+            stub = self._peers[owner["address"]] = asterisk_service_pb2_grpc.AsteriskConnectorStub(channel)
+        logging.info(f"[gRPC] call_id={call_id} la atiende el nodo {owner['node']} ({owner['address']}); se reenvía")
+        return stub
+
+    def _forward_metadata(self):
+        return ((FORWARDED_BY, self.ownership.node_id),)
+
+    async def _proxy_stream(self, stub, first_request, request_iterator, context):
+        """Reenvía el stream de una llamada al nodo que la atiende, en ambos sentidos."""
+        call = stub.HandleCallStream(metadata=self._forward_metadata())
+
+        async def forward_requests():
+            await call.write(first_request)
+            async for request in request_iterator:
+                await call.write(request)
+            await call.done_writing()
+
+        requests_task = asyncio.create_task(forward_requests())
+        try:
+            async for response in call:
+                await context.write(response)
+        except grpc.aio.AioRpcError as e:
+            logging.error(f"[gRPC] Stream reenviado de call_id={first_request.call_id} interrumpido: {e.code()}")
+        finally:
+            requests_task.cancel()
+            await asyncio.gather(requests_task, return_exceptions=True)
+            call.cancel()
+
+    async def _on_transcript(self, message):
+        try:
+            env = envelope.decode(message.body)
+        except ValueError as e:
+            logging.warning(f"[gRPC] Transcripción descartada: {e}")
+            return
+        # Al stream de la llamada sólo van las transcripciones finales (fin de frase)
+        if envelope.kind(env) == "transcript" and env.transcript.call_id and env.transcript.is_final:
+            self.stream_text(env.transcript.call_id, env.transcript.text)
+
+    async def forward_audio(self, call_id: str, audio_chunk: bytes):
+        """Envía audio a la llamada: directo a la sesión AGI si es local, si no vía RabbitMQ."""
+        router = getattr(self.agi_server, "audio_router", None)
+        if router is not None and call_id in router:
+            router.dispatch(call_id, RoutedMessage(audio_chunk, {"call_id": call_id}))
+        elif self.rabbitmq_channel is not None:
+            await self.rabbitmq_channel.default_exchange.publish(
+                aio_pika.Message(body=audio_chunk, headers={"call_id": call_id}),
+                routing_key="outgoing_audio_chunks"
+            )
+        else:
+            logging.warning(f"[gRPC] Sin destino para el audio de call_id={call_id}")
+
+    async def handle_control_event(self, call_id: str, event_type: str):
+        logging.info(f"[gRPC] Evento de control {event_type} para call_id={call_id}")
+        if event_type == "CALL_END":
+            await self._hangup(call_id)
+        elif event_type == INTERRUPT and self.agi_server is not None:
+            await self.agi_server.interrupt(call_id, "grpc")
+
+    async def _hangup(self, call_id: str):
+        if self.ami_client is None or self.ami_client.protocol is None:
+            return False, "AMI no disponible"
+        resp = await self.ami_client.hangup(call_id)
+        if resp is None:
+            return False, "Sin respuesta de AMI"
+        return resp.get("Response") == "Success", resp.get("Message", "")
+
+    async def HangupCall(self, request, context):
+        """Cuelga la llamada cuyo call_id (Channel de Asterisk) se indica, vía la acción AMI Hangup."""
+        if not request.call_id:
+            return asterisk_service_pb2.HangupCallResponse(success=False, message="call_id requerido")
+        stub = await self._owner_stub(request.call_id, context)
+        if stub is not None:
+            CALLS_FORWARDED.labels("HangupCall").inc()
+            try:
+                return await stub.HangupCall(request, metadata=self._forward_metadata(), timeout=self.forward_timeout)
+            except grpc.aio.AioRpcError as e:
+                return asterisk_service_pb2.HangupCallResponse(success=False, message=f"Nodo dueño no disponible: {e.code()}")
+        success, message = await self._hangup(request.call_id)
+        logging.info(f"[gRPC] HangupCall call_id={request.call_id}: success={success} {message}")
+        return asterisk_service_pb2.HangupCallResponse(success=success, message=message)
+
     async def HandleCallStream(self, request_iterator, context):
         """
         Procesa el stream gRPC de llamadas. El call_id DEBE ser el Channel de Asterisk (ej: SIP/mi_ext-00000001)
         para garantizar unicidad y trazabilidad en todo el flujo.
+
+        Los requests entrantes (audio o eventos de control) se atienden según llegan y, en paralelo,
+        las respuestas de la llamada (audio, texto y eventos) se escriben con ``context.write``.
         """
-        logging.info("HandleCallStream iniciado. Consumiendo de outgoing_audio_chunks...")
-        if not self.rabbitmq_channel:
-            logging.error("No hay canal RabbitMQ disponible.")
-            return
-        async for request in request_iterator:
-            call_id = request.call_id
-            if not call_id:
-                logging.warning("[gRPC] call_id ausente en el request. Debe ser el Channel de Asterisk.")
-                continue
-            # Aquí podrías procesar el request, asegurando que call_id es el Channel
-            logging.info(f"[gRPC] Procesando request para call_id={call_id} (Channel)")
-            # Simulación: consumir mensajes de outgoing_audio_chunks
-            for method_frame, properties, body in self.rabbitmq_channel.consume('outgoing_audio_chunks', inactivity_timeout=1):
-                if body:
-                    logging.info(f"Simulando envío a Asterisk: {body.decode() if hasattr(body, 'decode') else body}")
-                    self.rabbitmq_channel.basic_ack(method_frame.delivery_tag)
-                    # Aquí podrías enviar una respuesta al cliente gRPC si lo deseas
-                await asyncio.sleep(0.1)  # Simula procesamiento
-            break  # Solo procesar un ciclo por request para evitar bucles infinitos en este ejemplo
-        logging.info("Fin de consumo de outgoing_audio_chunks.")
-        # Aquí normalmente se respondería vía gRPC stream, pero este ejemplo es solo para simular el flujo.
+        call_id = None
+        responses = None
+        writer_task = None
 
-# --- Servidor gRPC ---
-def serve():
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+        async def write_responses():
+            while True:
+                response = await responses.get()
+                await context.write(response)
+                if response.WhichOneof("payload") == "event_type" and response.event_type == CALL_ENDED:
+                    return
 
-    async def main():
-        server = grpc.aio.server()
-        asterisk_service_pb2_grpc.add_AsteriskConnectorServicer_to_server(AsteriskConnectorServicer(), server)
-        server.add_insecure_port('[::]:50051')
-        logging.info("Servidor gRPC escuchando en el puerto 50051...")
-        await server.start()
         try:
-            await server.wait_for_termination()
-        except KeyboardInterrupt:
-            logging.info("Servidor detenido por el usuario.")
+            async for request in request_iterator:
+                if not request.call_id:
+                    logging.warning("[gRPC] call_id ausente en el request. Debe ser el Channel de Asterisk.")
+                    continue
+                if call_id is None:
+                    stub = await self._owner_stub(request.call_id, context)
+                    if stub is not None:
+                        CALLS_FORWARDED.labels("HandleCallStream").inc()
+                        await self._proxy_stream(stub, request, request_iterator, context)
+                        return
+                    if request.call_id in self.call_streams:
+                        # Dos streams no pueden compartir la cola: cada respuesta llegaría sólo a uno
+                        logging.warning(f"[gRPC] Ya existe un stream para call_id={request.call_id}; se rechaza el nuevo")
+                        await context.abort(grpc.StatusCode.ALREADY_EXISTS,
+                                            f"Ya hay un stream abierto para call_id={request.call_id}")
+                    call_id = request.call_id
+                    responses = self.call_streams.register(call_id)
+                    self._watch_stream(call_id, True)
+                    writer_task = asyncio.create_task(write_responses())
+                    logging.info(f"[gRPC] Stream abierto para call_id={call_id} (Channel)")
+                    record = self.call_registry.get(call_id) if self.call_registry is not None else None
+                    if record is not None and not record.active:
+                        self.stream_event(call_id, CALL_ENDED)
+                elif request.call_id != call_id:
+                    logging.warning(f"[gRPC] call_id={request.call_id} ignorado en el stream de {call_id}")
+                    continue
+                payload = request.WhichOneof("payload")
+                if payload == "audio_chunk":
+                    await self.forward_audio(call_id, request.audio_chunk)
+                elif payload == "event_type":
+                    await self.handle_control_event(call_id, request.event_type)
+            # El cliente cerró su lado: seguir enviando hasta que termine la llamada. Si no
+            # está aquí (desconocida o ya colgada) nadie enviará CALL_ENDED: se envía lo
+            # pendiente y se cierra
+            if writer_task is not None:
+                if not self._is_local(call_id):
+                    self.stream_event(call_id, CALL_ENDED)
+                await writer_task
+        finally:
+            if writer_task is not None:
+                writer_task.cancel()
+                await asyncio.gather(writer_task, return_exceptions=True)
+            if call_id is not None:
+                self.call_streams.unregister(call_id)
+                self._watch_stream(call_id, False)
+            logging.info(f"[gRPC] Stream cerrado para call_id={call_id}")
 
-    asyncio.run(main())
+
+# --- Servidor gRPC ---
+async def serve_async(servicer: Optional[AsteriskConnectorServicer] = None, port: int = 50051):
+    servicer = servicer or AsteriskConnectorServicer()
+    await servicer.start()
+    server = grpc.aio.server()
+    asterisk_service_pb2_grpc.add_AsteriskConnectorServicer_to_server(servicer, server)
+    server.add_insecure_port(f'[::]:{port}')
+    logging.info(f"Servidor gRPC escuchando en el puerto {port}...")
+    await server.start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(grace=1)
+
+
+def serve():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(serve_async())
+    except KeyboardInterrupt:
+        logging.info("Servidor detenido por el usuario.")
 
 if __name__ == "__main__":
     serve()
-# NOTA: Para un servidor gRPC real, se debe registrar el servicer y arrancar el server.
-# Este archivo es solo un esqueleto para la lógica solicitada.
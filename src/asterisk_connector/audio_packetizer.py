@@ -0,0 +1,81 @@
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+# Bytes por muestra y frecuencia por defecto de los formatos que entrega Asterisk
+SAMPLE_WIDTHS = {"slin": 2, "slin16": 2, "ulaw": 1, "alaw": 1}
+DEFAULT_SAMPLE_RATES = {"slin": 8000, "slin16": 16000, "ulaw": 8000, "alaw": 8000}
+
+
+class AudioFrame(NamedTuple):
+    seq: int
+    capture_ts: float
+    payload: bytes
+
+
+class AudioPacketizer:
+    """
+    Agrupa lecturas de tamaño arbitrario en tramas de duración fija.
+
+    Cada trama contiene exactamente ``frame_ms`` de audio del formato indicado (nunca
+    corta una muestra), lleva un número de secuencia por llamada y la marca de tiempo
+    de captura de su primera muestra, derivada del reloj al inicio del flujo y de la
+    cantidad de audio emitida, de modo que no deriva con el jitter de las lecturas.
+    """
+
+    def __init__(self, frame_ms: int = 20, audio_format: str = "slin", sample_rate: Optional[int] = None,
+                 clock: Callable[[], float] = time.time):
+        if audio_format not in SAMPLE_WIDTHS:
+            raise ValueError(f"Formato de audio no soportado: {audio_format}")
+        if frame_ms <= 0:
+            raise ValueError("frame_ms debe ser positivo")
+        self.frame_ms = frame_ms
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate or DEFAULT_SAMPLE_RATES[audio_format]
+        self.sample_width = SAMPLE_WIDTHS[audio_format]
+        samples = self.sample_rate * frame_ms // 1000
+        if samples * 1000 != self.sample_rate * frame_ms:
+            raise ValueError(f"{frame_ms} ms no es un número entero de muestras a {self.sample_rate} Hz")
+        self.frame_bytes = samples * self.sample_width
+        self.bytes_per_second = self.sample_rate * self.sample_width
+        self.clock = clock
+        self.seq = 0
+        self._buffer = bytearray()
+        self._start_ts: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def _capture_ts(self) -> float:
+        return self._start_ts + self.seq * self.frame_ms / 1000.0
+
+    def feed(self, data: bytes) -> List[AudioFrame]:
+        """Añade audio leído y devuelve las tramas completas disponibles."""
+        if self._start_ts is None:
+            # La lectura recién recibida se capturó justo antes de ahora
+            self._start_ts = self.clock() - len(data) / self.bytes_per_second
+        buf = self._buffer
+        buf += data
+        size = self.frame_bytes
+        if len(buf) < size:
+            return []
+        frames = []
+        view = memoryview(buf)
+        offset = 0
+        while len(buf) - offset >= size:
+            frames.append(AudioFrame(self.seq, self._capture_ts(), bytes(view[offset:offset + size])))
+            self.seq += 1
+            offset += size
+        view.release()
+        del buf[:offset]
+        return frames
+
+    def flush(self) -> List[AudioFrame]:
+        """Emite el resto pendiente (más corto que una trama) al terminar el flujo."""
+        usable = len(self._buffer) - len(self._buffer) % self.sample_width
+        if not usable:
+            self._buffer.clear()
+            return []
+        frame = AudioFrame(self.seq, self._capture_ts(), bytes(self._buffer[:usable]))
+        self.seq += 1
+        self._buffer.clear()
+        return [frame]
@@ -0,0 +1,265 @@
+"""
+Índice compartido en Redis de qué conector atiende cada llamada.
+
+Con varias instancias de ``asterisk_connector`` (varias máquinas Asterisk o AGI
+balanceado) una petición gRPC puede llegar a un nodo que no tiene la sesión AGI de la
+llamada. Cada nodo anota en Redis las llamadas que atiende (``claim``) con su
+dirección gRPC, y el servicer consulta el dueño (``owner``) para reenviarle la
+petición.
+
+- Escrituras: ``claim``/``release`` no esperan a Redis; las órdenes se acumulan y se
+  envían en un único pipeline por vuelta del bucle.
+- TTL: mientras la llamada vive, la clave dura ``ttl`` (red de seguridad si el nodo cae
+  sin liberar); al colgar pasa a ``hangup_ttl`` para que las peticiones tardías aún se
+  enruten y después desaparece sola.
+- Lecturas: caché local LRU de lectura directa (``cache_ttl``) que se invalida por
+  pub/sub cuando otro nodo cambia una llamada.
+- Audio saliente: todos los nodos consumen la cola compartida ``outgoing_audio_chunks``;
+  lo que llega a un nodo que no atiende la llamada se reenvía (``forward_audio``) a la
+  cola propia del dueño (``audio_queue``), que sólo consume ese nodo.
+"""
+import asyncio
+import collections
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import aio_pika
+
+from common import metrics
+from common.backoff import Backoff
+
+OWNER_LOOKUPS = metrics.REGISTRY.counter(
+    "call_owner_lookups_total", "Consultas del dueño de una llamada según dónde se resuelven (cache, redis)", ("source",))
+OWNER_WRITE_ERRORS = metrics.REGISTRY.counter("call_owner_write_errors_total",
+                                              "Pipelines de escritura del índice de llamadas fallidos")
+AUDIO_FORWARDED = metrics.REGISTRY.counter("outgoing_audio_forwarded_total",
+                                           "Audio saliente reenviado a la cola del nodo dueño de la llamada")
+
+# Cola compartida del audio saliente y cabecera del audio ya reenviado (no se vuelve a reenviar)
+OUTGOING_AUDIO_QUEUE = "outgoing_audio_chunks"
+FORWARDED_HEADER = "x-forwarded-by"
+
+
+class CallOwnershipIndex:
+    """
+    Índice de llamadas por nodo sobre un cliente ``redis.asyncio`` (o un sustituto con
+    ``get``, ``pipeline`` y ``pubsub``). ``run`` mantiene la suscripción de invalidación.
+    """
+
+    def __init__(self, redis, node_id: str, address: str, prefix: str = "voip:call:", ttl: float = 4 * 3600,
+                 hangup_ttl: float = 60.0, cache_size: int = 10000, cache_ttl: float = 30.0,
+                 max_pending: int = 10000, clock=time.monotonic):
+        self.redis = redis
+        self.node_id = node_id
+        self.address = address
+        self.prefix = prefix
+        self.channel = prefix + "invalidate"
+        self.ttl = int(ttl)
+        self.hangup_ttl = int(hangup_ttl)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.max_pending = max_pending
+        self.clock = clock
+        # Caché local: call_id -> (dueño, caducidad)
+        self._cache: "collections.OrderedDict[str, Tuple[Optional[Dict[str, Any]], float]]" = collections.OrderedDict()
+        # Llamadas de este nodo y órdenes pendientes de enviar (comando, clave, argumentos)
+        self.owned: Dict[str, Dict[str, Any]] = {}
+        self._pending: "collections.deque[Tuple[str, str, Any]]" = collections.deque()
+        self._flush_scheduled = False
+        self._flushing: Optional[asyncio.Task] = None
+        self.backoff = Backoff()
+        self.logger = logging.getLogger("CallOwnershipIndex")
+
+    def key(self, call_id: str) -> str:
+        return self.prefix + call_id
+
+    def subscribe_to(self, ami_client):
+        """Los Hangup de AMI liberan las llamadas de este nodo aunque su sesión AGI siga abierta."""
+        return ami_client.events.subscribe(("Hangup",), handler=self._on_hangup)
+
+    def _on_hangup(self, event: Dict[str, Any]):
+        channel = event.get("Channel")
+        if channel in self.owned:
+            self.release(channel)
+
+    # --- Escrituras (nunca esperan a Redis) ---
+    def claim(self, call_id: str, uniqueid: Optional[str] = None):
+        """Anota la llamada como atendida por este nodo."""
+        owner = {"node": self.node_id, "address": self.address, "uniqueid": uniqueid or call_id}
+        self.owned[call_id] = owner
+        self._remember(call_id, owner)
+        self._queue("set", call_id, json.dumps(owner, separators=(",", ":")))
+
+    def release(self, call_id: str):
+        """Llamada terminada: la clave caduca en ``hangup_ttl`` segundos."""
+        if self.owned.pop(call_id, None) is None:
+            return
+        self._queue("expire", call_id, None)
+
+    def _queue(self, command: str, call_id: str, value: Any):
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            OWNER_WRITE_ERRORS.inc()
+        self._pending.append((command, call_id, value))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_scheduled = False
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Envía en un solo pipeline las órdenes pendientes; si falla, se reintentan con backoff."""
+        attempt = 0
+        while self._pending:
+            batch: List[Tuple[str, str, Any]] = list(self._pending)
+            self._pending.clear()
+            pipe = self.redis.pipeline(transaction=False)
+            for command, call_id, value in batch:
+                if command == "set":
+                    pipe.set(self.key(call_id), value, ex=self.ttl)
+                else:
+                    pipe.expire(self.key(call_id), self.hangup_ttl)
+                pipe.publish(self.channel, f"{self.node_id} {call_id}")
+            try:
+                await pipe.execute()
+            except Exception as e:
+                OWNER_WRITE_ERRORS.inc()
+                self.logger.warning(f"[Owners] Error escribiendo {len(batch)} cambios en Redis: {e}")
+                self._pending.extendleft(reversed(batch))
+                while len(self._pending) > self.max_pending:
+                    self._pending.popleft()
+                attempt += 1
+                await asyncio.sleep(self.backoff.delay(attempt))
+                continue
+            attempt = 0
+
+    # --- Lecturas ---
+    def _remember(self, call_id: str, owner: Optional[Dict[str, Any]]):
+        cache = self._cache
+        cache[call_id] = (owner, self.clock() + self.cache_ttl)
+        cache.move_to_end(call_id)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def invalidate(self, call_id: Optional[str] = None):
+        if call_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(call_id, None)
+
+    async def owner(self, call_id: str) -> Optional[Dict[str, Any]]:
+        """Dueño de la llamada (``node``, ``address``, ``uniqueid``), o None si nadie la ha anunciado."""
+        local = self.owned.get(call_id)
+        if local is not None:
+            OWNER_LOOKUPS.labels("cache").inc()
+            return local
+        cached = self._cache.get(call_id)
+        if cached is not None and cached[1] > self.clock():
+            OWNER_LOOKUPS.labels("cache").inc()
+            return cached[0]
+        OWNER_LOOKUPS.labels("redis").inc()
+        value = await self.redis.get(self.key(call_id))
+        if value is None:
+            # Sin cachear: la llamada puede anunciarse en cualquier momento
+            self._cache.pop(call_id, None)
+            return None
+        owner = json.loads(value)
+        self._remember(call_id, owner)
+        return owner
+
+    # --- Audio saliente ---
+    def audio_queue(self, node_id: Optional[str] = None) -> str:
+        """Cola del audio saliente de las llamadas de un nodo (por defecto, de éste)."""
+        return f"{OUTGOING_AUDIO_QUEUE}.{node_id or self.node_id}"
+
+    async def forward_audio(self, channel, message) -> bool:
+        """
+        Reenvía a la cola de su dueño el audio de una llamada que este nodo no atiende.
+        Devuelve False si la llamada es de este nodo, nadie la ha anunciado o el mensaje
+        ya viene reenviado.
+        """
+        headers = message.headers or {}
+        call_id = headers.get("call_id")
+        if not call_id or FORWARDED_HEADER in headers or call_id in self.owned:
+            return False
+        try:
+            owner = await self.owner(call_id)
+        except Exception as e:
+            self.logger.warning(f"[Owners] No se ha podido consultar el dueño de call_id={call_id}: {e}")
+            return False
+        if owner is None or owner["node"] == self.node_id:
+            return False
+        await channel.default_exchange.publish(
+            aio_pika.Message(body=message.body, headers={**headers, FORWARDED_HEADER: self.node_id}),
+            routing_key=self.audio_queue(owner["node"]),
+        )
+        AUDIO_FORWARDED.inc()
+        return True
+
+    # --- Invalidación ---
+    async def run(self):
+        """Escucha las invalidaciones de los demás nodos; al reconectar vacía la caché."""
+        attempt = 0
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Lo cambiado mientras no se escuchaba se habría perdido
+                self.invalidate()
+                attempt = 0
+                self.logger.info(f"[Owners] Nodo {self.node_id} ({self.address}) suscrito a {self.channel}")
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = message["data"]
+                    node, _, call_id = (data.decode() if isinstance(data, bytes) else data).partition(" ")
+                    if node != self.node_id:
+                        self.invalidate(call_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                attempt += 1
+                self.logger.warning(f"[Owners] Suscripción a Redis perdida: {e}")
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(self.backoff.delay(attempt))
+
+    async def close(self, timeout: float = 2.0):
+        """Envía lo pendiente (hasta ``timeout`` segundos)."""
+        if self._flushing is not None and not self._flushing.done():
+            self._flushing.cancel()
+            await asyncio.gather(self._flushing, return_exceptions=True)
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"[Owners] {len(self._pending)} cambios sin escribir en Redis al cerrar")
+
+    def stats(self) -> Dict[str, int]:
+        return {"owned": len(self.owned), "cached": len(self._cache), "pending": len(self._pending)}
+
+
+async def connect_ownership_index(grpc_port: int) -> CallOwnershipIndex:
+    """Índice según el entorno (REDIS_HOST, REDIS_PORT, CONNECTOR_NODE_ID, CONNECTOR_GRPC_ADDRESS...)."""
+    import redis.asyncio
+
+    client = redis.asyncio.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", "6379")),
+                                 password=os.getenv("REDIS_PASS") or None, decode_responses=True)
+    hostname = socket.gethostname()
+    return CallOwnershipIndex(
+        client,
+        node_id=os.getenv("CONNECTOR_NODE_ID", hostname),
+        address=os.getenv("CONNECTOR_GRPC_ADDRESS", f"{hostname}:{grpc_port}"),
+        ttl=float(os.getenv("CALL_OWNER_TTL", str(4 * 3600))),
+        hangup_ttl=float(os.getenv("CALL_OWNER_HANGUP_TTL", "60")),
+        cache_ttl=float(os.getenv("CALL_OWNER_CACHE_TTL", "30")),
+    )
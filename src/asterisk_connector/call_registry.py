@@ -0,0 +1,241 @@
+import collections
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+# Eventos AMI que alimentan el registro (todos de la clase "call")
+REGISTRY_EVENTS = ("Newchannel", "Newstate", "Rename", "BridgeEnter", "BridgeLeave", "Hangup")
+
+
+class CallRecord:
+    """Estado vivo de un canal. Con __slots__ para que miles de llamadas ocupen poco."""
+
+    __slots__ = ("channel", "uniqueid", "linkedid", "state", "caller_id", "exten", "bridge_id",
+                 "start_time", "answer_time", "end_time", "hangup_cause", "agi_session", "from_ami")
+
+    def __init__(self, channel: str, uniqueid: str, linkedid: Optional[str] = None, start_time: float = 0.0):
+        self.channel = channel
+        self.uniqueid = uniqueid
+        self.linkedid = linkedid or uniqueid
+        self.state = "Down"
+        self.caller_id: Optional[str] = None
+        self.exten: Optional[str] = None
+        self.bridge_id: Optional[str] = None
+        self.start_time = start_time
+        self.answer_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self.hangup_cause: Optional[str] = None
+        self.agi_session: Any = None
+        # Si AMI ha anunciado el canal (si no, sólo existe por su sesión AGI)
+        self.from_ami = False
+
+    @property
+    def active(self) -> bool:
+        return self.end_time is None
+
+
+class CallSnapshot(NamedTuple):
+    channel: str
+    uniqueid: str
+    linkedid: str
+    state: str
+    caller_id: Optional[str]
+    exten: Optional[str]
+    peers: Tuple[str, ...]
+    start_time: float
+    answer_time: Optional[float]
+    end_time: Optional[float]
+    hangup_cause: Optional[str]
+    has_agi: bool
+
+
+class CallRegistry:
+    """
+    Registro en memoria de las llamadas vivas del conector.
+
+    Se alimenta de eventos AMI (``subscribe_to``) y de las sesiones AGI
+    (``attach_agi``/``detach_agi``) y se indexa por Channel, Uniqueid y Linkedid con
+    búsqueda O(1). Las llamadas colgadas se conservan ``linger`` segundos (para
+    eventos tardíos y consultas) y después se expulsan automáticamente.
+    """
+
+    def __init__(self, linger: float = 5.0, clock: Callable[[], float] = time.time):
+        self.linger = linger
+        self.clock = clock
+        self._by_channel: Dict[str, CallRecord] = {}
+        self._by_uniqueid: Dict[str, CallRecord] = {}
+        self._by_linkedid: Dict[str, Dict[str, CallRecord]] = {}
+        self._bridges: Dict[str, Set[str]] = {}
+        self._evictions = collections.deque()
+        self._handlers = {
+            "Newchannel": self._on_newchannel,
+            "Newstate": self._on_newstate,
+            "Rename": self._on_rename,
+            "BridgeEnter": self._on_bridge_enter,
+            "BridgeLeave": self._on_bridge_leave,
+            "Hangup": self._on_hangup,
+        }
+
+    def __len__(self) -> int:
+        return len(self._by_uniqueid)
+
+    def __contains__(self, channel: str) -> bool:
+        return channel in self._by_channel
+
+    def subscribe_to(self, ami_client):
+        """Registra el registro como suscriptor de los eventos de llamada del cliente AMI."""
+        return ami_client.events.subscribe(REGISTRY_EVENTS, handler=self.on_event)
+
+    # --- Consultas ---
+    def get(self, channel: str) -> Optional[CallRecord]:
+        return self._by_channel.get(channel)
+
+    def by_uniqueid(self, uniqueid: str) -> Optional[CallRecord]:
+        return self._by_uniqueid.get(uniqueid)
+
+    def by_linkedid(self, linkedid: str) -> List[CallRecord]:
+        return list(self._by_linkedid.get(linkedid, {}).values())
+
+    def peers(self, record: CallRecord) -> Tuple[str, ...]:
+        """Channels de los otros participantes del bridge en que está la llamada."""
+        members = self._bridges.get(record.bridge_id) if record.bridge_id else None
+        if not members:
+            return ()
+        return tuple(self._by_uniqueid[u].channel for u in members if u != record.uniqueid and u in self._by_uniqueid)
+
+    def snapshot(self, active_only: bool = False) -> List[CallSnapshot]:
+        self.evict_expired()
+        return [
+            CallSnapshot(r.channel, r.uniqueid, r.linkedid, r.state, r.caller_id, r.exten, self.peers(r),
+                         r.start_time, r.answer_time, r.end_time, r.hangup_cause, r.agi_session is not None)
+            for r in self._by_uniqueid.values()
+            if not active_only or r.active
+        ]
+
+    # --- Alimentación ---
+    def on_event(self, event: Dict[str, Any]):
+        handler = self._handlers.get(event.get("Event"))
+        if handler is not None:
+            handler(event)
+        if self._evictions:
+            self.evict_expired()
+
+    def _record_for(self, event: Dict[str, Any]) -> Optional[CallRecord]:
+        uniqueid = event.get("Uniqueid")
+        record = self._by_uniqueid.get(uniqueid) if uniqueid else None
+        if record is None and event.get("Channel"):
+            record = self._by_channel.get(event["Channel"])
+        if record is not None:
+            record.from_ami = True
+        return record
+
+    def _add(self, channel: str, uniqueid: str, linkedid: Optional[str]) -> CallRecord:
+        record = CallRecord(channel, uniqueid, linkedid, self.clock())
+        self._by_channel[channel] = record
+        self._by_uniqueid[uniqueid] = record
+        self._by_linkedid.setdefault(record.linkedid, {})[uniqueid] = record
+        return record
+
+    def _on_newchannel(self, event):
+        channel, uniqueid = event.get("Channel"), event.get("Uniqueid")
+        if not channel or not uniqueid:
+            return
+        record = self._by_uniqueid.get(uniqueid) or self._add(channel, uniqueid, event.get("Linkedid"))
+        record.from_ami = True
+        record.state = event.get("ChannelStateDesc", record.state)
+        record.caller_id = event.get("CallerIDNum") or record.caller_id
+        record.exten = event.get("Exten") or record.exten
+
+    def _on_newstate(self, event):
+        record = self._record_for(event)
+        if record is None:
+            return
+        record.state = event.get("ChannelStateDesc", record.state)
+        if record.state == "Up" and record.answer_time is None:
+            record.answer_time = self.clock()
+
+    def _on_rename(self, event):
+        record = self._record_for(event)
+        new_name = event.get("Newname") or event.get("NewName")
+        if record is None or not new_name:
+            return
+        self._by_channel.pop(record.channel, None)
+        record.channel = new_name
+        self._by_channel[new_name] = record
+
+    def _on_bridge_enter(self, event):
+        record = self._record_for(event)
+        bridge_id = event.get("BridgeUniqueid")
+        if record is None or not bridge_id:
+            return
+        record.bridge_id = bridge_id
+        self._bridges.setdefault(bridge_id, set()).add(record.uniqueid)
+
+    def _on_bridge_leave(self, event):
+        record = self._record_for(event)
+        if record is None:
+            return
+        self._leave_bridge(record)
+
+    def _leave_bridge(self, record: CallRecord):
+        members = self._bridges.get(record.bridge_id) if record.bridge_id else None
+        if members is not None:
+            members.discard(record.uniqueid)
+            if not members:
+                del self._bridges[record.bridge_id]
+        record.bridge_id = None
+
+    def _on_hangup(self, event):
+        record = self._record_for(event)
+        if record is None:
+            return
+        self.end(record, event.get("Cause-txt") or event.get("Cause"))
+
+    def end(self, record: CallRecord, cause: Optional[str] = None):
+        """Marca la llamada como colgada y programa su expulsión."""
+        if record.end_time is not None:
+            return
+        self._leave_bridge(record)
+        record.state = "Hangup"
+        record.end_time = self.clock()
+        record.hangup_cause = cause
+        self._evictions.append((record.end_time + self.linger, record))
+
+    def attach_agi(self, channel: str, session: Any, uniqueid: Optional[str] = None) -> CallRecord:
+        """Asocia una sesión AGI a su llamada (creándola si AMI aún no la ha anunciado)."""
+        record = self._by_channel.get(channel) or (self._by_uniqueid.get(uniqueid) if uniqueid else None)
+        if record is None:
+            record = self._add(channel, uniqueid or channel, None)
+            record.state = "Up"
+        record.agi_session = session
+        return record
+
+    def detach_agi(self, channel: str):
+        """Desasocia la sesión AGI. Si AMI nunca anunció la llamada, ningún Hangup la cerrará: se cierra aquí."""
+        record = self._by_channel.get(channel)
+        if record is not None:
+            record.agi_session = None
+            if not record.from_ami:
+                self.end(record)
+        if self._evictions:
+            self.evict_expired()
+
+    def evict_expired(self, now: Optional[float] = None) -> int:
+        now = self.clock() if now is None else now
+        evictions = self._evictions
+        evicted = 0
+        while evictions and evictions[0][0] <= now:
+            _, record = evictions.popleft()
+            self._remove(record)
+            evicted += 1
+        return evicted
+
+    def _remove(self, record: CallRecord):
+        if self._by_channel.get(record.channel) is record:
+            del self._by_channel[record.channel]
+        if self._by_uniqueid.get(record.uniqueid) is record:
+            del self._by_uniqueid[record.uniqueid]
+        linked = self._by_linkedid.get(record.linkedid)
+        if linked is not None:
+            linked.pop(record.uniqueid, None)
+            if not linked:
+                del self._by_linkedid[record.linkedid]
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+
+class RoutedMessage:
+    """Mensaje local con la misma forma (body, headers) que un mensaje de aio-pika."""
+
+    __slots__ = ("body", "headers")
+
+    def __init__(self, body: bytes, headers: Optional[Dict[str, Any]] = None):
+        self.body = body
+        self.headers = headers or {}
+
+
+class CallRouter:
+    """
+    Demultiplexa los mensajes de una cola compartida en colas asyncio acotadas por call_id.
+
+    Un único consumidor por conector lee la cola de RabbitMQ y entrega cada mensaje a la
+    sesión de la llamada en O(1), independientemente del número de llamadas activas.
+    Si la cola de una llamada está llena se descarta el mensaje más antiguo: para audio
+    en tiempo real es preferible perder pasado que acumular retardo.
+    """
+
+    def __init__(self, maxsize: int = 200, name: str = "outgoing_audio"):
+        self.maxsize = maxsize
+        self.name = name
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self.routed = 0
+        self.dropped = 0
+        self.unrouted = 0
+        # Último mensaje entregado sin confirmar (consumo con prefetch) y ack ya programado
+        self._unacked = None
+        self._ack_scheduled = False
+        # Destino alternativo (corrutina que recibe el mensaje y devuelve si lo ha entregado)
+        # para el audio de llamadas que no están aquí: con varios nodos, el reenvío al dueño
+        self.forward = None
+
+    def __contains__(self, call_id: str) -> bool:
+        return call_id in self._queues
+
+    def __len__(self) -> int:
+        return len(self._queues)
+
+    def register(self, call_id: str) -> asyncio.Queue:
+        """Crea (o devuelve) la cola de una llamada."""
+        queue = self._queues.get(call_id)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.maxsize)
+            self._queues[call_id] = queue
+        return queue
+
+    def unregister(self, call_id: str):
+        self._queues.pop(call_id, None)
+
+    def queue_for(self, call_id: str) -> Optional[asyncio.Queue]:
+        return self._queues.get(call_id)
+
+    def purge(self, call_id: str) -> int:
+        """Descarta lo pendiente en la cola de una llamada. Devuelve cuántos elementos."""
+        queue = self._queues.get(call_id)
+        purged = 0
+        while queue is not None and not queue.empty():
+            queue.get_nowait()
+            purged += 1
+        return purged
+
+    def dispatch(self, call_id: Optional[str], item: Any) -> bool:
+        """Entrega un elemento a la cola de su llamada. Devuelve False si no hay destino."""
+        queue = self._queues.get(call_id) if call_id else None
+        if queue is None:
+            self.unrouted += 1
+            return False
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(item)
+        self.routed += 1
+        return True
+
+    async def _on_message(self, message):
+        call_id = (message.headers or {}).get("call_id")
+        if self.forward is not None and call_id not in self._queues:
+            try:
+                if await self.forward(message):
+                    return
+            except Exception as e:
+                logging.warning(f"[CallRouter] Error reenviando mensaje de {self.name} (call_id={call_id}): {e}")
+        self.dispatch(call_id, message)
+
+    async def _on_message_ack(self, message):
+        await self._on_message(message)
+        # Un único ack (multiple) por los mensajes repartidos en la misma vuelta del bucle
+        self._unacked = message
+        if not self._ack_scheduled:
+            self._ack_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush_ack)
+
+    def _flush_ack(self):
+        message, self._unacked, self._ack_scheduled = self._unacked, None, False
+        if message is not None:
+            asyncio.ensure_future(self._ack(message))
+
+    async def _ack(self, message):
+        try:
+            await message.ack(multiple=True)
+        except Exception as e:
+            logging.warning(f"[CallRouter] Error confirmando mensajes de {self.name}: {e}")
+
+    async def consume(self, channel, queue_name: str, prefetch: int = 0, durable: bool = True):
+        """
+        Lanza el consumidor único de ``queue_name`` sobre un canal aio-pika. Sin
+        ``prefetch`` se consume sin ack: el audio saliente es efímero y el reparto en
+        memoria es inmediato. Con ``prefetch`` (el QoS del canal) el broker no entrega más
+        de ``prefetch`` mensajes sin confirmar, y se confirman en bloque tras repartirlos.
+        Una cola no ``durable`` (la propia de un nodo) se borra al irse su consumidor.
+        """
+        if durable:
+            queue = await channel.declare_queue(queue_name, durable=True)
+        else:
+            queue = await channel.declare_queue(queue_name, auto_delete=True)
+        if prefetch > 0:
+            await queue.consume(self._on_message_ack, no_ack=False)
+        else:
+            await queue.consume(self._on_message, no_ack=True)
+        logging.info(f"[CallRouter] Consumidor único de {queue_name} activo ({self.name}"
+                     + (f", prefetch {prefetch})" if prefetch > 0 else ")"))
+        return queue
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": len(self._queues),
+            "routed": self.routed,
+            "dropped": self.dropped,
+            "unrouted": self.unrouted,
+        }
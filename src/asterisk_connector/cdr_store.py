@@ -0,0 +1,445 @@
+"""
+Persistencia de CDR y de la línea temporal de eventos de cada llamada en MongoDB.
+
+``CDRRecorder`` se alimenta de eventos AMI y del inicio/fin de las sesiones AGI sin
+esperar nunca a la base de datos: acumula en memoria un documento CDR por llamada
+(``_id`` = Uniqueid) y un documento por evento, y los escribe por lotes
+(``insert_many`` de eventos y upserts en bloque de CDR) al llegar a ``batch_size``
+documentos o cada ``flush_interval`` segundos. Si MongoDB no responde, los lotes van a
+un spool en disco acotado (``Spool``) y se reescriben en orden cuando vuelve; sin
+spool, o con el spool lleno, se descartan los más antiguos.
+
+Los CDR se escriben con ``$set`` del estado completo de la llamada y los eventos con un
+``_id`` propio, así que reescribir un lote (tras un timeout, desde el spool) no duplica
+ni retrocede nada.
+"""
+import asyncio
+import collections
+import copy
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from common import metrics
+from common.backoff import Backoff
+
+# Eventos AMI que alimentan los CDR (todos de la clase "call")
+CDR_EVENTS = ("Newchannel", "Newstate", "Rename", "DialBegin", "DialEnd", "BridgeEnter", "BridgeLeave", "Hangup")
+# Campos del evento que ya están en el documento de la línea temporal
+TIMELINE_KEYS = ("Event", "Uniqueid", "Linkedid")
+
+CDR_FLUSH_SECONDS = metrics.REGISTRY.histogram("cdr_flush_seconds", "Duración de cada escritura por lotes en MongoDB")
+CDR_DOCUMENTS = metrics.REGISTRY.counter(
+    "cdr_documents_total", "Documentos de CDR y eventos según su destino (written, spooled, dropped)", ("outcome",))
+CDR_WRITE_ERRORS = metrics.REGISTRY.counter("cdr_write_errors_total", "Escrituras por lotes en MongoDB fallidas")
+
+Batch = Dict[str, Any]
+
+
+def _batch_size(batch: Batch) -> int:
+    return len(batch["calls"]) + len(batch["events"])
+
+
+class Spool:
+    """
+    Lotes pendientes en disco, un fichero JSON por lote nombrado con su número de
+    secuencia para reescribirlos en el orden en que se formaron. Si al guardar uno se
+    superaría ``max_bytes`` se borran los más antiguos. Las operaciones son bloqueantes:
+    ``CDRRecorder`` las ejecuta en el executor del bucle.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._files: Deque[Tuple[str, int]] = collections.deque()
+        for name in sorted(n for n in os.listdir(directory) if n.endswith(".json")):
+            path = os.path.join(directory, name)
+            self._files.append((path, os.path.getsize(path)))
+        self.bytes = sum(size for _, size in self._files)
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    @property
+    def last_seq(self) -> int:
+        """Secuencia del lote más reciente en disco (para continuar la numeración al arrancar)."""
+        if not self._files:
+            return 0
+        return int(os.path.basename(self._files[-1][0]).split(".")[0])
+
+    def put(self, seq: int, batch: Batch) -> int:
+        """Guarda un lote. Devuelve los documentos descartados para hacerle sitio."""
+        data = json.dumps(batch, separators=(",", ":")).encode()
+        dropped = 0
+        while self._files and self.bytes + len(data) > self.max_bytes:
+            dropped += _batch_size(self.load(self._files[0][0]))
+            self.pop()
+        if len(data) > self.max_bytes:
+            return dropped + _batch_size(batch)
+        path = os.path.join(self.directory, f"{seq:020d}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        # Un desbordamiento (seq N+1) puede guardarse antes que el lote N cuya escritura
+        # estaba en curso y ha fallado: se inserta en su sitio para reescribirlos en orden
+        index = len(self._files)
+        while index and self._files[index - 1][0] > path:
+            index -= 1
+        self._files.insert(index, (path, len(data)))
+        self.bytes += len(data)
+        return dropped
+
+    def peek(self) -> Optional[Tuple[str, Batch]]:
+        """El lote más antiguo (ruta y contenido), o None si no hay."""
+        if not self._files:
+            return None
+        path = self._files[0][0]
+        return path, self.load(path)
+
+    def load(self, path: str) -> Batch:
+        with open(path, "rb") as f:
+            return json.loads(f.read())
+
+    def pop(self):
+        path, size = self._files.popleft()
+        self.bytes -= size
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+class CDRRecorder:
+    """
+    Etapa de persistencia de llamadas. ``on_event`` (suscrito a AMI con
+    ``subscribe_to``), ``agi_started`` y ``agi_ended`` sólo actualizan memoria; ``run``
+    vuelca los lotes al destino (``sink.write(calls, events)``). Si se acumulan
+    ``max_buffered`` documentos sin poder escribirlos, el lote va directamente al spool.
+    """
+
+    def __init__(self, sink, batch_size: int = 500, flush_interval: float = 1.0, max_buffered: int = 10000,
+                 spool: Optional[Spool] = None, write_timeout: float = 5.0, clock: Callable[[], float] = time.time,
+                 backoff: Optional[Backoff] = None, finished_memory: int = 10000):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max(batch_size, max_buffered)
+        self.spool = spool
+        self.write_timeout = write_timeout
+        self.clock = clock
+        self.backoff = backoff or Backoff(base=flush_interval, cap=30.0)
+        # Llamadas abiertas (Uniqueid -> documento CDR), las modificadas desde el último lote y eventos pendientes
+        self._calls: Dict[str, Dict[str, Any]] = {}
+        self._dirty: Dict[str, None] = {}
+        self._events: List[Dict[str, Any]] = []
+        # Llamadas ya cerradas: sus eventos tardíos sólo van a la línea temporal
+        self._finished: Dict[str, None] = {}
+        self.finished_memory = finished_memory
+        self._seq = spool.last_seq if spool is not None else 0
+        self._wakeup = asyncio.Event()
+        self._spool_lock = asyncio.Lock()
+        self._spills = set()
+        self._failures = 0
+        self.written = 0
+        self.spooled = 0
+        self.dropped = 0
+        self._updaters = {
+            "Newchannel": self._on_newchannel,
+            "Newstate": self._on_newstate,
+            "Rename": self._on_rename,
+            "DialBegin": self._on_dial_begin,
+            "DialEnd": self._on_dial_end,
+            "BridgeEnter": self._on_bridge_enter,
+            "Hangup": self._on_hangup,
+        }
+        self.logger = logging.getLogger("CDRRecorder")
+
+    @property
+    def buffered(self) -> int:
+        return len(self._events) + len(self._dirty)
+
+    def subscribe_to(self, ami_client):
+        """Registra el recorder como suscriptor de los eventos de llamada del cliente AMI."""
+        return ami_client.events.subscribe(CDR_EVENTS, handler=self.on_event)
+
+    def register_metrics(self, registry: metrics.MetricsRegistry = metrics.REGISTRY):
+        registry.gauge("cdr_buffered_documents", "Documentos de CDR y eventos pendientes de escribir en memoria",
+                       function=lambda: self.buffered)
+        registry.gauge("cdr_spool_bytes", "Bytes de lotes pendientes en el spool en disco",
+                       function=lambda: self.spool.bytes if self.spool is not None else 0)
+
+    # --- Alimentación (nunca espera a la base de datos) ---
+    def on_event(self, event: Dict[str, Any]):
+        uniqueid = event.get("Uniqueid")
+        if not uniqueid:
+            return
+        name = event.get("Event")
+        ts = self.clock()
+        linkedid = event.get("Linkedid")
+        if uniqueid not in self._finished:
+            record = self._record(uniqueid, event.get("Channel"), linkedid)
+            update = self._updaters.get(name)
+            if update is not None:
+                update(record, event, ts)
+            linkedid = record["linkedid"]
+            self._dirty[uniqueid] = None
+        self._events.append({
+            "_id": uuid.uuid4().hex, "uniqueid": uniqueid, "linkedid": linkedid or uniqueid, "event": name, "ts": ts,
+            "fields": {k: v for k, v in event.items() if k not in TIMELINE_KEYS},
+        })
+        self._buffered()
+
+    def agi_started(self, call_id: str, uniqueid: Optional[str] = None):
+        record = self._record(uniqueid or call_id, call_id)
+        record["agi"] = {"start": self.clock(), "end": None}
+        self._dirty[record["_id"]] = None
+        self._buffered()
+
+    def agi_ended(self, call_id: str, uniqueid: Optional[str] = None, stats: Optional[Dict[str, Any]] = None):
+        record = self._calls.get(uniqueid or call_id)
+        if record is None:
+            return
+        agi = record.setdefault("agi", {"start": None})
+        agi["end"] = self.clock()
+        if stats:
+            agi["stats"] = stats
+        self._dirty[record["_id"]] = None
+        self._buffered()
+
+    def _record(self, uniqueid: str, channel: Optional[str] = None, linkedid: Optional[str] = None) -> Dict[str, Any]:
+        record = self._calls.get(uniqueid)
+        if record is None:
+            record = self._calls[uniqueid] = {"_id": uniqueid, "channel": channel, "linkedid": linkedid or uniqueid,
+                                              "start": self.clock()}
+        return record
+
+    def _on_newchannel(self, record, event, ts):
+        record["linkedid"] = event.get("Linkedid") or record["linkedid"]
+        for key, field in (("channel", "Channel"), ("caller_id", "CallerIDNum"), ("caller_name", "CallerIDName"),
+                           ("exten", "Exten"), ("context", "Context"), ("state", "ChannelStateDesc")):
+            if event.get(field):
+                record[key] = event[field]
+
+    def _on_newstate(self, record, event, ts):
+        record["state"] = event.get("ChannelStateDesc", record.get("state"))
+        if record["state"] == "Up" and record.get("answer") is None:
+            record["answer"] = ts
+
+    def _on_rename(self, record, event, ts):
+        record["channel"] = event.get("Newname") or event.get("NewName") or record["channel"]
+
+    def _on_dial_begin(self, record, event, ts):
+        if event.get("DestChannel"):
+            record.setdefault("dialed", []).append(event["DestChannel"])
+
+    def _on_dial_end(self, record, event, ts):
+        record["dial_status"] = event.get("DialStatus")
+
+    def _on_bridge_enter(self, record, event, ts):
+        record["bridge_id"] = event.get("BridgeUniqueid")
+        record.setdefault("bridged", ts)
+
+    def _on_hangup(self, record, event, ts):
+        if record.get("end") is not None:
+            return
+        record["state"] = "Hangup"
+        record["end"] = ts
+        record["hangup_cause"] = event.get("Cause-txt") or event.get("Cause")
+        record["duration"] = ts - record["start"]
+        record["billsec"] = ts - record["answer"] if record.get("answer") is not None else 0.0
+
+    def _buffered(self):
+        buffered = self.buffered
+        if buffered >= self.max_buffered:
+            # La escritura no da abasto: el lote va al spool en lugar de crecer en memoria
+            task = asyncio.get_running_loop().create_task(self._spill(self._take()))
+            self._spills.add(task)
+            task.add_done_callback(self._spills.discard)
+        elif buffered >= self.batch_size:
+            self._wakeup.set()
+
+    # --- Lotes ---
+    def _take(self) -> Optional[Tuple[int, Batch]]:
+        """Saca lo pendiente como un lote numerado y olvida las llamadas terminadas."""
+        if not self._events and not self._dirty:
+            return None
+        calls = []
+        for uniqueid in self._dirty:
+            record = self._calls.get(uniqueid)
+            if record is None:
+                continue
+            calls.append(copy.deepcopy(record))
+            agi = record.get("agi")
+            agi_done = agi is None or agi.get("end") is not None
+            # Terminada: colgada según AMI y sin sesión AGI abierta, o sesión AGI sin eventos AMI
+            if agi_done and (record.get("end") is not None or (agi is not None and "state" not in record)):
+                del self._calls[uniqueid]
+                self._finished[uniqueid] = None
+                if len(self._finished) > self.finished_memory:
+                    del self._finished[next(iter(self._finished))]
+        events, self._events, self._dirty = self._events, [], {}
+        self._seq += 1
+        return self._seq, {"calls": calls, "events": events}
+
+    async def _write(self, batch: Batch) -> bool:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.sink.write(batch["calls"], batch["events"]), self.write_timeout)
+        except Exception as e:
+            CDR_WRITE_ERRORS.inc()
+            self._failures += 1
+            if self._failures == 1:
+                self.logger.error(f"[CDR] Error escribiendo en MongoDB: {e!r}; los lotes pasan al spool")
+            return False
+        CDR_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        if self._failures:
+            self.logger.info(f"[CDR] Escritura en MongoDB recuperada tras {self._failures} fallos")
+        self._failures = 0
+        self.written += _batch_size(batch)
+        CDR_DOCUMENTS.labels("written").inc(_batch_size(batch))
+        return True
+
+    async def _spill(self, numbered: Optional[Tuple[int, Batch]]):
+        if numbered is None:
+            return
+        seq, batch = numbered
+        if self.spool is None:
+            self._drop(_batch_size(batch))
+            return
+        async with self._spool_lock:
+            dropped = await asyncio.get_running_loop().run_in_executor(None, self.spool.put, seq, batch)
+        self.spooled += _batch_size(batch)
+        CDR_DOCUMENTS.labels("spooled").inc(_batch_size(batch))
+        self._drop(dropped)
+
+    def _drop(self, count: int):
+        if count:
+            self.dropped += count
+            CDR_DOCUMENTS.labels("dropped").inc(count)
+            self.logger.warning(f"[CDR] {count} documentos descartados (MongoDB sin respuesta y spool lleno)")
+
+    async def _drain_spool(self) -> bool:
+        """Reescribe en orden los lotes del spool. False si MongoDB sigue sin responder."""
+        loop = asyncio.get_running_loop()
+        async with self._spool_lock:
+            while len(self.spool):
+                path, batch = await loop.run_in_executor(None, self.spool.peek)
+                if not await self._write(batch):
+                    return False
+                await loop.run_in_executor(None, self.spool.pop)
+        return True
+
+    async def flush(self) -> bool:
+        """Escribe lo pendiente (antes, lo que haya en el spool). False si ha quedado en el spool."""
+        numbered = self._take()
+        if self.spool is not None and len(self.spool) and not await self._drain_spool():
+            await self._spill(numbered)
+            return False
+        if numbered is None:
+            return True
+        if await self._write(numbered[1]):
+            return True
+        await self._spill(numbered)
+        return False
+
+    async def run(self):
+        """Vuelca lotes por tamaño o por intervalo; tras un fallo, reintenta con backoff."""
+        self.logger.info(f"[CDR] Persistencia por lotes activa (lote {self.batch_size}, cada {self.flush_interval} s"
+                         + (f", spool en {self.spool.directory})" if self.spool is not None else ", sin spool)"))
+        while True:
+            timeout = max(self.flush_interval, self.backoff.delay(self._failures))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        if self._spills:
+            await asyncio.gather(*self._spills, return_exceptions=True)
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {"open_calls": len(self._calls), "buffered": self.buffered, "written": self.written,
+                "spooled": self.spooled, "dropped": self.dropped,
+                "spool_batches": len(self.spool) if self.spool is not None else 0}
+
+
+class MongoCDRSink:
+    """Destino MongoDB (motor): eventos con ``insert_many`` y CDR con upserts en bloque."""
+
+    def __init__(self, database, cdr_collection: str = "cdr", events_collection: str = "call_events"):
+        self.cdr = database[cdr_collection]
+        self.events = database[events_collection]
+
+    async def ensure_indexes(self):
+        await self.cdr.create_index("linkedid")
+        await self.events.create_index([("uniqueid", 1), ("ts", 1)])
+        await self.events.create_index("linkedid")
+
+    async def write(self, calls: List[Dict[str, Any]], events: List[Dict[str, Any]]):
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
+
+        if events:
+            try:
+                await self.events.insert_many(events, ordered=False)
+            except BulkWriteError as e:
+                # Claves duplicadas: eventos de un lote reescrito que ya estaban guardados
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", ())):
+                    raise
+        if calls:
+            await self.cdr.bulk_write([
+                UpdateOne({"_id": call["_id"]}, {"$set": {k: v for k, v in call.items() if k != "_id"}}, upsert=True)
+                for call in calls
+            ], ordered=False)
+
+
+class InMemoryCDRSink:
+    """
+    Destino en memoria con la semántica de ``MongoCDRSink`` (pruebas y benchmarks):
+    eventos idempotentes por ``_id`` y CDR fusionados con ``$set``. ``fail`` simula una
+    caída de MongoDB y ``delay`` una escritura lenta.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.cdr: Dict[str, Dict[str, Any]] = {}
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self.delay = delay
+        self.fail = False
+        self.writes = 0
+
+    async def write(self, calls: List[Dict[str, Any]], events: List[Dict[str, Any]]):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("MongoDB no disponible")
+        self.writes += 1
+        for event in events:
+            self.events.setdefault(event["_id"], event)
+        for call in calls:
+            self.cdr.setdefault(call["_id"], {}).update(call)
+
+    def timeline(self, uniqueid: str) -> List[str]:
+        return [e["event"] for e in sorted(self.events.values(), key=lambda e: e["ts"]) if e["uniqueid"] == uniqueid]
+
+
+async def connect_mongo_sink() -> MongoCDRSink:
+    """Destino MongoDB según el entorno (MONGO_HOST, MONGO_PORT, MONGO_USER, MONGO_PASS, MONGO_DB)."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    credentials = f"{os.getenv('MONGO_USER')}:{os.getenv('MONGO_PASS', '')}@" if os.getenv("MONGO_USER") else ""
+    client = AsyncIOMotorClient(f"mongodb://{credentials}{os.getenv('MONGO_HOST', 'localhost')}:"
+                                f"{os.getenv('MONGO_PORT', '27017')}/", serverSelectionTimeoutMS=5000)
+    sink = MongoCDRSink(client[os.getenv("MONGO_DB", "voip")])
+    try:
+        await sink.ensure_indexes()
+    except Exception as e:
+        logging.warning(f"[CDR] No se han podido crear los índices de MongoDB: {e}")
+    return sink
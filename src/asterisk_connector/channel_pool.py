@@ -0,0 +1,186 @@
+"""
+Canales AMQP del conector y control de flujo por llamada.
+
+Con un único canal compartido, un bloqueo de ese canal (flow control del broker, un
+consumidor lento en el mismo canal) detiene el audio de todas las llamadas a la vez.
+``ChannelPool`` separa los papeles: varios canales de publicación repartidos por
+call_id y canales de consumo dedicados con su QoS. ``CallPublisher`` da a cada llamada
+su propia cola acotada hacia el broker: la lectura del socket AGI nunca espera a
+RabbitMQ y, si la cola de una llamada se llena, se descartan sus tramas de audio más
+antiguas sin afectar a las demás.
+"""
+import asyncio
+import collections
+import logging
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+import aio_pika
+
+from common import envelope, metrics
+
+# Colas que el conector declara al arrancar y tras cada reconexión
+TOPOLOGY = ("incoming_audio_chunks", "outgoing_audio_chunks")
+
+PUBLISH_DROPPED = metrics.REGISTRY.counter(
+    "agi_publish_dropped_total", "Tramas de audio entrante descartadas por la cola de publicación de su llamada llena")
+RABBITMQ_RECONNECTS = metrics.REGISTRY.counter("rabbitmq_reconnects_total", "Reconexiones del conector a RabbitMQ")
+
+
+class ChannelPool:
+    """
+    Canales de una conexión aio-pika (robusta): ``publish_channels`` canales de
+    publicación, elegidos por hash del call_id para que cada llamada publique siempre
+    en orden por el mismo, y canales de consumo dedicados (``consume_channel``) con
+    ``prefetch`` mensajes sin confirmar en vuelo. Al reconectar, aio-pika restaura los
+    canales y el pool vuelve a declarar la topología.
+    """
+
+    def __init__(self, connection, publish_channels: int = 4, prefetch: int = 200, topology: Iterable[str] = TOPOLOGY):
+        self.connection = connection
+        self.size = max(1, publish_channels)
+        self.prefetch = prefetch
+        self.topology = tuple(topology)
+        self.publish_channels: List[Any] = []
+        self.consume_channels: List[Any] = []
+
+    async def open(self) -> "ChannelPool":
+        self.publish_channels = [await self.connection.channel() for _ in range(self.size)]
+        await self.declare_topology()
+        callbacks = getattr(self.connection, "reconnect_callbacks", None)
+        if callbacks is not None:
+            callbacks.add(self._on_reconnect)
+        logging.info(f"[RabbitMQ] {self.size} canales de publicación abiertos (prefetch de consumo {self.prefetch})")
+        return self
+
+    async def declare_topology(self):
+        for name in self.topology:
+            await self.publish_channels[0].declare_queue(name, durable=True)
+
+    async def _on_reconnect(self, *args):
+        RABBITMQ_RECONNECTS.inc()
+        logging.warning("[RabbitMQ] Conexión restablecida; se vuelve a declarar la topología")
+        try:
+            await self.declare_topology()
+        except Exception as e:
+            logging.error(f"[RabbitMQ] Error declarando la topología tras reconectar: {e}")
+
+    def for_call(self, call_id: str):
+        """Canal de publicación de una llamada (siempre el mismo para el mismo call_id)."""
+        return self.publish_channels[zlib.crc32(call_id.encode()) % len(self.publish_channels)]
+
+    async def consume_channel(self, prefetch: Optional[int] = None):
+        """Canal dedicado a consumir, con QoS ``prefetch`` (0 = sin límite)."""
+        channel = await self.connection.channel()
+        prefetch = self.prefetch if prefetch is None else prefetch
+        if prefetch > 0:
+            await channel.set_qos(prefetch_count=prefetch)
+        self.consume_channels.append(channel)
+        return channel
+
+    async def close(self):
+        for channel in self.publish_channels + self.consume_channels:
+            try:
+                await channel.close()
+            except Exception:
+                pass
+        self.publish_channels, self.consume_channels = [], []
+
+
+class CallPublisher:
+    """
+    Cola de publicación de una llamada hacia ``routing_key``.
+
+    ``offer`` no espera nunca: encola y despierta a la tarea de la llamada, que publica
+    en orden por el canal de la llamada. Con la cola en ``maxsize`` (el broker o el
+    canal no dan abasto, o la llamada envía más rápido que en tiempo real) se descarta
+    la trama de audio más antigua; los mensajes de control (inicio de llamada, eventos)
+    no se descartan nunca y pueden exceder el límite.
+    """
+
+    def __init__(self, call_id: str, channel, maxsize: int = 50, routing_key: str = "incoming_audio_chunks",
+                 latency: Optional[metrics.Histogram] = None):
+        self.call_id = call_id
+        self.channel = channel
+        self.maxsize = maxsize
+        self.routing_key = routing_key
+        self.latency = latency
+        self._queue = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def offer(self, body: bytes, headers: Optional[Dict[str, Any]] = None, droppable: bool = True) -> bool:
+        """Encola un mensaje. Devuelve False si se ha descartado él mismo."""
+        if self._closed:
+            return False
+        queue = self._queue
+        if len(queue) >= self.maxsize and droppable:
+            for i, item in enumerate(queue):
+                if item[2]:
+                    del queue[i]
+                    break
+            else:
+                self._drop()
+                return False
+            self._drop()
+        queue.append((body, headers, droppable, time.perf_counter()))
+        self._idle.clear()
+        self._wakeup.set()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return True
+
+    def _drop(self):
+        self.dropped += 1
+        PUBLISH_DROPPED.inc()
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            if not queue:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            body, headers, _, enqueued = queue.popleft()
+            try:
+                await self.channel.default_exchange.publish(
+                    aio_pika.Message(body=body, headers=headers, content_type=envelope.CONTENT_TYPE),
+                    routing_key=self.routing_key,
+                )
+            except Exception as e:
+                self.failed += 1
+                if self.failed == 1:
+                    logging.error(f"[AGI] Error publicando audio de call_id={self.call_id}: {e}")
+                continue
+            self.published += 1
+            if self.latency is not None:
+                self.latency.observe(time.perf_counter() - enqueued)
+
+    async def close(self, timeout: float = 2.0):
+        """Publica lo pendiente (hasta ``timeout`` segundos) y detiene la tarea de la llamada."""
+        self._closed = True
+        # _run saca el mensaje de la cola antes de publicarlo: con la cola vacía puede haber
+        # aún una publicación en curso, y _idle sólo se pone cuando ha terminado
+        if not self._idle.is_set():
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"[AGI] {len(self._queue)} mensajes de call_id={self.call_id} sin publicar al cerrar")
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": len(self._queue), "published": self.published, "dropped": self.dropped, "failed": self.failed}
@@ -5,27 +5,217 @@ Asterisk Connector - Microservicio para conectar con Asterisk
 
 
 import asyncio
+import functools
 import logging
 import os
 import sys
 import time
 from datetime import datetime
+from typing import Optional
 
 import aio_pika
 
+from common import envelope, metrics, tracing
+from common.audio_codec import Transcoder
+from common.latency import LatencyStats
+
 try:
     from .ami_client import AMIClient
+    from .ami_parser import DEFAULT_FIELD_WHITELIST
+    from .asterisk_connector_servicer import (AsteriskConnectorServicer,
+                                              serve_async)
+    from .audio_packetizer import (DEFAULT_SAMPLE_RATES, SAMPLE_WIDTHS,
+                                   AudioPacketizer)
+    from .call_ownership import connect_ownership_index
+    from .call_registry import CallRegistry
+    from .cdr_store import CDRRecorder, Spool, connect_mongo_sink
+    from .call_router import CallRouter
+    from .channel_pool import CallPublisher, ChannelPool
+    from .playout_buffer import PlayoutBuffer
+    from .rabbitmq_publisher import PUBLISH_SECONDS, AsyncRabbitMQPublisher
+    from .vad import (SPEECH_CONFIRMED, SPEECH_START, EnergyZCRModel,
+                      VADEvent, VoiceActivityDetector)
+    from .worker_pool import AGIWorkerPool
 except ImportError:
     from ami_client import AMIClient
+    from ami_parser import DEFAULT_FIELD_WHITELIST
+    from asterisk_connector_servicer import (AsteriskConnectorServicer,
+                                             serve_async)
+    from audio_packetizer import (DEFAULT_SAMPLE_RATES, SAMPLE_WIDTHS,
+                                  AudioPacketizer)
+    from call_ownership import connect_ownership_index
+    from call_registry import CallRegistry
+    from cdr_store import CDRRecorder, Spool, connect_mongo_sink
+    from call_router import CallRouter
+    from channel_pool import CallPublisher, ChannelPool
+    from playout_buffer import PlayoutBuffer
+    from rabbitmq_publisher import PUBLISH_SECONDS, AsyncRabbitMQPublisher
+    from vad import (SPEECH_CONFIRMED, SPEECH_START, EnergyZCRModel,
+                     VADEvent, VoiceActivityDetector)
+    from worker_pool import AGIWorkerPool
+
+# Evento de llamada con el que se pide al servicio TTS cancelar la síntesis en curso
+BARGE_IN = "barge_in"
+
+AGI_BYTES_RECEIVED = metrics.REGISTRY.counter("agi_bytes_received_total", "Bytes de audio recibidos por los sockets AGI")
+AGI_PUBLISH_SECONDS = PUBLISH_SECONDS.labels("agi")
+TRACE_STAGE_SECONDS = metrics.REGISTRY.histogram(
+    "trace_stage_seconds", "Duración de cada etapa de las trazas de respuesta (desde la etapa anterior)", ("stage",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+
+class AGISession:
+    """Sesión AGI activa de una llamada (el handle que guarda el registro de llamadas)."""
+
+    __slots__ = ("call_id", "agi_env", "writer", "playout", "vad", "started_at", "playing_utterances",
+                 "muted_utterances", "publisher")
+
+    def __init__(self, call_id, agi_env, writer, playout, vad=None, publisher=None):
+        self.call_id = call_id
+        self.agi_env = agi_env
+        self.writer = writer
+        self.playout = playout
+        self.vad = vad
+        # Cola de publicación de la llamada hacia incoming_audio_chunks
+        self.publisher = publisher
+        self.started_at = time.time()
+        # Locuciones (utterance_id) reproducidas desde la última interrupción, y las interrumpidas
+        self.playing_utterances = set()
+        self.muted_utterances = set()
 
 
 class AGIServer:
-    def __init__(self, agi_port, ami_client, rabbitmq_channel):
+    def __init__(self, agi_port, ami_client, rabbitmq_channel, audio_router=None, call_registry=None,
+                 channel_pool: Optional[ChannelPool] = None):
         self.agi_port = agi_port
         self.ami_client = ami_client
+        # Canal de consumo del audio saliente y, sin pool, también de publicación
         self.rabbitmq_channel = rabbitmq_channel
+        self.channel_pool = channel_pool
+        # Mensajes pendientes de publicar por llamada antes de descartar su audio más antiguo
+        self.publish_queue_size = int(os.getenv("AGI_PUBLISH_QUEUE_SIZE", "50"))
+        # Reparto del audio saliente por call_id (un único consumidor por conector)
+        self.audio_router = audio_router or CallRouter(maxsize=int(os.getenv("AGI_OUTGOING_QUEUE_SIZE", "200")))
+        # Formato del audio entrante y duración de cada trama publicada (20/40/100 ms)
+        self.audio_format = os.getenv("AGI_AUDIO_FORMAT", "slin")
+        self.frame_ms = int(os.getenv("AGI_FRAME_MS", "20"))
+        # Buffer de reproducción del audio saliente (profundidad en fragmentos)
+        self.playout_target_depth = int(os.getenv("AGI_PLAYOUT_TARGET_DEPTH", "3"))
+        self.playout_max_depth = int(os.getenv("AGI_PLAYOUT_MAX_DEPTH", "100"))
+        # Espera máxima del pre-buffer y silencio tras el que vaciarse no es un underrun
+        self.playout_max_prebuffer_ms = int(os.getenv("AGI_PLAYOUT_MAX_PREBUFFER_MS", "100"))
+        self.playout_quiet_ms = int(os.getenv("AGI_PLAYOUT_QUIET_MS", "200"))
+        # Detección de voz antes de publicar: suppress (descarta silencio), mark (lo marca) u off
+        self.vad_mode = os.getenv("AGI_VAD", "suppress")
+        self.vad_threshold_db = float(os.getenv("AGI_VAD_THRESHOLD_DB", "-40"))
+        self.vad_hangover_ms = int(os.getenv("AGI_VAD_HANGOVER_MS", "300"))
+        self.vad_pre_roll_ms = int(os.getenv("AGI_VAD_PRE_ROLL_MS", "60"))
+        # Barge-in: la voz del llamante interrumpe la reproducción en curso
+        self.barge_in = os.getenv("AGI_BARGE_IN", "1") not in ("0", "false", "no")
+        # Voz continuada necesaria para interrumpir (0: la primera trama de voz)
+        self.barge_in_min_ms = int(os.getenv("AGI_BARGE_IN_MIN_MS", "200"))
+        self.barge_in_latency = LatencyStats()
+        # Trazas de latencia: fracción de llamadas trazadas y desglose por etapa de cada una
+        self.trace_sampler = tracing.TraceSampler(float(os.getenv("TRACE_SAMPLE_RATE", "0.1")))
+        self.trace_report = tracing.TraceReport()
+        # Sesiones AGI activas por call_id y registro de llamadas compartido con AMI
+        self.sessions = {}
+        self.call_registry = call_registry
+        # Servicer gRPC que reenvía audio y eventos de la llamada a su stream (si existe)
+        self.grpc_streams = None
+        # Persistencia de CDR: inicio y fin de cada sesión AGI (si existe)
+        self.cdr = None
+        # Índice compartido de qué conector atiende cada llamada (si hay varios)
+        self.ownership = None
         self.logger = logging.getLogger("AGIServer")
 
+    def channel_for(self, call_id: str):
+        """Canal por el que publica una llamada: su canal del pool o el canal compartido."""
+        if self.channel_pool is not None:
+            return self.channel_pool.for_call(call_id)
+        return self.rabbitmq_channel
+
+    def create_vad(self):
+        """VAD de una llamada, o None si está desactivado."""
+        if self.vad_mode == "off":
+            return None
+        return VoiceActivityDetector(
+            sample_rate=DEFAULT_SAMPLE_RATES[self.audio_format],
+            frame_ms=self.frame_ms,
+            model=EnergyZCRModel(energy_threshold_db=self.vad_threshold_db),
+            hangover_ms=self.vad_hangover_ms,
+            pre_roll_ms=self.vad_pre_roll_ms,
+            suppress=self.vad_mode == "suppress",
+            audio_format=self.audio_format,
+            confirm_ms=self.barge_in_min_ms if self.barge_in else 0,
+        )
+
+    def register_metrics(self, registry: metrics.MetricsRegistry = metrics.REGISTRY):
+        """Gauges calculados al hacer scrape: llamadas activas y audio saliente pendiente por llamada."""
+        registry.gauge("agi_active_calls", "Sesiones AGI activas", function=lambda: len(self.sessions))
+
+        def outgoing_depth():
+            depths = {}
+            for call_id in self.sessions:
+                queue = self.audio_router.queue_for(call_id)
+                depths[(call_id,)] = queue.qsize() if queue is not None else 0
+            return depths
+
+        registry.gauge("agi_outgoing_queue_depth", "Fragmentos de audio saliente en cola del conector por llamada",
+                       ("call_id",), function=outgoing_depth)
+        registry.gauge("agi_publish_queue_depth", "Mensajes pendientes de publicar en RabbitMQ por llamada",
+                       ("call_id",), function=lambda: {(call_id,): len(s.publisher) for call_id, s in self.sessions.items()
+                                                       if s.publisher is not None})
+        registry.gauge("agi_playout_depth", "Fragmentos en el buffer de reproducción por llamada", ("call_id",),
+                       function=lambda: {(call_id,): len(s.playout) for call_id, s in self.sessions.items()})
+
+    def finish_trace(self, trace: tracing.TraceContext):
+        """Cierra la traza de una respuesta al escribir en el socket AGI su primer audio."""
+        trace.mark("played")
+        self.trace_report.add(trace)
+        for stage, ms in trace.breakdown():
+            TRACE_STAGE_SECONDS.labels(stage).observe(ms / 1000)
+        TRACE_STAGE_SECONDS.labels("total").observe(trace.total_ms / 1000)
+
+    def is_playing(self, call_id: str) -> bool:
+        """Hay audio saliente sonando o pendiente para la llamada."""
+        session = self.sessions.get(call_id)
+        if session is None:
+            return False
+        queue = self.audio_router.queue_for(call_id)
+        return bool(session.playout.playing or len(session.playout) or (queue is not None and queue.qsize())
+                    or session.playout.written_ahead(asyncio.get_running_loop().time()))
+
+    async def interrupt(self, call_id: str, reason: str = "grpc", trigger_ts: Optional[float] = None) -> Optional[float]:
+        """
+        Barge-in: descarta el audio saliente pendiente de la llamada (cola del conector y
+        buffer de reproducción), ignora lo que siga llegando de las locuciones interrumpidas
+        y pide al servicio TTS que cancele su síntesis. Devuelve la latencia desde
+        ``trigger_ts`` (o desde ahora) hasta que deja de sonar audio, en ms.
+        """
+        session = self.sessions.get(call_id)
+        if session is None:
+            return None
+        started = time.time()
+        queued = self.audio_router.purge(call_id)
+        buffered = session.playout.clear()
+        session.muted_utterances.update(session.playing_utterances)
+        session.playing_utterances.clear()
+        # Lo ya escrito en el socket AGI sigue sonando hasta agotarse
+        ahead = session.playout.written_ahead(asyncio.get_running_loop().time())
+        latency_ms = (time.time() - (trigger_ts or started) + ahead) * 1000
+        self.barge_in_latency.add(latency_ms)
+        self.logger.info(f"[AGI] Barge-in ({reason}) call_id={call_id}: {queued + buffered} fragmentos descartados, "
+                         f"silencio en {latency_ms:.1f} ms")
+        # Por la cola de la llamada, en orden con su audio y sin esperar al broker
+        if session.publisher is not None:
+            session.publisher.offer(envelope.encode_call_event(call_id, BARGE_IN, ts=trigger_ts or started,
+                                                               fields={"reason": reason}),
+                                    {"call_id": call_id}, droppable=False)
+        if self.grpc_streams is not None:
+            self.grpc_streams.stream_event(call_id, "PLAYBACK_INTERRUPTED")
+        return latency_ms
+
     async def handle_agi(self, reader, writer):
         # Leer variables AGI
         agi_env = {}
@@ -40,45 +230,178 @@ class AGIServer:
 
         # Lanzar tareas de audio bidireccional
         async def read_and_publish_audio():
+            packetizer = AudioPacketizer(frame_ms=self.frame_ms, audio_format=self.audio_format)
+            # Sólo call_id en cabeceras (reparto) y, si la llamada se traza, la traza de cada trama
+            headers = {"call_id": call_id}
+            traced = self.trace_sampler.sampled(call_id)
+
+            # Las tramas de audio se pueden descartar si la cola de la llamada se llena; los eventos no
+            async def send(body, frame=None):
+                message_headers = headers
+                if traced and frame is not None:
+                    trace = tracing.TraceContext(call_id, frame.seq, frame.capture_ts).mark("published")
+                    message_headers = {"call_id": call_id, tracing.TRACE_HEADER: trace.encode()}
+                publisher.offer(body, message_headers, droppable=frame is not None)
+
+            async def send_vad_event(event):
+                # Con AGI_BARGE_IN_MIN_MS se interrumpe al confirmarse la voz, no con la primera trama
+                trigger = SPEECH_CONFIRMED if vad.confirm_frames else SPEECH_START
+                if event.kind == trigger and self.barge_in and self.is_playing(call_id):
+                    await self.interrupt(call_id, "speech", trigger_ts=event.ts)
+                if event.kind == SPEECH_CONFIRMED:
+                    return
+                await send(envelope.encode_call_event(call_id, event.kind, ts=event.ts))
+                if self.grpc_streams is not None:
+                    self.grpc_streams.stream_event(call_id, event.kind.upper())
+
+            async def publish(frames):
+                if self.grpc_streams is not None:
+                    for frame in frames:
+                        self.grpc_streams.stream_audio(call_id, frame.payload)
+                if vad is None:
+                    for frame in frames:
+                        await send(envelope.encode_audio_chunk(call_id, frame.seq, frame.capture_ts, frame.payload),
+                                   frame)
+                    return
+                for item in vad.process(frames):
+                    if isinstance(item, VADEvent):
+                        await send_vad_event(item)
+                    else:
+                        frame, speech = item
+                        await send(envelope.encode_audio_chunk(call_id, frame.seq, frame.capture_ts, frame.payload,
+                                                               silence=not speech), frame)
+
             try:
+                # Metadatos de la llamada una sola vez, antes de la primera trama
+                await send(envelope.encode_call_start(
+                    call_id, packetizer.audio_format, packetizer.sample_rate, packetizer.frame_ms,
+                    agi_env=agi_env, uniqueid=agi_env.get("agi_uniqueid", ""), start_ts=session.started_at,
+                ))
                 while True:
                     chunk = await reader.read(1024)
                     if not chunk:
                         break
-                    msg = {
-                        "call_id": call_id,
-                        "audio": chunk,
-                        "format": "pcm",
-                        "agi_env": agi_env
-                    }
-                    await self.rabbitmq_channel.default_exchange.publish(
-                        aio_pika.Message(body=chunk, headers={"call_id": call_id, "format": "pcm"}),
-                        routing_key="incoming_audio_chunks"
-                    )
+                    AGI_BYTES_RECEIVED.inc(len(chunk))
+                    await publish(packetizer.feed(chunk))
+                await publish(packetizer.flush())
+                if vad is not None:
+                    for event in vad.finish(time.time()):
+                        await send_vad_event(event)
+                # Fin del audio de la sesión AGI (el fin de la llamada lo anuncia AMI)
+                await send(envelope.encode_call_event(call_id, "audio_ended"))
             except Exception as e:
                 self.logger.error(f"[AGI] Error leyendo audio: {e}")
 
         async def consume_and_write_audio():
+            # Transcodificadores del audio saliente que no llega en el formato del canal
+            transcoders = {}
+
+            def to_channel_format(body, headers):
+                source = (headers.get("format") or self.audio_format, int(headers.get("sample_rate") or channel_rate))
+                if source == (self.audio_format, channel_rate):
+                    return body
+                transcoder = transcoders.get(source)
+                if transcoder is None:
+                    transcoder = transcoders[source] = Transcoder(source[0], source[1], self.audio_format, channel_rate)
+                return transcoder.convert(body)
+
+            async def fill_playout():
+                while True:
+                    message = await outgoing.get()
+                    headers = message.headers or {}
+                    utterance = headers.get("utterance_id")
+                    if utterance:
+                        if utterance in session.muted_utterances:
+                            continue
+                        session.playing_utterances.add(utterance)
+                    seq = headers.get("seq")
+                    trace = tracing.from_headers(headers)
+                    on_played = None
+                    if trace is not None:
+                        trace.mark("playout_queued")
+                        on_played = functools.partial(self.finish_trace, trace)
+                    playout.push(to_channel_format(message.body, headers), int(seq) if seq is not None else None,
+                                 on_played)
+
             try:
-                queue = await self.rabbitmq_channel.declare_queue("outgoing_audio_chunks", durable=True)
-                async with queue.iterator() as queue_iter:
-                    async for message in queue_iter:
-                        async with message.process():
-                            if message.headers.get("call_id") == call_id:
-                                writer.write(message.body)
-                                await writer.drain()
+                await asyncio.gather(fill_playout(), playout.run(writer))
+            except asyncio.CancelledError:
+                pass
             except Exception as e:
                 self.logger.error(f"[AGI] Error escribiendo audio: {e}")
 
-        # Ejecutar ambas tareas concurrentemente
-        await asyncio.gather(read_and_publish_audio(), consume_and_write_audio())
-        self.logger.info(f"[AGI] Fin de llamada para call_id={call_id}")
+        # Ejecutar ambas tareas concurrentemente; la llamada termina cuando el canal AGI se cierra
+        outgoing = self.audio_router.register(call_id)
+        channel_rate = DEFAULT_SAMPLE_RATES[self.audio_format]
+        playout = PlayoutBuffer(
+            bytes_per_second=channel_rate * SAMPLE_WIDTHS[self.audio_format],
+            target_depth=self.playout_target_depth,
+            max_depth=self.playout_max_depth,
+            max_prebuffer_ms=self.playout_max_prebuffer_ms,
+            quiet_ms=self.playout_quiet_ms,
+        )
+        vad = self.create_vad()
+        publisher = CallPublisher(call_id, self.channel_for(call_id), maxsize=self.publish_queue_size,
+                                  latency=AGI_PUBLISH_SECONDS)
+        session = self.sessions[call_id] = AGISession(call_id, agi_env, writer, playout, vad, publisher)
+        if self.call_registry is not None:
+            self.call_registry.attach_agi(call_id, session, agi_env.get("agi_uniqueid"))
+        if self.cdr is not None:
+            self.cdr.agi_started(call_id, agi_env.get("agi_uniqueid"))
+        if self.ownership is not None:
+            self.ownership.claim(call_id, agi_env.get("agi_uniqueid"))
+        write_task = asyncio.create_task(consume_and_write_audio())
+        try:
+            await read_and_publish_audio()
+        finally:
+            write_task.cancel()
+            await asyncio.gather(write_task, return_exceptions=True)
+            await publisher.close()
+            self.audio_router.unregister(call_id)
+            self.sessions.pop(call_id, None)
+            if self.call_registry is not None:
+                self.call_registry.detach_agi(call_id)
+            if self.grpc_streams is not None:
+                self.grpc_streams.stream_event(call_id, "CALL_ENDED")
+            if self.ownership is not None:
+                self.ownership.release(call_id)
+            if self.cdr is not None:
+                self.cdr.agi_ended(call_id, agi_env.get("agi_uniqueid"), {
+                    "playout": playout.stats(), "publish": publisher.stats(),
+                    **({"vad": vad.stats()} if vad is not None else {}),
+                })
+        self.logger.info(f"[AGI] Fin de llamada para call_id={call_id}; reproducción: {playout.stats()}; "
+                         f"publicación: {publisher.stats()}"
+                         + (f"; VAD: {vad.stats()}" if vad is not None else ""))
+        traces = self.trace_report.pop(call_id)
+        if traces:
+            self.logger.info(f"[AGI] Latencias por etapa de call_id={call_id}: {tracing.TraceReport.format(traces)}")
         writer.close()
         await writer.wait_closed()
 
+    async def listen(self, reuse_port: bool = False, consume_outgoing: bool = True):
+        """
+        Abre el puerto AGI (sin atender aún). En un worker del pool (``worker_pool``) varios
+        procesos comparten el puerto (``reuse_port``) y el audio saliente llega por IPC desde
+        el proceso principal, que es el único consumidor de ``outgoing_audio_chunks``.
+
+        Con el índice de llamadas (``ownership``) el audio de llamadas de otros nodos se
+        reenvía a la cola de su dueño y se consume también la cola propia de este nodo.
+        """
+        if consume_outgoing and self.rabbitmq_channel is not None:
+            prefetch = self.channel_pool.prefetch if self.channel_pool is not None else 0
+            if self.ownership is not None:
+                self.audio_router.forward = functools.partial(self.ownership.forward_audio, self.rabbitmq_channel)
+                await self.audio_router.consume(self.rabbitmq_channel, self.ownership.audio_queue(),
+                                                prefetch=prefetch, durable=False)
+            await self.audio_router.consume(self.rabbitmq_channel, "outgoing_audio_chunks", prefetch=prefetch)
+        server = await asyncio.start_server(self.handle_agi, host="0.0.0.0", port=self.agi_port,
+                                            reuse_port=reuse_port or None)
+        self.logger.info(f"AGI Server escuchando en el puerto {self.agi_port}" + (" (SO_REUSEPORT)" if reuse_port else ""))
+        return server
+
     async def start(self):
-        server = await asyncio.start_server(self.handle_agi, host="0.0.0.0", port=self.agi_port)
-        self.logger.info(f"AGI Server escuchando en el puerto {self.agi_port}")
+        server = await self.listen()
         async with server:
             await server.serve_forever()
 
@@ -89,26 +412,83 @@ def main():
     agi_port = int(os.getenv("ASTERISK_AGI_PORT", "4573"))
 
     async def async_main():
-        # Inicializar AMIClient
-        ami_client = AMIClient()
-        await ami_client.connect()
-
         # Inicializar RabbitMQ async
         rabbitmq_url = f"amqp://{os.getenv('RABBITMQ_USER', 'guest')}:{os.getenv('RABBITMQ_PASS', 'guest')}@{os.getenv('RABBITMQ_HOST', 'localhost')}/"
         rabbitmq_conn = await aio_pika.connect_robust(rabbitmq_url)
-        rabbitmq_channel = await rabbitmq_conn.channel()
+        # Canales de publicación repartidos por llamada y uno dedicado (con QoS) a consumir;
+        # aio-pika los restaura al reconectar y el pool vuelve a declarar las colas
+        channel_pool = await ChannelPool(rabbitmq_conn, publish_channels=int(os.getenv("RABBITMQ_PUBLISH_CHANNELS", "4")),
+                                         prefetch=int(os.getenv("RABBITMQ_PREFETCH", "200"))).open()
+        rabbitmq_channel = await channel_pool.consume_channel()
+
+        # Inicializar AMIClient con un publisher asíncrono en su propio canal
+        ami_channel = await rabbitmq_conn.channel(publisher_confirms=True)
+        await ami_channel.declare_queue("incoming_audio_chunks", durable=True)
+        # Sin cola general: sólo llegan las clases de eventos con suscriptores
+        ami_client = AMIClient(publisher=AsyncRabbitMQPublisher(ami_channel, name="ami"), field_whitelist=DEFAULT_FIELD_WHITELIST,
+                               event_queue_size=0)
+
+        # Registro de llamadas vivas alimentado por AMI y por las sesiones AGI
+        call_registry = CallRegistry(linger=float(os.getenv("CALL_REGISTRY_LINGER", "5")))
+        call_registry.subscribe_to(ami_client)
+
+        # Inicializar AGIServer: en este proceso o, con AGI_WORKERS > 0, en un pool de procesos
+        # que comparten el puerto AGI y reciben de éste los eventos AMI y el audio saliente
+        metrics_port = int(os.getenv("METRICS_PORT", "9108"))
+        agi_workers = int(os.getenv("AGI_WORKERS", "0"))
+        if agi_workers > 0:
+            agi_server = AGIWorkerPool(agi_workers, agi_port, rabbitmq_channel, call_registry=call_registry,
+                                       health_timeout=float(os.getenv("AGI_WORKER_HEALTH_TIMEOUT", "5")),
+                                       metrics_port=metrics_port)
+            agi_server.subscribe_to(ami_client)
+        else:
+            agi_server = AGIServer(agi_port, ami_client, rabbitmq_channel, call_registry=call_registry,
+                                   channel_pool=channel_pool)
+
+        # CDR y línea temporal de eventos por llamada en MongoDB, escritos por lotes
+        tasks = []
+        cdr = None
+        if os.getenv("CDR_ENABLED", "1") not in ("0", "false", "no") and os.getenv("MONGO_HOST"):
+            spool_dir = os.getenv("CDR_SPOOL_DIR", "/tmp/asterisk_connector_cdr")
+            cdr = CDRRecorder(
+                await connect_mongo_sink(),
+                batch_size=int(os.getenv("CDR_BATCH_SIZE", "500")),
+                flush_interval=float(os.getenv("CDR_FLUSH_INTERVAL", "1.0")),
+                max_buffered=int(os.getenv("CDR_MAX_BUFFERED", "10000")),
+                spool=Spool(spool_dir, int(os.getenv("CDR_SPOOL_MAX_MB", "64")) * 1024 * 1024) if spool_dir else None,
+            )
+            cdr.subscribe_to(ami_client)
+            agi_server.cdr = cdr
+            tasks.append(cdr.run())
+
+        # Con varios conectores: índice en Redis de qué nodo atiende cada llamada, para
+        # reenviarle las peticiones gRPC que lleguen a otro
+        grpc_port = int(os.getenv("GRPC_PORT", "50051"))
+        ownership = None
+        if os.getenv("CALL_OWNERSHIP", "1") not in ("0", "false", "no") and os.getenv("REDIS_HOST"):
+            ownership = await connect_ownership_index(grpc_port)
+            ownership.subscribe_to(ami_client)
+            agi_server.ownership = ownership
+            tasks.append(ownership.run())
 
-        # Inicializar AGIServer
-        agi_server = AGIServer(agi_port, ami_client, rabbitmq_channel)
+        # Servicer gRPC compartiendo el bucle, el canal y las sesiones AGI
+        servicer = AsteriskConnectorServicer(ami_client=ami_client, agi_server=agi_server, rabbitmq_channel=rabbitmq_channel,
+                                             call_registry=call_registry, ownership=ownership)
 
-        # Importar y lanzar gRPC server
-        from asterisk_connector_servicer import serve as grpc_serve
+        # Métricas Prometheus (0 las desactiva)
+        if metrics_port > 0:
+            agi_server.register_metrics()
+            if cdr is not None:
+                cdr.register_metrics()
+            await metrics.start_metrics_server(metrics_port)
+            tasks.append(metrics.monitor_loop_lag(float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.1"))))
 
         # Lanzar tareas concurrentes
         await asyncio.gather(
             ami_client.run(),
             agi_server.start(),
-            grpc_serve()
+            serve_async(servicer, port=grpc_port),
+            *tasks
         )
 
     try:
@@ -0,0 +1,191 @@
+import asyncio
+import heapq
+import time
+from typing import Callable, Dict, Optional
+
+from common import metrics
+
+BYTES_WRITTEN = metrics.REGISTRY.counter("agi_bytes_sent_total", "Bytes de audio escritos en los sockets AGI")
+
+
+class PlayoutBuffer:
+    """
+    Buffer de reproducción (jitter buffer) del audio saliente de una llamada.
+
+    Reordena los fragmentos por número de secuencia, espera a tener ``target_depth``
+    fragmentos antes de empezar a reproducir (o como mucho ``max_prebuffer_ms`` desde el
+    primero, para que las respuestas cortas y los finales de locución no se queden
+    esperando) y escribe en el socket AGI al ritmo real del códec (según los bytes de
+    cada fragmento), con un pequeño adelanto ``lead_ms`` para absorber el jitter del
+    propio bucle. Contadores:
+
+    - ``underruns``: el buffer se vació en mitad de la reproducción, es decir, llegó más
+      audio antes de ``quiet_ms``; si el flujo se calla, vaciarse es el final normal.
+    - ``overruns``: se superó ``max_depth`` y se descartó el fragmento más antiguo.
+    - ``late_frames``: llegó un fragmento cuya posición ya se había reproducido.
+
+    ``push`` admite un ``on_played`` que se llama justo al escribir ese fragmento en el
+    socket (trazas de latencia).
+    """
+
+    def __init__(self, bytes_per_second: int = 16000, target_depth: int = 3, max_depth: int = 100,
+                 lead_ms: int = 40, max_prebuffer_ms: int = 100, quiet_ms: int = 200,
+                 clock: Callable[[], float] = time.monotonic):
+        if target_depth < 1 or max_depth < target_depth:
+            raise ValueError("Se requiere 1 <= target_depth <= max_depth")
+        self.bytes_per_second = bytes_per_second
+        self.target_depth = target_depth
+        self.max_depth = max_depth
+        self.lead = lead_ms / 1000.0
+        self.max_prebuffer = max_prebuffer_ms / 1000.0
+        self.quiet = quiet_ms / 1000.0
+        self.clock = clock
+        self._heap = []
+        self._seqs = set()
+        self._auto_seq = 0
+        self._next_seq: Optional[int] = None
+        self._playing = False
+        self._available = asyncio.Event()
+        # Instante (reloj del bucle) en que termina de sonar lo ya escrito en el socket
+        self._next_tick: Optional[float] = None
+        self._on_played: Dict[int, Callable[[], None]] = {}
+        self._last_seq: Optional[int] = None
+        # Llegada del primer fragmento en pre-buffer y momento en que se vació reproduciendo
+        self._prebuffer_since: Optional[float] = None
+        self._drained_at: Optional[float] = None
+        self.played = 0
+        self.underruns = 0
+        self.overruns = 0
+        self.late_frames = 0
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def playing(self) -> bool:
+        return self._playing
+
+    def push(self, payload: bytes, seq: Optional[int] = None, on_played: Optional[Callable[[], None]] = None) -> bool:
+        """Encola un fragmento. Sin ``seq`` se asume orden de llegada."""
+        if seq is None:
+            seq = self._auto_seq
+        self._auto_seq = max(self._auto_seq, seq + 1)
+        if self._next_seq is not None and seq < self._next_seq:
+            self.late_frames += 1
+            return False
+        if seq in self._seqs:
+            self.duplicates += 1
+            return False
+        now = self.clock()
+        if self._drained_at is not None:
+            # Si el audio sigue llegando, vaciarse fue un underrun; si no, el fin de una locución
+            if now - self._drained_at < self.quiet:
+                self.underruns += 1
+            self._drained_at = None
+        if not self._playing and self._prebuffer_since is None:
+            self._prebuffer_since = now
+        heapq.heappush(self._heap, (seq, payload))
+        self._seqs.add(seq)
+        if on_played is not None:
+            self._on_played[seq] = on_played
+        if len(self._heap) > self.max_depth:
+            old_seq, _ = heapq.heappop(self._heap)
+            self._seqs.discard(old_seq)
+            self._on_played.pop(old_seq, None)
+            self._next_seq = old_seq + 1
+            self.overruns += 1
+        # El primer fragmento en pre-buffer también despierta a run(), que arma la espera máxima
+        if self._playing or len(self._heap) >= self.target_depth or len(self._heap) == 1:
+            self._available.set()
+        return True
+
+    def prebuffer_remaining(self) -> Optional[float]:
+        """Segundos hasta que el pre-buffer arranque aunque no llegue a ``target_depth`` (None si no aplica)."""
+        if self._playing or not self._heap or self._prebuffer_since is None:
+            return None
+        return max(0.0, self.max_prebuffer - (self.clock() - self._prebuffer_since))
+
+    def pop(self) -> Optional[bytes]:
+        """Devuelve el siguiente fragmento a reproducir, o None si hay que esperar."""
+        if not self._playing:
+            if not self._heap:
+                return None
+            if len(self._heap) < self.target_depth and self.prebuffer_remaining():
+                return None
+            self._playing = True
+            self._prebuffer_since = None
+        if not self._heap:
+            self._playing = False
+            self._drained_at = self.clock()
+            return None
+        seq, payload = heapq.heappop(self._heap)
+        self._seqs.discard(seq)
+        self._last_seq = seq
+        # Un hueco en la secuencia se da por perdido: los que lleguen después son tardíos
+        self._next_seq = seq + 1
+        self.played += 1
+        return payload
+
+    def written_ahead(self, now: float) -> float:
+        """Segundos de audio ya escritos en el socket que aún no han sonado."""
+        if self._next_tick is None:
+            return 0.0
+        return max(0.0, self._next_tick - now)
+
+    def clear(self) -> int:
+        """Descarta todo lo pendiente y vuelve a pre-bufferizar. Devuelve los fragmentos descartados."""
+        dropped = len(self._heap)
+        self._heap.clear()
+        self._seqs.clear()
+        self._on_played.clear()
+        self._playing = False
+        self._prebuffer_since = None
+        self._drained_at = None
+        self._available.clear()
+        return dropped
+
+    async def run(self, writer):
+        """Reproduce el buffer sobre ``writer`` a ritmo real hasta que se cancele la tarea."""
+        loop = asyncio.get_running_loop()
+        while True:
+            payload = self.pop()
+            if payload is None:
+                # Pre-buffer o buffer vacío: esperar a tener profundidad suficiente o, con algo
+                # pendiente, como mucho a que venza max_prebuffer_ms
+                self._available.clear()
+                remaining = self.prebuffer_remaining()
+                if remaining is None:
+                    await self._available.wait()
+                else:
+                    try:
+                        await asyncio.wait_for(self._available.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                self._next_tick = None
+                continue
+            now = loop.time()
+            if self._next_tick is None or self._next_tick < now - self.lead:
+                # Inicio de reproducción o bucle retrasado: re-sincronizar el reloj
+                self._next_tick = now
+            writer.write(payload)
+            BYTES_WRITTEN.inc(len(payload))
+            if self._on_played:
+                callback = self._on_played.pop(self._last_seq, None)
+                if callback is not None:
+                    callback()
+            await writer.drain()
+            self._next_tick += len(payload) / self.bytes_per_second
+            delay = self._next_tick - loop.time() - self.lead
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": len(self._heap),
+            "played": self.played,
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "late_frames": self.late_frames,
+            "duplicates": self.duplicates,
+        }
@@ -1,7 +1,17 @@
+import asyncio
+import collections
 import logging
+import time
+from typing import Optional
 
+import aio_pika
 import pika
 
+from common import metrics
+
+PUBLISH_SECONDS = metrics.REGISTRY.histogram(
+    "rabbitmq_publish_seconds", "Tiempo desde que se publica un mensaje hasta que el broker lo acepta", ("source",))
+
 
 class RabbitMQPublisher:
     def __init__(self, channel):
@@ -18,3 +28,135 @@ class RabbitMQPublisher:
             logging.info(f"[RabbitMQPublisher] Publicado en {routing_key}: {message_body}")
         except Exception as e:
             logging.error(f"[RabbitMQPublisher] Error publicando en RabbitMQ: {e}")
+
+
+class AsyncRabbitMQPublisher:
+    """
+    Publisher asyncio (aio-pika) con buffer acotado y micro-batching.
+
+    ``publish`` nunca bloquea: encola el mensaje y devuelve False si el buffer está
+    lleno. Una tarea de fondo vacía el buffer en lotes de hasta ``max_batch`` mensajes
+    o cada ``max_delay`` segundos, enviando el lote completo antes de esperar las
+    confirmaciones del broker (publisher confirms en pipeline). ``saturated`` y
+    ``wait_writable`` exponen la contrapresión al productor.
+    """
+
+    def __init__(self, channel, max_buffer: int = 10000, max_batch: int = 100, max_delay: float = 0.005,
+                 high_watermark: Optional[int] = None, low_watermark: Optional[int] = None, name: str = "publisher"):
+        self.channel = channel
+        # Etiqueta ``source`` de la latencia de publicación (desde que se encola)
+        self._publish_seconds = PUBLISH_SECONDS.labels(name)
+        self.max_buffer = max_buffer
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.high_watermark = high_watermark or int(max_buffer * 0.8)
+        self.low_watermark = low_watermark or int(max_buffer * 0.5)
+        self._buffer = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def saturated(self) -> bool:
+        """True mientras el buffer esté por encima de la marca alta."""
+        return not self._writable.is_set()
+
+    def publish(self, routing_key, message_body, headers=None) -> bool:
+        if self._closing:
+            self.dropped += 1
+            return False
+        buffer = self._buffer
+        if len(buffer) >= self.max_buffer:
+            self.dropped += 1
+            self._writable.clear()
+            return False
+        if isinstance(message_body, str):
+            message_body = message_body.encode()
+        buffer.append((routing_key, message_body, headers, time.perf_counter()))
+        self._idle.clear()
+        if len(buffer) >= self.high_watermark:
+            self._writable.clear()
+        if len(buffer) == 1 or len(buffer) >= self.max_batch:
+            self._wakeup.set()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return True
+
+    async def wait_writable(self):
+        await self._writable.wait()
+
+    async def flush(self):
+        """Espera a que todo lo encolado se haya enviado y confirmado."""
+        # _idle sólo se pone cuando el buffer está vacío y el último lote ya está confirmado:
+        # con el buffer vacío puede haber aún un lote en vuelo
+        if not self._idle.is_set():
+            self._wakeup.set()
+            await self._idle.wait()
+
+    async def close(self):
+        self._closing = True
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        buffer = self._buffer
+        while True:
+            if not buffer:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            if len(buffer) < self.max_batch and not self._closing:
+                # Ventana de agregación: esperar a llenar el lote o a que venza max_delay
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            batch = [buffer.popleft() for _ in range(min(len(buffer), self.max_batch))]
+            if batch:
+                try:
+                    await self._send_batch(batch)
+                except Exception as e:
+                    # Fuera de las publicaciones (p. ej. canal cerrado al pedir el exchange):
+                    # se pierde el lote, pero la tarea sigue atendiendo los siguientes
+                    self.failed += len(batch)
+                    logging.error(f"[AsyncRabbitMQPublisher] Lote de {len(batch)} mensajes no enviado: {e}")
+            if len(buffer) <= self.low_watermark:
+                self._writable.set()
+
+    async def _send_batch(self, batch):
+        exchange = self.channel.default_exchange
+        results = await asyncio.gather(
+            *(
+                exchange.publish(
+                    aio_pika.Message(body=body, headers=headers, delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                    routing_key=routing_key,
+                )
+                for routing_key, body, headers, _ in batch
+            ),
+            return_exceptions=True,
+        )
+        self.batches += 1
+        now = time.perf_counter()
+        for (_, _, _, enqueued), result in zip(batch, results):
+            if not isinstance(result, BaseException):
+                self._publish_seconds.observe(now - enqueued)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        self.published += len(batch) - len(errors)
+        if errors:
+            self.failed += len(errors)
+            logging.error(f"[AsyncRabbitMQPublisher] {len(errors)}/{len(batch)} mensajes sin confirmar: {errors[0]}")
@@ -0,0 +1,170 @@
+import collections
+import math
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from common.audio_codec import to_linear
+
+from .audio_packetizer import AudioFrame
+
+SPEECH_START = "speech_start"
+SPEECH_END = "speech_end"
+# Voz continuada durante ``confirm_ms``: descarta golpes, toses y ruidos cortos (barge-in)
+SPEECH_CONFIRMED = "speech_confirmed"
+
+# Un modelo recibe las tramas como matriz float32 (una fila por trama, muestras en
+# [-1, 1)) y la frecuencia de muestreo, y devuelve un booleano de voz por trama.
+SpeechModel = Callable[[np.ndarray, int], np.ndarray]
+
+
+class VADEvent(NamedTuple):
+    kind: str  # SPEECH_START, SPEECH_CONFIRMED o SPEECH_END
+    ts: float  # Marca de captura de la trama en que empieza/termina la voz
+
+
+class EnergyZCRModel:
+    """
+    Clasificador de voz por energía y tasa de cruces por cero, vectorizado por trama.
+
+    Una trama es voz si su energía supera ``energy_threshold_db`` (dBFS) y su tasa de
+    cruces por cero no supera ``zcr_max``: el ruido blanco y el siseo cruzan por cero en
+    casi la mitad de las muestras, la voz sonora muy por debajo. Si la energía supera el
+    umbral en más de ``loud_margin_db`` se acepta como voz sea cual sea su ZCR (fricativas
+    intensas).
+    """
+
+    def __init__(self, energy_threshold_db: float = -40.0, zcr_max: float = 0.25, loud_margin_db: float = 15.0):
+        self.energy_threshold_db = energy_threshold_db
+        self.zcr_max = zcr_max
+        self.loud_margin_db = loud_margin_db
+
+    def __call__(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        energy_db = 10.0 * np.log10(np.mean(samples * samples, axis=1) + 1e-10)
+        signs = np.signbit(samples)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / max(samples.shape[1] - 1, 1)
+        loud = energy_db > self.energy_threshold_db
+        return loud & ((zcr <= self.zcr_max) | (energy_db > self.energy_threshold_db + self.loud_margin_db))
+
+
+class VoiceActivityDetector:
+    """
+    Etapa de detección de actividad de voz (VAD) del audio del llamante.
+
+    Clasifica de una vez todas las tramas de cada lectura (``model``, por defecto
+    ``EnergyZCRModel``) y aplica una máquina de estados por llamada:
+
+    - ``hangover_ms``: tras la última trama de voz se siguen dejando pasar tramas durante
+      este tiempo, para no cortar finales de palabra ni pausas cortas.
+    - ``pre_roll_ms``: al empezar la voz se emiten también las tramas inmediatamente
+      anteriores, para no cortar el ataque de la primera sílaba.
+    - ``confirm_ms``: si se indica, un ``SPEECH_CONFIRMED`` (uno por tramo de voz) sigue a
+      la trama con la que se acumulan ``confirm_ms`` de voz sin interrupción.
+
+    Con ``suppress`` el silencio se descarta; sin él se emite marcado como silencio.
+    ``process`` devuelve, en orden, tuplas ``(trama, es_voz)`` y ``VADEvent`` de inicio y
+    fin de voz.
+    """
+
+    def __init__(self, sample_rate: int = 8000, frame_ms: int = 20, model: Optional[SpeechModel] = None,
+                 hangover_ms: int = 300, pre_roll_ms: int = 60, suppress: bool = True, audio_format: str = "slin",
+                 confirm_ms: int = 0):
+        self.sample_rate = sample_rate
+        self.audio_format = audio_format
+        self.frame_ms = frame_ms
+        self.model = model or EnergyZCRModel()
+        self.suppress = suppress
+        self.hangover_frames = math.ceil(hangover_ms / frame_ms)
+        self._pre_roll = collections.deque(maxlen=math.ceil(pre_roll_ms / frame_ms) if suppress else 0)
+        self._hangover = 0
+        self.confirm_frames = math.ceil(confirm_ms / frame_ms) if confirm_ms > 0 else 0
+        # Tramas de voz seguidas y si el tramo actual ya está confirmado
+        self._voiced_run = 0
+        self._confirmed = False
+        self.in_speech = False
+        self.frames = 0
+        self.speech_frames = 0
+        self.dropped_frames = 0
+        self.total_bytes = 0
+        self.dropped_bytes = 0
+        self.speech_segments = 0
+
+    @property
+    def dropped_fraction(self) -> float:
+        """Fracción del audio (en bytes) que no se ha publicado."""
+        return self.dropped_bytes / self.total_bytes if self.total_bytes else 0.0
+
+    def classify(self, frames: Sequence[AudioFrame]) -> np.ndarray:
+        """Decide voz/silencio para cada trama (PCM lineal o G.711, que se decodifica por tabla)."""
+        speech = np.zeros(len(frames), dtype=bool)
+        sizes = [len(f.payload) for f in frames]
+        # Una llamada al modelo por tamaño de trama (la última de la llamada puede ser más corta)
+        for size in dict.fromkeys(sizes):
+            index = [i for i, s in enumerate(sizes) if s == size]
+            samples = to_linear(b"".join(frames[i].payload for i in index), self.audio_format).reshape(len(index), -1)
+            speech[index] = np.asarray(self.model(samples.astype(np.float32) / 32768.0, self.sample_rate), dtype=bool)
+        return speech
+
+    def _drop(self, frame: AudioFrame):
+        self.dropped_frames += 1
+        self.dropped_bytes += len(frame.payload)
+
+    def process(self, frames: Sequence[AudioFrame]) -> List[Union[Tuple[AudioFrame, bool], VADEvent]]:
+        output: List[Union[Tuple[AudioFrame, bool], VADEvent]] = []
+        pre_roll = self._pre_roll
+        for frame, speech in zip(frames, self.classify(frames)):
+            self.frames += 1
+            self.total_bytes += len(frame.payload)
+            if speech:
+                self.speech_frames += 1
+                self._hangover = self.hangover_frames
+                if not self.in_speech:
+                    self.in_speech = True
+                    self.speech_segments += 1
+                    output.append(VADEvent(SPEECH_START, pre_roll[0].capture_ts if pre_roll else frame.capture_ts))
+                    output.extend((f, True) for f in pre_roll)
+                    pre_roll.clear()
+                output.append((frame, True))
+                self._voiced_run += 1
+                if self.confirm_frames and not self._confirmed and self._voiced_run >= self.confirm_frames:
+                    self._confirmed = True
+                    output.append(VADEvent(SPEECH_CONFIRMED, frame.capture_ts))
+            elif self.in_speech and self._hangover > 0:
+                self._hangover -= 1
+                self._voiced_run = 0
+                output.append((frame, True))
+            else:
+                self._voiced_run = 0
+                if self.in_speech:
+                    self.in_speech = False
+                    self._confirmed = False
+                    output.append(VADEvent(SPEECH_END, frame.capture_ts))
+                if not self.suppress:
+                    output.append((frame, False))
+                elif pre_roll.maxlen:
+                    if len(pre_roll) == pre_roll.maxlen:
+                        self._drop(pre_roll[0])
+                    pre_roll.append(frame)
+                else:
+                    self._drop(frame)
+        return output
+
+    def finish(self, ts: float) -> List[VADEvent]:
+        """Cierra la llamada: descarta el pre-roll pendiente y cierra el tramo de voz abierto."""
+        while self._pre_roll:
+            self._drop(self._pre_roll.popleft())
+        self._voiced_run = 0
+        if self.in_speech:
+            self.in_speech = False
+            self._confirmed = False
+            return [VADEvent(SPEECH_END, ts)]
+        return []
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "frames": self.frames,
+            "speech_frames": self.speech_frames,
+            "speech_segments": self.speech_segments,
+            "dropped_frames": self.dropped_frames,
+            "dropped_fraction": round(self.dropped_fraction, 4),
+        }
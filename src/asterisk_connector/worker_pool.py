@@ -0,0 +1,552 @@
+"""
+Modo multiproceso del conector: N procesos AGI comparten el puerto AGI con
+SO_REUSEPORT (el kernel reparte las conexiones entrantes entre ellos) y el proceso
+principal conserva lo que debe ser único: la conexión AMI, el servidor gRPC, el
+consumidor de ``outgoing_audio_chunks`` y las métricas.
+
+Principal y workers se comunican por un socket Unix con tramas binarias:
+
+    tipo (1 byte) | longitud total (4 bytes) | longitud de meta (2 bytes) | meta (JSON) | cuerpo
+
+- principal -> worker: eventos AMI de llamada (a todos), audio saliente e
+  interrupciones (al worker dueño de la llamada) y altas/bajas de streams gRPC.
+- worker -> principal: saludo, latido de salud, llamadas que atiende, eventos de
+  llamada y, sólo si hay un stream gRPC abierto para ella, su audio.
+
+El principal sabe qué worker atiende cada llamada por los avisos ATTACH/DETACH, vigila
+los latidos y reinicia los workers caídos o bloqueados.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import aio_pika
+
+from common import metrics
+
+try:
+    from .call_registry import REGISTRY_EVENTS, CallRegistry
+    from .call_router import RoutedMessage
+    from .channel_pool import ChannelPool
+except ImportError:
+    from call_registry import REGISTRY_EVENTS, CallRegistry
+    from call_router import RoutedMessage
+    from channel_pool import ChannelPool
+
+# worker -> principal
+HELLO = 1
+HEALTH = 2
+ATTACH = 3
+DETACH = 4
+STREAM_EVENT = 5
+STREAM_AUDIO = 6
+# principal -> worker
+AMI_EVENT = 10
+AUDIO = 11
+INTERRUPT = 12
+SUBSCRIBE = 13
+UNSUBSCRIBE = 14
+
+_HEADER = struct.Struct("!BIH")
+# Audio pendiente de escribir hacia un worker a partir del cual se descarta (worker atascado)
+MAX_WRITE_BUFFER = 4 * 1024 * 1024
+
+WORKER_RESTARTS = metrics.REGISTRY.counter("agi_worker_restarts_total", "Reinicios de procesos AGI", ("worker",))
+IPC_DROPPED = metrics.REGISTRY.counter("agi_worker_ipc_dropped_total",
+                                       "Tramas (audio y eventos AMI) descartadas hacia un worker con el socket IPC saturado")
+
+
+def pack_frame(kind: int, meta: Optional[Dict[str, Any]] = None, body: bytes = b"") -> bytes:
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode() if meta else b""
+    return _HEADER.pack(kind, len(meta_bytes) + len(body), len(meta_bytes)) + meta_bytes + body
+
+
+def _json_headers(headers: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Cabeceras AMQP serializables en JSON (las de tipo bytes, como texto)."""
+    return {k: v.decode(errors="replace") if isinstance(v, bytes) else v for k, v in (headers or {}).items()}
+
+
+class IPCConnection:
+    """Extremo del socket IPC: escribe tramas sin esperar (el transporte las agrupa) y las lee de una en una."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def send(self, kind: int, meta: Optional[Dict[str, Any]] = None, body: bytes = b""):
+        if not self.writer.is_closing():
+            self.writer.write(pack_frame(kind, meta, body))
+
+    def congested(self) -> bool:
+        return self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER
+
+    async def recv(self) -> Optional[Tuple[int, Dict[str, Any], bytes]]:
+        """Siguiente trama (tipo, meta, cuerpo), o None si el otro extremo cerró."""
+        try:
+            header = await self.reader.readexactly(_HEADER.size)
+            kind, length, meta_length = _HEADER.unpack(header)
+            data = await self.reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+        meta = json.loads(data[:meta_length]) if meta_length else {}
+        return kind, meta, data[meta_length:]
+
+    def close(self):
+        self.writer.close()
+
+
+# --- Lado worker ---
+class WorkerCallRegistry(CallRegistry):
+    """Registro de llamadas del worker: además avisa al principal de las llamadas que atiende."""
+
+    def __init__(self, worker: "AGIWorker", **kwargs):
+        super().__init__(**kwargs)
+        self.worker = worker
+
+    def attach_agi(self, channel: str, session: Any, uniqueid: Optional[str] = None):
+        record = super().attach_agi(channel, session, uniqueid)
+        self.worker.send(ATTACH, {"call_id": channel, "uniqueid": record.uniqueid})
+        return record
+
+    def detach_agi(self, channel: str):
+        super().detach_agi(channel)
+        self.worker.send(DETACH, {"call_id": channel})
+
+
+class AGIWorker:
+    """
+    Proceso AGI del pool: atiende llamadas en el puerto compartido, recibe del principal
+    los eventos AMI y el audio saliente de sus llamadas y le envía su latido de salud.
+    ``agi_server`` llega sin registro de llamadas y aquí se le asigna uno ``WorkerCallRegistry``.
+    """
+
+    def __init__(self, index: int, ipc_path: str, agi_server, health_interval: float = 1.0,
+                 lag_interval: float = 0.05):
+        self.index = index
+        self.ipc_path = ipc_path
+        self.agi_server = agi_server
+        self.health_interval = health_interval
+        self.lag_interval = lag_interval
+        self.ipc: Optional[IPCConnection] = None
+        self.call_registry = agi_server.call_registry = WorkerCallRegistry(
+            self, linger=float(os.getenv("CALL_REGISTRY_LINGER", "5")))
+        # El servidor AGI entrega sus eventos de llamada a este worker, que los reenvía
+        agi_server.grpc_streams = self
+        # Llamadas con un stream gRPC abierto en el principal (sólo a ellas se les reenvía el audio)
+        self.subscribed: Set[str] = set()
+        self._max_lag = 0.0
+        self.logger = logging.getLogger(f"AGIWorker-{index}")
+
+    def send(self, kind: int, meta: Optional[Dict[str, Any]] = None, body: bytes = b""):
+        if self.ipc is not None:
+            self.ipc.send(kind, meta, body)
+
+    # Interfaz de ``AGIServer.grpc_streams``
+    def stream_event(self, call_id: str, event_type: str):
+        self.send(STREAM_EVENT, {"call_id": call_id, "event": event_type})
+
+    def stream_audio(self, call_id: str, audio_chunk: bytes):
+        if call_id in self.subscribed:
+            self.send(STREAM_AUDIO, {"call_id": call_id}, audio_chunk)
+
+    def health(self) -> Dict[str, Any]:
+        published = metrics.REGISTRY.get("rabbitmq_publish_seconds")
+        received = metrics.REGISTRY.get("agi_bytes_received_total")
+        return {
+            "pid": os.getpid(),
+            "calls": len(self.agi_server.sessions),
+            "cpu_s": time.process_time(),
+            "loop_lag_ms": self._max_lag * 1000,
+            "bytes_received": received.value if received is not None else 0,
+            "frames_published": published.labels("agi").count if published is not None else 0,
+            "unrouted": self.agi_server.audio_router.unrouted,
+        }
+
+    async def _heartbeat(self):
+        """Mide el retraso del bucle cada ``lag_interval`` y envía la salud cada ``health_interval``."""
+        loop = asyncio.get_running_loop()
+        next_report = loop.time()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self._max_lag = max(self._max_lag, loop.time() - start - self.lag_interval)
+            if loop.time() >= next_report:
+                self.send(HEALTH, self.health())
+                self._max_lag = 0.0
+                next_report = loop.time() + self.health_interval
+
+    async def handle(self, kind: int, meta: Dict[str, Any], body: bytes):
+        if kind == AMI_EVENT:
+            self.call_registry.on_event(meta)
+        elif kind == AUDIO:
+            self.agi_server.audio_router.dispatch(meta.get("call_id"), RoutedMessage(body, meta))
+        elif kind == INTERRUPT:
+            await self.agi_server.interrupt(meta["call_id"], meta.get("reason", "grpc"), meta.get("trigger_ts"))
+        elif kind == SUBSCRIBE:
+            self.subscribed.add(meta["call_id"])
+        elif kind == UNSUBSCRIBE:
+            self.subscribed.discard(meta["call_id"])
+
+    async def run(self, reuse_port: bool = True):
+        """Atiende llamadas hasta que el principal cierra el socket IPC."""
+        server = await self.agi_server.listen(reuse_port=reuse_port, consume_outgoing=False)
+        reader, writer = await asyncio.open_unix_connection(self.ipc_path)
+        self.ipc = IPCConnection(reader, writer)
+        # El saludo sale con el puerto ya abierto: el principal no da el pool por listo antes
+        self.send(HELLO, {"worker": self.index, "pid": os.getpid()})
+        tasks = [asyncio.create_task(server.serve_forever()), asyncio.create_task(self._heartbeat())]
+        try:
+            while True:
+                frame = await self.ipc.recv()
+                if frame is None:
+                    self.logger.warning(f"[Worker {self.index}] El proceso principal cerró el canal IPC")
+                    return
+                await self.handle(*frame)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            server.close()
+            self.ipc.close()
+
+
+async def connect_channel_pool():
+    """Canales de publicación propios del worker (cada proceso abre su conexión a RabbitMQ)."""
+    url = f"amqp://{os.getenv('RABBITMQ_USER', 'guest')}:{os.getenv('RABBITMQ_PASS', 'guest')}@{os.getenv('RABBITMQ_HOST', 'localhost')}/"
+    connection = await aio_pika.connect_robust(url)
+    return await ChannelPool(connection, publish_channels=int(os.getenv("RABBITMQ_PUBLISH_CHANNELS", "4"))).open()
+
+
+def _worker_main(index: int, agi_port: int, ipc_path: str, channel_factory: Callable[[], Awaitable[Any]],
+                 health_interval: float, metrics_port: int, log_level: int = logging.INFO):
+    """Punto de entrada del proceso worker."""
+    logging.basicConfig(level=log_level, format=f"%(asctime)s %(levelname)s [w{index}] %(message)s")
+    try:
+        from .main import AGIServer
+    except ImportError:
+        from main import AGIServer
+
+    async def run():
+        # La fábrica da un pool de canales o, en pruebas y benchmarks, un canal suelto
+        channel = await channel_factory()
+        if isinstance(channel, ChannelPool):
+            agi_server = AGIServer(agi_port, None, None, channel_pool=channel)
+        else:
+            agi_server = AGIServer(agi_port, None, channel)
+        worker = AGIWorker(index, ipc_path, agi_server, health_interval)
+        if metrics_port > 0:
+            agi_server.register_metrics()
+            await metrics.start_metrics_server(metrics_port)
+        await worker.run()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+# --- Lado principal ---
+class WorkerHandle:
+    """Estado de un worker visto desde el principal."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.ipc: Optional[IPCConnection] = None
+        self.pid: Optional[int] = None
+        self.started_at = 0.0
+        self.last_seen = 0.0
+        self.health: Dict[str, Any] = {}
+        self.calls: Set[str] = set()
+        self.restarts = 0
+
+    @property
+    def up(self) -> bool:
+        return self.ipc is not None
+
+    def send(self, kind: int, meta: Optional[Dict[str, Any]] = None, body: bytes = b""):
+        if self.ipc is not None:
+            self.ipc.send(kind, meta, body)
+
+
+class AGIWorkerPool:
+    """
+    Pool de procesos AGI gobernado por el proceso dueño de la conexión AMI.
+
+    Ocupa el lugar de ``AGIServer`` en el proceso principal: ``start`` lanza y vigila
+    los workers, ``interrupt`` y ``audio_router`` (el propio pool) llevan las órdenes
+    y el audio saliente al worker que atiende la llamada, y ``grpc_streams`` recibe
+    los eventos que éstos reenvían.
+    """
+
+    def __init__(self, workers: int, agi_port: int, rabbitmq_channel=None, call_registry: Optional[CallRegistry] = None,
+                 ipc_path: Optional[str] = None, channel_factory: Callable[[], Awaitable[Any]] = connect_channel_pool,
+                 health_interval: float = 1.0, health_timeout: float = 5.0, metrics_port: int = 0):
+        self.agi_port = agi_port
+        self.rabbitmq_channel = rabbitmq_channel
+        self.call_registry = call_registry
+        self.ipc_path = ipc_path or os.path.join(tempfile.gettempdir(), f"asterisk_connector_{os.getpid()}.sock")
+        self.channel_factory = channel_factory
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        # Cada worker expone sus métricas en metrics_port + 1 + índice (0 lo desactiva)
+        self.metrics_port = metrics_port
+        self.workers = [WorkerHandle(i) for i in range(workers)]
+        # Worker que atiende cada llamada (y su Uniqueid) y llamadas con stream gRPC abierto
+        self.owners: Dict[str, WorkerHandle] = {}
+        self.uniqueids: Dict[str, Optional[str]] = {}
+        self.streams: Set[str] = set()
+        self.grpc_streams = None
+        # Persistencia de CDR e índice compartido de llamadas: las sesiones AGI de los workers, según ATTACH/DETACH
+        self.cdr = None
+        self.ownership = None
+        self.unrouted = 0
+        self._server = None
+        self._ready = asyncio.Event()
+        self.logger = logging.getLogger("AGIWorkerPool")
+
+    @property
+    def audio_router(self) -> "AGIWorkerPool":
+        return self
+
+    def __contains__(self, call_id: str) -> bool:
+        return call_id in self.owners
+
+    # --- Principal -> workers ---
+    def subscribe_to(self, ami_client):
+        """Reenvía a todos los workers los eventos AMI que alimentan sus registros de llamadas."""
+        return ami_client.events.subscribe(REGISTRY_EVENTS, handler=self.broadcast_event)
+
+    def broadcast_event(self, event: Dict[str, Any]):
+        frame = pack_frame(AMI_EVENT, dict(event))
+        for handle in self.workers:
+            if handle.ipc is None or handle.ipc.writer.is_closing():
+                continue
+            if handle.ipc.congested():
+                # Un worker atascado no debe hacer crecer sin límite el buffer del principal
+                IPC_DROPPED.inc()
+                continue
+            handle.ipc.writer.write(frame)
+
+    def dispatch(self, call_id: Optional[str], message) -> bool:
+        """Entrega audio saliente al worker que atiende la llamada. Devuelve False si no hay destino."""
+        handle = self.owners.get(call_id) if call_id else None
+        if handle is None or handle.ipc is None:
+            self.unrouted += 1
+            return False
+        if handle.ipc.congested():
+            IPC_DROPPED.inc()
+            return False
+        headers = _json_headers(message.headers)
+        headers["call_id"] = call_id
+        handle.send(AUDIO, headers, message.body)
+        return True
+
+    async def _on_message(self, message):
+        call_id = (message.headers or {}).get("call_id")
+        if self.ownership is not None and call_id not in self.owners:
+            # Llamada de otro nodo: a la cola de su dueño
+            try:
+                if await self.ownership.forward_audio(self.rabbitmq_channel, message):
+                    return
+            except Exception as e:
+                self.logger.warning(f"[Pool] Error reenviando audio de call_id={call_id}: {e}")
+        self.dispatch(call_id, message)
+
+    async def interrupt(self, call_id: str, reason: str = "grpc", trigger_ts: Optional[float] = None) -> Optional[float]:
+        """Barge-in en el worker que atiende la llamada (la latencia la mide y registra él)."""
+        handle = self.owners.get(call_id)
+        if handle is None:
+            return None
+        handle.send(INTERRUPT, {"call_id": call_id, "reason": reason, "trigger_ts": trigger_ts or time.time()})
+        return None
+
+    def subscribe_stream(self, call_id: str, active: bool = True):
+        """Alta/baja del stream gRPC de una llamada: sólo con stream se reenvía su audio al principal."""
+        if active:
+            self.streams.add(call_id)
+        else:
+            self.streams.discard(call_id)
+        handle = self.owners.get(call_id)
+        if handle is not None:
+            handle.send(SUBSCRIBE if active else UNSUBSCRIBE, {"call_id": call_id})
+
+    # --- Workers -> principal ---
+    async def _on_worker(self, reader, writer):
+        ipc = IPCConnection(reader, writer)
+        frame = await ipc.recv()
+        if frame is None or frame[0] != HELLO or not 0 <= frame[1].get("worker", -1) < len(self.workers):
+            ipc.close()
+            return
+        handle = self.workers[frame[1]["worker"]]
+        if handle.ipc is not None:
+            handle.ipc.close()
+        handle.ipc, handle.pid, handle.last_seen = ipc, frame[1].get("pid"), time.time()
+        self.logger.info(f"[Pool] Worker {handle.index} (pid {handle.pid}) conectado")
+        if all(h.up for h in self.workers):
+            self._ready.set()
+        try:
+            while True:
+                frame = await ipc.recv()
+                if frame is None:
+                    break
+                self.handle(handle, *frame)
+        finally:
+            if handle.ipc is ipc:
+                self._worker_gone(handle)
+            ipc.close()
+
+    def handle(self, handle: WorkerHandle, kind: int, meta: Dict[str, Any], body: bytes):
+        handle.last_seen = time.time()
+        if kind == HEALTH:
+            handle.health = meta
+        elif kind == ATTACH:
+            call_id = meta["call_id"]
+            self.owners[call_id] = handle
+            self.uniqueids[call_id] = meta.get("uniqueid")
+            handle.calls.add(call_id)
+            if self.call_registry is not None:
+                self.call_registry.attach_agi(call_id, handle, meta.get("uniqueid"))
+            if self.cdr is not None:
+                self.cdr.agi_started(call_id, meta.get("uniqueid"))
+            if self.ownership is not None:
+                self.ownership.claim(call_id, meta.get("uniqueid"))
+            if call_id in self.streams:
+                handle.send(SUBSCRIBE, {"call_id": call_id})
+        elif kind == DETACH:
+            self._release(handle, meta["call_id"])
+        elif kind == STREAM_EVENT:
+            if self.grpc_streams is not None:
+                self.grpc_streams.stream_event(meta["call_id"], meta["event"])
+        elif kind == STREAM_AUDIO:
+            if self.grpc_streams is not None:
+                self.grpc_streams.stream_audio(meta["call_id"], body)
+
+    def _release(self, handle: WorkerHandle, call_id: str):
+        handle.calls.discard(call_id)
+        if self.owners.get(call_id) is handle:
+            del self.owners[call_id]
+            uniqueid = self.uniqueids.pop(call_id, None)
+            if self.call_registry is not None:
+                self.call_registry.detach_agi(call_id)
+            if self.cdr is not None:
+                self.cdr.agi_ended(call_id, uniqueid)
+            if self.ownership is not None:
+                self.ownership.release(call_id)
+
+    def _worker_gone(self, handle: WorkerHandle):
+        """Worker desconectado: sus llamadas se han cortado con él."""
+        handle.ipc = None
+        self._ready.clear()
+        if handle.calls:
+            self.logger.warning(f"[Pool] Worker {handle.index} caído con {len(handle.calls)} llamadas activas")
+        for call_id in list(handle.calls):
+            self._release(handle, call_id)
+            if self.grpc_streams is not None:
+                self.grpc_streams.stream_event(call_id, "CALL_ENDED")
+
+    # --- Ciclo de vida ---
+    def _spawn(self, handle: WorkerHandle):
+        context = multiprocessing.get_context("spawn")
+        metrics_port = self.metrics_port + 1 + handle.index if self.metrics_port > 0 else 0
+        handle.process = context.Process(
+            target=_worker_main, name=f"agi-worker-{handle.index}", daemon=True,
+            args=(handle.index, self.agi_port, self.ipc_path, self.channel_factory, self.health_interval, metrics_port,
+                  logging.getLogger().getEffectiveLevel()))
+        handle.process.start()
+        handle.started_at = time.time()
+        handle.health = {}
+
+    def _restart(self, handle: WorkerHandle, reason: str):
+        self.logger.warning(f"[Pool] Reiniciando worker {handle.index}: {reason}")
+        if handle.process is not None and handle.process.is_alive():
+            handle.process.kill()
+            handle.process.join(timeout=1)
+        if handle.ipc is not None:
+            handle.ipc.close()
+            self._worker_gone(handle)
+        handle.restarts += 1
+        WORKER_RESTARTS.labels(handle.index).inc()
+        self._spawn(handle)
+
+    def check_workers(self, now: Optional[float] = None):
+        """Reinicia los workers terminados y los que no envían latido en ``health_timeout`` segundos."""
+        now = time.time() if now is None else now
+        for handle in self.workers:
+            if handle.process is None:
+                continue
+            if not handle.process.is_alive():
+                self._restart(handle, f"terminó con código {handle.process.exitcode}")
+            elif now - max(handle.last_seen, handle.started_at) > self.health_timeout:
+                self._restart(handle, f"sin latido desde hace {now - max(handle.last_seen, handle.started_at):.1f} s")
+
+    async def serve_ipc(self):
+        if os.path.exists(self.ipc_path):
+            os.unlink(self.ipc_path)
+        self._server = await asyncio.start_unix_server(self._on_worker, path=self.ipc_path)
+
+    async def wait_ready(self, timeout: Optional[float] = None):
+        """Espera a que todos los workers se hayan conectado al principal."""
+        await asyncio.wait_for(self._ready.wait(), timeout)
+
+    async def start(self):
+        """Lanza los workers y los vigila hasta que se cancela la tarea."""
+        if self.rabbitmq_channel is not None:
+            if self.ownership is not None:
+                own = await self.rabbitmq_channel.declare_queue(self.ownership.audio_queue(), auto_delete=True)
+                await own.consume(self._on_message, no_ack=True)
+            queue = await self.rabbitmq_channel.declare_queue("outgoing_audio_chunks", durable=True)
+            await queue.consume(self._on_message, no_ack=True)
+        await self.serve_ipc()
+        for handle in self.workers:
+            self._spawn(handle)
+        self.logger.info(f"AGI Server: {len(self.workers)} workers escuchando en el puerto {self.agi_port} (SO_REUSEPORT)")
+        try:
+            while True:
+                await asyncio.sleep(self.health_interval)
+                self.check_workers()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        for handle in self.workers:
+            if handle.ipc is not None:
+                handle.ipc.close()
+            if handle.process is not None and handle.process.is_alive():
+                handle.process.terminate()
+        for handle in self.workers:
+            if handle.process is not None:
+                handle.process.join(timeout=2)
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if os.path.exists(self.ipc_path):
+                os.unlink(self.ipc_path)
+
+    # --- Salud ---
+    def health(self) -> Dict[int, Dict[str, Any]]:
+        now = time.time()
+        return {
+            handle.index: {**handle.health, "pid": handle.pid, "up": handle.up, "restarts": handle.restarts,
+                           "heartbeat_age_s": now - handle.last_seen if handle.last_seen else None}
+            for handle in self.workers
+        }
+
+    def register_metrics(self, registry: metrics.MetricsRegistry = metrics.REGISTRY):
+        """Gauges por worker calculados al hacer scrape a partir de su último latido."""
+        registry.gauge("agi_active_calls", "Sesiones AGI activas", function=lambda: len(self.owners))
+        registry.gauge("agi_worker_up", "Worker AGI conectado al proceso principal", ("worker",),
+                       function=lambda: {(h.index,): int(h.up) for h in self.workers})
+        registry.gauge("agi_worker_active_calls", "Sesiones AGI activas por worker", ("worker",),
+                       function=lambda: {(h.index,): len(h.calls) for h in self.workers})
+        registry.gauge("agi_worker_loop_lag_seconds", "Retraso máximo del bucle de eventos del worker en su último latido",
+                       ("worker",), function=lambda: {(h.index,): h.health.get("loop_lag_ms", 0) / 1000
+                                                      for h in self.workers})
+        registry.gauge("agi_worker_heartbeat_age_seconds", "Segundos desde el último mensaje del worker", ("worker",),
+                       function=lambda: {(h.index,): time.time() - h.last_seen for h in self.workers if h.last_seen})
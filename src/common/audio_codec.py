@@ -0,0 +1,191 @@
+"""
+Transcodificación de audio de telefonía: G.711 (μ-law/A-law) <-> PCM lineal de 16 bits
+y remuestreo polifásico entre frecuencias (8/16/22.05/24/48 kHz).
+
+Todas las funciones aceptan cualquier objeto con protocolo de buffer (bytes, bytearray,
+memoryview) y lo leen con ``np.frombuffer``, sin copias intermedias; la (de)codificación
+G.711 es una indexación en tablas precalculadas (256 entradas al decodificar, 65536 al
+codificar).
+"""
+import math
+from typing import Optional, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+LINEAR_FORMATS = ("slin", "slin16")
+G711_FORMATS = ("ulaw", "alaw")
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def _build_ulaw_decode() -> np.ndarray:
+    u = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (u >> 4) & 0x07
+    mantissa = u & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(u & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _build_ulaw_encode() -> np.ndarray:
+    # Mismo algoritmo que ulaw.c de Asterisk (BIAS 0x84, CLIP 32635)
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32)
+    sign = np.where(pcm < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(pcm), 32635) + 0x84
+    exponent = np.floor(np.log2(np.maximum(magnitude >> 7, 1))).astype(np.int32)
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+def _build_alaw_decode() -> np.ndarray:
+    a = np.arange(256, dtype=np.int32) ^ 0x55
+    t = (a & 0x0F) << 4
+    seg = (a & 0x70) >> 4
+    t = np.where(seg == 0, t + 8, (t + 0x108) << np.maximum(seg - 1, 0))
+    return np.where(a & 0x80, t, -t).astype(np.int16)
+
+
+def _build_alaw_encode() -> np.ndarray:
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 3
+    mask = np.where(pcm >= 0, 0xD5, 0x55)
+    value = np.where(pcm >= 0, pcm, -pcm - 1)
+    seg = np.searchsorted(np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF]), value)
+    quant = np.where(seg < 2, value >> 1, value >> np.maximum(seg, 1)) & 0x0F
+    aval = np.where(seg >= 8, 0x7F, (np.minimum(seg, 7) << 4) | quant)
+    return (aval ^ mask).astype(np.uint8)
+
+
+ULAW_DECODE = _build_ulaw_decode()
+ULAW_ENCODE = _build_ulaw_encode()
+ALAW_DECODE = _build_alaw_decode()
+ALAW_ENCODE = _build_alaw_encode()
+
+_DECODE_TABLES = {"ulaw": ULAW_DECODE, "alaw": ALAW_DECODE}
+_ENCODE_TABLES = {"ulaw": ULAW_ENCODE, "alaw": ALAW_ENCODE}
+
+
+def _check_format(audio_format: str):
+    if audio_format not in LINEAR_FORMATS and audio_format not in G711_FORMATS:
+        raise ValueError(f"Formato de audio no soportado: {audio_format}")
+
+
+def to_linear(data: Buffer, audio_format: str) -> np.ndarray:
+    """
+    Muestras int16 del audio. En PCM lineal es una vista sobre ``data`` (sin copia; se
+    ignora un byte final suelto); en G.711, un array nuevo decodificado por tabla.
+    """
+    _check_format(audio_format)
+    if audio_format in LINEAR_FORMATS:
+        view = memoryview(data).cast("B")
+        return np.frombuffer(view[:len(view) & ~1], dtype="<i2")
+    return _DECODE_TABLES[audio_format][np.frombuffer(data, dtype=np.uint8)]
+
+
+def from_linear(samples: np.ndarray, audio_format: str) -> bytes:
+    """Codifica muestras int16 en el formato indicado."""
+    _check_format(audio_format)
+    samples = np.asarray(samples, dtype="<i2")
+    if audio_format in LINEAR_FORMATS:
+        return samples.tobytes()
+    return _ENCODE_TABLES[audio_format][samples.view(np.uint16)].tobytes()
+
+
+def ulaw_to_linear(data: Buffer) -> np.ndarray:
+    return ULAW_DECODE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def linear_to_ulaw(samples: np.ndarray) -> bytes:
+    return ULAW_ENCODE[np.asarray(samples, dtype="<i2").view(np.uint16)].tobytes()
+
+
+def alaw_to_linear(data: Buffer) -> np.ndarray:
+    return ALAW_DECODE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def linear_to_alaw(samples: np.ndarray) -> bytes:
+    return ALAW_ENCODE[np.asarray(samples, dtype="<i2").view(np.uint16)].tobytes()
+
+
+class Resampler:
+    """
+    Remuestreo polifásico racional (``dst_rate / src_rate = up / down``) con estado.
+
+    El filtro prototipo es una sinc enventanada (Kaiser) de ``taps`` coeficientes por
+    fase y corte en la menor de las dos frecuencias de Nyquist; cada muestra de salida
+    usa sólo la fase que le corresponde, así que el coste es ``taps`` multiplicaciones
+    por muestra de salida sea cual sea ``up``. Se puede alimentar por fragmentos (las
+    ``taps - 1`` últimas muestras se guardan entre llamadas) y el resultado es idéntico
+    al de procesar todo el audio de una vez, con un retardo de ``taps / 2`` muestras.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int, taps: int = 16, beta: float = 8.0):
+        if src_rate <= 0 or dst_rate <= 0:
+            raise ValueError("Las frecuencias de muestreo deben ser positivas")
+        g = math.gcd(src_rate, dst_rate)
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        self.taps = taps
+        length = self.up * taps
+        cutoff = 0.5 / max(self.up, self.down)  # en ciclos por muestra de la frecuencia intermedia
+        n = np.arange(length) - (length - 1) / 2.0
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta)
+        prototype *= self.up / prototype.sum()
+        # phases[p, k] = prototype[p + k * up]; se invierte k para que el producto sea una convolución
+        # sobre la ventana de taps muestras que termina en la muestra base
+        self.phases = prototype.reshape(taps, self.up).T[:, ::-1].astype(np.float32)
+        self._history = np.zeros(taps - 1, dtype=np.float32)
+        self._position = 0  # Posición de la siguiente salida, en 1/up muestras de entrada
+
+    def reset(self):
+        self._history[:] = 0
+        self._position = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Remuestrea un fragmento de muestras int16 y devuelve las int16 de salida disponibles."""
+        if self.up == self.down:
+            return np.asarray(samples, dtype=np.int16)
+        count = len(samples)
+        buffer = np.concatenate((self._history, np.asarray(samples, dtype=np.float32)))
+        span = count * self.up
+        if self._position >= span:
+            outputs = 0
+        else:
+            outputs = -(-(span - self._position) // self.down)
+        if self.up <= 16:
+            # Pocas fases: las salidas de una misma fase son un producto matriz-vector sobre
+            # una vista deslizante del buffer (sin copiar ventanas)
+            result = np.empty(outputs, dtype=np.float32)
+            windows = sliding_window_view(buffer, self.taps)
+            for first in range(min(self.up, outputs)):
+                position = self._position + self.down * first
+                base = position // self.up
+                n = len(range(first, outputs, self.up))
+                result[first::self.up] = windows[base:base + self.down * n:self.down] @ self.phases[position % self.up]
+        else:
+            # Muchas fases (ej. 22050 -> 16000): se reúnen las ventanas de todas las salidas
+            positions = self._position + self.down * np.arange(outputs)
+            base = positions // self.up
+            window = buffer[base[:, None] + np.arange(self.taps)]
+            result = np.einsum("ij,ij->i", window, self.phases[positions % self.up])
+        self._position += outputs * self.down - span
+        self._history = buffer[len(buffer) - (self.taps - 1):].copy()
+        return np.clip(np.rint(result), -32768, 32767).astype(np.int16)
+
+
+class Transcoder:
+    """Conversión con estado entre dos formatos/frecuencias (decodifica, remuestrea y codifica)."""
+
+    def __init__(self, src_format: str, src_rate: int, dst_format: str, dst_rate: int, taps: int = 16):
+        _check_format(src_format)
+        _check_format(dst_format)
+        self.src_format = src_format
+        self.dst_format = dst_format
+        self.resampler: Optional[Resampler] = Resampler(src_rate, dst_rate, taps) if src_rate != dst_rate else None
+
+    def convert(self, data: Buffer) -> bytes:
+        samples = to_linear(data, self.src_format)
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+        return from_linear(samples, self.dst_format)
@@ -0,0 +1,27 @@
+"""Esperas de reintento con crecimiento exponencial y jitter, compartidas por los clientes que reconectan."""
+import random
+from typing import Callable
+
+
+class Backoff:
+    """
+    Espera antes del intento ``attempt`` (0, 1, 2, ...): el primero es inmediato y los
+    siguientes crecen como ``base * 2**(attempt - 1)`` hasta ``cap``. Con jitter se espera
+    entre la mitad y el total de ese valor, para que muchos clientes caídos a la vez no
+    reconecten sincronizados.
+    """
+
+    def __init__(self, base: float = 0.5, cap: float = 30.0, jitter: bool = True,
+                 rng: Callable[[], float] = random.random):
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+        self.rng = rng
+
+    def delay(self, attempt: int) -> float:
+        if attempt <= 0:
+            return 0.0
+        delay = min(self.cap, self.base * 2 ** min(attempt - 1, 32))
+        if self.jitter:
+            delay = delay / 2 + self.rng() * delay / 2
+        return delay
@@ -0,0 +1,82 @@
+"""
+Sobre binario versionado (protobuf, ``proto/call_envelope.proto``) para los mensajes
+que los microservicios intercambian por RabbitMQ: inicio de llamada, tramas de audio,
+eventos de llamada, transcripciones y peticiones de locución (TTS).
+
+Los metadatos de la llamada (formato, frecuencia, entorno AGI) viajan una sola vez en
+``CallStart``; cada trama de audio lleva sólo call_id, secuencia, captura y payload.
+"""
+import os
+import sys
+import time
+from typing import Mapping, Optional
+
+from google.protobuf.message import DecodeError
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../proto'))
+import call_envelope_pb2
+
+ENVELOPE_VERSION = 1
+CONTENT_TYPE = "application/x-protobuf; proto=call_envelope.Envelope"
+# Exchange fanout de las transcripciones: cada consumidor (la cola durable ``transcripts``
+# del servicio de conversación, una cola exclusiva por conector) recibe todas
+TRANSCRIPTS_EXCHANGE = "transcripts"
+
+Envelope = call_envelope_pb2.Envelope
+
+
+def encode_call_start(call_id: str, audio_format: str, sample_rate: int, frame_ms: int,
+                      agi_env: Optional[Mapping[str, str]] = None, uniqueid: str = "",
+                      start_ts: Optional[float] = None) -> bytes:
+    return Envelope(version=ENVELOPE_VERSION, call_start=call_envelope_pb2.CallStart(
+        call_id=call_id, uniqueid=uniqueid, audio_format=audio_format, sample_rate=sample_rate,
+        frame_ms=frame_ms, start_ts=time.time() if start_ts is None else start_ts, agi_env=agi_env or {},
+    )).SerializeToString()
+
+
+def encode_audio_chunk(call_id: str, seq: int, capture_ts: float, payload: bytes, silence: bool = False) -> bytes:
+    return Envelope(version=ENVELOPE_VERSION, audio_chunk=call_envelope_pb2.AudioChunk(
+        call_id=call_id, seq=seq, capture_ts=capture_ts, payload=payload, silence=silence,
+    )).SerializeToString()
+
+
+def encode_call_event(call_id: str, event: str, ts: Optional[float] = None,
+                      fields: Optional[Mapping[str, str]] = None) -> bytes:
+    return Envelope(version=ENVELOPE_VERSION, call_event=call_envelope_pb2.CallEvent(
+        call_id=call_id, event=event, ts=time.time() if ts is None else ts, fields=fields or {},
+    )).SerializeToString()
+
+
+def encode_transcript(call_id: str, text: str, is_final: bool = True, start_ts: float = 0.0,
+                      end_ts: float = 0.0) -> bytes:
+    return Envelope(version=ENVELOPE_VERSION, transcript=call_envelope_pb2.Transcript(
+        call_id=call_id, text=text, is_final=is_final, start_ts=start_ts, end_ts=end_ts,
+    )).SerializeToString()
+
+
+def encode_speak(call_id: str, text: str, utterance_id: str = "", language_code: str = "", voice_name: str = "",
+                 request_ts: Optional[float] = None) -> bytes:
+    return Envelope(version=ENVELOPE_VERSION, speak=call_envelope_pb2.SpeakRequest(
+        call_id=call_id, utterance_id=utterance_id, text=text, language_code=language_code, voice_name=voice_name,
+        request_ts=time.time() if request_ts is None else request_ts,
+    )).SerializeToString()
+
+
+def decode(data: bytes) -> Envelope:
+    """
+    Decodifica un sobre. Lanza ``ValueError`` si no es un sobre válido o su versión es
+    posterior a la soportada (los campos desconocidos de versiones compatibles se ignoran).
+    """
+    envelope = Envelope()
+    try:
+        envelope.ParseFromString(data)
+    except DecodeError as e:
+        raise ValueError(f"Sobre inválido: {e}") from e
+    if not envelope.version or envelope.version > ENVELOPE_VERSION:
+        raise ValueError(f"Versión de sobre no soportada: {envelope.version}")
+    return envelope
+
+
+def kind(envelope: Envelope) -> Optional[str]:
+    """Tipo de contenido del sobre: call_start, audio_chunk, call_event, transcript o speak."""
+    return envelope.WhichOneof("body")
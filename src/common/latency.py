@@ -0,0 +1,28 @@
+"""Resumen de latencias (percentiles sobre una ventana de medidas) compartido por los servicios."""
+import collections
+from typing import Dict
+
+import numpy as np
+
+
+class LatencyStats:
+    """Últimas ``window`` medidas de una latencia (en ms), resumidas en percentiles."""
+
+    def __init__(self, window: int = 1000):
+        self.samples = collections.deque(maxlen=window)
+        self.count = 0
+
+    def add(self, ms: float):
+        self.samples.append(ms)
+        self.count += 1
+
+    def stats(self) -> Dict[str, float]:
+        if not self.samples:
+            return {"count": self.count, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        values = np.asarray(self.samples)
+        return {
+            "count": self.count,
+            "p50": round(float(np.percentile(values, 50)), 2),
+            "p95": round(float(np.percentile(values, 95)), 2),
+            "max": round(float(values.max()), 2),
+        }
@@ -0,0 +1,144 @@
+"""
+Trazas de latencia de extremo a extremo por fragmento de audio.
+
+Una ``TraceContext`` identifica un fragmento del llamante (call_id, secuencia y marca
+de captura) y acumula las marcas de tiempo (reloj de pared, ``time.time()``) de cada
+etapa por la que pasa. Viaja serializada en la cabecera AMQP / metadato gRPC
+``x-trace``:
+
+    v1|<call_id>|<seq>|<capture_ts>|<etapa>=<ts>,<etapa>=<ts>,...
+
+Recorrido de una respuesta: el conector marca ``published`` en cada trama; el servicio
+STT ``stt_received`` al recibirla y, para la última trama con voz de la frase,
+``stt_final`` y ``transcript_published``; el servicio de conversación copia la cabecera
+de la transcripción en su petición de locución (añadiendo su propia etapa); el servicio
+TTS marca ``tts_request``, ``tts_first_audio`` y ``tts_published`` en el primer fragmento
+de la locución, y el conector ``playout_queued`` y ``played`` al escribirlo en el socket
+AGI. Las marcas de servicios distintos sólo son comparables con los relojes
+sincronizados (NTP).
+
+El muestreo es por llamada y determinista (hash del call_id), así que todos los
+servicios toman la misma decisión sin coordinarse.
+"""
+import collections
+import time
+import zlib
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from common.latency import LatencyStats
+
+TRACE_HEADER = "x-trace"
+TRACE_VERSION = "v1"
+
+
+class TraceContext:
+    __slots__ = ("call_id", "seq", "capture_ts", "stages")
+
+    def __init__(self, call_id: str, seq: int = 0, capture_ts: float = 0.0,
+                 stages: Optional[List[Tuple[str, float]]] = None):
+        self.call_id = call_id
+        self.seq = seq
+        self.capture_ts = capture_ts
+        self.stages = stages if stages is not None else []
+
+    def mark(self, stage: str, ts: Optional[float] = None) -> "TraceContext":
+        self.stages.append((stage, time.time() if ts is None else ts))
+        return self
+
+    def copy(self) -> "TraceContext":
+        return TraceContext(self.call_id, self.seq, self.capture_ts, list(self.stages))
+
+    def encode(self) -> str:
+        stages = ",".join(f"{stage}={ts:.6f}" for stage, ts in self.stages)
+        return f"{TRACE_VERSION}|{self.call_id}|{self.seq}|{self.capture_ts:.6f}|{stages}"
+
+    @classmethod
+    def decode(cls, value) -> Optional["TraceContext"]:
+        """Traza serializada, o None si no es válida (una traza rota no debe romper el audio)."""
+        if isinstance(value, bytes):
+            value = value.decode(errors="replace")
+        try:
+            version, call_id, seq, capture_ts, stages = value.split("|")
+            if version != TRACE_VERSION:
+                return None
+            parsed = []
+            for item in filter(None, stages.split(",")):
+                stage, _, ts = item.partition("=")
+                parsed.append((stage, float(ts)))
+            return cls(call_id, int(seq), float(capture_ts), parsed)
+        except (AttributeError, ValueError):
+            return None
+
+    def breakdown(self) -> List[Tuple[str, float]]:
+        """Duración (ms) de cada etapa desde la anterior; la primera, desde la captura."""
+        result = []
+        previous = self.capture_ts
+        for stage, ts in self.stages:
+            result.append((stage, (ts - previous) * 1000))
+            previous = ts
+        return result
+
+    @property
+    def total_ms(self) -> float:
+        return (self.stages[-1][1] - self.capture_ts) * 1000 if self.stages else 0.0
+
+
+def from_headers(headers: Optional[Mapping]) -> Optional[TraceContext]:
+    """Traza de las cabeceras AMQP de un mensaje, si las lleva."""
+    if not headers:
+        return None
+    value = headers.get(TRACE_HEADER)
+    return TraceContext.decode(value) if value else None
+
+
+def from_metadata(metadata: Optional[Iterable[Tuple[str, str]]]) -> Optional[TraceContext]:
+    """Traza de los metadatos de una llamada gRPC (pares clave/valor), si los lleva."""
+    for key, value in metadata or ():
+        if key == TRACE_HEADER:
+            return TraceContext.decode(value)
+    return None
+
+
+class TraceSampler:
+    """Decide por llamada si se traza, con probabilidad ``rate``, a partir del hash del call_id."""
+
+    def __init__(self, rate: float = 0.0):
+        self.rate = max(0.0, min(1.0, rate))
+        self._threshold = int(self.rate * 0x100000000)
+
+    def sampled(self, call_id: str) -> bool:
+        if self.rate <= 0.0:
+            return False
+        if self.rate >= 1.0:
+            return True
+        return zlib.crc32(call_id.encode()) < self._threshold
+
+
+class TraceReport:
+    """Desglose de latencias por etapa de cada llamada trazada (más el total)."""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.calls: Dict[str, Dict[str, LatencyStats]] = {}
+
+    def add(self, trace: TraceContext):
+        stages = self.calls.get(trace.call_id)
+        if stages is None:
+            stages = self.calls[trace.call_id] = collections.defaultdict(lambda: LatencyStats(self.window))
+        for stage, ms in trace.breakdown():
+            stages[stage].add(ms)
+        stages["total"].add(trace.total_ms)
+
+    def report(self, call_id: str) -> Dict[str, Dict[str, float]]:
+        return {stage: stats.stats() for stage, stats in self.calls.get(call_id, {}).items()}
+
+    def pop(self, call_id: str) -> Dict[str, Dict[str, float]]:
+        report = self.report(call_id)
+        self.calls.pop(call_id, None)
+        return report
+
+    @staticmethod
+    def format(report: Dict[str, Dict[str, float]]) -> str:
+        """Resumen de una línea: etapa p50/p95 ms (n)."""
+        return ", ".join(f"{stage} {stats['p50']:.1f}/{stats['p95']:.1f} ms (n={stats['count']})"
+                         for stage, stats in report.items())
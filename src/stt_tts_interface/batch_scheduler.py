@@ -0,0 +1,112 @@
+import asyncio
+import collections
+import concurrent.futures
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+
+class BatchScheduler:
+    """
+    Planificador dinámico de lotes para un paso de inferencia.
+
+    Las peticiones de todas las llamadas se encolan con ``submit``; un único bucle forma
+    lotes de hasta ``max_batch`` elementos y los ejecuta con ``run_batch`` en un hilo
+    dedicado (el motor nunca se ejecuta concurrentemente consigo mismo). Con poca carga
+    un lote sale, como tarde, ``max_latency`` segundos después de llegar su primer
+    elemento; con mucha, los lotes se llenan solos mientras se ejecuta el anterior.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch: int = 32, max_latency: float = 0.02,
+                 name: str = "batch", executor: Optional[concurrent.futures.Executor] = None):
+        if max_batch < 1:
+            raise ValueError("max_batch debe ser al menos 1")
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.name = name
+        self._own_executor = executor is None
+        self._executor = executor or concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._pending = collections.deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+        self.max_wait = 0.0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, item: Any) -> asyncio.Future:
+        """Encola un elemento y devuelve el futuro con su resultado."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((loop.time(), item, future))
+        self._wakeup.set()
+        return future
+
+    async def _collect(self) -> List[Any]:
+        loop = asyncio.get_running_loop()
+        while not self._pending:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        deadline = self._pending[0][0] + self.max_latency
+        while len(self._pending) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        count = min(len(self._pending), self.max_batch)
+        return [self._pending.popleft() for _ in range(count)]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            started = loop.time()
+            self.max_wait = max(self.max_wait, started - batch[0][0])
+            try:
+                results = await loop.run_in_executor(self._executor, self.run_batch, [item for _, item, _ in batch])
+                if len(results) != len(batch):
+                    # Sin un resultado por elemento no se sabe a quién corresponde cada uno
+                    raise ValueError(f"run_batch devolvió {len(results)} resultados para {len(batch)} elementos")
+            except Exception as e:
+                logging.error(f"[{self.name}] Error en el lote de {len(batch)} elementos: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._pending:
+            _, _, future = self._pending.popleft()
+            future.cancel()
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "queued": len(self._pending),
+        }
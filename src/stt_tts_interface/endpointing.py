@@ -0,0 +1,100 @@
+from typing import Optional
+
+import numpy as np
+
+
+class Endpointer:
+    """
+    Detección de fin de frase (endpointing) de una sesión de reconocimiento.
+
+    Cada fragmento de audio se clasifica como voz o silencio por su energía (o por la
+    marca ``silence`` del conector); los huecos en las marcas de captura, que deja el
+    VAD del conector al suprimir el silencio, cuentan también como silencio. La frase
+    termina cuando, tras al menos ``min_speech_ms`` de voz, se acumulan
+    ``end_silence_ms`` de silencio, o cuando dura ``max_utterance_ms``. Si el audio deja
+    de llegar, ``expired`` aplica la misma regla con el reloj de llegada. Una ráfaga de
+    voz más corta que ``min_speech_ms`` seguida de silencio se descarta (ruido, tos).
+    Con ``end_silence_ms`` <= 0 sólo se aplica ``max_utterance_ms``.
+    """
+
+    def __init__(self, sample_rate: int, energy_threshold_db: float = -40.0, min_speech_ms: float = 100.0,
+                 end_silence_ms: float = 300.0, max_utterance_ms: float = 15000.0):
+        self.sample_rate = sample_rate
+        # Umbral sobre la energía media (int16 al cuadrado) equivalente a energy_threshold_db dBFS
+        self.energy_threshold = (32768.0 * 10 ** (energy_threshold_db / 20)) ** 2
+        self.min_speech_ms = min_speech_ms
+        self.end_silence_ms = end_silence_ms
+        self.max_utterance_ms = max_utterance_ms
+        self.reset()
+        self._next_ts: Optional[float] = None
+        self.discarded = 0
+
+    def reset(self):
+        """Empieza una frase nueva (tras un fin de frase)."""
+        self.speech_ms = 0.0
+        self.silence_ms = 0.0
+        self.utterance_ms = 0.0
+        self.last_arrival: Optional[float] = None
+
+    @property
+    def in_utterance(self) -> bool:
+        return self.speech_ms > 0
+
+    def is_voiced(self, samples: np.ndarray) -> bool:
+        if not len(samples):
+            return False
+        x = samples.astype(np.float32)
+        return float(np.dot(x, x)) / len(x) >= self.energy_threshold
+
+    def feed(self, samples: np.ndarray, capture_ts: Optional[float] = None, silence: bool = False,
+             arrival: Optional[float] = None) -> bool:
+        """
+        Procesa un fragmento (muestras int16 a ``sample_rate``). Devuelve True si es voz;
+        ``ended`` indica después si con él termina la frase en curso.
+        """
+        duration_ms = len(samples) * 1000.0 / self.sample_rate
+        if capture_ts is not None:
+            if self._next_ts is not None:
+                gap_ms = (capture_ts - self._next_ts) * 1000.0
+                if gap_ms > duration_ms / 2:
+                    self._add_silence(gap_ms)
+            self._next_ts = capture_ts + duration_ms / 1000.0
+        voiced = not silence and self.is_voiced(samples)
+        if voiced:
+            self.speech_ms += duration_ms
+            self.silence_ms = 0.0
+            self.utterance_ms += duration_ms
+        else:
+            self._add_silence(duration_ms)
+        if arrival is not None and self.in_utterance:
+            self.last_arrival = arrival
+        return voiced
+
+    def _add_silence(self, ms: float):
+        if not self.in_utterance:
+            return
+        self.silence_ms += ms
+        self.utterance_ms += ms
+        if 0 < self.end_silence_ms <= self.silence_ms and self.speech_ms < self.min_speech_ms:
+            self.discarded += 1
+            self.reset()
+
+    @property
+    def ended(self) -> bool:
+        if not self.in_utterance:
+            return False
+        if self.forced:
+            return True
+        return 0 < self.end_silence_ms <= self.silence_ms and self.speech_ms >= self.min_speech_ms
+
+    @property
+    def forced(self) -> bool:
+        """La frase ha alcanzado ``max_utterance_ms``."""
+        return self.utterance_ms >= self.max_utterance_ms
+
+    def expired(self, now: float) -> bool:
+        """Fin de frase por falta de audio: ``end_silence_ms`` sin recibir nada desde la última voz."""
+        if (self.end_silence_ms <= 0 or not self.in_utterance or self.last_arrival is None
+                or self.speech_ms < self.min_speech_ms):
+            return False
+        return self.silence_ms + (now - self.last_arrival) * 1000.0 >= self.end_silence_ms
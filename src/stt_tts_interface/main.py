@@ -3,28 +3,89 @@
 STT/TTS Service - Microservicio para Speech-to-Text y Text-to-Speech
 """
 
+import asyncio
+import logging
 import os
 import sys
-import time
-from datetime import datetime
+
+import aio_pika
+
+try:
+    from .speech_engine import load_engine
+    from .speech_worker import SpeechWorker
+    from .stt_tts_servicer import SttTtsServicer, serve_async
+    from .tts_cache import TTSCache
+except ImportError:
+    from speech_engine import load_engine
+    from speech_worker import SpeechWorker
+    from stt_tts_servicer import SttTtsServicer, serve_async
+    from tts_cache import TTSCache
+
+
+def create_tts_cache() -> TTSCache:
+    """Caché de audio TTS: LRU en memoria y, si se indica TTS_CACHE_DIR, persistente en disco."""
+    disk_mb = os.getenv("TTS_CACHE_DISK_MB")
+    return TTSCache(
+        memory_bytes=int(float(os.getenv("TTS_CACHE_MEMORY_MB", "64")) * 1024 * 1024),
+        directory=os.getenv("TTS_CACHE_DIR") or None,
+        disk_bytes=int(float(disk_mb) * 1024 * 1024) if disk_mb else None,
+    )
+
+
+def load_prewarm_texts(path: str):
+    """Frases a pre-sintetizar: una por línea; se ignoran las vacías y las que empiezan por '#'."""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
 
 
 def main():
     """Función principal del servicio STT/TTS"""
-    print(f"[{datetime.now()}] STT/TTS Service iniciado")
-    print(f"[{datetime.now()}] Variables de entorno:")
-    print(f"  - RABBITMQ_HOST: {os.getenv('RABBITMQ_HOST', 'N/A')}")
-    print(f"  - RABBITMQ_USER: {os.getenv('RABBITMQ_USER', 'N/A')}")
-    
-    print(f"[{datetime.now()}] Servicio ejecutándose. Presiona Ctrl+C para detener.")
-    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    async def async_main():
+        # Motor de inferencia compartido por todas las llamadas ("stub" o "modulo:Clase")
+        engine = load_engine(os.getenv("STT_TTS_ENGINE", "stub"))
+        worker = SpeechWorker(
+            engine,
+            step_ms=int(os.getenv("STT_STEP_MS", "200")),
+            stt_max_batch=int(os.getenv("STT_MAX_BATCH", "32")),
+            stt_max_latency=float(os.getenv("STT_MAX_LATENCY_MS", "20")) / 1000.0,
+            tts_max_batch=int(os.getenv("TTS_MAX_BATCH", "8")),
+            tts_max_latency=float(os.getenv("TTS_MAX_LATENCY_MS", "10")) / 1000.0,
+            tts_cache=create_tts_cache(),
+            playback_chunk_ms=int(os.getenv("TTS_PLAYBACK_CHUNK_MS", "20")),
+            sentence_max_chars=int(os.getenv("TTS_SENTENCE_MAX_CHARS", "160")),
+            partials=os.getenv("STT_PARTIALS", "1") not in ("0", "false", "no"),
+            endpoint_silence_ms=float(os.getenv("STT_ENDPOINT_SILENCE_MS", "300")),
+            endpoint_min_speech_ms=float(os.getenv("STT_ENDPOINT_MIN_SPEECH_MS", "100")),
+            max_utterance_ms=float(os.getenv("STT_MAX_UTTERANCE_MS", "15000")),
+            endpoint_threshold_db=float(os.getenv("STT_ENDPOINT_THRESHOLD_DB", "-40")),
+        )
+
+        prewarm_file = os.getenv("TTS_PREWARM_FILE")
+        if prewarm_file:
+            try:
+                await worker.prewarm(load_prewarm_texts(prewarm_file), os.getenv("TTS_LANGUAGE", ""),
+                                     os.getenv("TTS_VOICE", ""))
+            except OSError as e:
+                logging.warning(f"[TTS] No se pudo leer TTS_PREWARM_FILE={prewarm_file}: {e}")
+
+        rabbitmq_url = f"amqp://{os.getenv('RABBITMQ_USER', 'guest')}:{os.getenv('RABBITMQ_PASS', 'guest')}@{os.getenv('RABBITMQ_HOST', 'localhost')}/"
+        rabbitmq_conn = await aio_pika.connect_robust(rabbitmq_url)
+        rabbitmq_channel = await rabbitmq_conn.channel()
+        await worker.consume(rabbitmq_channel)
+
+        try:
+            await serve_async(SttTtsServicer(worker), port=int(os.getenv("STT_TTS_GRPC_PORT", "50052")))
+        finally:
+            logging.info(f"STT/TTS: {worker.stats()}")
+            await worker.close()
+            await rabbitmq_conn.close()
+
     try:
-        while True:
-            # Simulación de trabajo
-            print(f"[{datetime.now()}] STT/TTS Service trabajando...")
-            time.sleep(30)
+        asyncio.run(async_main())
     except KeyboardInterrupt:
-        print(f"[{datetime.now()}] Deteniendo STT/TTS Service...")
+        logging.info("Deteniendo STT/TTS Service...")
         sys.exit(0)
 
 if __name__ == "__main__":
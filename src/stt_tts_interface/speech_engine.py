@@ -0,0 +1,85 @@
+import importlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+class RecognitionResult(NamedTuple):
+    text: str
+    is_final: bool
+
+
+# Elemento de un lote de reconocimiento: (sesión, muestras int16 a engine.sample_rate, fin de frase)
+RecognitionItem = Tuple[str, np.ndarray, bool]
+# Elemento de un lote de síntesis: (sesión, texto, language_code, voice_name)
+SynthesisItem = Tuple[str, str, str, str]
+
+
+class StubSpeechEngine:
+    """
+    Motor STT/TTS determinista y sólo CPU, para pruebas y benchmarks.
+
+    Implementa la interfaz que el servicio espera de cualquier motor:
+
+    - ``sample_rate``: frecuencia (PCM lineal 16 bits) a la que trabaja el motor.
+    - ``recognize(batch)``: un paso de inferencia sobre fragmentos de varias sesiones a la
+      vez; devuelve un ``RecognitionResult`` (o None) por elemento: la hipótesis parcial
+      (``is_final=False``) de la frase en curso o, si el elemento cierra la frase, la
+      final. El estado de cada sesión vive en el motor hasta ``close_session``.
+    - ``synthesize(batch)``: audio int16 de cada texto del lote.
+
+    El "reconocimiento" cuenta, en una sola operación sobre la matriz del lote, las
+    tramas de 20 ms con energía de voz y devuelve la duración acumulada de la frase. La
+    "síntesis" genera un tono por carácter. Ambos son deterministas.
+    """
+
+    def __init__(self, sample_rate: int = 16000, energy_threshold: float = 300.0, ms_per_char: int = 50):
+        self.sample_rate = sample_rate
+        self.energy_threshold = energy_threshold
+        self.ms_per_char = ms_per_char
+        self.frame = sample_rate // 50
+        self._voiced_frames: Dict[str, int] = {}
+
+    def recognize(self, batch: List[RecognitionItem]) -> List[Optional[RecognitionResult]]:
+        frames = max(-(-len(samples) // self.frame) for _, samples, _ in batch) if batch else 0
+        matrix = np.zeros((len(batch), max(frames, 1) * self.frame), dtype=np.float32)
+        for row, (_, samples, _) in enumerate(batch):
+            matrix[row, :len(samples)] = samples
+        rms = np.sqrt(np.mean(matrix.reshape(len(batch), -1, self.frame) ** 2, axis=2))
+        voiced = np.count_nonzero(rms > self.energy_threshold, axis=1)
+        results: List[Optional[RecognitionResult]] = []
+        for (session, _, final), count in zip(batch, voiced.tolist()):
+            total = self._voiced_frames.get(session, 0) + count
+            if final:
+                self._voiced_frames.pop(session, None)
+                results.append(RecognitionResult(f"[{total * 20} ms de voz]", True))
+            else:
+                self._voiced_frames[session] = total
+                results.append(RecognitionResult(f"[{total * 20} ms de voz]", False) if total else None)
+        return results
+
+    def synthesize(self, batch: List[SynthesisItem]) -> List[np.ndarray]:
+        per_char = self.sample_rate * self.ms_per_char // 1000
+        audio = []
+        for _, text, _, _ in batch:
+            codes = np.frombuffer(text.encode("utf-8") or b" ", dtype=np.uint8)
+            freqs = np.repeat(200.0 + (codes % 32) * 20.0, per_char)
+            phase = np.cumsum(2 * np.pi * freqs / self.sample_rate)
+            audio.append((6000 * np.sin(phase)).astype(np.int16))
+        return audio
+
+    def close_session(self, session: str):
+        self._voiced_frames.pop(session, None)
+
+
+def load_engine(spec: str = "stub", **kwargs):
+    """
+    Crea el motor indicado: ``stub`` o la ruta ``paquete.modulo:Clase`` de cualquier clase
+    con la interfaz de ``StubSpeechEngine``.
+    """
+    if spec == "stub":
+        return StubSpeechEngine(**kwargs)
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise ValueError(f"Motor no válido (se espera 'modulo:Clase'): {spec}")
+    return getattr(importlib.import_module(module_name), class_name)(**kwargs)
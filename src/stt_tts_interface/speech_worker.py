@@ -0,0 +1,498 @@
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+import aio_pika
+import numpy as np
+
+from common import envelope, tracing
+from common.audio_codec import Transcoder
+from common.latency import LatencyStats
+
+try:
+    from .batch_scheduler import BatchScheduler
+    from .endpointing import Endpointer
+    from .speech_engine import RecognitionResult
+    from .streaming_tts import split_sentences, synthesize_sentences
+    from .tts_cache import TTSCache, cache_key
+except ImportError:
+    from batch_scheduler import BatchScheduler
+    from endpointing import Endpointer
+    from speech_engine import RecognitionResult
+    from streaming_tts import split_sentences, synthesize_sentences
+    from tts_cache import TTSCache, cache_key
+
+# Eventos de llamada que cierran la frase en curso / la sesión de reconocimiento
+UTTERANCE_END_EVENTS = ("speech_end",)
+SESSION_END_EVENTS = ("audio_ended", "call_ended")
+# Eventos que cancelan la locución en curso de la llamada (barge-in del conector)
+INTERRUPT_EVENTS = ("barge_in",)
+
+
+class RecognitionSession:
+    """
+    Audio pendiente de reconocer de una llamada, ya convertido al formato del motor.
+
+    Acumula tramas hasta reunir ``step`` muestras (un paso de inferencia), las pasa por
+    su ``endpointer`` para detectar el fin de frase y recuerda las marcas de captura de
+    la voz de la frase en curso para adjuntarlas a la transcripción.
+    """
+
+    __slots__ = ("key", "call_id", "publish", "on_result", "transcoder", "step", "frame_seconds", "endpointer",
+                 "_chunks", "_samples", "start_ts", "end_ts", "steps", "last_partial", "trace")
+
+    def __init__(self, key: str, call_id: str, engine_rate: int, step_ms: int = 200, audio_format: str = "slin",
+                 sample_rate: int = 8000, frame_ms: int = 20, publish: bool = True,
+                 endpointer: Optional[Endpointer] = None):
+        self.key = key
+        self.call_id = call_id
+        # Publicar las transcripciones en RabbitMQ (las sesiones gRPC las reciben por su stream)
+        self.publish = publish
+        # Alternativa a publicar: se llama con cada RecognitionResult según está listo
+        self.on_result: Optional[Callable[[RecognitionResult], None]] = None
+        self.transcoder = Transcoder(audio_format, sample_rate, "slin", engine_rate)
+        self.step = engine_rate * step_ms // 1000
+        self.frame_seconds = frame_ms / 1000.0
+        self.endpointer = endpointer or Endpointer(engine_rate)
+        self._chunks: List[np.ndarray] = []
+        self._samples = 0
+        self.start_ts: Optional[float] = None
+        self.end_ts: Optional[float] = None
+        self.steps = 0
+        self.last_partial: Optional[str] = None
+        # Traza de la última trama con voz de la frase (si la llamada se traza)
+        self.trace: Optional[tracing.TraceContext] = None
+
+    def feed(self, payload: bytes, capture_ts: Optional[float] = None, silence: bool = False,
+             arrival: Optional[float] = None, trace: Optional[tracing.TraceContext] = None) -> bool:
+        """
+        Añade una trama (las marcadas como silencio sólo cuentan para el endpointing).
+        Devuelve True si ya hay un paso completo pendiente.
+        """
+        samples = np.frombuffer(self.transcoder.convert(payload), dtype="<i2")
+        voiced = self.endpointer.feed(samples, capture_ts, silence, arrival)
+        if not silence:
+            self._chunks.append(samples)
+            self._samples += len(samples)
+        if voiced:
+            if self.start_ts is None:
+                self.start_ts = capture_ts
+            if capture_ts is not None:
+                self.end_ts = capture_ts + self.frame_seconds
+            if trace is not None:
+                self.trace = trace
+        elif not self.endpointer.in_utterance:
+            # Ráfaga descartada por el endpointer (o aún sin voz)
+            self.start_ts = None
+            self.end_ts = None
+            self.trace = None
+        return self._samples >= self.step
+
+    def take(self) -> np.ndarray:
+        audio = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.int16)
+        self._chunks = []
+        self._samples = 0
+        self.steps += 1
+        return audio
+
+    @property
+    def in_utterance(self) -> bool:
+        """Hay una frase con voz abierta."""
+        return self.endpointer.in_utterance
+
+    def end_utterance(self):
+        self.start_ts = None
+        self.end_ts = None
+        self.trace = None
+        self.endpointer.reset()
+
+
+class SpeechWorker:
+    """
+    Servicio STT multi-llamada: consume ``incoming_audio_chunks`` (sobres de
+    common.envelope), mantiene una sesión de reconocimiento por llamada y agrupa los
+    pasos de inferencia de todas las llamadas en lotes (``BatchScheduler``) sobre un
+    único motor. Las transcripciones finales se publican en el exchange fanout
+    ``transcripts``, del que cuelgan la cola durable del servicio de conversación y la
+    cola exclusiva de cada conector.
+
+    La síntesis (TTS) usa otro planificador sobre el mismo motor y se expone a través
+    de ``synthesize``, detrás de ``tts_cache`` si se indica. Las locuciones de
+    ``tts_requests`` se sintetizan frase a frase y cada frase se publica en
+    ``outgoing_audio_chunks`` en cuanto está lista, midiendo el tiempo hasta el primer
+    audio (TTFA) de cada una.
+
+    Cada paso de reconocimiento publica su hipótesis parcial (``is_final=False``) si ha
+    cambiado; el fin de frase lo decide el ``Endpointer`` de la sesión (silencio tras la
+    voz o duración máxima), o antes un evento ``speech_end`` del conector.
+
+    Las tramas con traza (cabecera ``x-trace``, common.tracing) alimentan el desglose de
+    latencias por llamada (``trace_report``); la traza de la última trama con voz viaja
+    con la transcripción final, y la de cada petición de locución con su primer audio.
+    """
+
+    def __init__(self, engine, rabbitmq_channel=None, step_ms: int = 200, stt_max_batch: int = 32,
+                 stt_max_latency: float = 0.02, tts_max_batch: int = 8, tts_max_latency: float = 0.01,
+                 tts_cache: Optional[TTSCache] = None, playback_chunk_ms: int = 20, sentence_max_chars: int = 160,
+                 partials: bool = True, endpoint_silence_ms: float = 300.0, endpoint_min_speech_ms: float = 100.0,
+                 max_utterance_ms: float = 15000.0, endpoint_threshold_db: float = -40.0,
+                 endpoint_poll_ms: float = 50.0):
+        self.engine = engine
+        self.partials = partials
+        self.endpoint_silence_ms = endpoint_silence_ms
+        self.endpoint_min_speech_ms = endpoint_min_speech_ms
+        self.max_utterance_ms = max_utterance_ms
+        self.endpoint_threshold_db = endpoint_threshold_db
+        self.endpoint_poll = endpoint_poll_ms / 1000.0
+        self.tts_cache = tts_cache
+        self.playback_chunk_ms = playback_chunk_ms
+        self.sentence_max_chars = sentence_max_chars
+        self.rabbitmq_channel = rabbitmq_channel
+        # Exchange fanout de las transcripciones (lo declara ``consume``); sin él, la cola directa
+        self.transcripts_exchange = None
+        self.step_ms = step_ms
+        # Un único hilo para el motor: STT y TTS nunca lo ejecutan a la vez
+        self._engine_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="engine")
+        self.stt = BatchScheduler(engine.recognize, stt_max_batch, stt_max_latency, name="stt",
+                                  executor=self._engine_executor)
+        self.tts = BatchScheduler(engine.synthesize, tts_max_batch, tts_max_latency, name="tts",
+                                  executor=self._engine_executor)
+        self.sessions: Dict[str, RecognitionSession] = {}
+        self._endpoint_task: Optional[asyncio.Task] = None
+        # Fines de frase por motivo: silence, timeout, max, event, request, session_end
+        self.endpoints = collections.Counter()
+        # Locución en curso (o la última encolada) de cada llamada
+        self._speaking: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.transcripts = 0
+        self.utterances = 0
+        self.ttfa = LatencyStats()
+        self.trace_report = tracing.TraceReport()
+        self.logger = logging.getLogger("SpeechWorker")
+
+    async def consume(self, channel=None):
+        """Declara las colas y lanza los consumidores de ``incoming_audio_chunks`` y ``tts_requests``."""
+        self.rabbitmq_channel = channel or self.rabbitmq_channel
+        self.transcripts_exchange = await self.rabbitmq_channel.declare_exchange(
+            envelope.TRANSCRIPTS_EXCHANGE, aio_pika.ExchangeType.FANOUT, durable=True)
+        transcripts = await self.rabbitmq_channel.declare_queue("transcripts", durable=True)
+        await transcripts.bind(self.transcripts_exchange)
+        await self.rabbitmq_channel.declare_queue("outgoing_audio_chunks", durable=True)
+        queue = await self.rabbitmq_channel.declare_queue("incoming_audio_chunks", durable=True)
+        # Sin ack: el audio es efímero y se procesa en memoria
+        await queue.consume(self._on_message, no_ack=True)
+        tts_queue = await self.rabbitmq_channel.declare_queue("tts_requests", durable=True)
+        await tts_queue.consume(self._on_message, no_ack=True)
+        self.logger.info("[STT] Consumidores de incoming_audio_chunks y tts_requests activos")
+        return queue
+
+    async def _on_message(self, message):
+        try:
+            env = envelope.decode(message.body)
+        except ValueError as e:
+            self.logger.warning(f"[STT] Mensaje descartado: {e}")
+            return
+        self.handle_envelope(env, tracing.from_headers(message.headers))
+
+    def open_session(self, key: str, call_id: str, audio_format: str = "slin", sample_rate: int = 8000,
+                     frame_ms: int = 20, publish: bool = True) -> RecognitionSession:
+        session = self.sessions.get(key)
+        if session is None:
+            endpointer = Endpointer(self.engine.sample_rate, self.endpoint_threshold_db, self.endpoint_min_speech_ms,
+                                    self.endpoint_silence_ms, self.max_utterance_ms)
+            session = self.sessions[key] = RecognitionSession(
+                key, call_id, self.engine.sample_rate, self.step_ms, audio_format, sample_rate, frame_ms, publish,
+                endpointer)
+            if self._endpoint_task is None and self.endpoint_silence_ms > 0:
+                self._endpoint_task = asyncio.create_task(self._watch_endpoints())
+        return session
+
+    def handle_envelope(self, env, trace: Optional[tracing.TraceContext] = None):
+        kind = envelope.kind(env)
+        if kind == "call_start":
+            start = env.call_start
+            self.open_session(start.call_id, start.call_id, start.audio_format or "slin", start.sample_rate or 8000,
+                              start.frame_ms or 20)
+        elif kind == "audio_chunk":
+            chunk = env.audio_chunk
+            session = self.sessions.get(chunk.call_id)
+            if session is None:
+                if chunk.silence:
+                    return
+                # Sin CallStart (p.ej. el servicio arrancó a mitad de llamada): formato por defecto del conector
+                session = self.open_session(chunk.call_id, chunk.call_id)
+            if trace is not None:
+                self.trace_report.add(trace.mark("stt_received"))
+            self.feed_audio(session, chunk.payload, chunk.capture_ts, chunk.silence, trace)
+        elif kind == "speak":
+            speak = env.speak
+            self.speak(speak.call_id, speak.text, speak.utterance_id, speak.language_code, speak.voice_name,
+                       speak.request_ts, trace)
+        elif kind == "call_event":
+            event = env.call_event
+            if event.event in SESSION_END_EVENTS or event.event in INTERRUPT_EVENTS:
+                self.cancel_speech(event.call_id)
+            session = self.sessions.get(event.call_id)
+            if session is None:
+                return
+            if event.event in UTTERANCE_END_EVENTS:
+                self.end_utterance(session, "event")
+            elif event.event in SESSION_END_EVENTS:
+                self.close_session(session.key)
+
+    def feed_audio(self, session: RecognitionSession, payload: bytes, capture_ts: Optional[float] = None,
+                   silence: bool = False, trace: Optional[tracing.TraceContext] = None) -> Optional[asyncio.Task]:
+        """Añade audio a la sesión y lanza el paso de reconocimiento o el fin de frase que toque."""
+        ready = session.feed(payload, capture_ts, silence, asyncio.get_running_loop().time(), trace)
+        if session.endpointer.ended:
+            return self.end_utterance(session, "max" if session.endpointer.forced else "silence")
+        if ready:
+            return self.recognize_step(session)
+        return None
+
+    def end_utterance(self, session: RecognitionSession, reason: str) -> Optional[asyncio.Task]:
+        """Cierra la frase en curso, si tiene voz, con un paso final."""
+        if not session.in_utterance:
+            session.end_utterance()
+            return None
+        self.endpoints[reason] += 1
+        return self.recognize_step(session, final=True)
+
+    def recognize_step(self, session: RecognitionSession, final: bool = False) -> asyncio.Task:
+        """
+        Envía al planificador el audio pendiente de la sesión (en orden de llegada). Devuelve
+        la tarea que entrega el resultado (publicación o ``on_result``) cuando está listo.
+        """
+        start_ts, end_ts = session.start_ts, session.end_ts
+        trace = session.trace.copy() if final and session.trace is not None else None
+        future = self.stt.submit((session.key, session.take(), final))
+        if final:
+            session.end_utterance()
+        task = asyncio.create_task(self._deliver(session, future, start_ts, end_ts, trace))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _watch_endpoints(self):
+        """Fin de frase de las sesiones que han dejado de recibir audio (silencio suprimido por el VAD)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.endpoint_poll)
+            now = loop.time()
+            for session in list(self.sessions.values()):
+                if session.endpointer.expired(now):
+                    self.end_utterance(session, "timeout")
+
+    def close_session(self, key: str) -> Optional[asyncio.Task]:
+        """Cierra la frase en curso y libera el estado de la sesión en el motor (tras su último paso)."""
+        session = self.sessions.pop(key, None)
+        if session is None:
+            return None
+        task = self.end_utterance(session, "session_end")
+        self._spawn(self._release(key, task))
+        traces = self.trace_report.pop(session.call_id)
+        if traces:
+            self.logger.info(f"[STT] Latencias por etapa de call_id={session.call_id}: "
+                             f"{tracing.TraceReport.format(traces)}")
+        return task
+
+    async def _release(self, key: str, task: Optional[asyncio.Task]):
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(self._engine_executor, self.engine.close_session, key)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, session: RecognitionSession, future: asyncio.Future, start_ts: Optional[float],
+                       end_ts: Optional[float], trace: Optional[tracing.TraceContext] = None
+                       ) -> Optional[RecognitionResult]:
+        try:
+            result: Optional[RecognitionResult] = await future
+        except Exception:
+            return None
+        if result is None or not result.text:
+            return None
+        if result.is_final:
+            session.last_partial = None
+        elif not self.partials or result.text == session.last_partial:
+            return None
+        else:
+            session.last_partial = result.text
+        if trace is not None:
+            trace.mark("stt_final")
+        if session.on_result is not None:
+            session.on_result(result)
+        elif session.publish and self.rabbitmq_channel is not None:
+            await self.publish_transcript(session.call_id, result, start_ts or 0.0, end_ts or 0.0, trace)
+        return result
+
+    async def publish_transcript(self, call_id: str, result: RecognitionResult, start_ts: float = 0.0,
+                                 end_ts: float = 0.0, trace: Optional[tracing.TraceContext] = None):
+        body = envelope.encode_transcript(call_id, result.text, result.is_final, start_ts, end_ts)
+        headers = {"call_id": call_id}
+        if trace is not None:
+            # El servicio de conversación copia esta cabecera en su petición de locución
+            headers[tracing.TRACE_HEADER] = trace.mark("transcript_published").encode()
+        exchange = self.transcripts_exchange or self.rabbitmq_channel.default_exchange
+        try:
+            await exchange.publish(
+                aio_pika.Message(body=body, headers=headers, content_type=envelope.CONTENT_TYPE),
+                routing_key="transcripts"
+            )
+            self.transcripts += 1
+        except Exception as e:
+            self.logger.error(f"[STT] Error publicando transcripción de call_id={call_id}: {e}")
+
+    async def synthesize(self, key: str, text: str, language_code: str = "", voice_name: str = "") -> np.ndarray:
+        """Audio int16 (a ``engine.sample_rate``) del texto, de la caché o sintetizado en lote con otras peticiones."""
+        if self.tts_cache is None:
+            return await self.tts.submit((key, text, language_code, voice_name))
+        audio = await self.tts_cache.get_or_synthesize(
+            self.synthesis_key(text, language_code, voice_name),
+            lambda: self._synthesize_bytes(key, text, language_code, voice_name))
+        return np.frombuffer(audio, dtype="<i2")
+
+    def synthesis_key(self, text: str, language_code: str = "", voice_name: str = "") -> str:
+        return cache_key(text, language_code, voice_name, f"slin@{self.engine.sample_rate}")
+
+    async def _synthesize_bytes(self, key: str, text: str, language_code: str, voice_name: str) -> bytes:
+        return (await self.tts.submit((key, text, language_code, voice_name))).tobytes()
+
+    async def prewarm(self, texts, language_code: str = "", voice_name: str = "") -> int:
+        """Carga en la caché TTS los textos indicados (frases fijas del IVR) antes de atender llamadas."""
+        if self.tts_cache is None:
+            return 0
+        texts = list(texts)
+        generated = await self.tts_cache.prewarm(
+            (self.synthesis_key(text, language_code, voice_name),
+             lambda text=text: self._synthesize_bytes("prewarm", text, language_code, voice_name))
+            for text in texts
+        )
+        self.logger.info(f"[TTS] Pre-calentamiento: {generated} audios sintetizados de {len(texts)} frases")
+        return generated
+
+    async def synthesize_stream(self, key: str, text: str, language_code: str = "",
+                                voice_name: str = "") -> AsyncIterator[np.ndarray]:
+        """Audio de cada frase del texto, en orden, en cuanto está sintetizada."""
+        async for audio in synthesize_sentences(
+                lambda sentence: self.synthesize(key, sentence, language_code, voice_name),
+                split_sentences(text, self.sentence_max_chars)):
+            yield audio
+
+    def speak(self, call_id: str, text: str, utterance_id: str = "", language_code: str = "", voice_name: str = "",
+              request_ts: float = 0.0, trace: Optional[tracing.TraceContext] = None) -> asyncio.Task:
+        """
+        Sintetiza y publica una locución para la llamada. Las locuciones de una misma
+        llamada se reproducen en el orden en que se piden.
+        """
+        request_ts = request_ts or time.time()
+        if trace is not None:
+            trace.mark("tts_request")
+        # El conector identifica por utterance_id lo que debe descartar tras un barge-in
+        utterance_id = utterance_id or uuid.uuid4().hex[:12]
+        previous = self._speaking.get(call_id)
+        task = asyncio.create_task(self._speak(call_id, text, utterance_id, language_code, voice_name, request_ts,
+                                               previous, trace))
+        self._speaking[call_id] = task
+        self._tasks.add(task)
+
+        def done(task):
+            self._tasks.discard(task)
+            if self._speaking.get(call_id) is task:
+                del self._speaking[call_id]
+            if task.cancelled() and previous is not None:
+                previous.cancel()
+
+        task.add_done_callback(done)
+        return task
+
+    def cancel_speech(self, call_id: str) -> bool:
+        """Cancela la locución en curso de la llamada y las que esperaban tras ella."""
+        task = self._speaking.pop(call_id, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def _speak(self, call_id: str, text: str, utterance_id: str, language_code: str, voice_name: str,
+                     request_ts: float, previous: Optional[asyncio.Task], trace: Optional[tracing.TraceContext] = None):
+        sentences = 0
+        try:
+            async for audio in self.synthesize_stream(f"tts:{call_id}", text, language_code, voice_name):
+                if previous is not None:
+                    # La locución anterior de la llamada termina de publicarse antes que esta
+                    await asyncio.gather(previous, return_exceptions=True)
+                    previous = None
+                first_trace = None
+                if sentences == 0:
+                    ttfa_ms = (time.time() - request_ts) * 1000
+                    self.ttfa.add(ttfa_ms)
+                    self.logger.info(f"[TTS] Primer audio de utterance={utterance_id} call_id={call_id}: "
+                                     f"TTFA={ttfa_ms:.1f} ms")
+                    first_trace = trace.mark("tts_first_audio") if trace is not None else None
+                sentences += 1
+                await self.publish_audio(call_id, audio, utterance_id, first_trace)
+            self.utterances += 1
+        except asyncio.CancelledError:
+            self.logger.info(f"[TTS] Locución utterance={utterance_id} call_id={call_id} cancelada "
+                             f"tras {sentences} frases")
+            raise
+        except Exception as e:
+            self.logger.error(f"[TTS] Error sintetizando utterance={utterance_id} call_id={call_id}: {e}")
+
+    async def publish_audio(self, call_id: str, audio: np.ndarray, utterance_id: str = "",
+                            trace: Optional[tracing.TraceContext] = None):
+        """
+        Publica audio del motor en ``outgoing_audio_chunks``, en fragmentos de
+        ``playback_chunk_ms``. La traza, si se indica, viaja con el primer fragmento.
+        """
+        if self.rabbitmq_channel is None:
+            return
+        data = audio.astype("<i2", copy=False).tobytes()
+        chunk_bytes = self.engine.sample_rate * self.playback_chunk_ms // 1000 * 2
+        # El conector transcodifica al formato del canal según format/sample_rate
+        headers = {"call_id": call_id, "format": "slin", "sample_rate": self.engine.sample_rate,
+                   "utterance_id": utterance_id}
+        for offset in range(0, len(data), chunk_bytes):
+            message_headers = headers
+            if trace is not None and offset == 0:
+                message_headers = {**headers, tracing.TRACE_HEADER: trace.mark("tts_published").encode()}
+            await self.rabbitmq_channel.default_exchange.publish(
+                aio_pika.Message(body=data[offset:offset + chunk_bytes], headers=message_headers),
+                routing_key="outgoing_audio_chunks"
+            )
+
+    async def close(self):
+        if self._endpoint_task is not None:
+            self._endpoint_task.cancel()
+            await asyncio.gather(self._endpoint_task, return_exceptions=True)
+            self._endpoint_task = None
+        for call_id in list(self._speaking):
+            self.cancel_speech(call_id)
+        pending = [f for f in (self.close_session(key) for key in list(self.sessions)) if f is not None]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.stt.close()
+        await self.tts.close()
+        self._engine_executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "sessions": len(self.sessions),
+            "transcripts": self.transcripts,
+            "endpoints": dict(self.endpoints),
+            "utterances": self.utterances,
+            "ttfa_ms": self.ttfa.stats(),
+            "stt": self.stt.stats(),
+            "tts": self.tts.stats(),
+            "tts_cache": self.tts_cache.stats() if self.tts_cache is not None else None,
+        }
@@ -0,0 +1,57 @@
+import asyncio
+import re
+from typing import AsyncIterator, Awaitable, Callable, List
+
+import numpy as np
+
+# Fin de frase: puntuación final (incluidos cierres de comillas/paréntesis) seguida de espacio
+_SENTENCE_END = re.compile(r'(?<=[.!?;:…])["»)\]]*\s+|\n+')
+_CLAUSE_END = re.compile(r'(?<=[,–—])\s+')
+
+
+def split_sentences(text: str, max_chars: int = 160) -> List[str]:
+    """
+    Divide un texto en frases para sintetizarlas por separado. Las frases más largas que
+    ``max_chars`` se cortan por comas y, si aún no basta, por espacios, para que el
+    primer audio no espere a sintetizar un párrafo entero.
+    """
+    sentences = []
+    for sentence in _SENTENCE_END.split(text):
+        sentence = " ".join(sentence.split())
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            sentences.append(sentence)
+            continue
+        for clause in _CLAUSE_END.split(sentence):
+            while len(clause) > max_chars:
+                cut = clause.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                sentences.append(clause[:cut].strip())
+                clause = clause[cut:].strip()
+            if clause:
+                sentences.append(clause)
+    return sentences
+
+
+async def synthesize_sentences(synthesize: Callable[[str], Awaitable[np.ndarray]],
+                               sentences: List[str]) -> AsyncIterator[np.ndarray]:
+    """
+    Audio de cada frase, en orden, según está listo. La primera frase se sintetiza sola
+    (un lote pequeño, el menor tiempo hasta el primer audio); en cuanto está lista se
+    lanzan todas las demás en paralelo, que se sintetizan mientras se reproduce la primera.
+    Si el consumidor deja de iterar, las síntesis pendientes se cancelan.
+    """
+    if not sentences:
+        return
+    pending = [asyncio.ensure_future(synthesize(sentences[0]))]
+    try:
+        first = await pending[0]
+        pending.extend(asyncio.ensure_future(synthesize(sentence)) for sentence in sentences[1:])
+        yield first
+        for task in pending[1:]:
+            yield await task
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,132 @@
+import asyncio
+import itertools
+import logging
+import os
+import sys
+
+import grpc
+
+from common import tracing
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../proto'))
+import stt_tts_service_pb2
+import stt_tts_service_pb2_grpc
+
+try:
+    from .speech_worker import SpeechWorker
+except ImportError:
+    from speech_worker import SpeechWorker
+
+
+class SttTtsServicer(stt_tts_service_pb2_grpc.SttTtsServiceServicer):
+    """
+    API gRPC del servicio STT/TTS sobre el mismo ``SpeechWorker`` que atiende RabbitMQ,
+    de modo que los streams gRPC y las llamadas de Asterisk comparten lotes de inferencia.
+
+    El audio de ``RecognizeSpeech`` se espera en PCM lineal de 16 bits a la frecuencia del
+    motor (``sample_rate``), y ``SynthesizeSpeech`` devuelve audio en ese mismo formato.
+    """
+
+    def __init__(self, worker: SpeechWorker, synthesis_chunk_ms: int = 100):
+        self.worker = worker
+        self.synthesis_chunk_ms = synthesis_chunk_ms
+        self._streams = itertools.count(1)
+
+    async def RecognizeSpeech(self, request_iterator, context):
+        """
+        Reconoce el audio de un stream. Se escriben con ``context.write``, según están listas,
+        las hipótesis parciales (``is_final=False``) y la transcripción final de cada frase,
+        que cierra el endpointing del servicio o una request con ``final_recognition``.
+        """
+        stream_id = next(self._streams)
+        sessions = {}
+        results: asyncio.Queue = asyncio.Queue()
+        # Entregas pendientes de los pasos de reconocimiento de este stream
+        steps = set()
+
+        def track(task):
+            if task is not None:
+                steps.add(task)
+                task.add_done_callback(steps.discard)
+
+        async def write_results():
+            while True:
+                response = await results.get()
+                if response is None:
+                    return
+                await context.write(response)
+
+        def on_result(call_id):
+            return lambda result: results.put_nowait(stt_tts_service_pb2.SpeechRecognitionResponse(
+                call_id=call_id, transcript=result.text, is_final=result.is_final))
+
+        writer_task = asyncio.create_task(write_results())
+        try:
+            async for request in request_iterator:
+                session = sessions.get(request.call_id)
+                if session is None:
+                    session = sessions[request.call_id] = self.worker.open_session(
+                        f"grpc:{stream_id}:{request.call_id}", request.call_id, "slin", self.worker.engine.sample_rate,
+                        publish=False)
+                    session.on_result = on_result(request.call_id)
+                if request.audio_chunk:
+                    track(self.worker.feed_audio(session, request.audio_chunk))
+                if request.final_recognition:
+                    track(self.worker.end_utterance(session, "request"))
+            for session in sessions.values():
+                track(self.worker.close_session(session.key))
+            await asyncio.gather(*steps, return_exceptions=True)
+            results.put_nowait(None)
+            await writer_task
+        finally:
+            writer_task.cancel()
+            await asyncio.gather(writer_task, return_exceptions=True)
+            # Si el stream se ha abortado o cancelado, las sesiones siguen abiertas y su
+            # estado vive en el motor hasta close_session
+            for session in sessions.values():
+                self.worker.close_session(session.key)
+
+    async def SynthesizeSpeech(self, request_iterator, context):
+        """
+        Sintetiza cada texto recibido frase a frase y lo devuelve en fragmentos según está
+        listo (el primero no espera al texto completo); el último lleva ``is_final``.
+
+        Si la llamada trae el metadato ``x-trace``, se devuelve en los metadatos iniciales
+        de la respuesta con las etapas ``tts_request`` y ``tts_first_audio`` añadidas.
+        """
+        stream_id = next(self._streams)
+        chunk_bytes = self.worker.engine.sample_rate * self.synthesis_chunk_ms // 1000 * 2
+        trace = tracing.from_metadata(context.invocation_metadata())
+        if trace is not None:
+            trace.mark("tts_request")
+        async for request in request_iterator:
+            if not request.text_input:
+                continue
+            pending = b""
+            async for audio in self.worker.synthesize_stream(f"grpc:{stream_id}:{request.call_id}", request.text_input,
+                                                             request.language_code, request.voice_name):
+                if trace is not None:
+                    # Antes del primer fragmento: los metadatos iniciales preceden a los mensajes
+                    await context.send_initial_metadata(((tracing.TRACE_HEADER, trace.mark("tts_first_audio").encode()),))
+                    trace = None
+                # Se retiene el último fragmento hasta saber si es el final de la locución
+                pending += audio.tobytes()
+                while len(pending) > chunk_bytes:
+                    await context.write(stt_tts_service_pb2.SynthesisResponse(
+                        call_id=request.call_id, audio_chunk=pending[:chunk_bytes], is_final=False))
+                    pending = pending[chunk_bytes:]
+            await context.write(stt_tts_service_pb2.SynthesisResponse(
+                call_id=request.call_id, audio_chunk=pending, is_final=True))
+
+
+# --- Servidor gRPC ---
+async def serve_async(servicer: SttTtsServicer, port: int = 50052):
+    server = grpc.aio.server()
+    stt_tts_service_pb2_grpc.add_SttTtsServiceServicer_to_server(servicer, server)
+    server.add_insecure_port(f'[::]:{port}')
+    logging.info(f"Servidor gRPC STT/TTS escuchando en el puerto {port}...")
+    await server.start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(grace=1)
@@ -0,0 +1,266 @@
+import asyncio
+import collections
+import hashlib
+import logging
+import mmap
+import os
+import unicodedata
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Union
+
+Audio = Union[bytes, memoryview]
+
+
+def cache_key(text: str, language_code: str = "", voice_name: str = "", audio_format: str = "") -> str:
+    """
+    Clave de contenido de un audio sintetizado. El texto se normaliza (NFC y espacios)
+    para que variantes triviales de la misma frase compartan entrada.
+    """
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    material = "\x1f".join((normalized, language_code, voice_name, audio_format))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """LRU en memoria acotada por bytes: al superar ``max_bytes`` se expulsa lo menos usado."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items: "collections.OrderedDict[str, Audio]" = collections.OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._items
+
+    def get(self, key: str) -> Optional[Audio]:
+        audio = self._items.get(key)
+        if audio is not None:
+            self._items.move_to_end(key)
+        return audio
+
+    def put(self, key: str, audio: Audio) -> bool:
+        size = len(audio)
+        if size > self.max_bytes:
+            return False
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old)
+        self._items[key] = audio
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+        return True
+
+
+class DiskTier:
+    """
+    Nivel en disco que sobrevive a reinicios: un fichero por clave (escritura atómica) que
+    se lee con ``mmap``, de modo que el audio se sirve desde la caché de páginas del SO sin
+    copiarlo al heap de Python. Acotado por ``max_bytes`` (se expulsa lo menos usado).
+    """
+
+    SUFFIX = ".pcm"
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._index: "collections.OrderedDict[str, int]" = collections.OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + self.SUFFIX)
+
+    def _load_index(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(self.SUFFIX):
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, name[:-len(self.SUFFIX)], stat.st_size))
+                elif name.endswith(".tmp"):
+                    os.unlink(path)  # Escritura interrumpida
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.bytes += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[memoryview]:
+        if key not in self._index:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._forget(key)
+            return None
+        self._index.move_to_end(key)
+        return memoryview(mapped)
+
+    def put(self, key: str, audio: Audio) -> bool:
+        size = len(audio)
+        if not size or (self.max_bytes is not None and size > self.max_bytes):
+            return False
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(audio)
+        os.replace(tmp, path)
+        if key in self._index:
+            self.bytes -= self._index.pop(key)
+        self._index[key] = size
+        self.bytes += size
+        self._evict()
+        return True
+
+    def _forget(self, key: str):
+        size = self._index.pop(key, None)
+        if size is not None:
+            self.bytes -= size
+
+    def _evict(self):
+        while self.max_bytes is not None and self.bytes > self.max_bytes and self._index:
+            key = next(iter(self._index))
+            self._forget(key)
+            self.evictions += 1
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+
+class _Synthesis:
+    """Síntesis en curso de una clave: la tarea (propiedad de la caché) y cuántos la esperan."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+
+
+class TTSCache:
+    """
+    Caché de audio TTS direccionada por contenido (``cache_key``) en dos niveles: LRU en
+    memoria y, opcionalmente, disco con mmap. Lo que se encuentra en disco se promociona
+    a memoria. ``get_or_synthesize`` además agrupa las peticiones concurrentes del mismo
+    audio en una sola síntesis.
+    """
+
+    def __init__(self, memory_bytes: int = 64 * 1024 * 1024, directory: Optional[str] = None,
+                 disk_bytes: Optional[int] = None):
+        self.memory = MemoryTier(memory_bytes)
+        self.disk = DiskTier(directory, disk_bytes) if directory else None
+        self._inflight: Dict[str, _Synthesis] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: str) -> Optional[Audio]:
+        audio = self.memory.get(key)
+        if audio is not None:
+            self.memory_hits += 1
+            return audio
+        if self.disk is not None:
+            audio = self.disk.get(key)
+            if audio is not None:
+                self.disk_hits += 1
+                self.memory.put(key, audio)
+                return audio
+        self.misses += 1
+        return None
+
+    def put(self, key: str, audio: Audio):
+        self.memory.put(key, audio)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, audio)
+            except OSError as e:
+                logging.warning(f"[TTSCache] No se pudo escribir en disco la clave {key[:12]}: {e}")
+
+    async def get_or_synthesize(self, key: str, synthesize: Callable[[], Awaitable[Audio]]) -> Audio:
+        """
+        Audio de la caché o, si falta, sintetizado una sola vez para todas las peticiones
+        concurrentes. La síntesis corre en una tarea de la caché: cancelar una petición
+        (barge-in de una llamada) no afecta a las demás, y sólo se cancela la síntesis
+        cuando se va la última que la esperaba.
+        """
+        audio = self.get(key)
+        if audio is not None:
+            return audio
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = self._inflight[key] = _Synthesis()
+            inflight.task = asyncio.ensure_future(self._synthesize(key, synthesize, inflight))
+        else:
+            self.coalesced += 1
+        inflight.waiters += 1
+        try:
+            return await asyncio.shield(inflight.task)
+        except asyncio.CancelledError:
+            if inflight.waiters == 1 and not inflight.task.done():
+                inflight.task.cancel()
+                # Una petición nueva de la misma clave no debe recibir la síntesis cancelada
+                if self._inflight.get(key) is inflight:
+                    del self._inflight[key]
+            raise
+        finally:
+            inflight.waiters -= 1
+
+    async def _synthesize(self, key: str, synthesize: Callable[[], Awaitable[Audio]], inflight: _Synthesis) -> Audio:
+        try:
+            audio = await synthesize()
+            if len(audio):
+                self.put(key, audio)
+            return audio
+        finally:
+            if self._inflight.get(key) is inflight:
+                del self._inflight[key]
+
+    async def prewarm(self, keys_and_factories: Iterable, concurrency: int = 8) -> int:
+        """Sintetiza por adelantado los audios que falten. Devuelve cuántos se han generado."""
+        semaphore = asyncio.Semaphore(concurrency)
+        generated = 0
+
+        async def warm(key, synthesize):
+            nonlocal generated
+            async with semaphore:
+                if key in self.memory or (self.disk is not None and key in self.disk):
+                    return
+                await self.get_or_synthesize(key, synthesize)
+                generated += 1
+
+        await asyncio.gather(*(warm(key, synthesize) for key, synthesize in keys_and_factories))
+        return generated
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_items": len(self.memory),
+            "memory_bytes": self.memory.bytes,
+            "memory_evictions": self.memory.evictions,
+            "disk_items": len(self.disk) if self.disk is not None else 0,
+            "disk_bytes": self.disk.bytes if self.disk is not None else 0,
+            "disk_evictions": self.disk.evictions if self.disk is not None else 0,
+        }
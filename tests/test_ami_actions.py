@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.ami_actions import PendingAction, TimeoutWheel
+
+
+class Item:
+    def __init__(self, name):
+        self.name = name
+        self.deadline = 0.0
+        self.slot = None
+
+
+@pytest.mark.asyncio
+async def test_pending_action_simple_response():
+    pending = PendingAction("a-1", asyncio.get_running_loop().create_future())
+    assert pending.feed({"Response": "Success", "ActionID": "a-1"})
+    assert pending.result() == {"Response": "Success", "ActionID": "a-1"}
+
+
+@pytest.mark.asyncio
+async def test_pending_action_event_list():
+    pending = PendingAction("a-1", asyncio.get_running_loop().create_future())
+    assert not pending.feed({"Response": "Success", "EventList": "start", "ActionID": "a-1"})
+    assert not pending.feed({"Event": "CoreShowChannel", "Channel": "SIP/1", "ActionID": "a-1"})
+    assert not pending.feed({"Event": "CoreShowChannel", "Channel": "SIP/2", "ActionID": "a-1"})
+    assert pending.feed({"Event": "CoreShowChannelsComplete", "EventList": "Complete", "ActionID": "a-1"})
+    result = pending.result()
+    assert result["Response"] == "Success"
+    assert [e["Channel"] for e in result["events"]] == ["SIP/1", "SIP/2"]
+
+
+@pytest.mark.asyncio
+async def test_timeout_wheel_expires_in_order():
+    expired = []
+    wheel = TimeoutWheel(lambda item: expired.append(item.name), resolution=0.01, slots=8)
+    fast, slow, kept = Item("fast"), Item("slow"), Item("kept")
+    wheel.add(fast, 0.02)
+    wheel.add(slow, 0.15)  # más largo que una vuelta de la rueda (0.08 s)
+    wheel.add(kept, 0.05)
+    wheel.discard(kept)
+    assert len(wheel) == 2
+    await asyncio.sleep(0.06)
+    assert expired == ["fast"]
+    await asyncio.sleep(0.15)
+    assert expired == ["fast", "slow"]
+    assert len(wheel) == 0
+    assert wheel._handle is None  # sin pendientes no quedan temporizadores activos
+
+
+@pytest.mark.asyncio
+async def test_timeout_wheel_item_added_late_in_a_tick():
+    loop = asyncio.get_running_loop()
+    expired = []
+    wheel = TimeoutWheel(lambda item: expired.append(loop.time()), resolution=0.05, slots=8)
+    wheel.add(Item("ancla"), 10)
+    # Se añade a 40 ms de un tick de 50 ms: vence con su ranura, no una vuelta después (0.4 s)
+    await asyncio.sleep(0.04)
+    added = loop.time()
+    wheel.add(Item("tarde"), 0.1)
+    await asyncio.sleep(0.3)
+    assert len(expired) == 1
+    assert 0.1 <= expired[0] - added < 0.1 + 0.05 + 0.03
+    wheel.cancel()
@@ -67,4 +67,8 @@ async def test_ami_client_rabbitmq_publish(monkeypatch):
     await client.handle_message(msg.strip())
     # Verifica que se haya publicado algo en RabbitMQ
     assert published["routing_key"] == "incoming_audio_chunks"
-    assert "SIP/200-00000002" in published["body"]
+    # El cuerpo es un sobre binario (common.envelope), no el repr de un dict
+    assert b"SIP/200-00000002" in published["body"]
+    from common import envelope
+    event = envelope.decode(published["body"]).call_event
+    assert (event.call_id, event.event, event.fields["Uniqueid"]) == ("SIP/200-00000002", "call_started", "654321")
@@ -34,3 +34,274 @@ async def test_event_queue_mock():
     await client.event_queue.put(event)
     result = await client.get_event(timeout=1)
     assert result == event
+
+@pytest.mark.asyncio
+async def test_protocol_data_received_mock():
+    client = AMIClient()
+    protocol = AMIClientProtocol(client)
+    protocol.data_received(b"Event: Newchannel\r\nChannel: SIP/100-0")
+    protocol.data_received(b"0000001\r\n\r\nEvent: Hangup\r\nChannel: SIP/100-00000001\r\n\r\n")
+    first = await client.get_event(timeout=1)
+    second = await client.get_event(timeout=1)
+    assert first["Event"] == "Newchannel"
+    assert first["Channel"] == "SIP/100-00000001"
+    assert second["Event"] == "Hangup"
+
+@pytest.mark.asyncio
+async def test_publisher_backpressure_pauses_reading_mock():
+    class SaturatedPublisher:
+        def __init__(self):
+            self.saturated = True
+            self.writable = asyncio.Event()
+            self.published = []
+        def publish(self, routing_key, body):
+            self.published.append((routing_key, body))
+        async def wait_writable(self):
+            await self.writable.wait()
+
+    publisher = SaturatedPublisher()
+    client = AMIClient(publisher=publisher)
+    client.transport = MagicMock()
+    await client.handle_message("Event: Hangup\r\nChannel: SIP/100-00000001\r\n")
+    client.transport.pause_reading.assert_called_once()
+    publisher.saturated = False
+    publisher.writable.set()
+    await asyncio.sleep(0.01)
+    client.transport.resume_reading.assert_called_once()
+    assert [routing_key for routing_key, _ in publisher.published] == ["incoming_audio_chunks"]
+    # Evento de llamada en sobre binario, no como repr de un dict
+    from common import envelope
+    event = envelope.decode(publisher.published[0][1]).call_event
+    assert event.call_id == "SIP/100-00000001"
+    assert event.event == "call_ended"
+
+@pytest.mark.asyncio
+async def test_pipelined_actions_coalesced_mock():
+    client = AMIClient()
+    protocol = AMIClientProtocol(client)
+    protocol.transport = MagicMock()
+    client.protocol = protocol
+    tasks = [asyncio.create_task(client.send_action({'Action': 'Ping'}, wait_response=True, timeout=1)) for _ in range(20)]
+    await asyncio.sleep(0.01)
+    # 20 acciones en vuelo, una sola escritura en el socket
+    protocol.transport.write.assert_called_once()
+    assert protocol.transport.write.call_args[0][0].count(b"Action: Ping") == 20
+    assert len(client._pending_actions) == 20
+    for action_id in reversed(list(client._pending_actions)):
+        await client.handle_message(f'Response: Success\r\nActionID: {action_id}\r\n')
+    responses = await asyncio.gather(*tasks)
+    assert all(r['Response'] == 'Success' for r in responses)
+    assert [r['ActionID'] for r in responses] == [f"copilot-{i}" for i in range(1, 21)]
+    assert not client._pending_actions
+    assert len(client._timeouts) == 0
+
+@pytest.mark.asyncio
+async def test_event_list_action_mock():
+    client = AMIClient()
+    client.protocol = MagicMock()
+    task = asyncio.create_task(client.send_action({'Action': 'CoreShowChannels'}, wait_response=True, timeout=1))
+    await asyncio.sleep(0.01)
+    action_id = next(iter(client._pending_actions))
+    protocol = AMIClientProtocol(client)
+    protocol.data_received(
+        f"Response: Success\r\nEventList: start\r\nActionID: {action_id}\r\n\r\n"
+        f"Event: CoreShowChannel\r\nChannel: SIP/100-00000001\r\nActionID: {action_id}\r\n\r\n"
+        f"Event: CoreShowChannelsComplete\r\nEventList: Complete\r\nListItems: 1\r\nActionID: {action_id}\r\n\r\n".encode()
+    )
+    resp = await asyncio.wait_for(task, timeout=1)
+    assert resp['Response'] == 'Success'
+    assert [e['Channel'] for e in resp['events']] == ['SIP/100-00000001']
+    assert client.event_queue.empty()  # los eventos de la lista no van a la cola general
+
+@pytest.mark.asyncio
+async def test_action_timeout_and_connection_lost_mock():
+    client = AMIClient()
+    client.protocol = MagicMock()
+    client._timeouts.resolution = 0.01
+    assert await client.send_action({'Action': 'Ping'}, wait_response=True, timeout=0.03) is None
+    task = asyncio.create_task(client.hangup('SIP/100-00000001'))
+    await asyncio.sleep(0.01)
+    assert 'Action: Hangup' in client.protocol.send.call_args[0][0]
+    client._fail_pending_actions(ConnectionError("perdida"))
+    assert await task is None
+    assert not client._pending_actions
+
+@pytest.mark.asyncio
+async def test_event_mask_login_and_update_mock():
+    client = AMIClient(event_queue_size=0)
+    assert client.event_queue is None
+    client.protocol = MagicMock()
+    login = asyncio.create_task(client.authenticate())
+    await asyncio.sleep(0.01)
+    assert 'Events: call' in client.protocol.send.call_args[0][0]
+    action_id = next(iter(client._pending_actions))
+    await client.handle_message(f'Response: Success\r\nActionID: {action_id}\r\n')
+    await login
+    sub = client.events.subscribe(("DTMFEnd",))
+    await asyncio.sleep(0.01)
+    assert 'EventMask: call,dtmf' in client.protocol.send.call_args[0][0]
+    await client.handle_message("Event: DTMFEnd\r\nChannel: SIP/100-00000001\r\nDigit: 1\r\n")
+    assert (await sub.get(timeout=1))["Digit"] == "1"
+
+@pytest.mark.asyncio
+async def test_idle_async_publisher_still_publishes_mock():
+    from asterisk_connector.rabbitmq_publisher import AsyncRabbitMQPublisher
+    # Con el buffer vacío el publisher asíncrono es falsy (__len__ == 0): no debe descartar eventos
+    publisher = AsyncRabbitMQPublisher(MagicMock())
+    publisher.publish = MagicMock(return_value=True)
+    client = AMIClient(publisher=publisher, event_queue_size=0)
+    await client.process_ami_events({"Event": "Newchannel", "Channel": "SIP/100-00000001", "Uniqueid": "1.1"})
+    publisher.publish.assert_called_once()
+
+
+def _list_response(action_id, event, channels):
+    frames = [f"Response: Success\r\nEventList: start\r\nActionID: {action_id}\r\n"]
+    for fields in channels:
+        frames.append(f"Event: {event}\r\nActionID: {action_id}\r\n"
+                      + "".join(f"{k}: {v}\r\n" for k, v in fields.items()))
+    frames.append(f"Event: {event}sComplete\r\nEventList: Complete\r\nActionID: {action_id}\r\n")
+    return frames
+
+
+@pytest.mark.asyncio
+async def test_resync_reconciles_channels_mock():
+    from asterisk_connector.call_registry import CallRegistry
+    publisher = MagicMock()
+    client = AMIClient(publisher=publisher, event_queue_size=0)
+    registry = CallRegistry()
+    registry.subscribe_to(client)
+    client.protocol = MagicMock()
+    # Estado conocido antes de la caída: A y B
+    await client.handle_message("Event: Newchannel\r\nChannel: SIP/a-1\r\nUniqueid: 1.1\r\nChannelStateDesc: Up\r\n")
+    await client.handle_message("Event: Newchannel\r\nChannel: SIP/b-1\r\nUniqueid: 2.2\r\nChannelStateDesc: Up\r\n")
+
+    task = asyncio.create_task(client.resync())
+    await asyncio.sleep(0.01)
+    core_id, status_id = list(client._pending_actions)
+    # Durante la caída A colgó y apareció C (contestada y en un bridge); D cuelga durante la resincronización
+    for frame in _list_response(core_id, "CoreShowChannel", [
+        {"Channel": "SIP/b-1", "Uniqueid": "2.2", "ChannelStateDesc": "Up"},
+        {"Channel": "SIP/c-1", "Uniqueid": "3.3", "ChannelStateDesc": "Up", "CallerIDNum": "300"},
+        {"Channel": "SIP/d-1", "Uniqueid": "4.4", "ChannelStateDesc": "Ring"},
+    ]):
+        await client.handle_message(frame)
+    await client.handle_message("Event: Hangup\r\nChannel: SIP/d-1\r\nUniqueid: 4.4\r\n")
+    for frame in _list_response(status_id, "Status", [
+        {"Channel": "SIP/c-1", "Uniqueid": "3.3", "BridgeID": "br-1", "ChannelStateDesc": "Ring"},
+    ]):
+        await client.handle_message(frame)
+    summary = await asyncio.wait_for(task, timeout=1)
+
+    assert summary == {"ended": 1, "started": 1, "live": 3}
+    assert registry.get("SIP/a-1").hangup_cause == "resync"
+    record = registry.get("SIP/c-1")
+    assert record.state == "Up" and record.answer_time is not None and record.caller_id == "300"
+    assert record.bridge_id == "br-1"
+    assert registry.get("SIP/d-1") is None
+    assert client.live_channels == {"2.2": "SIP/b-1", "3.3": "SIP/c-1"}
+    # Newchannel de A y B, Hangup real de D y, de la resincronización, call_ended de A y call_started de C
+    assert publisher.publish.call_count == 5
+
+
+@pytest.mark.asyncio
+async def test_resync_without_answers_keeps_state_mock():
+    client = AMIClient(event_queue_size=0)
+    client.protocol = MagicMock()
+    await client.handle_message("Event: Newchannel\r\nChannel: SIP/a-1\r\nUniqueid: 1.1\r\n")
+    client._timeouts.resolution = 0.01
+    client.send_actions = AsyncMock(return_value=[None, None])
+    assert await client.resync() is None
+    assert client.live_channels == {"1.1": "SIP/a-1"}
+
+
+@pytest.mark.asyncio
+async def test_reconnect_immediately_and_resync_after_drop():
+    from asterisk_connector import ami_client as ami_module
+    connections = []
+
+    async def handle(reader, writer):
+        # Servidor AMI mínimo: Login y listados vacíos; la primera conexión se corta tras el login
+        connections.append(writer)
+        writer.write(b"Asterisk Call Manager/5.0.0\r\n")
+        buffer = b""
+        while True:
+            try:
+                data = await reader.read(65536)
+            except (ConnectionError, asyncio.CancelledError):
+                break
+            if not data:
+                break
+            buffer += data
+            while b"\r\n\r\n" in buffer:
+                frame, buffer = buffer.split(b"\r\n\r\n", 1)
+                fields = dict(line.split(": ", 1) for line in frame.decode().split("\r\n") if ": " in line)
+                action, action_id = fields.get("Action"), fields.get("ActionID")
+                if action == "Login":
+                    writer.write(f"Response: Success\r\nActionID: {action_id}\r\n\r\n".encode())
+                elif action in ("CoreShowChannels", "Status"):
+                    writer.write("\r\n".join(_list_response(action_id, action, [])).encode() + b"\r\n")
+                    if action == "Status" and len(connections) == 1:
+                        await asyncio.sleep(0.05)
+                        writer.close()
+                        return
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    recoveries = ami_module.AMI_RECOVERY_SECONDS.count
+    client = AMIClient(event_queue_size=0, publisher=MagicMock(spec=["publish"]))
+    client.host, client.port = "127.0.0.1", server.sockets[0].getsockname()[1]
+    client.backoff.base = 10  # sólo el primer reintento (inmediato) cabe en la prueba
+    try:
+        await asyncio.wait_for(client.connect(), timeout=2)
+        for _ in range(200):
+            if len(connections) == 2 and ami_module.AMI_RECOVERY_SECONDS.count > recoveries:
+                break
+            await asyncio.sleep(0.01)
+        assert len(connections) == 2
+        assert ami_module.AMI_RECOVERY_SECONDS.count == recoveries + 1
+        assert client._authenticated.is_set()
+        assert ami_module.AMI_CONNECTED.value == 1
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_dropped_login_is_retried_without_closing_client():
+    connections = []
+
+    async def handle(reader, writer):
+        # La primera conexión se corta al recibir el Login, sin responder
+        connections.append(writer)
+        buffer = b""
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            buffer += data
+            while b"\r\n\r\n" in buffer:
+                frame, buffer = buffer.split(b"\r\n\r\n", 1)
+                fields = dict(line.split(": ", 1) for line in frame.decode().split("\r\n") if ": " in line)
+                if fields.get("Action") == "Login":
+                    if len(connections) == 1:
+                        writer.close()
+                        return
+                    writer.write(f"Response: Success\r\nActionID: {fields['ActionID']}\r\n\r\n".encode())
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    publisher = MagicMock(spec=["publish", "close"])
+    publisher.close = AsyncMock()
+    client = AMIClient(event_queue_size=0, publisher=publisher)
+    client.host, client.port = "127.0.0.1", server.sockets[0].getsockname()[1]
+    client.resync_enabled = False
+    client.backoff.base = 0.01
+    try:
+        await asyncio.wait_for(client.connect(), timeout=2)
+        assert len(connections) == 2
+        assert client._authenticated.is_set() and client._running
+        # El publisher sigue abierto: sólo se cerró la conexión fallida
+        publisher.close.assert_not_called()
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.ami_events import (BLOCK, DROP_NEWEST, DROP_OLDEST,
+                                           AMIEventDispatcher)
+
+
+@pytest.mark.asyncio
+async def test_dispatch_by_type_and_channel_pattern():
+    dispatcher = AMIEventDispatcher()
+    handled = []
+    dispatcher.subscribe(("Hangup",), handler=handled.append)
+    sip = dispatcher.subscribe(("Newchannel", "Hangup"), channel_pattern="SIP/*")
+    everything = dispatcher.subscribe()
+    assert await dispatcher.dispatch({"Event": "Newchannel", "Channel": "SIP/100-1"}) == 2
+    assert await dispatcher.dispatch({"Event": "Hangup", "Channel": "PJSIP/200-2"}) == 2
+    assert await dispatcher.dispatch({"Event": "VarSet", "Channel": "SIP/100-1"}) == 1
+    assert [e["Channel"] for e in handled] == ["PJSIP/200-2"]
+    assert (await sip.get(timeout=0.1))["Event"] == "Newchannel"
+    assert await sip.get(timeout=0.01) is None
+    assert everything.queue.qsize() == 3
+
+
+@pytest.mark.asyncio
+async def test_async_handler_and_iterator():
+    dispatcher = AMIEventDispatcher()
+    seen = []
+
+    async def handler(event):
+        seen.append(event["Event"])
+
+    dispatcher.subscribe(("DTMFEnd",), handler=handler)
+    sub = dispatcher.subscribe(("DTMFEnd",))
+    await dispatcher.dispatch({"Event": "DTMFEnd", "Digit": "5"})
+    assert seen == ["DTMFEnd"]
+    async for event in sub:
+        assert event["Digit"] == "5"
+        break
+
+
+@pytest.mark.asyncio
+async def test_failing_handler_does_not_stop_delivery(caplog):
+    dispatcher = AMIEventDispatcher()
+    handled = []
+
+    def failing(event):
+        raise KeyError("Uniqueid")
+
+    dispatcher.subscribe(("Hangup",), handler=failing)
+    dispatcher.subscribe(("Hangup",), handler=handled.append)
+    sub = dispatcher.subscribe()
+    with caplog.at_level("ERROR"):
+        assert await dispatcher.dispatch({"Event": "Hangup", "Channel": "SIP/100-1"}) == 2
+    # Los suscriptores posteriores al que falla reciben el evento igualmente
+    assert [e["Event"] for e in handled] == ["Hangup"]
+    assert (await sub.get(timeout=1))["Event"] == "Hangup"
+    assert "Error en el manejador de Hangup" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_queue_policies():
+    dispatcher = AMIEventDispatcher()
+    oldest = dispatcher.subscribe(maxsize=2, policy=DROP_OLDEST)
+    newest = dispatcher.subscribe(maxsize=2, policy=DROP_NEWEST)
+    for i in range(4):
+        await dispatcher.dispatch({"Event": "UserEvent", "N": i})
+    assert [oldest.queue.get_nowait()["N"] for _ in range(2)] == [2, 3]
+    assert [newest.queue.get_nowait()["N"] for _ in range(2)] == [0, 1]
+    assert oldest.dropped == newest.dropped == 2
+
+
+@pytest.mark.asyncio
+async def test_block_policy_waits_for_consumer():
+    dispatcher = AMIEventDispatcher()
+    sub = dispatcher.subscribe(maxsize=1, policy=BLOCK)
+    await dispatcher.dispatch({"Event": "UserEvent", "N": 0})
+    blocked = asyncio.create_task(dispatcher.dispatch({"Event": "UserEvent", "N": 1}))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+    assert sub.queue.get_nowait()["N"] == 0
+    await asyncio.wait_for(blocked, timeout=1)
+    assert sub.queue.get_nowait()["N"] == 1
+    assert sub.dropped == 0
+
+
+def test_event_mask_follows_subscriptions():
+    changes = []
+    dispatcher = AMIEventDispatcher(on_change=lambda: changes.append(dispatcher.event_mask()))
+    assert dispatcher.event_mask() == "off"
+    calls = dispatcher.subscribe(("Newchannel", "Hangup"))
+    dtmf = dispatcher.subscribe(("DTMFEnd",))
+    assert dispatcher.event_mask() == "call,dtmf"
+    custom = dispatcher.subscribe(("MiEventoRaro",))
+    assert dispatcher.event_mask() == "on"
+    dispatcher.unsubscribe(custom)
+    dispatcher.unsubscribe(dtmf)
+    assert dispatcher.event_mask() == "call"
+    everything = dispatcher.subscribe()
+    assert dispatcher.event_mask() == "on"
+    dispatcher.unsubscribe(everything)
+    dispatcher.unsubscribe(calls)
+    assert changes == ["call", "call,dtmf", "on", "call,dtmf", "call", "on", "call", "off"]
+    assert len(dispatcher) == 0
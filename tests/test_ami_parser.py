@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.ami_parser import (DEFAULT_FIELD_WHITELIST,
+                                           AMIFrameParser, parse_ami_message)
+
+STREAM = (
+    b"Event: Newchannel\r\nChannel: SIP/100-00000001\r\nUniqueid: 123.1\r\n\r\n"
+    b"Event: VarSet\r\nChannel: SIP/100-00000001\r\nCallerIDNum: 100\r\nVariable: FOO\r\nValue: bar\r\n\r\n"
+    b"Response: Success\r\nActionID: copilot-1\r\nMessage: Pong\r\n\r\n"
+)
+
+
+def test_feed_complete_frames():
+    parser = AMIFrameParser()
+    frames = parser.feed(STREAM)
+    assert [f.get("Event") or f.get("Response") for f in frames] == ["Newchannel", "VarSet", "Success"]
+    assert frames[0]["Channel"] == "SIP/100-00000001"
+    assert len(parser) == 0
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64])
+def test_feed_split_segments(size):
+    """El resultado no depende de cómo se trocee el flujo TCP (incluido el terminador)."""
+    parser = AMIFrameParser()
+    frames = []
+    for i in range(0, len(STREAM), size):
+        frames.extend(parser.feed(STREAM[i:i + size]))
+    assert frames == AMIFrameParser().feed(STREAM)
+
+
+def test_partial_frame_kept_until_terminator():
+    parser = AMIFrameParser()
+    assert parser.feed(b"Event: Hangup\r\nChannel: SIP/1") == []
+    frames = parser.feed(b"00-1\r\n\r\nEvent: Ne")
+    assert frames == [{"Event": "Hangup", "Channel": "SIP/100-1"}]
+    assert len(parser) == len(b"Event: Ne")
+
+
+def test_banner_and_loose_spacing():
+    parser = AMIFrameParser()
+    frames = parser.feed(b"Asterisk Call Manager/5.0.1\r\nResponse: Success\r\nActionID:copilot-1 \r\n\r\n")
+    assert frames == [{"Response": "Success", "ActionID": "copilot-1"}]
+
+
+def test_field_whitelist():
+    parser = AMIFrameParser(DEFAULT_FIELD_WHITELIST)
+    frames = parser.feed(STREAM)
+    assert frames[0]["Uniqueid"] == "123.1"  # Newchannel no está filtrado
+    assert frames[1] == {"Event": "VarSet", "Channel": "SIP/100-00000001", "Variable": "FOO", "Value": "bar"}
+    assert frames[2]["Message"] == "Pong"
+
+
+def test_parse_ami_message():
+    assert parse_ami_message("Event: Hangup\r\nChannel: SIP/1\r\nbasura") == {"Event": "Hangup", "Channel": "SIP/1"}
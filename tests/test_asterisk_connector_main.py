@@ -19,3 +19,303 @@ async def test_start_stub():
         app = asterisk_main.AsteriskApp(agi_port=4573, ami_client=None, rabbitmq_channel=None)
         assert hasattr(app, 'start')
         assert asyncio.iscoroutinefunction(app.start)
+
+
+class DummyExchange:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, message))
+
+
+class DummyChannel:
+    def __init__(self):
+        self.default_exchange = DummyExchange()
+
+
+class DummyWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+class DummyMessage:
+    def __init__(self, call_id, body, seq=None):
+        self.headers = {"call_id": call_id}
+        if seq is not None:
+            self.headers["seq"] = seq
+        self.body = body
+
+
+@pytest.mark.asyncio
+async def test_agi_session_receives_routed_audio(monkeypatch):
+    monkeypatch.setenv("AGI_VAD", "off")
+    channel = DummyChannel()
+    server = asterisk_main.AGIServer(agi_port=0, ami_client=None, rabbitmq_channel=channel)
+    reader = asyncio.StreamReader()
+    writer = DummyWriter()
+    reader.feed_data(b"agi_channel: SIP/100-00000001\nagi_uniqueid: 123.1\n\n")
+    session = asyncio.create_task(server.handle_agi(reader, writer))
+    await asyncio.sleep(0.01)
+    assert "SIP/100-00000001" in server.audio_router
+    # Llegan desordenados; el buffer de reproducción los reordena antes de escribir
+    for seq, body in ((1, b"t"), (0, b"t"), (2, b"s")):
+        server.audio_router.dispatch("SIP/100-00000001", DummyMessage("SIP/100-00000001", body, seq))
+    server.audio_router.dispatch("SIP/200-00000002", DummyMessage("SIP/200-00000002", b"ajeno"))
+    reader.feed_data(b"\x01\x02")
+    await asyncio.sleep(0.05)
+    reader.feed_eof()
+    await asyncio.wait_for(session, timeout=1)
+    assert bytes(writer.data) == b"tts"
+    assert writer.closed
+    assert "SIP/100-00000001" not in server.audio_router
+    assert channel.default_exchange.published[0][0] == "incoming_audio_chunks"
+    # Metadatos una vez por llamada; las tramas sólo llevan lo imprescindible
+    from common import envelope
+    decoded = [envelope.decode(message.body) for _, message in channel.default_exchange.published]
+    assert [envelope.kind(e) for e in decoded] == ["call_start", "audio_chunk", "call_event"]
+    assert decoded[0].call_start.agi_env["agi_uniqueid"] == "123.1"
+    assert decoded[0].call_start.uniqueid == "123.1"
+    assert decoded[1].audio_chunk.payload == b"\x01\x02"
+    assert decoded[1].audio_chunk.seq == 0
+    assert decoded[2].call_event.event == "audio_ended"
+    assert all(message.headers == {"call_id": "SIP/100-00000001"} for _, message in channel.default_exchange.published)
+
+
+@pytest.mark.asyncio
+async def test_agi_session_vad_suppresses_silence(monkeypatch):
+    import numpy as np
+    monkeypatch.setenv("AGI_VAD", "suppress")
+    monkeypatch.setenv("AGI_VAD_HANGOVER_MS", "40")
+    monkeypatch.setenv("AGI_VAD_PRE_ROLL_MS", "20")
+    channel = DummyChannel()
+    server = asterisk_main.AGIServer(agi_port=0, ami_client=None, rabbitmq_channel=channel)
+    reader = asyncio.StreamReader()
+    writer = DummyWriter()
+    reader.feed_data(b"agi_channel: SIP/100-00000001\n\n")
+    session = asyncio.create_task(server.handle_agi(reader, writer))
+    # 200 ms de silencio, 100 ms de tono de 300 Hz y otros 200 ms de silencio (slin 8 kHz)
+    tone = (0.3 * 32767 * np.sin(2 * np.pi * 300 * np.arange(800) / 8000)).astype("<i2").tobytes()
+    reader.feed_data(bytes(3200) + tone + bytes(3200))
+    reader.feed_eof()
+    await asyncio.wait_for(session, timeout=1)
+
+    from common import envelope
+    decoded = [envelope.decode(message.body) for _, message in channel.default_exchange.published]
+    kinds = [e.call_event.event if envelope.kind(e) == "call_event" else envelope.kind(e) for e in decoded]
+    # pre-roll (1) + voz (5) + hangover (2)
+    assert kinds == ["call_start", "speech_start"] + ["audio_chunk"] * 8 + ["speech_end", "audio_ended"]
+    seqs = [e.audio_chunk.seq for e in decoded if envelope.kind(e) == "audio_chunk"]
+    assert seqs == list(range(9, 17))
+    assert server.sessions == {}
+
+
+@pytest.mark.asyncio
+async def test_agi_session_transcodes_outgoing_audio(monkeypatch):
+    monkeypatch.setenv("AGI_VAD", "off")
+    monkeypatch.setenv("AGI_PLAYOUT_TARGET_DEPTH", "1")
+    server = asterisk_main.AGIServer(agi_port=0, ami_client=None, rabbitmq_channel=DummyChannel())
+    reader = asyncio.StreamReader()
+    writer = DummyWriter()
+    reader.feed_data(b"agi_channel: SIP/100-00000001\n\n")
+    session = asyncio.create_task(server.handle_agi(reader, writer))
+    await asyncio.sleep(0.01)
+    # 20 ms de TTS a 16 kHz hacia un canal slin de 8 kHz
+    message = DummyMessage("SIP/100-00000001", bytes(640), 0)
+    message.headers.update({"format": "slin16", "sample_rate": 16000})
+    server.audio_router.dispatch("SIP/100-00000001", message)
+    await asyncio.sleep(0.05)
+    reader.feed_eof()
+    await asyncio.wait_for(session, timeout=1)
+    assert len(writer.data) == 320
+
+
+@pytest.mark.asyncio
+async def test_barge_in_flushes_playback_when_caller_speaks(monkeypatch):
+    import numpy as np
+    monkeypatch.setenv("AGI_VAD", "suppress")
+    monkeypatch.setenv("AGI_PLAYOUT_TARGET_DEPTH", "1")
+    channel = DummyChannel()
+    server = asterisk_main.AGIServer(agi_port=0, ami_client=None, rabbitmq_channel=channel)
+    reader = asyncio.StreamReader()
+    writer = DummyWriter()
+    reader.feed_data(b"agi_channel: SIP/100-00000001\n\n")
+    session = asyncio.create_task(server.handle_agi(reader, writer))
+    await asyncio.sleep(0.01)
+
+    def tts(utterance, count):
+        for _ in range(count):
+            message = DummyMessage("SIP/100-00000001", b"\x01" * 320)
+            message.headers["utterance_id"] = utterance
+            server.audio_router.dispatch("SIP/100-00000001", message)
+
+    # 2 s de locución; el llamante empieza a hablar a los ~100 ms (300 ms de voz, más que AGI_BARGE_IN_MIN_MS)
+    tts("u1", 100)
+    await asyncio.sleep(0.1)
+    assert server.is_playing("SIP/100-00000001")
+    tone = (0.3 * 32767 * np.sin(2 * np.pi * 300 * np.arange(2400) / 8000)).astype("<i2").tobytes()
+    reader.feed_data(tone)
+    # Tras el barge-in sólo suena lo ya escrito en el socket (el adelanto de la reproducción)
+    await asyncio.sleep(0.1)
+    played = len(writer.data)
+    assert played < 20 * 320
+    assert not server.is_playing("SIP/100-00000001")
+    # Lo que siga llegando de la locución interrumpida se descarta; una nueva sí suena
+    tts("u1", 5)
+    tts("u2", 2)
+    await asyncio.sleep(0.1)
+    assert len(writer.data) == played + 2 * 320
+    reader.feed_eof()
+    await asyncio.wait_for(session, timeout=1)
+
+    from common import envelope
+    events = [e.call_event for e in (envelope.decode(m.body) for _, m in channel.default_exchange.published)
+              if envelope.kind(e) == "call_event"]
+    barge_in = [e for e in events if e.event == "barge_in"]
+    assert len(barge_in) == 1 and barge_in[0].fields["reason"] == "speech"
+    # La confirmación de la voz decide el barge-in pero no se publica
+    assert [e.event for e in events if e.event != "audio_ended"] == ["speech_start", "barge_in", "speech_end"]
+    stats = server.barge_in_latency.stats()
+    assert stats["count"] == 1 and stats["max"] < 500
+
+
+@pytest.mark.asyncio
+async def test_short_noise_burst_does_not_barge_in(monkeypatch):
+    import numpy as np
+    monkeypatch.setenv("AGI_VAD", "suppress")
+    monkeypatch.setenv("AGI_PLAYOUT_TARGET_DEPTH", "1")
+    monkeypatch.setenv("AGI_BARGE_IN_MIN_MS", "200")
+    channel = DummyChannel()
+    server = asterisk_main.AGIServer(agi_port=0, ami_client=None, rabbitmq_channel=channel)
+    reader = asyncio.StreamReader()
+    writer = DummyWriter()
+    reader.feed_data(b"agi_channel: SIP/100-00000001\n\n")
+    session = asyncio.create_task(server.handle_agi(reader, writer))
+    await asyncio.sleep(0.01)
+    for _ in range(100):
+        server.audio_router.dispatch("SIP/100-00000001", DummyMessage("SIP/100-00000001", b"\x01" * 320))
+    await asyncio.sleep(0.1)
+    # Dos golpes de 100 ms separados por 100 ms de silencio: nunca 200 ms seguidos de voz
+    burst = (0.3 * 32767 * np.sin(2 * np.pi * 300 * np.arange(800) / 8000)).astype("<i2").tobytes()
+    reader.feed_data(burst + bytes(1600) + burst)
+    await asyncio.sleep(0.1)
+    assert server.is_playing("SIP/100-00000001")
+    assert server.barge_in_latency.stats()["count"] == 0
+    reader.feed_eof()
+    await asyncio.wait_for(session, timeout=1)
+    from common import envelope
+    events = [e.call_event.event for e in (envelope.decode(m.body) for _, m in channel.default_exchange.published)
+              if envelope.kind(e) == "call_event"]
+    assert "speech_start" in events and "barge_in" not in events
+
+
+@pytest.mark.asyncio
+async def test_agi_metrics_track_calls_and_outgoing_depth(monkeypatch):
+    from common.metrics import REGISTRY, MetricsRegistry
+    monkeypatch.setenv("AGI_VAD", "off")
+    monkeypatch.setenv("AGI_PLAYOUT_TARGET_DEPTH", "5")
+    registry = MetricsRegistry()
+    server = asterisk_main.AGIServer(agi_port=0, ami_client=None, rabbitmq_channel=DummyChannel())
+    server.register_metrics(registry)
+    received = REGISTRY.get("agi_bytes_received_total").value
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"agi_channel: SIP/100-00000001\n\n")
+    session = asyncio.create_task(server.handle_agi(reader, DummyWriter()))
+    await asyncio.sleep(0.01)
+    # Sin llegar a target_depth, los fragmentos esperan en el buffer de reproducción
+    for seq in range(2):
+        server.audio_router.dispatch("SIP/100-00000001", DummyMessage("SIP/100-00000001", b"tt", seq))
+    reader.feed_data(b"\x01\x02" * 10)
+    await asyncio.sleep(0.01)
+    text = registry.render()
+    assert "agi_active_calls 1\n" in text
+    assert 'agi_playout_depth{call_id="SIP/100-00000001"} 2\n' in text
+    assert 'agi_outgoing_queue_depth{call_id="SIP/100-00000001"} 0\n' in text
+    assert REGISTRY.get("agi_bytes_received_total").value - received == 20
+    reader.feed_eof()
+    await asyncio.wait_for(session, timeout=1)
+    assert "agi_active_calls 0\n" in registry.render()
+
+
+@pytest.mark.asyncio
+async def test_sampled_call_traces_incoming_frames_and_reply_playback(monkeypatch):
+    from common import envelope
+    from common.tracing import TRACE_HEADER, TraceContext
+    monkeypatch.setenv("AGI_VAD", "off")
+    monkeypatch.setenv("AGI_PLAYOUT_TARGET_DEPTH", "1")
+    monkeypatch.setenv("TRACE_SAMPLE_RATE", "1")
+    channel = DummyChannel()
+    server = asterisk_main.AGIServer(agi_port=0, ami_client=None, rabbitmq_channel=channel)
+    finished = []
+    original = server.finish_trace
+    server.finish_trace = lambda trace: finished.append(trace) or original(trace)
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"agi_channel: SIP/100-00000001\n\n")
+    session = asyncio.create_task(server.handle_agi(reader, DummyWriter()))
+    reader.feed_data(b"\x01\x02" * 320)
+    await asyncio.sleep(0.01)
+    chunks = [m for _, m in channel.default_exchange.published
+              if envelope.kind(envelope.decode(m.body)) == "audio_chunk"]
+    traces = [TraceContext.decode(m.headers[TRACE_HEADER]) for m in chunks]
+    assert [t.seq for t in traces] == [0, 1]
+    assert all([stage for stage, _ in t.stages] == ["published"] for t in traces)
+
+    reply = DummyMessage("SIP/100-00000001", b"tt", 0)
+    reply.headers[TRACE_HEADER] = traces[1].mark("tts_published").encode()
+    server.audio_router.dispatch("SIP/100-00000001", reply)
+    await asyncio.sleep(0.01)
+    assert [stage for stage, _ in finished[0].stages] == ["published", "tts_published", "playout_queued", "played"]
+    assert server.trace_report.report("SIP/100-00000001")["played"]["count"] == 1
+    reader.feed_eof()
+    await asyncio.wait_for(session, timeout=1)
+    # El desglose de la llamada se emite al terminar y se libera
+    assert server.trace_report.report("SIP/100-00000001") == {}
+
+
+class ShardPool:
+    """Pool de canales mínimo: un canal de publicación por llamada."""
+
+    prefetch = 0
+
+    def __init__(self):
+        self.channels = {}
+
+    def for_call(self, call_id):
+        return self.channels.setdefault(call_id, DummyChannel())
+
+
+@pytest.mark.asyncio
+async def test_agi_session_publishes_on_its_pool_channel(monkeypatch):
+    from common import envelope
+    from common.metrics import MetricsRegistry
+    monkeypatch.setenv("AGI_VAD", "off")
+    monkeypatch.setenv("AGI_PUBLISH_QUEUE_SIZE", "4")
+    shared, pool = DummyChannel(), ShardPool()
+    server = asterisk_main.AGIServer(agi_port=0, ami_client=None, rabbitmq_channel=shared, channel_pool=pool)
+    registry = MetricsRegistry()
+    server.register_metrics(registry)
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"agi_channel: SIP/100-00000001\n\n")
+    session = asyncio.create_task(server.handle_agi(reader, DummyWriter()))
+    await asyncio.sleep(0.01)
+    assert 'agi_publish_queue_depth{call_id="SIP/100-00000001"} 0\n' in registry.render()
+    reader.feed_data(b"\x01\x02" * 320)
+    reader.feed_eof()
+    await asyncio.wait_for(session, timeout=1)
+    # Todo por el canal de la llamada, nada por el compartido
+    assert not shared.default_exchange.published
+    decoded = [envelope.decode(m.body) for _, m in pool.channels["SIP/100-00000001"].default_exchange.published]
+    assert [envelope.kind(e) for e in decoded] == ["call_start"] + ["audio_chunk"] * 2 + ["call_event"]
@@ -19,3 +19,289 @@ async def test_handle_callstream_stub():
     servicer = AsteriskConnectorServicer()
     assert hasattr(servicer, 'HandleCallStream')
     assert asyncio.iscoroutinefunction(servicer.HandleCallStream)
+
+
+async def _start_server(servicer):
+    import grpc
+    from asterisk_connector.asterisk_connector_servicer import \
+        asterisk_service_pb2_grpc
+    server = grpc.aio.server()
+    asterisk_service_pb2_grpc.add_AsteriskConnectorServicer_to_server(servicer, server)
+    port = server.add_insecure_port('127.0.0.1:0')
+    await server.start()
+    channel = grpc.aio.insecure_channel(f'127.0.0.1:{port}')
+    return server, channel, asterisk_service_pb2_grpc.AsteriskConnectorStub(channel)
+
+
+class DummyMessage:
+    def __init__(self, call_id, body):
+        self.headers = {"call_id": call_id}
+        self.body = body
+
+
+@pytest.mark.asyncio
+async def test_handle_callstream_bidirectional():
+    from asterisk_connector.asterisk_connector_servicer import (
+        AsteriskConnectorServicer, asterisk_service_pb2)
+    from asterisk_connector.call_router import CallRouter
+
+    class DummyAGIServer:
+        def __init__(self):
+            self.audio_router = CallRouter()
+
+    agi_server = DummyAGIServer()
+    outgoing = agi_server.audio_router.register("SIP/100-00000001")
+    servicer = AsteriskConnectorServicer(agi_server=agi_server)
+    assert agi_server.grpc_streams is servicer
+    server, channel, stub = await _start_server(servicer)
+    try:
+        call = stub.HandleCallStream()
+        await call.write(asterisk_service_pb2.CallStreamRequest(call_id="SIP/100-00000001", audio_chunk=b"tts"))
+        message = await asyncio.wait_for(outgoing.get(), timeout=2)
+        assert message.body == b"tts"
+
+        servicer.stream_audio("SIP/100-00000001", b"caller")
+        from common import envelope
+        await servicer._on_transcript(DummyMessage("SIP/100-00000001", envelope.encode_transcript(
+            "SIP/100-00000001", "ho", is_final=False)))
+        await servicer._on_transcript(DummyMessage("SIP/100-00000001", envelope.encode_transcript("SIP/100-00000001", "hola")))
+        await servicer._on_transcript(DummyMessage("SIP/100-00000001", b"no es un sobre"))
+        servicer.stream_text("SIP/999-00000009", "otra llamada")
+        servicer.stream_event("SIP/100-00000001", "CALL_ENDED")
+        await call.done_writing()
+        responses = [r async for r in call]
+        assert [r.WhichOneof("payload") for r in responses] == ["audio_chunk", "text_response", "event_type"]
+        assert responses[0].audio_chunk == b"caller"
+        assert responses[1].text_response == "hola"
+        assert responses[2].event_type == "CALL_ENDED"
+        assert "SIP/100-00000001" not in servicer.call_streams
+    finally:
+        await channel.close()
+        await server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_handle_callstream_concurrent_streams():
+    from asterisk_connector.asterisk_connector_servicer import (
+        AsteriskConnectorServicer, asterisk_service_pb2)
+
+    servicer = AsteriskConnectorServicer()
+    server, channel, stub = await _start_server(servicer)
+    try:
+        calls = []
+        for i in range(50):
+            call = stub.HandleCallStream()
+            await call.write(asterisk_service_pb2.CallStreamRequest(call_id=f"SIP/{i}", event_type="CALL_START"))
+            calls.append(call)
+        for _ in range(100):
+            if len(servicer.call_streams) == 50:
+                break
+            await asyncio.sleep(0.01)
+        for i in range(50):
+            servicer.stream_text(f"SIP/{i}", f"texto {i}")
+            servicer.stream_event(f"SIP/{i}", "CALL_ENDED")
+        for i, call in enumerate(calls):
+            await call.done_writing()
+            responses = [r async for r in call]
+            assert responses[0].text_response == f"texto {i}"
+    finally:
+        await channel.close()
+        await server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_hangup_call():
+    from asterisk_connector.asterisk_connector_servicer import (
+        AsteriskConnectorServicer, asterisk_service_pb2)
+
+    class DummyAMIClient:
+        def __init__(self):
+            self.protocol = object()
+            self.hung_up = []
+
+        async def hangup(self, channel, cause=16):
+            self.hung_up.append(channel)
+            return {"Response": "Success", "Message": "Channel Hungup"}
+
+    ami_client = DummyAMIClient()
+    servicer = AsteriskConnectorServicer(ami_client=ami_client)
+    server, channel, stub = await _start_server(servicer)
+    try:
+        resp = await stub.HangupCall(asterisk_service_pb2.HangupCallRequest(call_id="SIP/100-00000001"))
+        assert resp.success
+        assert resp.message == "Channel Hungup"
+        assert ami_client.hung_up == ["SIP/100-00000001"]
+        resp = await stub.HangupCall(asterisk_service_pb2.HangupCallRequest())
+        assert not resp.success
+        servicer.ami_client = None
+        resp = await stub.HangupCall(asterisk_service_pb2.HangupCallRequest(call_id="SIP/1"))
+        assert not resp.success
+        assert resp.message == "AMI no disponible"
+    finally:
+        await channel.close()
+        await server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_interrupt_control_event_reaches_agi_server():
+    from asterisk_connector.asterisk_connector_servicer import (
+        INTERRUPT, AsteriskConnectorServicer)
+
+    class DummyAGIServer:
+        def __init__(self):
+            self.interrupted = []
+
+        async def interrupt(self, call_id, reason="grpc", trigger_ts=None):
+            self.interrupted.append((call_id, reason))
+
+    agi_server = DummyAGIServer()
+    servicer = AsteriskConnectorServicer(agi_server=agi_server)
+    await servicer.handle_control_event("SIP/100-00000001", INTERRUPT)
+    assert agi_server.interrupted == [("SIP/100-00000001", "grpc")]
+
+
+@pytest.mark.asyncio
+async def test_stream_open_and_close_notify_worker_pool():
+    from asterisk_connector.asterisk_connector_servicer import (
+        CALL_ENDED, AsteriskConnectorServicer, asterisk_service_pb2)
+
+    # Con AGI_WORKERS el pool sólo reenvía al principal el audio de llamadas con stream abierto
+    class DummyPool:
+        def __init__(self):
+            self.subscriptions = []
+
+        def subscribe_stream(self, call_id, active=True):
+            self.subscriptions.append((call_id, active))
+
+    pool = DummyPool()
+    servicer = AsteriskConnectorServicer(agi_server=pool)
+    server, channel, stub = await _start_server(servicer)
+    try:
+        call = stub.HandleCallStream()
+        await call.write(asterisk_service_pb2.CallStreamRequest(call_id="SIP/100-00000001", event_type="HELLO"))
+        for _ in range(100):
+            if pool.subscriptions:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.subscriptions == [("SIP/100-00000001", True)]
+        servicer.stream_event("SIP/100-00000001", CALL_ENDED)
+        await call.done_writing()
+        async for _ in call:
+            pass
+        assert pool.subscriptions[-1] == ("SIP/100-00000001", False)
+    finally:
+        await channel.close()
+        await server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_duplicate_stream_is_rejected():
+    import grpc
+    from asterisk_connector.asterisk_connector_servicer import (
+        CALL_ENDED, AsteriskConnectorServicer, asterisk_service_pb2)
+
+    servicer = AsteriskConnectorServicer()
+    server, channel, stub = await _start_server(servicer)
+    try:
+        first = stub.HandleCallStream()
+        await first.write(asterisk_service_pb2.CallStreamRequest(call_id="SIP/1", event_type="CALL_START"))
+        for _ in range(100):
+            if "SIP/1" in servicer.call_streams:
+                break
+            await asyncio.sleep(0.01)
+        # Un segundo stream de la misma llamada no comparte (ni cierra) la cola del primero
+        second = stub.HandleCallStream()
+        await second.write(asterisk_service_pb2.CallStreamRequest(call_id="SIP/1", event_type="CALL_START"))
+        with pytest.raises(grpc.aio.AioRpcError) as error:
+            await second.read()
+        assert error.value.code() == grpc.StatusCode.ALREADY_EXISTS
+        assert "SIP/1" in servicer.call_streams
+        servicer.stream_text("SIP/1", "hola")
+        servicer.stream_event("SIP/1", CALL_ENDED)
+        await first.done_writing()
+        assert [r.text_response for r in [r async for r in first]][0] == "hola"
+    finally:
+        await channel.close()
+        await server.stop(None)
+
+
+@pytest.mark.asyncio
+async def test_stream_of_unknown_call_ends_after_half_close():
+    from asterisk_connector.asterisk_connector_servicer import (
+        CALL_ENDED, AsteriskConnectorServicer, asterisk_service_pb2)
+
+    servicer = AsteriskConnectorServicer()
+    server, channel, stub = await _start_server(servicer)
+    try:
+        call = stub.HandleCallStream()
+        await call.write(asterisk_service_pb2.CallStreamRequest(call_id="SIP/404", event_type="CALL_START"))
+        for _ in range(100):
+            if "SIP/404" in servicer.call_streams:
+                break
+            await asyncio.sleep(0.01)
+        servicer.stream_text("SIP/404", "pendiente")
+        await call.done_writing()
+        # La llamada no está en este nodo: se entrega lo pendiente y el stream termina
+        responses = await asyncio.wait_for(_collect(call), timeout=2)
+        assert [r.WhichOneof("payload") for r in responses] == ["text_response", "event_type"]
+        assert responses[1].event_type == CALL_ENDED
+        assert "SIP/404" not in servicer.call_streams
+    finally:
+        await channel.close()
+        await server.stop(None)
+
+
+async def _collect(call):
+    return [r async for r in call]
+
+
+class RecordingQueue:
+    def __init__(self, name, kwargs):
+        self.name = name
+        self.kwargs = kwargs
+        self.bound = []
+        self.callback = None
+
+    async def bind(self, exchange):
+        self.bound.append(exchange)
+
+    async def consume(self, callback, no_ack=False):
+        self.callback = callback
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.exchanges = {}
+        self.queues = []
+
+    async def declare_exchange(self, name, type, durable=False):
+        self.exchanges[name] = type
+        return name
+
+    async def declare_queue(self, name=None, **kwargs):
+        queue = RecordingQueue(name, kwargs)
+        self.queues.append(queue)
+        return queue
+
+
+@pytest.mark.asyncio
+async def test_transcripts_consumed_from_own_queue_on_fanout():
+    import aio_pika
+    from asterisk_connector.asterisk_connector_servicer import (
+        AsteriskConnectorServicer, asterisk_service_pb2)
+    from common import envelope
+
+    channel = RecordingChannel()
+    servicer = AsteriskConnectorServicer(rabbitmq_channel=channel)
+    await servicer.start()
+    assert channel.exchanges == {envelope.TRANSCRIPTS_EXCHANGE: aio_pika.ExchangeType.FANOUT}
+    consumed = [q for q in channel.queues if q.callback is not None]
+    # Una cola anónima y exclusiva del conector, nunca la cola durable compartida
+    assert len(consumed) == 1
+    queue = consumed[0]
+    assert queue.name is None and queue.kwargs == {"exclusive": True, "auto_delete": True}
+    assert queue.bound == [envelope.TRANSCRIPTS_EXCHANGE]
+
+    responses = servicer.call_streams.register("SIP/1")
+    await queue.callback(DummyMessage("SIP/1", envelope.encode_transcript("SIP/1", "hola", True, 0.0, 1.0)))
+    assert responses.get_nowait() == asterisk_service_pb2.CallStreamResponse(call_id="SIP/1", text_response="hola")
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from common.audio_codec import (ALAW_DECODE, ULAW_DECODE, Resampler,
+                                Transcoder, alaw_to_linear, from_linear,
+                                linear_to_alaw, linear_to_ulaw, to_linear,
+                                ulaw_to_linear)
+
+
+def sine(rate, freq, seconds=1.0, amplitude=10000):
+    return (amplitude * np.sin(2 * np.pi * freq * np.arange(int(rate * seconds)) / rate)).astype(np.int16)
+
+
+def test_g711_known_values():
+    # Valores de referencia de G.711 (silencio, máximos y un nivel intermedio)
+    assert ulaw_to_linear(bytes([0xFF, 0x7F, 0x00, 0x80])).tolist() == [0, 0, -32124, 32124]
+    assert alaw_to_linear(bytes([0xD5, 0x55, 0xAA, 0x2A])).tolist() == [8, -8, 32256, -32256]
+    assert linear_to_ulaw(np.array([0, 32767, -32768], dtype=np.int16)) == bytes([0xFF, 0x80, 0x00])
+    assert linear_to_alaw(np.array([0, 32767, -32768], dtype=np.int16)) == bytes([0xD5, 0xAA, 0x2A])
+
+
+@pytest.mark.parametrize("audio_format,table", [("ulaw", ULAW_DECODE), ("alaw", ALAW_DECODE)])
+def test_g711_roundtrip(audio_format, table):
+    # Cada nivel cuantizado vuelve a sí mismo y el error de cuantización es logarítmico
+    assert (to_linear(from_linear(table, audio_format), audio_format) == table).all()
+    pcm = np.arange(-32768, 32768, 13, dtype=np.int16)
+    error = np.abs(to_linear(from_linear(pcm, audio_format), audio_format).astype(np.int32) - pcm)
+    assert (error <= np.maximum(np.abs(pcm.astype(np.int32)) // 16, 16)).all()
+
+
+def test_linear_is_zero_copy_view():
+    data = bytearray(sine(8000, 440, 0.02).tobytes() + b"\x01")
+    samples = to_linear(memoryview(data), "slin")
+    assert len(samples) == 160
+    data[0:2] = b"\x00\x00"
+    assert samples[0] == 0  # vista sobre el buffer original, sin copia
+    with pytest.raises(ValueError):
+        to_linear(b"", "mp3")
+
+
+@pytest.mark.parametrize("src,dst", [(8000, 16000), (16000, 8000), (24000, 16000), (22050, 16000)])
+def test_resampler_preserves_tone_and_streams(src, dst):
+    x = sine(src, 440)
+    whole = Resampler(src, dst).process(x)
+    assert len(whole) == dst
+    resampler = Resampler(src, dst)
+    step = src // 50  # fragmentos de 20 ms
+    chunked = np.concatenate([resampler.process(x[i:i + step]) for i in range(0, len(x), step)])
+    assert (chunked == whole).all()
+    delay = (resampler.up * resampler.taps - 1) / 2 / resampler.up / src
+    reference = 10000 * np.sin(2 * np.pi * 440 * (np.arange(dst) / dst - delay))
+    assert np.abs(whole[200:-200] - reference[200:-200]).max() < 4
+
+
+def test_resampler_attenuates_aliases():
+    # Un tono de 6 kHz no cabe en 8 kHz y no debe plegarse a 2 kHz
+    out = Resampler(16000, 8000).process(sine(16000, 6000))
+    assert np.abs(out[200:-200]).max() < 10000 * 0.02
+
+
+def test_transcoder_ulaw8k_to_slin16():
+    transcoder = Transcoder("ulaw", 8000, "slin16", 16000)
+    ulaw = linear_to_ulaw(sine(8000, 440, 0.02))
+    out = transcoder.convert(memoryview(ulaw))
+    assert len(out) == 320 * 2
+    assert Transcoder("slin", 8000, "slin", 8000).convert(b"\x01\x02") == b"\x01\x02"
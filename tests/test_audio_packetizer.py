@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.audio_packetizer import AudioPacketizer
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_frame_size_by_format():
+    assert AudioPacketizer(20, "slin").frame_bytes == 320
+    assert AudioPacketizer(40, "ulaw").frame_bytes == 320
+    assert AudioPacketizer(100, "slin16").frame_bytes == 3200
+    with pytest.raises(ValueError):
+        AudioPacketizer(20, "mp3")
+
+
+def test_coalesces_small_reads_into_fixed_frames():
+    packetizer = AudioPacketizer(20, "slin", clock=FakeClock())
+    frames = []
+    for _ in range(227):
+        frames.extend(packetizer.feed(b"\x01\x02\x03"))  # lecturas de 3 bytes: cortan muestras
+    assert [len(f.payload) for f in frames] == [320, 320]
+    assert len(packetizer) == 227 * 3 - 640
+    (tail,) = packetizer.flush()
+    assert len(tail.payload) == 40  # el byte suelto de media muestra se descarta
+    assert tail.seq == 2
+
+
+def test_large_read_split_and_sequenced():
+    clock = FakeClock(1000.0)
+    packetizer = AudioPacketizer(20, "slin", clock=clock)
+    frames = packetizer.feed(bytes(1024))
+    assert [f.seq for f in frames] == [0, 1, 2]
+    # La captura empezó 1024 bytes (64 ms) antes de la primera lectura
+    assert frames[0].capture_ts == pytest.approx(1000.0 - 0.064)
+    assert frames[1].capture_ts - frames[0].capture_ts == pytest.approx(0.020)
+    clock.now += 5  # el jitter de las lecturas no afecta a la marca de tiempo
+    more = packetizer.feed(bytes(1024))
+    assert more[0].seq == 3
+    assert more[0].capture_ts == pytest.approx(1000.0 - 0.064 + 0.060)
+
+
+def test_flush_drops_half_sample():
+    packetizer = AudioPacketizer(20, "slin", clock=FakeClock())
+    packetizer.feed(b"\x00" * 5)
+    (frame,) = packetizer.flush()
+    assert len(frame.payload) == 4
+    assert frame.seq == 0
+    assert packetizer.flush() == []
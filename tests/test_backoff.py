@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from common.backoff import Backoff
+
+
+def test_backoff_immediate_first_retry_then_exponential():
+    backoff = Backoff(base=0.5, cap=4.0, jitter=False)
+    assert [backoff.delay(a) for a in range(7)] == [0.0, 0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+
+
+def test_backoff_jitter_between_half_and_full():
+    assert Backoff(base=1.0, cap=10.0, rng=lambda: 0.0).delay(3) == 2.0
+    assert Backoff(base=1.0, cap=10.0, rng=lambda: 1.0).delay(3) == 4.0
+    # Intentos muy altos no desbordan
+    assert Backoff(base=1.0, cap=10.0, rng=lambda: 0.5).delay(10_000) == 7.5
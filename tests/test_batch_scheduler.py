@@ -0,0 +1,62 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from stt_tts_interface.batch_scheduler import BatchScheduler
+
+
+@pytest.mark.asyncio
+async def test_batches_concurrent_requests():
+    sizes = []
+
+    def run_batch(items):
+        sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    scheduler = BatchScheduler(run_batch, max_batch=8, max_latency=0.05)
+    futures = [scheduler.submit(i) for i in range(20)]
+    assert await asyncio.gather(*futures) == [i * 2 for i in range(20)]
+    # Las peticiones ya encoladas salen en lotes llenos, sin esperar a max_latency
+    assert sizes == [8, 8, 4]
+    assert scheduler.stats()["mean_batch"] == pytest.approx(20 / 3, rel=0.01)
+    await scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_single_request_bounded_by_max_latency():
+    scheduler = BatchScheduler(lambda items: items, max_batch=32, max_latency=0.02)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    assert await scheduler.submit("a") == "a"
+    assert loop.time() - start < 0.5
+    assert scheduler.stats()["max_wait_ms"] >= 15
+    await scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_errors_fail_the_batch_and_scheduler_keeps_running():
+    def run_batch(items):
+        if "malo" in items:
+            raise RuntimeError("fallo del motor")
+        return items
+
+    scheduler = BatchScheduler(run_batch, max_batch=4, max_latency=0.0)
+    with pytest.raises(RuntimeError):
+        await scheduler.submit("malo")
+    assert await scheduler.submit("bueno") == "bueno"
+    await scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_short_result_list_fails_the_batch_instead_of_hanging():
+    def run_batch(items):
+        return items[:-1]  # un resultado de menos
+
+    scheduler = BatchScheduler(run_batch, max_batch=3, max_latency=0.01)
+    results = await asyncio.wait_for(
+        asyncio.gather(*(scheduler.submit(i) for i in range(3)), return_exceptions=True), timeout=1)
+    assert all(isinstance(r, ValueError) for r in results)
+    await scheduler.close()
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../benchmarks')))
+from bench_agi_workers import run_workers
+
+
+@pytest.mark.asyncio
+async def test_agi_workers_smoke():
+    # Dos workers reales, pocas llamadas y un segundo de audio
+    report = await run_workers(2, calls=4, duration=1.0, ramp=0.1, ami_events_per_sec=200, max_lag_ms=1000)
+    assert report["chunks_sent"] == 200
+    assert report["chunks_lost"] == 0
+    assert report["restarts"] == 0
+    assert report["calls_per_core"] > 0
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../benchmarks')))
+from bench_connector_load import run_load
+
+
+@pytest.mark.asyncio
+async def test_connector_load_smoke():
+    # Pocas llamadas y un segundo de audio, todo en el mismo proceso
+    report = await run_load(calls=3, duration=1.0, ramp=0.1, ami_events_per_sec=650, echo=True, in_process=True,
+                            max_p99_ms=1000)
+    assert report["chunks_sent"] == 150
+    assert report["chunks_lost"] == 0
+    assert report["calls_sustained"] == 3
+    # El cliente AMI se autentica contra el servidor falso y publica los Newchannel/Hangup
+    assert report["ami_call_events_published"] > 0
+    assert report["echo_bytes_received"] > 0
@@ -0,0 +1,373 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.call_ownership import FORWARDED_HEADER, CallOwnershipIndex
+
+
+class FakeRedis:
+    """Sustituto local de redis.asyncio: cadenas con caducidad, pipelines y pub/sub."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.data = {}
+        self.expires = {}
+        self.channels = {}
+        self.pipelines = 0
+        self.gets = 0
+        self.fail = False
+
+    def _expire_old(self, key):
+        if key in self.expires and self.expires[key] <= self.now:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+
+    def ttl(self, key):
+        self._expire_old(key)
+        if key not in self.data:
+            return -2
+        return self.expires[key] - self.now if key in self.expires else -1
+
+    async def get(self, key):
+        if self.fail:
+            raise ConnectionError("Redis no disponible")
+        self.gets += 1
+        self._expire_old(key)
+        return self.data.get(key)
+
+    def _set(self, key, value, ex=None):
+        self.data[key] = value
+        if ex is not None:
+            self.expires[key] = self.now + ex
+        else:
+            self.expires.pop(key, None)
+
+    def _expire(self, key, seconds):
+        self._expire_old(key)
+        if key in self.data:
+            self.expires[key] = self.now + seconds
+
+    def _publish(self, channel, message):
+        for queue in self.channels.get(channel, ()):
+            queue.put_nowait({"type": "message", "channel": channel, "data": message})
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    def drop_subscribers(self):
+        for queues in self.channels.values():
+            for queue in queues:
+                queue.put_nowait(ConnectionError("conexión perdida"))
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append((self.redis._set, (key, value, ex)))
+        return self
+
+    def expire(self, key, seconds):
+        self.commands.append((self.redis._expire, (key, seconds)))
+        return self
+
+    def publish(self, channel, message):
+        self.commands.append((self.redis._publish, (channel, message)))
+        return self
+
+    async def execute(self):
+        if self.redis.fail:
+            raise ConnectionError("Redis no disponible")
+        self.redis.pipelines += 1
+        return [command(*args) for command, args in self.commands]
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.queue = asyncio.Queue()
+        self.subscribed = []
+
+    async def subscribe(self, channel):
+        if self.redis.fail:
+            raise ConnectionError("Redis no disponible")
+        self.redis.channels.setdefault(channel, []).append(self.queue)
+        self.subscribed.append(channel)
+        self.queue.put_nowait({"type": "subscribe", "channel": channel, "data": 1})
+
+    async def listen(self):
+        while True:
+            message = await self.queue.get()
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+    async def close(self):
+        for channel in self.subscribed:
+            self.redis.channels[channel].remove(self.queue)
+        self.subscribed = []
+
+
+async def wait_for(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() > deadline:
+            raise AssertionError("condición no alcanzada")
+        await asyncio.sleep(0.005)
+
+
+def make_index(redis, node, **kwargs):
+    return CallOwnershipIndex(redis, node, f"{node}:50051", clock=lambda: redis.now, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_claims_are_pipelined_and_expire_after_hangup():
+    redis = FakeRedis()
+    index = make_index(redis, "nodo-a", ttl=3600, hangup_ttl=60)
+    for i in range(5):
+        index.claim(f"SIP/100-{i}", f"{i}.0")
+    await wait_for(lambda: len(redis.data) == 5)
+    # Cinco llamadas, un único viaje a Redis
+    assert redis.pipelines == 1
+    assert json.loads(redis.data["voip:call:SIP/100-3"]) == {"node": "nodo-a", "address": "nodo-a:50051",
+                                                              "uniqueid": "3.0"}
+    assert redis.ttl("voip:call:SIP/100-3") == 3600
+
+    index.release("SIP/100-3")
+    index.release("SIP/100-3")
+    await wait_for(lambda: redis.pipelines == 2)
+    # Tras colgar sigue enrutable un rato y después desaparece sola
+    assert redis.ttl("voip:call:SIP/100-3") == 60
+    redis.now += 61
+    assert redis.ttl("voip:call:SIP/100-3") == -2
+    assert redis.ttl("voip:call:SIP/100-4") > 0
+    assert index.stats()["owned"] == 4
+
+
+@pytest.mark.asyncio
+async def test_writes_are_retried_while_redis_is_down():
+    redis = FakeRedis()
+    index = make_index(redis, "nodo-a")
+    index.backoff.base = 0.01
+    redis.fail = True
+    index.claim("SIP/100-1")
+    await asyncio.sleep(0.02)
+    assert index.stats()["pending"] == 1 and not redis.data
+    redis.fail = False
+    await wait_for(lambda: "voip:call:SIP/100-1" in redis.data)
+    assert index.stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_read_through_cache_invalidated_by_other_nodes():
+    redis = FakeRedis()
+    a, b = make_index(redis, "nodo-a"), make_index(redis, "nodo-b")
+    listener = asyncio.create_task(a.run())
+    try:
+        await wait_for(lambda: redis.channels.get(a.channel))
+        b.claim("SIP/100-1")
+        await wait_for(lambda: "voip:call:SIP/100-1" in redis.data)
+        assert (await a.owner("SIP/100-1"))["node"] == "nodo-b"
+        assert (await a.owner("SIP/100-1"))["node"] == "nodo-b"
+        # La segunda consulta sale de la caché local
+        assert redis.gets == 1
+        assert await a.owner("SIP/otra") is None
+
+        # Otra instancia se queda la llamada: la invalidación llega por pub/sub
+        c = make_index(redis, "nodo-c")
+        c.claim("SIP/100-1")
+        await wait_for(lambda: "SIP/100-1" not in a._cache)
+        assert (await a.owner("SIP/100-1"))["node"] == "nodo-c"
+
+        # Al perder la suscripción se vacía la caché (pudieron perderse invalidaciones)
+        a._remember("SIP/100-9", {"node": "nodo-b"})
+        a.backoff.base = 0.01
+        redis.drop_subscribers()
+        await wait_for(lambda: "SIP/100-9" not in a._cache)
+        await wait_for(lambda: redis.channels.get(a.channel))
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_agi_session_claims_and_releases(monkeypatch):
+    from asterisk_connector.main import AGIServer
+    monkeypatch.setenv("AGI_VAD", "off")
+
+    class NullExchange:
+        async def publish(self, message, routing_key):
+            pass
+
+    class NullChannel:
+        default_exchange = NullExchange()
+
+    class Writer:
+        def write(self, data):
+            pass
+
+        async def drain(self):
+            pass
+
+        def close(self):
+            pass
+
+        async def wait_closed(self):
+            pass
+
+    redis = FakeRedis()
+    server = AGIServer(0, None, NullChannel())
+    server.ownership = make_index(redis, "nodo-a", hangup_ttl=30)
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"agi_channel: SIP/100-1\nagi_uniqueid: 1.1\n\n")
+    session = asyncio.create_task(server.handle_agi(reader, Writer()))
+    await wait_for(lambda: "voip:call:SIP/100-1" in redis.data)
+    assert "SIP/100-1" in server.ownership.owned
+    reader.feed_eof()
+    await asyncio.wait_for(session, timeout=1)
+    await wait_for(lambda: redis.ttl("voip:call:SIP/100-1") == 30)
+    assert not server.ownership.owned
+
+
+class Broker:
+    """Broker en memoria: cola por nombre y reparto round-robin entre sus consumidores."""
+
+    def __init__(self):
+        self.consumers = {}
+        self.turn = 0
+        self.default_exchange = self
+
+    async def declare_queue(self, name, durable=False, auto_delete=False):
+        broker = self
+
+        class Queue:
+            async def consume(self, callback, no_ack=False):
+                broker.consumers.setdefault(name, []).append(callback)
+
+        return Queue()
+
+    async def publish(self, message, routing_key):
+        consumers = self.consumers.get(routing_key)
+        if consumers:
+            self.turn += 1
+            await consumers[self.turn % len(consumers)](message)
+
+
+@pytest.mark.asyncio
+async def test_outgoing_audio_reaches_owner_through_its_node_queue():
+    import aio_pika
+    from asterisk_connector.call_router import CallRouter
+
+    redis, broker = FakeRedis(), Broker()
+    nodes = {}
+    for node in ("nodo-a", "nodo-b"):
+        index, router = make_index(redis, node), CallRouter()
+        router.forward = lambda message, index=index: index.forward_audio(broker, message)
+        await router.consume(broker, index.audio_queue(), durable=False)
+        await router.consume(broker, "outgoing_audio_chunks")
+        nodes[node] = (index, router)
+    index_b, router_b = nodes["nodo-b"]
+    router_a = nodes["nodo-a"][1]
+    queue = router_b.register("SIP/100-1")
+    index_b.claim("SIP/100-1")
+    await wait_for(lambda: redis.data)
+
+    # El speech worker publica en la cola compartida: la reparte entre ambos nodos
+    for i in range(6):
+        await broker.publish(aio_pika.Message(body=str(i).encode(), headers={"call_id": "SIP/100-1"}),
+                             "outgoing_audio_chunks")
+    bodies = [queue.get_nowait().body for _ in range(queue.qsize())]
+    assert bodies == [str(i).encode() for i in range(6)]
+    assert router_a.unrouted == 0
+
+    # Una llamada que nadie ha anunciado no se reenvía
+    await broker.publish(aio_pika.Message(body=b"x", headers={"call_id": "SIP/otra"}), "outgoing_audio_chunks.nodo-a")
+    assert router_a.unrouted == 1
+    # Lo ya reenviado no vuelve a reenviarse (sin bucles entre nodos)
+    await broker.publish(aio_pika.Message(body=b"y", headers={"call_id": "SIP/100-1", FORWARDED_HEADER: "nodo-b"}),
+                         "outgoing_audio_chunks.nodo-a")
+    assert router_a.unrouted == 2 and queue.empty()
+
+
+async def _start_node(servicer):
+    import grpc
+    from asterisk_connector.asterisk_connector_servicer import asterisk_service_pb2_grpc
+    server = grpc.aio.server()
+    asterisk_service_pb2_grpc.add_AsteriskConnectorServicer_to_server(servicer, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    return server, port
+
+
+@pytest.mark.asyncio
+async def test_grpc_requests_are_forwarded_to_owning_node():
+    import grpc
+    from asterisk_connector.asterisk_connector_servicer import (
+        AsteriskConnectorServicer, asterisk_service_pb2, asterisk_service_pb2_grpc)
+    from asterisk_connector.call_router import CallRouter
+
+    class DummyAGIServer:
+        def __init__(self):
+            self.audio_router = CallRouter()
+
+    class DummyAMI:
+        protocol = object()
+
+        def __init__(self):
+            self.hangups = []
+
+        async def hangup(self, channel):
+            self.hangups.append(channel)
+            return {"Response": "Success", "Message": "Channel Hungup"}
+
+    redis = FakeRedis()
+    # Nodo B atiende la llamada; el cliente gRPC se conecta al nodo A
+    agi_b, ami_b = DummyAGIServer(), DummyAMI()
+    servicer_b = AsteriskConnectorServicer(ami_client=ami_b, agi_server=agi_b)
+    server_b, port_b = await _start_node(servicer_b)
+    index_b = CallOwnershipIndex(redis, "nodo-b", f"127.0.0.1:{port_b}")
+    servicer_b.ownership = index_b
+    ami_a = DummyAMI()
+    servicer_a = AsteriskConnectorServicer(ami_client=ami_a, agi_server=DummyAGIServer(),
+                                           ownership=CallOwnershipIndex(redis, "nodo-a", "127.0.0.1:0"))
+    server_a, port_a = await _start_node(servicer_a)
+    channel = grpc.aio.insecure_channel(f"127.0.0.1:{port_a}")
+    stub = asterisk_service_pb2_grpc.AsteriskConnectorStub(channel)
+    try:
+        call_id = "SIP/100-00000001"
+        outgoing = agi_b.audio_router.register(call_id)
+        index_b.claim(call_id)
+        await wait_for(lambda: redis.data)
+
+        call = stub.HandleCallStream()
+        await call.write(asterisk_service_pb2.CallStreamRequest(call_id=call_id, audio_chunk=b"tts"))
+        # El audio llega a la sesión AGI del nodo B
+        message = await asyncio.wait_for(outgoing.get(), timeout=2)
+        assert message.body == b"tts"
+        await wait_for(lambda: call_id in servicer_b.call_streams)
+        servicer_b.stream_text(call_id, "hola")
+        servicer_b.stream_event(call_id, "CALL_ENDED")
+        await call.done_writing()
+        responses = [r async for r in call]
+        assert [r.text_response or r.event_type for r in responses] == ["hola", "CALL_ENDED"]
+
+        response = await stub.HangupCall(asterisk_service_pb2.HangupCallRequest(call_id=call_id))
+        assert response.success
+        assert ami_b.hangups == [call_id] and ami_a.hangups == []
+        # Una llamada que nadie ha anunciado se atiende localmente
+        await stub.HangupCall(asterisk_service_pb2.HangupCallRequest(call_id="SIP/otra"))
+        assert ami_a.hangups == ["SIP/otra"]
+    finally:
+        await channel.close()
+        await server_a.stop(None)
+        await server_b.stop(None)
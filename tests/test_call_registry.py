@@ -0,0 +1,106 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.ami_client import AMIClient
+from asterisk_connector.call_registry import CallRecord, CallRegistry
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def newchannel(channel, uniqueid, linkedid=None):
+    return {"Event": "Newchannel", "Channel": channel, "Uniqueid": uniqueid, "Linkedid": linkedid or uniqueid,
+            "ChannelStateDesc": "Ring", "CallerIDNum": "100", "Exten": "600"}
+
+
+def test_indexes_and_lifecycle():
+    clock = FakeClock()
+    registry = CallRegistry(linger=5, clock=clock)
+    registry.on_event(newchannel("SIP/100-1", "1.1"))
+    registry.on_event(newchannel("SIP/200-2", "1.2", linkedid="1.1"))
+    a = registry.get("SIP/100-1")
+    assert registry.by_uniqueid("1.2").channel == "SIP/200-2"
+    assert {r.channel for r in registry.by_linkedid("1.1")} == {"SIP/100-1", "SIP/200-2"}
+    assert a.caller_id == "100" and a.state == "Ring"
+
+    clock.now = 101.5
+    registry.on_event({"Event": "Newstate", "Uniqueid": "1.1", "ChannelStateDesc": "Up"})
+    assert a.answer_time == 101.5
+    registry.on_event({"Event": "BridgeEnter", "Uniqueid": "1.1", "BridgeUniqueid": "b1"})
+    registry.on_event({"Event": "BridgeEnter", "Uniqueid": "1.2", "BridgeUniqueid": "b1"})
+    assert registry.peers(a) == ("SIP/200-2",)
+
+    registry.on_event({"Event": "Rename", "Channel": "SIP/200-2", "Newname": "SIP/200-2<ZOMBIE>"})
+    assert "SIP/200-2" not in registry
+    assert registry.peers(a) == ("SIP/200-2<ZOMBIE>",)
+
+    clock.now = 110
+    registry.on_event({"Event": "Hangup", "Uniqueid": "1.1", "Channel": "SIP/100-1", "Cause-txt": "Normal Clearing"})
+    assert not a.active and a.hangup_cause == "Normal Clearing"
+    assert registry.peers(registry.by_uniqueid("1.2")) == ()
+    assert len(registry.snapshot(active_only=True)) == 1
+
+    clock.now = 115
+    assert registry.evict_expired() == 1
+    assert "SIP/100-1" not in registry
+    assert registry.by_uniqueid("1.1") is None
+    assert [r.uniqueid for r in registry.by_linkedid("1.1")] == ["1.2"]
+
+
+def test_agi_attach_and_snapshot():
+    registry = CallRegistry(clock=FakeClock())
+    session = object()
+    record = registry.attach_agi("SIP/300-3", session, uniqueid="3.1")
+    assert record.agi_session is session and record.state == "Up"
+    registry.on_event(newchannel("SIP/300-3", "3.1"))  # AMI llega después: misma llamada
+    assert len(registry) == 1
+    (snap,) = registry.snapshot()
+    assert snap.channel == "SIP/300-3" and snap.has_agi and snap.peers == ()
+    registry.detach_agi("SIP/300-3")
+    assert not registry.snapshot()[0].has_agi
+
+
+def test_agi_only_call_ends_and_is_evicted_on_detach():
+    clock = FakeClock()
+    registry = CallRegistry(linger=5, clock=clock)
+    registry.attach_agi("SIP/400-4", object(), uniqueid="4.1")
+    # AMI no anuncia nunca la llamada: al terminar la sesión AGI se da por colgada
+    registry.detach_agi("SIP/400-4")
+    record = registry.get("SIP/400-4")
+    assert not record.active and record.state == "Hangup"
+    clock.now += 6
+    registry.attach_agi("SIP/400-5", object(), uniqueid="4.2")
+    registry.detach_agi("SIP/400-5")
+    assert "SIP/400-4" not in registry and len(registry) == 1
+    # Con AMI, la llamada sigue viva hasta su Hangup
+    registry.on_event(newchannel("SIP/400-6", "4.3"))
+    registry.attach_agi("SIP/400-6", object(), uniqueid="4.3")
+    registry.detach_agi("SIP/400-6")
+    assert registry.get("SIP/400-6").active
+
+
+def test_record_is_compact():
+    record = CallRecord("SIP/1", "1")
+    assert not hasattr(record, "__dict__")
+    with pytest.raises(AttributeError):
+        record.otro = 1
+
+
+@pytest.mark.asyncio
+async def test_fed_by_ami_client():
+    client = AMIClient(event_queue_size=0)
+    registry = CallRegistry(linger=0)
+    registry.subscribe_to(client)
+    assert client.events.event_mask() == "call"
+    await client.handle_message("Event: Newchannel\r\nChannel: SIP/100-00000001\r\nUniqueid: 9.1\r\nLinkedid: 9.1\r\n")
+    assert registry.get("SIP/100-00000001").uniqueid == "9.1"
+    await client.handle_message("Event: Hangup\r\nChannel: SIP/100-00000001\r\nUniqueid: 9.1\r\n")
+    assert registry.snapshot() == []
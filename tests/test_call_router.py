@@ -0,0 +1,120 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.call_router import CallRouter
+
+
+class DummyMessage:
+    def __init__(self, call_id, body=b""):
+        self.headers = {"call_id": call_id}
+        self.body = body
+
+
+class DummyQueue:
+    def __init__(self):
+        self.callback = None
+        self.no_ack = None
+
+    async def consume(self, callback, no_ack=False):
+        self.callback = callback
+        self.no_ack = no_ack
+
+
+class DummyChannel:
+    def __init__(self):
+        self.queue = DummyQueue()
+        self.declared = []
+
+    async def declare_queue(self, name, durable=False):
+        self.declared.append(name)
+        return self.queue
+
+
+@pytest.mark.asyncio
+async def test_dispatch_to_registered_call():
+    router = CallRouter()
+    q1 = router.register("SIP/1")
+    q2 = router.register("SIP/2")
+    assert router.dispatch("SIP/2", "b")
+    assert router.dispatch("SIP/1", "a")
+    assert q1.get_nowait() == "a"
+    assert q2.get_nowait() == "b"
+    assert router.stats()["routed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_unrouted_and_unregister():
+    router = CallRouter()
+    router.register("SIP/1")
+    router.unregister("SIP/1")
+    assert not router.dispatch("SIP/1", "x")
+    assert not router.dispatch(None, "x")
+    assert router.unrouted == 2
+    assert "SIP/1" not in router
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_oldest():
+    router = CallRouter(maxsize=2)
+    q = router.register("SIP/1")
+    for item in ("a", "b", "c"):
+        router.dispatch("SIP/1", item)
+    assert router.dropped == 1
+    assert [q.get_nowait(), q.get_nowait()] == ["b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_single_consumer_demultiplexes():
+    router = CallRouter()
+    channel = DummyChannel()
+    await router.consume(channel, "outgoing_audio_chunks")
+    assert channel.declared == ["outgoing_audio_chunks"]
+    q = router.register("SIP/1")
+    await channel.queue.callback(DummyMessage("SIP/1", b"audio"))
+    await channel.queue.callback(DummyMessage("SIP/9", b"otro"))
+    assert q.get_nowait().body == b"audio"
+    assert router.unrouted == 1
+
+
+@pytest.mark.asyncio
+async def test_purge_drops_pending_for_one_call():
+    router = CallRouter()
+    q1 = router.register("SIP/1")
+    router.register("SIP/2")
+    for i in range(3):
+        router.dispatch("SIP/1", i)
+    router.dispatch("SIP/2", "b")
+    assert router.purge("SIP/1") == 3
+    assert q1.empty()
+    assert router.purge("SIP/2") == 1
+    assert router.purge("SIP/9") == 0
+
+
+class AckMessage(DummyMessage):
+    def __init__(self, call_id, body=b""):
+        super().__init__(call_id, body)
+        self.acks = []
+
+    async def ack(self, multiple=False):
+        self.acks.append(multiple)
+
+
+@pytest.mark.asyncio
+async def test_prefetch_consumer_acks_in_batches():
+    router = CallRouter()
+    channel = DummyChannel()
+    await router.consume(channel, "outgoing_audio_chunks", prefetch=10)
+    assert channel.queue.no_ack is False
+    q = router.register("SIP/1")
+    messages = [AckMessage("SIP/1", bytes([i])) for i in range(3)]
+    for message in messages:
+        await channel.queue.callback(message)
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    # Un único ack (multiple) por el último mensaje de la vuelta
+    assert [m.acks for m in messages] == [[], [], [True]]
+    assert q.qsize() == 3
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.cdr_store import CDRRecorder, InMemoryCDRSink, MongoCDRSink, Spool
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def call_events(uniqueid, channel, clock):
+    """Ciclo de vida AMI de una llamada contestada de 30 s (10 s sonando)."""
+    yield {"Event": "Newchannel", "Channel": channel, "Uniqueid": uniqueid, "Linkedid": uniqueid,
+           "ChannelStateDesc": "Ring", "CallerIDNum": "100", "Exten": "600", "Context": "default"}
+    clock.now += 10
+    yield {"Event": "Newstate", "Channel": channel, "Uniqueid": uniqueid, "ChannelStateDesc": "Up"}
+    yield {"Event": "BridgeEnter", "Channel": channel, "Uniqueid": uniqueid, "BridgeUniqueid": "b-1"}
+    clock.now += 30
+    yield {"Event": "Hangup", "Channel": channel, "Uniqueid": uniqueid, "Cause": "16", "Cause-txt": "Normal Clearing"}
+
+
+def feed(recorder, uniqueid, channel, clock):
+    for event in call_events(uniqueid, channel, clock):
+        recorder.on_event(event)
+
+
+@pytest.mark.asyncio
+async def test_call_lifecycle_becomes_cdr_and_timeline():
+    clock, sink = FakeClock(), InMemoryCDRSink()
+    recorder = CDRRecorder(sink, clock=clock)
+    feed(recorder, "1.1", "SIP/100-1", clock)
+    # Nada se escribe hasta el volcado, y se escribe en una sola operación
+    assert sink.writes == 0 and recorder.buffered == 5
+    assert await recorder.flush()
+    assert sink.writes == 1
+    cdr = sink.cdr["1.1"]
+    assert cdr["channel"] == "SIP/100-1" and cdr["caller_id"] == "100" and cdr["exten"] == "600"
+    assert cdr["answer"] == 1010 and cdr["end"] == 1040
+    assert cdr["duration"] == 40 and cdr["billsec"] == 30
+    assert cdr["hangup_cause"] == "Normal Clearing" and cdr["bridge_id"] == "b-1"
+    assert sink.timeline("1.1") == ["Newchannel", "Newstate", "BridgeEnter", "Hangup"]
+    # Llamada colgada y escrita: se olvida; sus eventos tardíos sólo van a la línea temporal
+    assert recorder.stats()["open_calls"] == 0
+    recorder.on_event({"Event": "BridgeLeave", "Channel": "SIP/100-1", "Uniqueid": "1.1"})
+    assert await recorder.flush()
+    assert sink.timeline("1.1")[-1] == "BridgeLeave"
+    assert recorder.stats()["open_calls"] == 0
+
+
+@pytest.mark.asyncio
+async def test_agi_session_stays_open_until_it_ends():
+    clock, sink = FakeClock(), InMemoryCDRSink()
+    recorder = CDRRecorder(sink, clock=clock)
+    recorder.on_event({"Event": "Newchannel", "Channel": "SIP/100-2", "Uniqueid": "2.2", "ChannelStateDesc": "Up"})
+    recorder.agi_started("SIP/100-2", "2.2")
+    recorder.on_event({"Event": "Hangup", "Channel": "SIP/100-2", "Uniqueid": "2.2", "Cause": "16"})
+    await recorder.flush()
+    # Colgada pero con la sesión AGI abierta: el CDR sigue en memoria
+    assert recorder.stats()["open_calls"] == 1
+    clock.now += 1
+    recorder.agi_ended("SIP/100-2", "2.2", {"publish": {"dropped": 0}})
+    await recorder.flush()
+    assert recorder.stats()["open_calls"] == 0
+    assert sink.cdr["2.2"]["agi"] == {"start": 1000.0, "end": 1001.0, "stats": {"publish": {"dropped": 0}}}
+    assert sink.cdr["2.2"]["hangup_cause"] == "16"
+
+
+@pytest.mark.asyncio
+async def test_run_flushes_on_batch_size_and_interval():
+    sink = InMemoryCDRSink()
+    recorder = CDRRecorder(sink, batch_size=4, flush_interval=0.05)
+    task = asyncio.create_task(recorder.run())
+    try:
+        for i in range(4):
+            recorder.on_event({"Event": "Newstate", "Uniqueid": "3.3", "ChannelStateDesc": "Ring"})
+        await asyncio.sleep(0.01)
+        # Por tamaño, antes del intervalo
+        assert len(sink.events) == 4
+        recorder.on_event({"Event": "Newstate", "Uniqueid": "3.3", "ChannelStateDesc": "Up"})
+        await asyncio.sleep(0.1)
+        assert len(sink.events) == 5 and sink.cdr["3.3"]["state"] == "Up"
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_outage_spools_batches_and_replays_in_order(tmp_path):
+    clock, sink = FakeClock(), InMemoryCDRSink()
+    recorder = CDRRecorder(sink, spool=Spool(str(tmp_path)), clock=clock)
+    sink.fail = True
+    recorder.on_event({"Event": "Newchannel", "Channel": "SIP/100-4", "Uniqueid": "4.4", "ChannelStateDesc": "Ring"})
+    assert not await recorder.flush()
+    recorder.on_event({"Event": "Newstate", "Channel": "SIP/100-4", "Uniqueid": "4.4", "ChannelStateDesc": "Up"})
+    assert not await recorder.flush()
+    assert len(recorder.spool) == 2 and recorder.spooled == 4 and not sink.events
+
+    # Un arranque nuevo encuentra el spool y continúa la numeración
+    assert Spool(str(tmp_path)).last_seq == 2
+    sink.fail = False
+    recorder.on_event({"Event": "Hangup", "Channel": "SIP/100-4", "Uniqueid": "4.4", "Cause": "16"})
+    assert await recorder.flush()
+    assert len(recorder.spool) == 0 and recorder.spool.bytes == 0
+    # En orden: el estado final no retrocede aunque los lotes antiguos se escriban después de la caída
+    assert sink.cdr["4.4"]["state"] == "Hangup"
+    assert sink.timeline("4.4") == ["Newchannel", "Newstate", "Hangup"]
+    assert recorder.stats()["dropped"] == 0
+
+
+def test_spool_is_bounded(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=400)
+    batch = {"calls": [], "events": [{"_id": str(i), "pad": "x" * 100} for i in range(2)]}
+    assert spool.put(1, batch) == 0
+    assert spool.put(2, batch) == 2
+    # Sólo cabe un lote: el más antiguo se ha descartado
+    assert len(spool) == 1 and spool.last_seq == 2
+    assert spool.put(3, {"calls": [], "events": [{"pad": "x" * 1000}]}) == 3
+    assert len(spool) == 0
+
+
+def test_spool_keeps_batches_in_sequence_order(tmp_path):
+    spool = Spool(str(tmp_path))
+    # El desbordamiento N+1 llega al disco antes que el lote N cuya escritura falló
+    spool.put(2, {"calls": [], "events": [{"_id": "nuevo"}]})
+    spool.put(1, {"calls": [], "events": [{"_id": "viejo"}]})
+    assert spool.last_seq == 2
+    _, batch = spool.peek()
+    assert batch["events"] == [{"_id": "viejo"}]
+    spool.pop()
+    assert spool.peek()[1]["events"] == [{"_id": "nuevo"}]
+
+
+@pytest.mark.asyncio
+async def test_slow_database_spills_to_disk_instead_of_growing(tmp_path):
+    sink = InMemoryCDRSink(delay=0.05)
+    recorder = CDRRecorder(sink, batch_size=2, max_buffered=5, spool=Spool(str(tmp_path)))
+    recorder.on_event({"Event": "Newstate", "Uniqueid": "5.5", "ChannelStateDesc": "Ring"})
+    flush = asyncio.create_task(recorder.flush())
+    await asyncio.sleep(0)
+    # Con la escritura en curso, la memoria no pasa de max_buffered
+    for i in range(10):
+        recorder.on_event({"Event": "Newstate", "Uniqueid": "5.5", "ChannelStateDesc": "Ring"})
+    assert recorder.buffered < 5
+    await flush
+    await recorder.close()
+    assert recorder.spooled > 0
+    assert len(sink.events) == 11 and len(recorder.spool) == 0
+
+
+@pytest.mark.asyncio
+async def test_agi_server_reports_sessions(monkeypatch):
+    from asterisk_connector.main import AGIServer
+    monkeypatch.setenv("AGI_VAD", "off")
+
+    class NullExchange:
+        async def publish(self, message, routing_key):
+            pass
+
+    class NullChannel:
+        default_exchange = NullExchange()
+
+    sink = InMemoryCDRSink()
+    server = AGIServer(0, None, NullChannel())
+    server.cdr = CDRRecorder(sink)
+
+    class Writer:
+        def write(self, data):
+            pass
+
+        async def drain(self):
+            pass
+
+        def close(self):
+            pass
+
+        async def wait_closed(self):
+            pass
+
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"agi_channel: SIP/100-6\nagi_uniqueid: 6.6\n\n")
+    reader.feed_eof()
+    await asyncio.wait_for(server.handle_agi(reader, Writer()), timeout=1)
+    await server.cdr.flush()
+    agi = sink.cdr["6.6"]["agi"]
+    assert agi["end"] >= agi["start"]
+    assert agi["stats"]["publish"]["published"] == 2
+
+
+class FakeCollection:
+    def __init__(self):
+        self.inserted = []
+        self.requests = []
+
+    async def insert_many(self, docs, ordered=True):
+        self.inserted.append((list(docs), ordered))
+
+    async def bulk_write(self, requests, ordered=True):
+        self.requests.append((list(requests), ordered))
+
+
+@pytest.mark.asyncio
+async def test_mongo_sink_uses_bulk_operations():
+    pytest.importorskip("pymongo")
+    database = {"cdr": FakeCollection(), "call_events": FakeCollection()}
+    sink = MongoCDRSink(database)
+    await sink.write([{"_id": "7.7", "state": "Up"}], [{"_id": "e1", "event": "Newstate"}])
+    assert database["call_events"].inserted == [([{"_id": "e1", "event": "Newstate"}], False)]
+    (requests, ordered), = database["cdr"].requests
+    assert not ordered and len(requests) == 1
+    assert requests[0]._filter == {"_id": "7.7"} and requests[0]._doc == {"$set": {"state": "Up"}}
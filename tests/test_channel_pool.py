@@ -0,0 +1,143 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.channel_pool import ChannelPool, CallPublisher
+
+
+class DummyExchange:
+    def __init__(self):
+        self.published = []
+        # Mientras no está puesto, publish se bloquea (canal en flow control)
+        self.open = asyncio.Event()
+        self.open.set()
+
+    async def publish(self, message, routing_key):
+        await self.open.wait()
+        self.published.append((routing_key, message))
+
+
+class DummyChannel:
+    def __init__(self):
+        self.default_exchange = DummyExchange()
+        self.declared = []
+        self.prefetch = None
+        self.closed = False
+
+    async def declare_queue(self, name, durable=False):
+        self.declared.append(name)
+
+    async def set_qos(self, prefetch_count):
+        self.prefetch = prefetch_count
+
+    async def close(self):
+        self.closed = True
+
+
+class DummyConnection:
+    def __init__(self):
+        self.channels = []
+        self.reconnect_callbacks = set()
+
+    async def channel(self):
+        channel = DummyChannel()
+        self.channels.append(channel)
+        return channel
+
+
+@pytest.mark.asyncio
+async def test_pool_shards_calls_and_dedicates_consume_channels():
+    connection = DummyConnection()
+    pool = await ChannelPool(connection, publish_channels=3, prefetch=50).open()
+    assert len(pool.publish_channels) == 3
+    assert pool.publish_channels[0].declared == ["incoming_audio_chunks", "outgoing_audio_chunks"]
+    # Cada llamada publica siempre por el mismo canal y las llamadas se reparten
+    shards = {pool.for_call(f"SIP/{i}") for i in range(30)}
+    assert len(shards) == 3
+    assert pool.for_call("SIP/7") is pool.for_call("SIP/7")
+
+    consume = await pool.consume_channel()
+    assert consume not in pool.publish_channels
+    assert consume.prefetch == 50
+    await pool.close()
+    assert all(c.closed for c in connection.channels)
+
+
+@pytest.mark.asyncio
+async def test_pool_redeclares_topology_on_reconnect():
+    connection = DummyConnection()
+    pool = await ChannelPool(connection, publish_channels=1).open()
+    assert len(connection.reconnect_callbacks) == 1
+    for callback in connection.reconnect_callbacks:
+        await callback(connection)
+    assert pool.publish_channels[0].declared == ["incoming_audio_chunks", "outgoing_audio_chunks"] * 2
+
+
+@pytest.mark.asyncio
+async def test_publisher_keeps_order_and_flushes_on_close():
+    channel = DummyChannel()
+    publisher = CallPublisher("SIP/1", channel, maxsize=10)
+    for i in range(5):
+        assert publisher.offer(str(i).encode(), {"call_id": "SIP/1"})
+    await publisher.close()
+    assert [m.body for _, m in channel.default_exchange.published] == [b"0", b"1", b"2", b"3", b"4"]
+    assert all(key == "incoming_audio_chunks" for key, _ in channel.default_exchange.published)
+    assert publisher.stats() == {"queued": 0, "published": 5, "dropped": 0, "failed": 0}
+    # Cerrada, no admite más mensajes
+    assert not publisher.offer(b"tarde")
+
+
+@pytest.mark.asyncio
+async def test_full_publisher_drops_oldest_audio_but_keeps_events():
+    channel = DummyChannel()
+    channel.default_exchange.open.clear()
+    publisher = CallPublisher("SIP/1", channel, maxsize=3)
+    publisher.offer(b"inicio", droppable=False)
+    for i in range(4):
+        publisher.offer(f"a{i}".encode())
+    publisher.offer(b"evento", droppable=False)
+    # Con la cola llena se han descartado las tramas más antiguas, nunca los eventos
+    assert len(publisher) == 4
+    channel.default_exchange.open.set()
+    await publisher.close()
+    bodies = [m.body for _, m in channel.default_exchange.published]
+    assert bodies == [b"inicio", b"a2", b"a3", b"evento"]
+    assert publisher.dropped == 2
+
+
+@pytest.mark.asyncio
+async def test_blocked_call_does_not_stall_others():
+    # Dos llamadas en canales distintos: una con su canal bloqueado no frena a la otra
+    blocked, healthy = DummyChannel(), DummyChannel()
+    blocked.default_exchange.open.clear()
+    slow = CallPublisher("SIP/lento", blocked, maxsize=5)
+    fast = CallPublisher("SIP/rapido", healthy, maxsize=5)
+    for _ in range(100):
+        slow.offer(b"x")
+        fast.offer(b"y")
+        await asyncio.sleep(0)
+    assert len(healthy.default_exchange.published) == 100
+    assert len(slow) == 5 and slow.dropped > 0
+    await fast.close()
+    await slow.close(timeout=0.01)
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_publish_in_flight():
+    channel = DummyChannel()
+    channel.default_exchange.open.clear()
+    publisher = CallPublisher("SIP/1", channel)
+    publisher.offer(b"audio_ended", droppable=False)
+    await asyncio.sleep(0)
+    # El mensaje ya salió de la cola y espera al broker
+    assert len(publisher) == 0
+    closing = asyncio.create_task(publisher.close())
+    await asyncio.sleep(0.01)
+    assert not closing.done()
+    channel.default_exchange.open.set()
+    await asyncio.wait_for(closing, timeout=1)
+    assert [m.body for _, m in channel.default_exchange.published] == [b"audio_ended"]
+    assert publisher.stats()["published"] == 1
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from stt_tts_interface.endpointing import Endpointer
+
+RATE = 8000
+FRAME = RATE // 50  # 20 ms
+VOICE = (8000 * np.sin(np.arange(FRAME) / 3)).astype(np.int16)
+SILENCE = np.zeros(FRAME, dtype=np.int16)
+
+
+def feed(endpointer, frames, start_ts=0.0):
+    """Alimenta tramas de 20 ms consecutivas; devuelve el índice de la que cierra la frase."""
+    for i, frame in enumerate(frames):
+        endpointer.feed(frame, start_ts + i * 0.02)
+        if endpointer.ended:
+            return i
+    return None
+
+
+def test_silence_after_speech_ends_the_utterance():
+    endpointer = Endpointer(RATE, end_silence_ms=300, min_speech_ms=100)
+    # 200 ms de voz y el fin de frase llega con la 15ª trama de silencio (300 ms)
+    assert feed(endpointer, [VOICE] * 10 + [SILENCE] * 20) == 10 + 14
+    assert endpointer.speech_ms == 200
+    endpointer.reset()
+    assert not endpointer.in_utterance and not endpointer.ended
+
+
+def test_pauses_shorter_than_end_silence_keep_the_utterance_open():
+    endpointer = Endpointer(RATE, end_silence_ms=300)
+    assert feed(endpointer, ([VOICE] * 10 + [SILENCE] * 10) * 3) is None
+    assert endpointer.speech_ms == 600
+
+
+def test_capture_gaps_count_as_silence():
+    # Con el silencio suprimido por el VAD del conector sólo llegan las tramas de voz
+    endpointer = Endpointer(RATE, end_silence_ms=300)
+    feed(endpointer, [VOICE] * 10)
+    endpointer.feed(VOICE, 0.2 + 0.5)
+    assert endpointer.silence_ms == 0.0
+    endpointer.feed(SILENCE, 0.72 + 0.4)
+    assert endpointer.ended
+
+
+def test_short_bursts_are_discarded():
+    endpointer = Endpointer(RATE, end_silence_ms=200, min_speech_ms=100)
+    assert feed(endpointer, [VOICE] * 2 + [SILENCE] * 20) is None
+    assert not endpointer.in_utterance and endpointer.discarded == 1
+
+
+def test_max_utterance_forces_the_end():
+    endpointer = Endpointer(RATE, max_utterance_ms=1000)
+    assert feed(endpointer, [VOICE] * 100) == 49
+    assert endpointer.forced
+
+
+def test_expired_uses_arrival_clock():
+    endpointer = Endpointer(RATE, end_silence_ms=300)
+    for i in range(10):
+        endpointer.feed(VOICE, arrival=100.0 + i * 0.02)
+    assert not endpointer.expired(100.18 + 0.29)
+    assert endpointer.expired(100.18 + 0.31)
+
+
+def test_end_silence_zero_disables_silence_endpointing():
+    endpointer = Endpointer(RATE, end_silence_ms=0, max_utterance_ms=1000)
+    assert feed(endpointer, [VOICE] * 2 + [SILENCE] * 30) is None
+    assert not endpointer.expired(1e9)
+    assert feed(endpointer, [SILENCE] * 30, start_ts=0.64) is not None  # max_utterance_ms
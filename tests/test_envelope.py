@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from common import envelope
+
+
+def test_audio_chunk_roundtrip():
+    data = envelope.encode_audio_chunk("SIP/100-00000001", 7, 1000.25, b"\x01\x02" * 160)
+    env = envelope.decode(data)
+    assert env.version == envelope.ENVELOPE_VERSION
+    assert envelope.kind(env) == "audio_chunk"
+    assert env.audio_chunk.call_id == "SIP/100-00000001"
+    assert env.audio_chunk.seq == 7
+    assert env.audio_chunk.capture_ts == 1000.25
+    assert env.audio_chunk.payload == b"\x01\x02" * 160
+    # El sobre de una trama de 20 ms apenas añade unas decenas de bytes
+    assert len(data) - 320 < 50
+
+
+def test_call_start_and_events_roundtrip():
+    env = envelope.decode(envelope.encode_call_start("SIP/1", "slin", 8000, 20, agi_env={"agi_uniqueid": "1.1"},
+                                                     uniqueid="1.1", start_ts=5.0))
+    assert envelope.kind(env) == "call_start"
+    assert env.call_start.sample_rate == 8000
+    assert dict(env.call_start.agi_env) == {"agi_uniqueid": "1.1"}
+    assert env.call_start.start_ts == 5.0
+
+    env = envelope.decode(envelope.encode_call_event("SIP/1", "call_ended", ts=6.0, fields={"Cause": "16"}))
+    assert env.call_event.event == "call_ended"
+    assert env.call_event.fields["Cause"] == "16"
+
+    env = envelope.decode(envelope.encode_transcript("SIP/1", "hola", is_final=False, start_ts=1.0, end_ts=2.0))
+    assert envelope.kind(env) == "transcript"
+    assert env.transcript.text == "hola"
+    assert not env.transcript.is_final
+
+
+def test_decode_rejects_invalid_and_future_versions():
+    with pytest.raises(ValueError):
+        envelope.decode(b"{'call_id': 'SIP/1'}")
+    future = envelope.Envelope(version=envelope.ENVELOPE_VERSION + 1).SerializeToString()
+    with pytest.raises(ValueError):
+        envelope.decode(future)
+    with pytest.raises(ValueError):
+        envelope.decode(b"")
+
+
+def test_speak_roundtrip():
+    env = envelope.decode(envelope.encode_speak("SIP/1", "Hola", utterance_id="u1", language_code="es-ES",
+                                                request_ts=12.5))
+    assert envelope.kind(env) == "speak"
+    assert (env.speak.call_id, env.speak.text, env.speak.utterance_id, env.speak.language_code,
+            env.speak.request_ts) == ("SIP/1", "Hola", "u1", "es-ES", 12.5)
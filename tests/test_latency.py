@@ -0,0 +1,14 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from common.latency import LatencyStats
+
+
+def test_latency_stats():
+    stats = LatencyStats(window=100)
+    assert stats.stats() == {"count": 0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    for ms in range(1, 201):
+        stats.add(ms)
+    # Sólo las 100 últimas medidas
+    assert stats.stats() == {"count": 200, "p50": 150.5, "p95": 195.05, "max": 200.0}
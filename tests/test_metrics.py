@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from common.metrics import MetricsRegistry, monitor_loop_lag, start_metrics_server
+
+
+def test_counter_gauge_and_labels_render():
+    registry = MetricsRegistry()
+    frames = registry.counter("frames_total", "Tramas")
+    frames.inc()
+    frames.inc(2)
+    calls = registry.gauge("active_calls", "Llamadas", function=lambda: 4)
+    depth = registry.gauge("queue_depth", "Profundidad", ("call_id",), function=lambda: {("SIP/1",): 3})
+    assert frames.value == 3 and calls.value == 4
+    # Registrar otra vez el mismo nombre devuelve la misma métrica
+    assert registry.counter("frames_total", "Tramas") is frames
+    with pytest.raises(ValueError):
+        registry.gauge("frames_total", "Tramas")
+
+    text = registry.render()
+    assert "# TYPE frames_total counter\nframes_total 3\n" in text
+    assert "active_calls 4\n" in text
+    assert 'queue_depth{call_id="SIP/1"} 3\n' in text
+    assert depth.labelnames == ("call_id",)
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("rtt_seconds", "Ida y vuelta", ("action",), buckets=(0.01, 0.1))
+    for value in (0.005, 0.01, 0.05, 2.0):
+        latency.labels("Ping").observe(value)
+    text = registry.render()
+    assert 'rtt_seconds_bucket{action="Ping",le="0.01"} 2\n' in text
+    assert 'rtt_seconds_bucket{action="Ping",le="0.1"} 3\n' in text
+    assert 'rtt_seconds_bucket{action="Ping",le="+Inf"} 4\n' in text
+    assert 'rtt_seconds_count{action="Ping"} 4\n' in text
+    assert latency.count == 4
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("events_total", "Eventos", ("name",)).labels('a"b\\c').inc()
+    assert 'events_total{name="a\\"b\\\\c"} 1' in registry.render()
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_and_loop_lag():
+    registry = MetricsRegistry()
+    lag = registry.histogram("loop_lag_seconds", "Retraso")
+    monitor = asyncio.create_task(monitor_loop_lag(0.01, lag))
+    server = await start_metrics_server(0, "127.0.0.1", registry)
+    port = server.sockets[0].getsockname()[1]
+    await asyncio.sleep(0.05)
+
+    async def get(path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response.decode()
+
+    response = await get("/metrics")
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert "text/plain; version=0.0.4" in response
+    assert "loop_lag_seconds_count" in response
+    assert lag.count >= 2
+    assert (await get("/otra")).startswith("HTTP/1.1 404")
+    monitor.cancel()
+    server.close()
+    await server.wait_closed()
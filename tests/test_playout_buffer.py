@@ -0,0 +1,157 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.playout_buffer import PlayoutBuffer
+
+
+class TimedWriter:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append((asyncio.get_running_loop().time(), data))
+
+    async def drain(self):
+        pass
+
+
+def test_reorders_and_waits_for_target_depth():
+    buffer = PlayoutBuffer(target_depth=3)
+    buffer.push(b"b", 1)
+    buffer.push(b"a", 0)
+    assert buffer.pop() is None  # pre-buffer: aún no hay profundidad suficiente
+    buffer.push(b"c", 2)
+    assert [buffer.pop(), buffer.pop(), buffer.pop()] == [b"a", b"b", b"c"]
+    assert buffer.pop() is None
+    # Vaciarse al final del flujo no es un underrun
+    assert buffer.underruns == 0
+    assert not buffer.playing
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_prebuffer_starts_after_max_wait_even_if_shallow():
+    clock = FakeClock()
+    buffer = PlayoutBuffer(target_depth=5, max_prebuffer_ms=100, clock=clock)
+    buffer.push(b"a", 0)
+    assert buffer.pop() is None
+    assert buffer.prebuffer_remaining() == pytest.approx(0.1)
+    clock.now = 0.1
+    # Respuesta corta: suena aunque nunca llegue a target_depth
+    assert buffer.pop() == b"a"
+
+
+def test_underrun_only_if_audio_keeps_arriving():
+    clock = FakeClock()
+    buffer = PlayoutBuffer(target_depth=1, quiet_ms=200, clock=clock)
+    buffer.push(b"a", 0)
+    assert buffer.pop() == b"a" and buffer.pop() is None
+    # Sigue llegando audio enseguida: el vaciado fue un underrun
+    clock.now = 0.05
+    buffer.push(b"b", 1)
+    assert buffer.underruns == 1
+    assert buffer.pop() == b"b" and buffer.pop() is None
+    # Locución nueva tras un silencio: no cuenta
+    clock.now = 1.0
+    buffer.push(b"c", 2)
+    assert buffer.underruns == 1
+
+
+@pytest.mark.asyncio
+async def test_run_plays_short_reply_without_waiting_for_depth():
+    buffer = PlayoutBuffer(bytes_per_second=16000, target_depth=5, max_prebuffer_ms=30, lead_ms=0)
+    writer = TimedWriter()
+    task = asyncio.create_task(buffer.run(writer))
+    await asyncio.sleep(0.01)
+    for seq in range(2):
+        buffer.push(bytes(160), seq)
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert len(writer.writes) == 2
+    assert buffer.underruns == 0
+
+
+def test_late_duplicate_and_overrun_counters():
+    buffer = PlayoutBuffer(target_depth=1, max_depth=3)
+    buffer.push(b"0", 0)
+    assert buffer.pop() == b"0"
+    assert not buffer.push(b"0", 0)
+    assert buffer.late_frames == 1
+    buffer.push(b"2", 2)
+    assert not buffer.push(b"2", 2)
+    assert buffer.duplicates == 1
+    for seq in (3, 4, 5):
+        buffer.push(bytes([seq]), seq)
+    assert buffer.overruns == 1
+    assert buffer.pop() == bytes([3])  # se descartó el más antiguo (2)
+    assert not buffer.push(b"1", 1)  # ya reproducido el hueco: tardío
+    assert buffer.stats()["late_frames"] == 2
+
+
+def test_clear_drops_pending():
+    buffer = PlayoutBuffer(target_depth=1)
+    for seq in range(4):
+        buffer.push(b"x", seq)
+    assert buffer.clear() == 4
+    assert len(buffer) == 0
+    assert not buffer.playing
+
+
+@pytest.mark.asyncio
+async def test_run_paces_at_real_time():
+    # 8 kHz slin: 160 bytes = 10 ms
+    buffer = PlayoutBuffer(bytes_per_second=16000, target_depth=2, lead_ms=0)
+    writer = TimedWriter()
+    for seq in range(6):
+        buffer.push(bytes(160), seq)
+    task = asyncio.create_task(buffer.run(writer))
+    await asyncio.sleep(0.08)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert len(writer.writes) == 6
+    elapsed = writer.writes[-1][0] - writer.writes[0][0]
+    assert elapsed == pytest.approx(0.05, abs=0.02)
+    assert buffer.underruns == 0
+
+
+@pytest.mark.asyncio
+async def test_written_ahead_tracks_audio_not_yet_played():
+    # 100 ms escritos de golpe con un adelanto de 200 ms
+    buffer = PlayoutBuffer(bytes_per_second=16000, target_depth=1, lead_ms=200)
+    loop = asyncio.get_running_loop()
+    assert buffer.written_ahead(loop.time()) == 0.0
+    for seq in range(10):
+        buffer.push(bytes(160), seq)
+    task = asyncio.create_task(buffer.run(TimedWriter()))
+    await asyncio.sleep(0.01)
+    assert len(buffer) == 0
+    assert buffer.written_ahead(loop.time()) == pytest.approx(0.09, abs=0.02)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_on_played_fires_when_the_chunk_is_written():
+    buffer = PlayoutBuffer(bytes_per_second=16000, target_depth=2, lead_ms=0)
+    writer = TimedWriter()
+    played = []
+    buffer.push(bytes(160), 0)
+    buffer.push(bytes(160), 1, on_played=lambda: played.append((asyncio.get_running_loop().time(), len(writer.writes))))
+    task = asyncio.create_task(buffer.run(writer))
+    await asyncio.sleep(0.03)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    # Justo tras escribir el segundo fragmento, 10 ms después del primero
+    assert [count for _, count in played] == [2]
+    assert played[0][0] - writer.writes[0][0] == pytest.approx(0.01, abs=0.01)
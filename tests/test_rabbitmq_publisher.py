@@ -1,8 +1,10 @@
+import asyncio
 from unittest.mock import MagicMock
 
 import pytest
 
-from asterisk_connector.rabbitmq_publisher import RabbitMQPublisher
+from asterisk_connector.rabbitmq_publisher import (AsyncRabbitMQPublisher,
+                                                   RabbitMQPublisher)
 
 
 class DummyChannel:
@@ -32,3 +34,130 @@ def test_publish_error(monkeypatch, caplog):
     with caplog.at_level('ERROR'):
         publisher.publish('test_queue', 'fail')
     assert 'Error publicando en RabbitMQ' in caplog.text
+
+
+class DummyExchange:
+    def __init__(self, fail_bodies=()):
+        self.published = []
+        self.fail_bodies = set(fail_bodies)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def publish(self, message, routing_key):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)  # Simula la espera de la confirmación del broker
+        self.in_flight -= 1
+        if message.body in self.fail_bodies:
+            raise Exception("nack")
+        self.published.append((routing_key, message.body, message.headers))
+
+
+class DummyAioChannel:
+    def __init__(self, **kwargs):
+        self.default_exchange = DummyExchange(**kwargs)
+
+
+@pytest.mark.asyncio
+async def test_async_publish_batches_and_pipelines():
+    channel = DummyAioChannel()
+    publisher = AsyncRabbitMQPublisher(channel, max_batch=10, max_delay=0.01)
+    for i in range(25):
+        assert publisher.publish('q', f'm{i}', headers={"call_id": "SIP/1"})
+    assert channel.default_exchange.published == []  # publish no bloquea
+    await publisher.flush()
+    bodies = [body for _, body, _ in channel.default_exchange.published]
+    assert bodies == [f'm{i}'.encode() for i in range(25)]
+    assert publisher.batches == 3
+    assert channel.default_exchange.max_in_flight == 10
+    assert channel.default_exchange.published[0][2] == {"call_id": "SIP/1"}
+    await publisher.close()
+
+
+@pytest.mark.asyncio
+async def test_async_publish_flushes_on_delay():
+    channel = DummyAioChannel()
+    publisher = AsyncRabbitMQPublisher(channel, max_batch=100, max_delay=0.005)
+    publisher.publish('q', b'solo')
+    await asyncio.sleep(0.05)
+    assert len(channel.default_exchange.published) == 1
+    await publisher.close()
+
+
+@pytest.mark.asyncio
+async def test_async_publish_backpressure():
+    channel = DummyAioChannel()
+    publisher = AsyncRabbitMQPublisher(channel, max_buffer=4, max_batch=2, high_watermark=3, low_watermark=1)
+    results = [publisher.publish('q', b'x') for _ in range(6)]
+    assert results == [True] * 4 + [False] * 2
+    assert publisher.saturated
+    assert publisher.dropped == 2
+    await asyncio.wait_for(publisher.wait_writable(), timeout=1)
+    await publisher.flush()
+    assert not publisher.saturated
+    assert publisher.published == 4
+    await publisher.close()
+    assert not publisher.publish('q', b'tarde')
+
+
+@pytest.mark.asyncio
+async def test_async_publish_counts_failures(caplog):
+    channel = DummyAioChannel(fail_bodies={b'malo'})
+    publisher = AsyncRabbitMQPublisher(channel)
+    publisher.publish('q', b'bueno')
+    publisher.publish('q', b'malo')
+    with caplog.at_level('ERROR'):
+        await publisher.flush()
+    assert publisher.published == 1
+    assert publisher.failed == 1
+    assert 'sin confirmar' in caplog.text
+    await publisher.close()
+
+
+@pytest.mark.asyncio
+async def test_async_publish_survives_closed_channel(caplog):
+    class ClosedChannel:
+        @property
+        def default_exchange(self):
+            raise RuntimeError("canal cerrado")
+
+    channel = ClosedChannel()
+    publisher = AsyncRabbitMQPublisher(channel, max_delay=0.001)
+    publisher.publish('q', b'perdido')
+    with caplog.at_level('ERROR'):
+        await asyncio.wait_for(publisher.flush(), timeout=1)
+    assert publisher.failed == 1
+    assert 'no enviado' in caplog.text
+    # Con el canal restaurado, la misma tarea sigue publicando
+    publisher.channel = DummyAioChannel()
+    publisher.publish('q', b'bueno')
+    await asyncio.wait_for(publisher.flush(), timeout=1)
+    assert [body for _, body, _ in publisher.channel.default_exchange.published] == [b'bueno']
+    await publisher.close()
+
+
+@pytest.mark.asyncio
+async def test_async_close_waits_for_batch_being_confirmed():
+    channel = DummyAioChannel()
+    exchange = channel.default_exchange
+    exchange.confirm = asyncio.Event()
+    original = exchange.publish
+
+    async def slow_publish(message, routing_key):
+        await exchange.confirm.wait()
+        await original(message, routing_key)
+
+    exchange.publish = slow_publish
+    publisher = AsyncRabbitMQPublisher(channel, max_batch=2, max_delay=0.001)
+    publisher.publish('q', b'a')
+    publisher.publish('q', b'b')
+    await asyncio.sleep(0.01)
+    # El lote ya salió del buffer pero el broker aún no lo ha confirmado
+    assert len(publisher) == 0 and not exchange.published
+    closing = asyncio.create_task(publisher.close())
+    await asyncio.sleep(0.01)
+    assert not closing.done()
+    exchange.confirm.set()
+    await asyncio.wait_for(closing, timeout=1)
+    assert [body for _, body, _ in exchange.published] == [b'a', b'b']
+    assert publisher.published == 2
@@ -0,0 +1,267 @@
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from common import envelope
+from stt_tts_interface.speech_engine import (RecognitionResult,
+                                             StubSpeechEngine, load_engine)
+from stt_tts_interface.speech_worker import SpeechWorker
+
+
+class DummyExchange:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, message))
+
+
+class DummyChannel:
+    def __init__(self):
+        self.default_exchange = DummyExchange()
+
+
+class DummyMessage:
+    def __init__(self, body):
+        self.body = body
+        self.headers = {}
+
+
+def tone_frames(count, rate=8000):
+    t = np.arange(count * rate // 50) / rate
+    pcm = (8000 * np.sin(2 * np.pi * 300 * t)).astype("<i2").tobytes()
+    size = rate // 50 * 2
+    return [pcm[i:i + size] for i in range(0, len(pcm), size)]
+
+
+def test_stub_engine_is_deterministic_and_batched():
+    engine = StubSpeechEngine()
+    voice = (8000 * np.sin(np.arange(16000) / 3)).astype(np.int16)
+    batch = [("a", voice[:3200], False), ("b", np.zeros(1600, dtype=np.int16), True), ("a", voice[:1600], True)]
+    assert engine.recognize(batch) == [RecognitionResult("[200 ms de voz]", False),
+                                       RecognitionResult("[0 ms de voz]", True),
+                                       RecognitionResult("[300 ms de voz]", True)]
+    assert engine.recognize([("c", np.zeros(1600, dtype=np.int16), False)]) == [None]
+    audio = engine.synthesize([("a", "hola", "es-ES", ""), ("b", "hola", "es-ES", "")])
+    assert len(audio[0]) == 4 * 800
+    assert (audio[0] == audio[1]).all()
+    assert isinstance(load_engine("stt_tts_interface.speech_engine:StubSpeechEngine"), StubSpeechEngine)
+    with pytest.raises(ValueError):
+        load_engine("sin_clase")
+
+
+@pytest.mark.asyncio
+async def test_worker_batches_calls_and_publishes_transcripts():
+    channel = DummyChannel()
+    worker = SpeechWorker(StubSpeechEngine(), channel, step_ms=100, stt_max_latency=0.01)
+    calls = [f"SIP/{100 + i}-0000000{i}" for i in range(5)]
+    for call_id in calls:
+        await worker._on_message(DummyMessage(envelope.encode_call_start(call_id, "slin", 8000, 20)))
+    # 10 tramas de 20 ms por llamada, intercaladas como llegan de la cola compartida
+    frames = tone_frames(10)
+    for seq, frame in enumerate(frames):
+        for call_id in calls:
+            await worker._on_message(DummyMessage(envelope.encode_audio_chunk(call_id, seq, seq * 0.02, frame)))
+    await worker._on_message(DummyMessage(envelope.encode_audio_chunk(calls[0], 99, 0.0, frames[0], silence=True)))
+    for call_id in calls:
+        await worker._on_message(DummyMessage(envelope.encode_call_event(call_id, "speech_end")))
+    await worker._on_message(DummyMessage(b"basura"))
+    await asyncio.sleep(0.1)
+
+    published = channel.default_exchange.published
+    assert {routing_key for routing_key, _ in published} == {"transcripts"}
+    transcripts = [envelope.decode(message.body).transcript for _, message in published]
+    partials = [t for t in transcripts if not t.is_final]
+    transcripts = [t for t in transcripts if t.is_final]
+    assert sorted(t.call_id for t in transcripts) == sorted(calls)
+    assert all(t.text == "[200 ms de voz]" for t in transcripts)
+    # Hipótesis parciales de cada paso de 100 ms antes de la final
+    assert sorted((t.call_id, t.text) for t in partials) == sorted(
+        (call_id, text) for call_id in calls for text in ("[100 ms de voz]", "[200 ms de voz]"))
+    assert transcripts[0].start_ts == 0.0
+    assert transcripts[0].end_ts == pytest.approx(0.2)
+    # Los pasos de las 5 llamadas se agrupan en lotes
+    stats = worker.stats()["stt"]
+    assert stats["items"] == 15
+    assert stats["mean_batch"] >= 4
+
+    await worker._on_message(DummyMessage(envelope.encode_call_event(calls[0], "audio_ended")))
+    assert calls[0] not in worker.sessions
+    await worker.close()
+    assert worker.sessions == {}
+
+
+@pytest.mark.asyncio
+async def test_worker_synthesize_batches_requests():
+    worker = SpeechWorker(StubSpeechEngine(), tts_max_latency=0.01)
+    audio = await asyncio.gather(*(worker.synthesize(f"k{i}", "hola") for i in range(4)))
+    assert all(len(a) == 3200 for a in audio)
+    assert worker.stats()["tts"]["batches"] == 1
+    await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_speak_publishes_sentences_as_they_are_ready():
+    channel = DummyChannel()
+    worker = SpeechWorker(StubSpeechEngine(sample_rate=8000), channel, tts_max_latency=0.001)
+    await worker._on_message(DummyMessage(envelope.encode_speak("SIP/1", "Hola. Adiós", utterance_id="u1")))
+    await asyncio.gather(*worker._tasks)
+    published = channel.default_exchange.published
+    assert {key for key, _ in published} == {"outgoing_audio_chunks"}
+    # "Hola." + "Adiós" (6 bytes UTF-8): 11 caracteres de 50 ms en fragmentos de 20 ms
+    assert len(published) == 11 * 50 // 20 + 1
+    headers = published[0][1].headers
+    assert headers == {"call_id": "SIP/1", "format": "slin", "sample_rate": 8000, "utterance_id": "u1"}
+    stats = worker.stats()
+    assert stats["utterances"] == 1 and stats["ttfa_ms"]["count"] == 1
+    await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_utterances_of_a_call_play_in_order_and_call_end_cancels_them():
+    channel = DummyChannel()
+    worker = SpeechWorker(StubSpeechEngine(sample_rate=8000), channel, tts_max_latency=0.001)
+    worker.speak("SIP/1", "Primera frase larga.", "u1")
+    worker.speak("SIP/1", "Dos.", "u2")
+    await asyncio.gather(*worker._tasks)
+    order = [message.headers["utterance_id"] for _, message in channel.default_exchange.published]
+    assert order == sorted(order) and order[0] == "u1" and order[-1] == "u2"
+
+    first = worker.speak("SIP/2", "Uno. Dos. Tres.", "u3")
+    second = worker.speak("SIP/2", "Cuatro.", "u4")
+    worker.handle_envelope(envelope.decode(envelope.encode_call_event("SIP/2", "call_ended")))
+    await asyncio.gather(first, second, return_exceptions=True)
+    assert first.cancelled() and second.cancelled()
+    assert "SIP/2" not in worker._speaking
+    await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_endpointing_publishes_final_with_voice_timestamps():
+    channel = DummyChannel()
+    worker = SpeechWorker(StubSpeechEngine(), channel, step_ms=100, stt_max_latency=0.001, endpoint_silence_ms=200,
+                          endpoint_poll_ms=10)
+    # Modo mark del conector: las tramas de silencio llegan marcadas
+    await worker._on_message(DummyMessage(envelope.encode_call_start("SIP/1", "slin", 8000, 20)))
+    frames = tone_frames(10)
+    for seq in range(30):
+        silence = seq < 5 or seq >= 15
+        payload = bytes(320) if silence else frames[seq - 5]
+        await worker._on_message(DummyMessage(envelope.encode_audio_chunk("SIP/1", seq, 10.0 + seq * 0.02, payload,
+                                                                          silence=silence)))
+    await asyncio.sleep(0.05)
+    # El speech_end del conector tras el fin de frase no genera otra transcripción
+    await worker._on_message(DummyMessage(envelope.encode_call_event("SIP/1", "speech_end")))
+    await asyncio.sleep(0.05)
+    finals = [t for t in (envelope.decode(m.body).transcript for _, m in channel.default_exchange.published)
+              if t.is_final]
+    assert [(t.text, t.start_ts, t.end_ts) for t in finals] == [("[200 ms de voz]", pytest.approx(10.1),
+                                                                 pytest.approx(10.3))]
+    assert worker.stats()["endpoints"] == {"silence": 1}
+
+    # Modo suppress: tras la voz deja de llegar audio y el fin de frase lo decide el reloj
+    for seq, frame in enumerate(tone_frames(10)):
+        await worker._on_message(DummyMessage(envelope.encode_audio_chunk("SIP/1", 100 + seq, 20.0 + seq * 0.02,
+                                                                          frame)))
+    await asyncio.sleep(0.35)
+    assert worker.stats()["endpoints"] == {"silence": 1, "timeout": 1}
+    await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_barge_in_event_cancels_speech():
+    channel = DummyChannel()
+    worker = SpeechWorker(StubSpeechEngine(sample_rate=8000), channel, tts_max_latency=0.001)
+    task = worker.speak("SIP/1", "Una frase. Y otra más.")
+    worker.handle_envelope(envelope.decode(envelope.encode_call_event("SIP/1", "barge_in")))
+    await asyncio.gather(task, return_exceptions=True)
+    assert task.cancelled()
+    # Sin utterance_id explícito se genera uno, para que el conector pueda descartar lo que quede
+    worker.speak("SIP/2", "Hola.")
+    await asyncio.gather(*worker._tasks)
+    assert channel.default_exchange.published[0][1].headers["utterance_id"]
+    await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_traces_flow_from_last_voiced_chunk_to_first_reply_audio():
+    from common.tracing import TRACE_HEADER, TraceContext
+    channel = DummyChannel()
+    worker = SpeechWorker(StubSpeechEngine(sample_rate=8000), channel, step_ms=100, stt_max_latency=0.001,
+                          tts_max_latency=0.001)
+
+    def traced(body, seq):
+        message = DummyMessage(body)
+        message.headers = {"call_id": "SIP/1",
+                           TRACE_HEADER: TraceContext("SIP/1", seq, 10.0 + seq * 0.02).mark("published").encode()}
+        return message
+
+    await worker._on_message(DummyMessage(envelope.encode_call_start("SIP/1", "slin", 8000, 20)))
+    for seq, frame in enumerate(tone_frames(5)):
+        await worker._on_message(traced(envelope.encode_audio_chunk("SIP/1", seq, 10.0 + seq * 0.02, frame), seq))
+    await worker._on_message(DummyMessage(envelope.encode_call_event("SIP/1", "speech_end")))
+    await asyncio.sleep(0.05)
+    assert worker.trace_report.report("SIP/1")["stt_received"]["count"] == 5
+
+    final = [m for _, m in channel.default_exchange.published if envelope.decode(m.body).transcript.is_final][0]
+    trace = TraceContext.decode(final.headers[TRACE_HEADER])
+    # La traza de la transcripción es la de la última trama con voz
+    assert trace.seq == 4
+    assert [stage for stage, _ in trace.stages] == ["published", "stt_received", "stt_final", "transcript_published"]
+
+    # El servicio de conversación reenvía la cabecera con su petición de locución
+    trace.mark("conversation")
+    speak = DummyMessage(envelope.encode_speak("SIP/1", "Hola. Adiós."))
+    speak.headers = {TRACE_HEADER: trace.encode()}
+    channel.default_exchange.published.clear()
+    await worker._on_message(speak)
+    await asyncio.gather(*worker._tasks)
+    audio = [m for key, m in channel.default_exchange.published if key == "outgoing_audio_chunks"]
+    assert len(audio) > 2
+    reply = TraceContext.decode(audio[0].headers[TRACE_HEADER])
+    assert [stage for stage, _ in reply.stages][-4:] == ["conversation", "tts_request", "tts_first_audio",
+                                                         "tts_published"]
+    assert all(TRACE_HEADER not in m.headers for m in audio[1:])
+    await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_transcripts_go_through_fanout_exchange():
+    import aio_pika
+
+    class Queue:
+        def __init__(self, name):
+            self.name = name
+            self.bound = []
+
+        async def bind(self, exchange):
+            self.bound.append(exchange)
+
+        async def consume(self, callback, no_ack=False):
+            pass
+
+    class TopologyChannel(DummyChannel):
+        def __init__(self):
+            super().__init__()
+            self.exchange = DummyExchange()
+            self.queues = {}
+
+        async def declare_exchange(self, name, type, durable=False):
+            assert name == envelope.TRANSCRIPTS_EXCHANGE and type == aio_pika.ExchangeType.FANOUT and durable
+            return self.exchange
+
+        async def declare_queue(self, name, durable=False):
+            return self.queues.setdefault(name, Queue(name))
+
+    channel = TopologyChannel()
+    worker = SpeechWorker(StubSpeechEngine(), channel)
+    await worker.consume()
+    # La cola del servicio de conversación sigue recibiéndolas, ahora desde el fanout
+    assert channel.queues["transcripts"].bound == [channel.exchange]
+    await worker.publish_transcript("SIP/1", RecognitionResult("hola", True))
+    assert len(channel.exchange.published) == 1 and not channel.default_exchange.published
+    await worker.close()
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from stt_tts_interface.streaming_tts import (split_sentences,
+                                            synthesize_sentences)
+
+
+async def spin():
+    """Deja avanzar a las tareas pendientes del bucle."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_split_sentences():
+    text = "Hola. ¿En qué puedo ayudarle?  Pulse uno;\nsi no, espere… Gracias"
+    assert split_sentences(text) == ["Hola.", "¿En qué puedo ayudarle?", "Pulse uno;", "si no, espere…", "Gracias"]
+    assert split_sentences("   ") == []
+    # Las frases largas se cortan por comas y después por espacios
+    long = "uno dos tres cuatro, cinco seis siete ocho nueve diez once"
+    parts = split_sentences(long, max_chars=20)
+    assert all(len(p) <= 20 for p in parts)
+    assert " ".join(parts).replace(", ", " ") == long.replace(",", "")
+
+
+@pytest.mark.asyncio
+async def test_first_sentence_alone_then_rest_in_parallel():
+    started = []
+    release = {}
+
+    async def synthesize(sentence):
+        started.append(sentence)
+        release[sentence] = asyncio.Event()
+        await release[sentence].wait()
+        return np.full(len(sentence), len(started), dtype=np.int16)
+
+    stream = synthesize_sentences(synthesize, ["a", "bb", "ccc"])
+    first = asyncio.ensure_future(stream.__anext__())
+    await spin()
+    assert started == ["a"]
+    release["a"].set()
+    assert len(await first) == 1
+    await spin()
+    # El resto se sintetiza a la vez mientras se reproduce la primera, y se entrega en orden
+    assert started == ["a", "bb", "ccc"]
+    second = asyncio.ensure_future(stream.__anext__())
+    release["ccc"].set()
+    release["bb"].set()
+    assert len(await second) == 2
+    assert len(await stream.__anext__()) == 3
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_closing_the_stream_cancels_pending_synthesis():
+    cancelled = []
+
+    async def synthesize(sentence):
+        if sentence != "a":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(sentence)
+                raise
+        return np.zeros(1, dtype=np.int16)
+
+    stream = synthesize_sentences(synthesize, ["a", "b", "c"])
+    await stream.__anext__()
+    await spin()
+    await stream.aclose()
+    assert sorted(cancelled) == ["b", "c"]
+
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from stt_tts_interface.speech_engine import StubSpeechEngine
+from stt_tts_interface.speech_worker import SpeechWorker
+from stt_tts_interface.stt_tts_servicer import (SttTtsServicer,
+                                                stt_tts_service_pb2,
+                                                stt_tts_service_pb2_grpc)
+
+
+async def _start_server(servicer):
+    import grpc
+    server = grpc.aio.server()
+    stt_tts_service_pb2_grpc.add_SttTtsServiceServicer_to_server(servicer, server)
+    port = server.add_insecure_port('127.0.0.1:0')
+    await server.start()
+    channel = grpc.aio.insecure_channel(f'127.0.0.1:{port}')
+    return server, channel, stt_tts_service_pb2_grpc.SttTtsServiceStub(channel)
+
+
+@pytest.mark.asyncio
+async def test_recognize_and_synthesize_streams():
+    worker = SpeechWorker(StubSpeechEngine(), step_ms=100, stt_max_latency=0.005, tts_max_latency=0.005)
+    server, channel, stub = await _start_server(SttTtsServicer(worker))
+    try:
+        voice = (8000 * np.sin(np.arange(16000 * 3 // 10) / 3)).astype("<i2").tobytes()  # 300 ms a 16 kHz
+        requests = [stt_tts_service_pb2.SpeechRecognitionRequest(call_id="SIP/1", audio_chunk=voice[i:i + 640])
+                    for i in range(0, len(voice), 640)]
+        requests.append(stt_tts_service_pb2.SpeechRecognitionRequest(call_id="SIP/1", final_recognition=True))
+
+        async def generate():
+            for request in requests:
+                yield request
+
+        responses = [r async for r in stub.RecognizeSpeech(generate())]
+        # Una hipótesis parcial por paso de 100 ms y la final al pedirla
+        assert [(r.call_id, r.transcript, r.is_final) for r in responses] == [
+            ("SIP/1", "[100 ms de voz]", False), ("SIP/1", "[200 ms de voz]", False),
+            ("SIP/1", "[300 ms de voz]", False), ("SIP/1", "[300 ms de voz]", True)]
+        assert worker.sessions == {}
+
+        async def texts():
+            yield stt_tts_service_pb2.SynthesisRequest(call_id="SIP/1", text_input="hola")
+
+        chunks = [r async for r in stub.SynthesizeSpeech(texts())]
+        assert sum(len(c.audio_chunk) for c in chunks) == 4 * 800 * 2
+        assert [c.is_final for c in chunks] == [False, True]  # fragmentos de 100 ms
+
+        async def sentences():
+            yield stt_tts_service_pb2.SynthesisRequest(call_id="SIP/1", text_input="Hola. Adiós. Sí.")
+
+        from common.tracing import TRACE_HEADER, TraceContext
+        trace = TraceContext("SIP/1", 7, 1.0).mark("conversation")
+        call = stub.SynthesizeSpeech(sentences(), metadata=((TRACE_HEADER, trace.encode()),))
+        chunks = [r async for r in call]
+        # La traza vuelve en los metadatos iniciales con las etapas del TTS
+        returned = TraceContext.decode(dict(await call.initial_metadata())[TRACE_HEADER])
+        assert [stage for stage, _ in returned.stages] == ["conversation", "tts_request", "tts_first_audio"]
+        # Frase a frase, pero en fragmentos de tamaño fijo y un solo is_final al terminar el texto
+        assert sum(len(c.audio_chunk) for c in chunks) == 16 * 800 * 2
+        assert {len(c.audio_chunk) for c in chunks[:-1]} == {3200}
+        assert [c.is_final for c in chunks] == [False] * (len(chunks) - 1) + [True]
+    finally:
+        await channel.close()
+        await server.stop(None)
+        await worker.close()
+
+
+
+class DummyContext:
+    def __init__(self):
+        self.written = []
+
+    async def write(self, response):
+        self.written.append(response)
+
+
+@pytest.mark.asyncio
+async def test_aborted_recognition_closes_engine_sessions():
+    engine = StubSpeechEngine()
+    closed = []
+    engine.close_session = closed.append
+    worker = SpeechWorker(engine, step_ms=100, stt_max_latency=0.005)
+    voice = (8000 * np.sin(np.arange(1600) / 3)).astype("<i2").tobytes()
+
+    async def broken():
+        yield stt_tts_service_pb2.SpeechRecognitionRequest(call_id="SIP/1", audio_chunk=voice)
+        raise ConnectionResetError("stream abortado")
+
+    # El stream se corta sin cerrar sus sesiones: se liberan también en el motor
+    with pytest.raises(ConnectionResetError):
+        await SttTtsServicer(worker).RecognizeSpeech(broken(), DummyContext())
+    for _ in range(100):
+        if closed:
+            break
+        await asyncio.sleep(0.01)
+    assert worker.sessions == {}
+    assert closed == ["grpc:1:SIP/1"]
+    await worker.close()
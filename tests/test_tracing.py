@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from common.tracing import (TRACE_HEADER, TraceContext, TraceReport,
+                            TraceSampler, from_headers, from_metadata)
+
+
+def test_trace_roundtrip_and_breakdown():
+    trace = TraceContext("Local/100@ctx-00000001;1", 42, 100.0).mark("published", 100.005).mark("stt_received", 100.015)
+    decoded = TraceContext.decode(trace.encode())
+    assert (decoded.call_id, decoded.seq, decoded.capture_ts) == ("Local/100@ctx-00000001;1", 42, 100.0)
+    assert [stage for stage, _ in decoded.breakdown()] == ["published", "stt_received"]
+    assert [ms for _, ms in decoded.breakdown()] == [pytest.approx(5.0), pytest.approx(10.0)]
+    assert decoded.total_ms == pytest.approx(15.0)
+    # Las copias no comparten etapas
+    copy = decoded.copy().mark("stt_final")
+    assert len(copy.stages) == 3 and len(decoded.stages) == 2
+
+
+def test_invalid_traces_are_ignored():
+    assert TraceContext.decode("basura") is None
+    assert TraceContext.decode("v9|SIP/1|0|0.0|") is None
+    assert TraceContext.decode("v1|SIP/1|x|0.0|") is None
+    assert from_headers({"call_id": "SIP/1"}) is None
+    trace = TraceContext("SIP/1").mark("published", 5.25)
+    assert from_headers({TRACE_HEADER: trace.encode().encode()}).call_id == "SIP/1"
+    assert from_metadata((("user-agent", "grpc"), (TRACE_HEADER, trace.encode()))).stages == trace.stages
+
+
+def test_sampler_is_per_call_and_deterministic():
+    assert not TraceSampler(0).sampled("SIP/1")
+    assert TraceSampler(1).sampled("SIP/1")
+    sampler = TraceSampler(0.25)
+    calls = [f"SIP/{i}-{i:08x}" for i in range(4000)]
+    sampled = [call for call in calls if sampler.sampled(call)]
+    assert len(sampled) / len(calls) == pytest.approx(0.25, abs=0.03)
+    # Otro servicio con la misma tasa decide lo mismo
+    assert [call for call in calls if TraceSampler(0.25).sampled(call)] == sampled
+
+
+def test_report_per_call():
+    report = TraceReport()
+    for capture in (0.0, 1.0):
+        report.add(TraceContext("SIP/1", 0, capture).mark("published", capture + 0.002).mark("played", capture + 0.5))
+    summary = report.pop("SIP/1")
+    assert summary["published"]["count"] == 2 and summary["published"]["p50"] == pytest.approx(2.0)
+    assert summary["total"]["max"] == pytest.approx(500.0)
+    assert "played 498.0/498.0 ms (n=2)" in TraceReport.format(summary)
+    assert report.pop("SIP/1") == {}
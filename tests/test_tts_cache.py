@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from stt_tts_interface.speech_engine import StubSpeechEngine
+from stt_tts_interface.speech_worker import SpeechWorker
+from stt_tts_interface.tts_cache import DiskTier, MemoryTier, TTSCache, cache_key
+
+
+def test_cache_key_normalizes_text_and_separates_voices():
+    assert cache_key("Hola,  mundo ", "es-ES") == cache_key("Hola, mundo", "es-ES")
+    # "é" precompuesta frente a "e" + acento combinado
+    assert cache_key("caf\u00e9") == cache_key("cafe\u0301")
+    assert cache_key("Hola", "es-ES", "voz-a") != cache_key("Hola", "es-ES", "voz-b")
+    assert cache_key("Hola", audio_format="slin@8000") != cache_key("Hola", audio_format="slin@16000")
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    tier = MemoryTier(max_bytes=10)
+    tier.put("a", b"1234")
+    tier.put("b", b"1234")
+    tier.get("a")  # "b" pasa a ser el menos usado
+    tier.put("c", b"1234")
+    assert "a" in tier and "c" in tier and "b" not in tier
+    assert tier.bytes == 8 and tier.evictions == 1
+    # Un audio mayor que la caché entera no se guarda
+    assert not tier.put("d", b"x" * 11)
+
+
+def test_disk_tier_survives_restart_and_reads_with_mmap(tmp_path):
+    tier = DiskTier(str(tmp_path))
+    tier.put("ab12", b"\x01\x02" * 100)
+    # Restos de una escritura interrumpida
+    (tmp_path / "ab" / "ab34.pcm.99.tmp").write_bytes(b"basura")
+
+    reopened = DiskTier(str(tmp_path))
+    assert len(reopened) == 1 and reopened.bytes == 200
+    audio = reopened.get("ab12")
+    assert isinstance(audio, memoryview)
+    assert bytes(audio) == b"\x01\x02" * 100
+    assert not (tmp_path / "ab" / "ab34.pcm.99.tmp").exists()
+
+
+def test_disk_tier_bounded_by_bytes(tmp_path):
+    tier = DiskTier(str(tmp_path), max_bytes=300)
+    for key in ("aa01", "aa02", "aa03"):
+        tier.put(key, b"x" * 120)
+    assert "aa01" not in tier and tier.bytes == 240 and tier.evictions == 1
+    assert not (tmp_path / "aa" / "aa01.pcm").exists()
+
+
+@pytest.mark.asyncio
+async def test_cache_promotes_disk_hits_and_reports_stats(tmp_path):
+    TTSCache(directory=str(tmp_path)).put("k1", b"audio")
+
+    cache = TTSCache(directory=str(tmp_path))
+    assert bytes(cache.get("k1")) == b"audio"
+    assert bytes(cache.get("k1")) == b"audio"
+    assert cache.get("k2") is None
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_ratio"] == pytest.approx(2 / 3, rel=0.01)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_are_coalesced():
+    cache = TTSCache()
+    calls = 0
+
+    async def synthesize():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return b"audio"
+
+    results = await asyncio.gather(*(cache.get_or_synthesize("k", synthesize) for _ in range(5)))
+    assert results == [b"audio"] * 5
+    assert calls == 1 and cache.stats()["coalesced"] == 4
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_does_not_cancel_coalesced_ones():
+    cache = TTSCache()
+    release = asyncio.Event()
+    calls = 0
+
+    async def synthesize():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return b"audio"
+
+    a = asyncio.create_task(cache.get_or_synthesize("k", synthesize))
+    b = asyncio.create_task(cache.get_or_synthesize("k", synthesize))
+    await asyncio.sleep(0)
+    # Barge-in en la llamada que lanzó la síntesis: la otra sigue esperando su audio
+    a.cancel()
+    await asyncio.gather(a, return_exceptions=True)
+    assert a.cancelled() and not b.done()
+    release.set()
+    assert await asyncio.wait_for(b, timeout=1) == b"audio"
+    assert calls == 1 and bytes(cache.get("k")) == b"audio"
+
+    # Si se van todas las peticiones, la síntesis se cancela y no queda en vuelo
+    release.clear()
+    c = asyncio.create_task(cache.get_or_synthesize("k2", synthesize))
+    await asyncio.sleep(0)
+    task = cache._inflight["k2"].task
+    c.cancel()
+    await asyncio.gather(c, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert task.cancelled() and "k2" not in cache._inflight
+
+
+@pytest.mark.asyncio
+async def test_failed_synthesis_is_not_cached():
+    cache = TTSCache()
+
+    async def failing():
+        raise RuntimeError("motor caído")
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_synthesize("k", failing)
+    assert "k" not in cache.memory
+
+
+@pytest.mark.asyncio
+async def test_worker_synthesize_uses_cache_and_prewarm(tmp_path):
+    engine = StubSpeechEngine(sample_rate=8000)
+    submitted = []
+    original = engine.synthesize
+
+    def counting(batch):
+        submitted.extend(text for _, text, _, _ in batch)
+        return original(batch)
+
+    engine.synthesize = counting
+    worker = SpeechWorker(engine, tts_cache=TTSCache(directory=str(tmp_path)))
+
+    assert await worker.prewarm(["Bienvenido", "Pulse uno"], "es-ES") == 2
+    # Ya pre-calentada: ni pasa por el motor
+    audio = await worker.synthesize("call-1", "Bienvenido", "es-ES")
+    assert len(audio) == 10 * 400
+    assert submitted == ["Bienvenido", "Pulse uno"]
+    # Otro idioma es otra entrada
+    await worker.synthesize("call-1", "Bienvenido", "en-US")
+    assert submitted[-1] == "Bienvenido" and len(submitted) == 3
+    assert await worker.prewarm(["Bienvenido"], "es-ES") == 0
+    assert worker.stats()["tts_cache"]["memory_hits"] >= 1
+    await worker.close()
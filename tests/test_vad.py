@@ -0,0 +1,100 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector.audio_packetizer import AudioFrame
+from asterisk_connector.vad import (SPEECH_CONFIRMED, SPEECH_END, SPEECH_START,
+                                    EnergyZCRModel, VADEvent,
+                                    VoiceActivityDetector)
+
+RATE = 8000
+FRAME = 160  # 20 ms a 8 kHz
+
+
+def tone(frames, freq=300.0, amplitude=0.3):
+    t = np.arange(frames * FRAME) / RATE
+    return (amplitude * 32767 * np.sin(2 * np.pi * freq * t)).astype("<i2").tobytes()
+
+
+def silence(frames):
+    return bytes(frames * FRAME * 2)
+
+
+def to_frames(pcm, start_seq=0):
+    size = FRAME * 2
+    return [AudioFrame(start_seq + i, i * 0.02, pcm[i * size:(i + 1) * size]) for i in range(len(pcm) // size)]
+
+
+def test_energy_zcr_model_classifies_tone_silence_and_noise():
+    rng = np.random.default_rng(0)
+    noise = rng.uniform(-0.05, 0.05, FRAME).astype(np.float32)
+    samples = np.stack([
+        np.frombuffer(tone(1), dtype="<i2") / 32768.0,
+        np.zeros(FRAME),
+        noise,  # ruido blanco de energía moderada: ZCR alta
+    ]).astype(np.float32)
+    assert EnergyZCRModel()(samples, RATE).tolist() == [True, False, False]
+
+
+def test_hangover_pre_roll_and_events():
+    vad = VoiceActivityDetector(RATE, 20, hangover_ms=40, pre_roll_ms=40)
+    frames = to_frames(silence(5) + tone(3) + silence(5))
+    output = vad.process(frames)
+    events = [item for item in output if isinstance(item, VADEvent)]
+    published = [item[0].seq for item in output if not isinstance(item, VADEvent)]
+    # 2 tramas de pre-roll, 3 de voz y 2 de hangover
+    assert published == list(range(3, 10))
+    assert events == [VADEvent(SPEECH_START, frames[3].capture_ts), VADEvent(SPEECH_END, frames[10].capture_ts)]
+    assert output[0] == events[0]
+    assert vad.finish(1.0) == []
+    assert vad.dropped_frames == 6
+    assert vad.dropped_fraction == pytest.approx(6 / 13)
+    assert vad.stats()["speech_segments"] == 1
+
+
+def test_confirmation_needs_continuous_voice():
+    vad = VoiceActivityDetector(RATE, 20, hangover_ms=100, pre_roll_ms=0, confirm_ms=100)
+    # 3 tramas de voz, 2 de pausa (dentro del hangover) y 5 seguidas: confirma la quinta
+    frames = to_frames(tone(3) + silence(2) + tone(5) + silence(10))
+    events = [item for item in vad.process(frames) if isinstance(item, VADEvent)]
+    assert events == [VADEvent(SPEECH_START, frames[0].capture_ts), VADEvent(SPEECH_CONFIRMED, frames[9].capture_ts),
+                      VADEvent(SPEECH_END, frames[15].capture_ts)]
+    # Un tramo nuevo se confirma de nuevo
+    frames = to_frames(tone(5))
+    assert [e.kind for e in vad.process(frames) if isinstance(e, VADEvent)] == [SPEECH_START, SPEECH_CONFIRMED]
+
+
+def test_mark_mode_keeps_silence_and_finish_closes_segment():
+    vad = VoiceActivityDetector(RATE, 20, hangover_ms=0, suppress=False)
+    output = vad.process(to_frames(silence(2) + tone(2)))
+    flags = [item[1] for item in output if not isinstance(item, VADEvent)]
+    assert flags == [False, False, True, True]
+    assert vad.dropped_fraction == 0.0
+    assert vad.finish(9.0) == [VADEvent(SPEECH_END, 9.0)]
+
+
+def test_pluggable_model_and_short_last_frame():
+    calls = []
+
+    def model(samples, sample_rate):
+        calls.append(samples.shape)
+        return np.ones(len(samples), dtype=bool)
+
+    vad = VoiceActivityDetector(RATE, 20, model=model)
+    frames = to_frames(silence(3)) + [AudioFrame(3, 0.06, bytes(10))]
+    output = vad.process(frames)
+    # Las tramas del mismo tamaño se clasifican en una sola llamada
+    assert calls == [(3, FRAME), (1, 5)]
+    assert sum(1 for item in output if not isinstance(item, VADEvent)) == 4
+
+
+def test_g711_frames_are_decoded_before_classifying():
+    from common.audio_codec import linear_to_ulaw
+    pcm = np.frombuffer(silence(2) + tone(2), dtype="<i2")
+    ulaw = linear_to_ulaw(pcm)
+    frames = [AudioFrame(i, i * 0.02, ulaw[i * FRAME:(i + 1) * FRAME]) for i in range(4)]
+    vad = VoiceActivityDetector(RATE, 20, audio_format="ulaw")
+    assert vad.classify(frames).tolist() == [False, False, True, True]
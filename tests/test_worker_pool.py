@@ -0,0 +1,206 @@
+import asyncio
+import contextlib
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from asterisk_connector import worker_pool
+from asterisk_connector.call_registry import CallRegistry
+from asterisk_connector.call_router import RoutedMessage
+from asterisk_connector.main import AGIServer
+from asterisk_connector.worker_pool import AGIWorker, AGIWorkerPool, IPCConnection
+
+
+class NullExchange:
+    async def publish(self, message, routing_key):
+        pass
+
+
+class NullChannel:
+    """Canal que descarta lo publicado (los workers de las pruebas no tienen broker)."""
+
+    def __init__(self):
+        self.default_exchange = NullExchange()
+
+
+async def null_channel():
+    return NullChannel()
+
+
+class FakeStreams:
+    def __init__(self):
+        self.events = []
+        self.audio = []
+
+    def stream_event(self, call_id, event_type):
+        self.events.append((call_id, event_type))
+
+    def stream_audio(self, call_id, audio_chunk):
+        self.audio.append((call_id, audio_chunk))
+
+
+async def wait_for(predicate, timeout=5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() > deadline:
+            raise AssertionError("condición no alcanzada")
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_ipc_frame_roundtrip():
+    reader = asyncio.StreamReader()
+    reader.feed_data(worker_pool.pack_frame(worker_pool.AUDIO, {"call_id": "SIP/1", "seq": 3}, b"\x00\x01\x02"))
+    reader.feed_data(worker_pool.pack_frame(worker_pool.HEALTH))
+    reader.feed_eof()
+    ipc = IPCConnection(reader, None)
+    assert await ipc.recv() == (worker_pool.AUDIO, {"call_id": "SIP/1", "seq": 3}, b"\x00\x01\x02")
+    assert await ipc.recv() == (worker_pool.HEALTH, {}, b"")
+    assert await ipc.recv() is None
+
+
+@contextlib.asynccontextmanager
+async def pool_and_worker(tmp_path):
+    # Principal y worker en el mismo bucle: el pool no lanza procesos, sólo sirve el socket IPC
+    registry = CallRegistry()
+    pool = AGIWorkerPool(1, 0, call_registry=registry, ipc_path=str(tmp_path / "ipc.sock"))
+    pool.grpc_streams = FakeStreams()
+    await pool.serve_ipc()
+    agi_server = AGIServer(0, None, NullChannel())
+    worker = AGIWorker(0, pool.ipc_path, agi_server, health_interval=0.05, lag_interval=0.01)
+    task = asyncio.create_task(worker.run(reuse_port=False))
+    await pool.wait_ready(timeout=5)
+    try:
+        yield pool, worker
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_ami_events_fan_out_to_workers(tmp_path):
+    async with pool_and_worker(tmp_path) as (pool, worker):
+        pool.broadcast_event({"Event": "Newchannel", "Channel": "SIP/100-1", "Uniqueid": "1.1",
+                              "ChannelStateDesc": "Ring", "CallerIDNum": "100"})
+        await wait_for(lambda: worker.call_registry.get("SIP/100-1") is not None)
+        assert worker.call_registry.get("SIP/100-1").caller_id == "100"
+
+
+@pytest.mark.asyncio
+async def test_ami_events_skip_congested_workers(tmp_path):
+    async with pool_and_worker(tmp_path) as (pool, worker):
+        ipc = pool.workers[0].ipc
+        ipc.congested = lambda: True
+        dropped = worker_pool.IPC_DROPPED.value
+        pool.broadcast_event({"Event": "Newchannel", "Channel": "SIP/100-9", "Uniqueid": "9.9",
+                              "ChannelStateDesc": "Ring"})
+        assert worker_pool.IPC_DROPPED.value - dropped == 1
+        assert ipc.writer.transport.get_write_buffer_size() == 0
+        # Cuando el socket se descongestiona los eventos vuelven a llegar
+        del ipc.congested
+        pool.broadcast_event({"Event": "Newchannel", "Channel": "SIP/100-10", "Uniqueid": "10.10",
+                              "ChannelStateDesc": "Ring"})
+        await wait_for(lambda: worker.call_registry.get("SIP/100-10") is not None)
+        assert worker.call_registry.get("SIP/100-9") is None
+
+
+@pytest.mark.asyncio
+async def test_call_ownership_routes_audio_and_interrupts(tmp_path):
+    async with pool_and_worker(tmp_path) as (pool, worker):
+        call_id = "SIP/100-2"
+        queue = worker.agi_server.audio_router.register(call_id)
+        worker.call_registry.attach_agi(call_id, object(), "2.2")
+        await wait_for(lambda: call_id in pool)
+        # El registro del principal ve la llamada con sesión AGI (en el worker)
+        assert pool.call_registry.get(call_id).agi_session is pool.workers[0]
+
+        assert pool.audio_router.dispatch(call_id, RoutedMessage(b"pcm", {"call_id": call_id, "seq": 7, "utterance_id": "u1"}))
+        message = await asyncio.wait_for(queue.get(), timeout=5)
+        assert message.body == b"pcm"
+        assert message.headers["seq"] == 7 and message.headers["utterance_id"] == "u1"
+        # Sin dueño no hay destino
+        assert not pool.dispatch("SIP/otra", RoutedMessage(b"pcm", {}))
+        assert pool.unrouted == 1
+
+        interrupted = []
+
+        async def interrupt(call_id, reason="grpc", trigger_ts=None):
+            interrupted.append((call_id, reason))
+
+        worker.agi_server.interrupt = interrupt
+        await pool.interrupt(call_id, "grpc")
+        await wait_for(lambda: interrupted)
+        assert interrupted == [(call_id, "grpc")]
+
+        worker.call_registry.detach_agi(call_id)
+        await wait_for(lambda: call_id not in pool)
+        assert pool.call_registry.get(call_id).agi_session is None
+
+
+@pytest.mark.asyncio
+async def test_stream_audio_only_forwarded_when_subscribed(tmp_path):
+    async with pool_and_worker(tmp_path) as (pool, worker):
+        call_id = "SIP/100-3"
+        worker.call_registry.attach_agi(call_id, object())
+        await wait_for(lambda: call_id in pool)
+
+        worker.stream_audio(call_id, b"antes")
+        pool.subscribe_stream(call_id, True)
+        await wait_for(lambda: call_id in worker.subscribed)
+        worker.stream_audio(call_id, b"despues")
+        worker.stream_event(call_id, "SPEECH_START")
+        await wait_for(lambda: pool.grpc_streams.events)
+        assert pool.grpc_streams.audio == [(call_id, b"despues")]
+        assert pool.grpc_streams.events == [(call_id, "SPEECH_START")]
+
+
+@pytest.mark.asyncio
+async def test_health_and_worker_loss(tmp_path):
+    async with pool_and_worker(tmp_path) as (pool, worker):
+        await wait_for(lambda: "cpu_s" in pool.workers[0].health)
+        health = pool.health()[0]
+        assert health["up"] and health["calls"] == 0 and health["pid"] == os.getpid()
+
+        worker.call_registry.attach_agi("SIP/100-4", object())
+        await wait_for(lambda: "SIP/100-4" in pool)
+        # Al caerse el worker sus llamadas terminan para el principal
+        worker.ipc.close()
+        await wait_for(lambda: not pool.workers[0].up)
+        assert "SIP/100-4" not in pool
+        assert ("SIP/100-4", "CALL_ENDED") in pool.grpc_streams.events
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_spawned_workers_share_agi_port(tmp_path):
+    # Dos procesos reales con SO_REUSEPORT: cada llamada la atiende uno y el principal lo sabe
+    port = free_port()
+    pool = AGIWorkerPool(2, port, call_registry=CallRegistry(), ipc_path=str(tmp_path / "ipc.sock"),
+                         channel_factory=null_channel, health_interval=0.2)
+    task = asyncio.create_task(pool.start())
+    try:
+        await pool.wait_ready(timeout=30)
+        writers = []
+        for i in range(8):
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"agi_channel: SIP/spawn-{i}\nagi_uniqueid: {i}.0\n\n".encode())
+            writers.append(writer)
+        await wait_for(lambda: len(pool.owners) == 8, timeout=10)
+        assert {pool.health()[i]["pid"] for i in range(2)} == {h.process.pid for h in pool.workers}
+        for writer in writers:
+            writer.close()
+        await wait_for(lambda: not pool.owners, timeout=10)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    assert not any(h.process.is_alive() for h in pool.workers)